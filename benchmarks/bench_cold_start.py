@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+# Measures RunScan/ScanStatus cold and warm latency locally. Every cold sample
+# is a fresh interpreter that imports the handler module, then serves its
+# first request; warm samples reuse that interpreter. Clients are constructed
+# for real (that cost is part of a cold start) but their API calls go to the
+# stubs from bench_run_scan.py, so no credentials or network are needed.
+#
+#   python benchmarks/bench_cold_start.py --cold 10 --warm 50 --handler run_scan
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+EVENTS = {
+    'run_scan': {'queryStringParameters': {
+        'role_arn': 'arn:aws:iam::111111111111:role/CrossAccountRole',
+        'external_id': 'bench12345',
+        'scan_name': 'Benchmark'
+    }},
+    'get_status': {'queryStringParameters': {'job': 'Benchmark-1721159874'}}
+}
+
+
+def child(handler_name, warm, api_latency):
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ.setdefault('AWS_REGION', 'us-east-1')
+    os.environ.setdefault('BUCKET_NAME', 'benchmark-bucket')
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'functions'))
+
+    start = time.perf_counter()
+    import worker
+    worker_imported = time.perf_counter()
+
+    from bench_run_scan import StubEc2Client, StubS3Client, StubSsmClient
+    stubs = {
+        'ec2': StubEc2Client(describe_latency=api_latency * 10, launch_latency=api_latency * 5),
+        's3': StubS3Client(latency=api_latency),
+        'ssm': StubSsmClient(latency=api_latency * 2)
+    }
+    stubs['s3'].objects['jobs/Benchmark-1721159874.json'] = json.dumps({'phase': 'scanning'}).encode()
+    created = []
+    create_client = worker.create_client
+
+    def create_stubbed_client(service):
+        create_client(service)
+        created.append(service)
+        return stubs[service]
+    worker.create_client = create_stubbed_client
+
+    handler = getattr(worker, handler_name)
+    event = EVENTS[handler_name]
+
+    def invoke():
+        begin = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = handler(event, None)
+        assert response['statusCode'] == 200, response
+        return time.perf_counter() - begin
+
+    first = invoke()
+    warm_samples = [invoke() for _ in range(warm)]
+    print(json.dumps({
+        'import_worker': worker_imported - start,
+        'first_invoke': first,
+        'cold_total': worker_imported - start + first,
+        'warm': warm_samples,
+        'clients': created
+    }))
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def report(label, samples):
+    print(f'{label:<14} p50={percentile(samples, 50) * 1000:8.1f}ms  '
+          f'p95={percentile(samples, 95) * 1000:8.1f}ms  '
+          f'mean={statistics.mean(samples) * 1000:8.1f}ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark handler cold and warm latency with stubbed AWS clients.')
+    parser.add_argument('--handler', choices=sorted(EVENTS), default='run_scan')
+    parser.add_argument('--cold', type=int, default=10, help='Fresh interpreters to start')
+    parser.add_argument('--warm', type=int, default=20, help='Warm invocations per interpreter')
+    parser.add_argument('--api-latency', type=float, default=0.01, help='Base simulated AWS API latency (seconds)')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.handler, args.warm, args.api_latency)
+        raise SystemExit(0)
+
+    runs = []
+    for _ in range(args.cold):
+        output = subprocess.run(
+            [sys.executable, __file__, '--child', '--handler', args.handler, '--warm', str(args.warm),
+             '--api-latency', str(args.api_latency)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f'{args.handler}: {args.cold} cold starts, {args.warm} warm invocations each, '
+          f'clients built {", ".join(runs[0]["clients"]) or "none"}')
+    for metric in ('import_worker', 'first_invoke', 'cold_total'):
+        report(metric, [r[metric] for r in runs])
+    report('warm', [s for r in runs for s in r['warm']])
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+# Compares answering "which accounts fail check X" by parsing every scan's
+# CSV against querying the partitioned Parquet store, over a synthetic corpus
+# (see synthetic_csv.py).
+#
+#   python benchmarks/bench_columnar.py --rows 1000000 --scans 200
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'functions'))
+
+from columnar import convert, count_by  # noqa: E402
+from findings import column_index, open_reader  # noqa: E402
+from synthetic_csv import TARGET_CHECK, generate_corpus  # noqa: E402
+
+
+def csv_failing_accounts(paths):
+    accounts = {}
+    for _, path in paths:
+        f, reader = open_reader(path)
+        with f:
+            index = column_index(next(reader))
+            check, status, account = index['CHECK_ID'], index['STATUS'], index['ACCOUNT_UID']
+            for row in reader:
+                if row[check] == TARGET_CHECK and row[status] == 'FAIL':
+                    accounts[row[account]] = accounts.get(row[account], 0) + 1
+    return accounts
+
+def parquet_failing_accounts(root):
+    rows = count_by(root, ['account'], {'check_id': TARGET_CHECK, 'status': 'FAIL'})
+    return {r['account']: r['count'] for r in rows}
+
+def timed(fn, *args, repeat=3):
+    results = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn(*args)
+        results.append(time.perf_counter() - start)
+    return value, min(results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--scans', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--keep', help='Write the corpus here and keep it instead of a temporary directory')
+    args = parser.parse_args()
+
+    directory = args.keep or tempfile.mkdtemp(prefix='prowler-columnar-')
+    root = os.path.join(directory, 'findings')
+    try:
+        start = time.perf_counter()
+        paths = generate_corpus(directory, args.rows, args.scans)
+        csv_bytes = sum(os.path.getsize(p) for _, p in paths)
+        print(f'generated {args.rows} findings in {args.scans} scans in {time.perf_counter() - start:.1f}s '
+              f'({csv_bytes / 1e6:.0f} MB of CSV)')
+
+        start = time.perf_counter()
+        for scan_id, path in paths:
+            convert(path, root, scan_id)
+        parquet_bytes = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(root) for f in files)
+        print(f'converted to parquet in {time.perf_counter() - start:.1f}s ({parquet_bytes / 1e6:.0f} MB)')
+
+        csv_result, csv_time = timed(csv_failing_accounts, paths, repeat=args.repeat)
+        parquet_result, parquet_time = timed(parquet_failing_accounts, root, repeat=args.repeat)
+        assert csv_result == parquet_result, 'CSV and Parquet answers differ'
+
+        print(f'accounts failing {TARGET_CHECK}: {len(parquet_result)}')
+        print(f'{"csv scan":<14} {csv_time * 1000:10.0f} ms')
+        print(f'{"parquet query":<14} {parquet_time * 1000:10.0f} ms')
+        print(f'speedup {csv_time / parquet_time:.1f}x')
+    finally:
+        if not args.keep:
+            shutil.rmtree(directory)
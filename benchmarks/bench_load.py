@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+
+# Load test for the whole scan launch path. Synthetic API Gateway events go
+# through worker.run_scan from concurrent threads, each one standing in for a
+# warm Lambda environment, against stub EC2, SSM, S3 and SQS clients that add
+# latency and fail a share of calls. Throttled calls are retried with the
+# SDK's backoff before they surface, capacity errors are not, as with boto3.
+# Reports throughput, latency percentiles and responses by status and error.
+#
+#   python benchmarks/bench_load.py --requests 500 --concurrency 25 --throttle 0.05 --capacity 0.1
+#   python benchmarks/bench_load.py --requests 500 --rate 40 --queued --json load.json
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'functions'))
+
+from botocore.exceptions import ClientError  # noqa: E402
+
+import worker  # noqa: E402
+
+
+# botocore's standard retry mode: 3 attempts, full jitter on 2^attempt
+SDK_ATTEMPTS = 3
+SDK_BACKOFF_CAP = 20
+ERROR_CODE = re.compile(r'\((\w+)\)')
+
+
+class Faults:
+    # Latency, throttling and capacity errors shared by the stub clients, with
+    # a count of every call and every injected error
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, throttle: float = 0.0, capacity: float = 0.0,
+                 retry_base: float = 1.0, seed: int = 0, sleep=time.sleep):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle = throttle
+        self.capacity = capacity
+        self.retry_base = retry_base
+        self.rng = random.Random(seed)
+        self.sleep = sleep
+        self.calls = {}
+        self.injected = {}
+        self.lock = threading.Lock()
+
+    def count(self, counts: dict, name: str):
+        with self.lock:
+            counts[name] = counts.get(name, 0) + 1
+
+    def draw(self) -> float:
+        with self.lock:
+            return self.rng.random()
+
+    def call(self, operation: str, scale: float = 1.0, throttle_code: str = 'Throttling',
+             capacity_code: str = None):
+        # One API call: `scale` times the base latency per attempt, throttled
+        # attempts retried until the SDK gives up
+        for attempt in range(1, SDK_ATTEMPTS + 1):
+            self.count(self.calls, operation)
+            delay = scale * (self.latency + self.jitter * self.draw())
+            if delay:
+                self.sleep(delay)
+            if self.draw() >= self.throttle:
+                break
+            self.count(self.injected, f'{operation}:{throttle_code}')
+            if attempt == SDK_ATTEMPTS:
+                raise client_error(throttle_code, operation)
+            self.sleep(self.draw() * min(SDK_BACKOFF_CAP, self.retry_base * 2 ** attempt))
+        if capacity_code and self.draw() < self.capacity:
+            self.count(self.injected, f'{operation}:{capacity_code}')
+            raise client_error(capacity_code, operation)
+
+
+class StubEc2Client:
+    def __init__(self, faults: Faults):
+        self.faults = faults
+        self.launched = 0
+        self.lock = threading.Lock()
+
+    def run_instances(self, **kwargs):
+        self.faults.call('RunInstances', 5, 'RequestLimitExceeded', 'InsufficientInstanceCapacity')
+        with self.lock:
+            self.launched += 1
+            number = self.launched
+        return {'Instances': [{
+            'InstanceId': f'i-{number:017x}',
+            'InstanceType': kwargs['InstanceType'],
+            'SubnetId': 'subnet-00000000',
+            'VpcId': 'vpc-00000000',
+            'PrivateIpAddress': '10.0.0.10'
+        }]}
+
+    def describe_images(self, **kwargs):
+        self.faults.call('DescribeImages', 10, 'RequestLimitExceeded')
+        return {'Images': [{'ImageId': 'ami-0abcdef1234567890', 'CreationDate': '2024-07-01T00:00:00.000Z'}]}
+
+    def terminate_instances(self, InstanceIds):
+        self.faults.call('TerminateInstances', 2, 'RequestLimitExceeded')
+        return {'TerminatingInstances': [{'InstanceId': i} for i in InstanceIds]}
+
+
+class StubSsmClient:
+    def __init__(self, faults: Faults, baked: bool = True):
+        self.faults = faults
+        self.baked = baked
+
+    def get_parameter(self, Name):
+        self.faults.call('GetParameter', 2, 'ThrottlingException')
+        if not self.baked and Name == worker.baked_image_parameter:
+            raise client_error('ParameterNotFound', 'GetParameter')
+        return {'Parameter': {'Name': Name, 'Value': 'ami-0abcdef1234567890'}}
+
+
+class StubS3Client:
+    # Job records, size hints and listings in memory; S3 throttles with SlowDown
+    def __init__(self, faults: Faults):
+        self.faults = faults
+        self.objects = {}
+
+    def get_object(self, Bucket, Key):
+        self.faults.call('GetObject', 1, 'SlowDown')
+        if Key not in self.objects:
+            raise client_error('NoSuchKey', 'GetObject')
+        return {'Body': io.BytesIO(self.objects[Key])}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.faults.call('PutObject', 1, 'SlowDown')
+        self.objects[Key] = Body
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Bucket, Prefix='', **kwargs):
+        self.faults.call('ListObjectsV2', 2, 'SlowDown')
+        yield {'Contents': [{'Key': k} for k in sorted(self.objects) if k.startswith(Prefix)]}
+
+
+class StubSqsClient:
+    def __init__(self, faults: Faults):
+        self.faults = faults
+        self.messages = []
+
+    def send_message(self, QueueUrl, MessageBody, DelaySeconds=0):
+        self.faults.call('SendMessage', 1, 'ThrottlingException')
+        self.messages.append(MessageBody)
+        return {'MessageId': str(len(self.messages))}
+
+
+def client_error(code: str, operation: str) -> ClientError:
+    return ClientError({'Error': {'Code': code, 'Message': 'Injected by the load test'}}, operation)
+
+def make_stubs(faults: Faults, baked: bool = True) -> dict:
+    return {
+        'ec2': StubEc2Client(faults),
+        'ssm': StubSsmClient(faults, baked),
+        's3': StubS3Client(faults),
+        'sqs': StubSqsClient(faults)
+    }
+
+def synthetic_events(count: int, customers: int = 50, invalid: float = 0.0, options: float = 0.2,
+                     sharded: float = 0.0, seed: int = 0) -> list:
+    # API Gateway events for run_scan: mostly plain launches of `customers`
+    # accounts, some with scan options or shards, some rejected by validation
+    rng = random.Random(seed)
+    events = []
+    for n in range(count):
+        customer = rng.randrange(customers)
+        params = {
+            'role_arn': f'arn:aws:iam::{100000000000 + customer}:role/CrossAccountRole',
+            'external_id': f'bench{customer:06d}',
+            'scan_name': f'Customer {customer}'
+        }
+        draw = rng.random()
+        if draw < invalid:
+            params = rng.choice([
+                None,
+                dict(params, external_id=''),
+                dict(params, role_arn='arn:aws:iam::1:user/someone'),
+                dict(params, regions='not a region')
+            ])
+        elif draw < invalid + sharded:
+            params['shards'] = str(rng.randint(2, 4))
+        elif draw < invalid + sharded + options:
+            params.update(regions='us-east-1,eu-west-1', severities='critical,high', delta='true')
+        events.append({'httpMethod': 'GET', 'path': '/scan', 'queryStringParameters': params})
+    return events
+
+@contextlib.contextmanager
+def patched_worker(stubs: dict, queued: bool = False):
+    # The stubs as worker's clients, restored afterwards; a cold AMI cache so
+    # the first requests pay the lookup like a fresh deployment would
+    saved = (worker.clients, worker.launch_queue_url, dict(worker.ami_cache))
+    worker.clients = dict(stubs)
+    worker.launch_queue_url = 'https://sqs.us-east-1.amazonaws.com/111111111111/bench' if queued else ''
+    worker.ami_cache.clear()
+    try:
+        yield
+    finally:
+        worker.clients, worker.launch_queue_url = saved[0], saved[1]
+        worker.ami_cache.clear()
+        worker.ami_cache.update(saved[2])
+
+def error_reason(response: dict) -> str:
+    # The AWS error code behind a failed launch, or the message up to its
+    # details
+    try:
+        body = json.loads(response.get('body') or '{}')
+    except ValueError:
+        return 'unparseable body'
+    message = body.get('message') or body.get('error') or ''
+    if response['statusCode'] == 400:
+        return 'validation'
+    match = ERROR_CODE.search(message)
+    return match.group(1) if match else message.split(':', 1)[0][:80]
+
+def invoke(event: dict, scheduled: float = None) -> dict:
+    # Latency runs from when the request was due, so time spent waiting for a
+    # free worker under an arrival rate counts against it
+    start = time.perf_counter()
+    response = worker.run_scan(event, None)
+    end = time.perf_counter()
+    sample = {'status': response['statusCode'], 'latency': end - (scheduled or start), 'service': end - start}
+    if response['statusCode'] >= 300:
+        sample['reason'] = error_reason(response)
+    return sample
+
+def run_load(events: list, concurrency: int = 10, rate: float = None, quiet: bool = True) -> tuple:
+    # ([sample per event], elapsed seconds); with `rate` requests arrive at
+    # that many per second, otherwise every worker sends back to back
+    begin = time.perf_counter()
+
+    def send(indexed):
+        n, event = indexed
+        scheduled = None
+        if rate:
+            scheduled = begin + n / rate
+            pause = scheduled - time.perf_counter()
+            if pause > 0:
+                time.sleep(pause)
+        return invoke(event, scheduled)
+
+    output = contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext()
+    with output, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(send, enumerate(events)))
+    return samples, time.perf_counter() - begin
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(samples: list, elapsed: float, faults: Faults = None) -> dict:
+    latencies = [s['latency'] for s in samples]
+    status, reasons = {}, {}
+    for sample in samples:
+        status[str(sample['status'])] = status.get(str(sample['status']), 0) + 1
+        if 'reason' in sample:
+            reasons[sample['reason']] = reasons.get(sample['reason'], 0) + 1
+    failed = sum(1 for s in samples if s['status'] >= 500)
+    summary = {
+        'requests': len(samples),
+        'elapsed': round(elapsed, 3),
+        'throughput': round(len(samples) / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'mean': round(statistics.mean(latencies) * 1000, 1),
+            'p50': round(percentile(latencies, 50) * 1000, 1),
+            'p90': round(percentile(latencies, 90) * 1000, 1),
+            'p95': round(percentile(latencies, 95) * 1000, 1),
+            'p99': round(percentile(latencies, 99) * 1000, 1),
+            'max': round(max(latencies) * 1000, 1)
+        } if latencies else {},
+        'status': dict(sorted(status.items())),
+        'error_rate': round(failed / len(samples), 4) if samples else 0,
+        'rejected_rate': round(status.get('400', 0) / len(samples), 4) if samples else 0,
+        'errors': dict(sorted(reasons.items(), key=lambda r: -r[1]))
+    }
+    if faults:
+        summary['api_calls'] = dict(sorted(faults.calls.items()))
+        summary['injected'] = dict(sorted(faults.injected.items()))
+    return summary
+
+def report(summary: dict):
+    latency = summary['latency_ms']
+    print(f'{summary["requests"]} requests in {summary["elapsed"]:.2f}s, {summary["throughput"]} req/s')
+    print(f'latency   mean={latency["mean"]}ms  p50={latency["p50"]}ms  p90={latency["p90"]}ms  '
+          f'p95={latency["p95"]}ms  p99={latency["p99"]}ms  max={latency["max"]}ms')
+    print(f'status    {"  ".join(f"{code}={n}" for code, n in summary["status"].items())}')
+    print(f'errors    {summary["error_rate"]:.2%} failed, {summary["rejected_rate"]:.2%} rejected')
+    for reason, n in summary['errors'].items():
+        print(f'  {n:>6}  {reason}')
+    if summary.get('api_calls'):
+        print(f'api calls {"  ".join(f"{op}={n}" for op, n in summary["api_calls"].items())}')
+    if summary.get('injected'):
+        print(f'injected  {"  ".join(f"{op}={n}" for op, n in summary["injected"].items())}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test run_scan against stub AWS clients.')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=10, help='Concurrent Lambda environments')
+    parser.add_argument('--rate', type=float, help='Arrivals per second, instead of back to back requests')
+    parser.add_argument('--customers', type=int, default=50)
+    parser.add_argument('--invalid', type=float, default=0.05, help='Share of requests that fail validation')
+    parser.add_argument('--options', type=float, default=0.2, help='Share of requests with scan options and delta')
+    parser.add_argument('--sharded', type=float, default=0.0, help='Share of requests asking for 2-4 shards')
+    parser.add_argument('--latency', type=float, default=0.02, help='Base API latency (seconds), RunInstances is 5x')
+    parser.add_argument('--jitter', type=float, default=0.01, help='Random extra latency per call (seconds)')
+    parser.add_argument('--throttle', type=float, default=0.0, help='Chance each API attempt is throttled')
+    parser.add_argument('--capacity', type=float, default=0.0,
+                        help='Chance a RunInstances call fails with InsufficientInstanceCapacity')
+    parser.add_argument('--retry-base', type=float, default=1.0,
+                        help='SDK backoff base (seconds); smaller values compress a throttled run')
+    parser.add_argument('--no-baked-image', action='store_true', help='Resolve the Ubuntu AMI instead')
+    parser.add_argument('--queued', action='store_true', help='Enqueue launches for the dispatcher instead')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='Also write the summary to this file')
+    args = parser.parse_args()
+
+    faults = Faults(args.latency, args.jitter, args.throttle, args.capacity, args.retry_base, args.seed)
+    events = synthetic_events(args.requests, args.customers, args.invalid, args.options, args.sharded, args.seed)
+    with patched_worker(make_stubs(faults, not args.no_baked_image), args.queued):
+        samples, elapsed = run_load(events, args.concurrency, args.rate)
+    summary = summarize(samples, elapsed, faults)
+    report(summary)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=1)
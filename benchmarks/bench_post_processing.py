@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+# Times each post-processing stage the scanner instance runs after Prowler,
+# over synthetic scans (see synthetic_csv.py) at one or more scales: merging
+# regional CSVs, the trend diff against the previous scan, a delta merge, the
+# UI data file, the catalog entry and the parquet conversion. Same scale and
+# seed, same input bytes, so runs are comparable across commits.
+#
+#   python benchmarks/bench_post_processing.py --scales small medium large --repeat 3
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'functions'))
+
+from catalog import build_entry  # noqa: E402
+from delta import merge_delta_files  # noqa: E402
+from findings import SERVICE_NAME, read_findings, write_findings  # noqa: E402
+from merge_csv import merge_findings  # noqa: E402
+from synthetic_csv import SCALES, account_id, generate_history, regional_files  # noqa: E402
+from trends import diff_scans, severity_counts  # noqa: E402
+from ui_data import compile_file  # noqa: E402
+
+# Services a delta scan re-runs in the delta merge stage
+DELTA_SERVICES = {'ec2', 'vpc', 's3'}
+
+
+def delta_run(path: str, out: str, services: set) -> str:
+    # The current scan narrowed to the rescanned services, as a delta run
+    # writes it
+    header, rows = read_findings(path)
+    position = header.index(SERVICE_NAME)
+    write_findings(out, header, (row for row in rows if row[position] in services))
+    return out
+
+def stages(directory: str, previous: str, current: str, object_key: str) -> dict:
+    # name -> zero-argument callable running that stage once
+    regional = os.path.join(directory, 'regional')
+    os.makedirs(regional, exist_ok=True)
+    parts = regional_files(current, regional)
+    delta_path = delta_run(current, os.path.join(directory, 'delta.csv'), DELTA_SERVICES)
+    result = {
+        'merge_regions': lambda: merge_findings(parts, os.path.join(directory, 'merged.csv')),
+        'trend_diff': lambda: diff_scans(previous, current),
+        'severity_counts': lambda: severity_counts(current),
+        'delta_merge': lambda: merge_delta_files(previous, delta_path, DELTA_SERVICES,
+                                                 os.path.join(directory, 'delta-merged.csv')),
+        'ui_data': lambda: compile_file(current, os.path.join(directory, 'ui.json.gz')),
+        'catalog_entry': lambda: build_entry(object_key, 'Benchmark', current)
+    }
+    try:
+        from columnar import convert
+    except ImportError:
+        print('pyarrow is not installed, skipping the parquet stage')
+    else:
+        result['parquet'] = lambda: convert(current, os.path.join(directory, 'parquet'), object_key)
+    return result
+
+def best_of(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def run(scale: str, rows: int, repeat: int, seed: int, directory: str) -> dict:
+    os.makedirs(directory, exist_ok=True)
+    start = time.perf_counter()
+    (_, previous), (object_key, current) = generate_history(directory, 'Benchmark', account_id(0), rows, 2, seed)
+    generated = time.perf_counter() - start
+    print(f'{scale}: {rows} findings per scan, {os.path.getsize(current) / 1e6:.1f} MB, generated in '
+          f'{generated:.1f}s')
+    results = {}
+    for name, fn in stages(directory, previous, current, object_key).items():
+        results[name] = best_of(fn, repeat)
+        print(f'  {name:<16} {results[name] * 1000:10.1f} ms  {rows / results[name]:12,.0f} rows/s')
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the post-processing stages over synthetic scans.')
+    parser.add_argument('--scales', nargs='+', choices=SCALES, default=['small', 'medium'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keep', help='Write the scans here and keep them instead of a temporary directory')
+    args = parser.parse_args()
+
+    directory = args.keep or tempfile.mkdtemp(prefix='prowler-post-')
+    try:
+        for scale in args.scales:
+            run(scale, SCALES[scale], args.repeat, args.seed, os.path.join(directory, scale))
+    finally:
+        if not args.keep:
+            shutil.rmtree(directory)
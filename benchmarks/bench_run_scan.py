@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+# Measures run_scan latency against stubbed AWS clients, comparing the
+# original describe_images-per-request AMI lookup with the cached lookup.
+#
+#   python benchmarks/bench_run_scan.py --requests 200 --describe-latency 0.5
+
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'functions'))
+
+import worker  # noqa: E402
+
+
+class StubEc2Client:
+    def __init__(self, describe_latency, launch_latency, image_count=2000):
+        self.describe_latency = describe_latency
+        self.launch_latency = launch_latency
+        self.images = [
+            {'ImageId': f'ami-{i:08x}', 'CreationDate': f'2024-{1 + i % 12:02d}-{1 + i % 28:02d}T00:00:00.000Z'}
+            for i in range(image_count)
+        ]
+
+    def describe_images(self, **kwargs):
+        time.sleep(self.describe_latency)
+        return {'Images': list(self.images)}
+
+    def run_instances(self, **kwargs):
+        time.sleep(self.launch_latency)
+        return {'Instances': [{
+            'InstanceId': 'i-0123456789abcdef0',
+            'InstanceType': kwargs['InstanceType'],
+            'SubnetId': 'subnet-00000000',
+            'VpcId': 'vpc-00000000',
+            'PrivateIpAddress': '10.0.0.10'
+        }]}
+
+
+class StubSsmClient:
+    def __init__(self, latency, available=True):
+        self.latency = latency
+        self.available = available
+
+    def get_parameter(self, Name):
+        time.sleep(self.latency)
+        if not self.available:
+            raise Exception('ParameterNotFound')
+        return {'Parameter': {'Name': Name, 'Value': 'ami-0abcdef1234567890'}}
+
+
+class StubS3Client:
+    # Job records and size hints; no hint exists, so every scan uses the defaults
+    def __init__(self, latency=0.01):
+        self.latency = latency
+        self.objects = {}
+
+    def get_object(self, Bucket, Key):
+        time.sleep(self.latency)
+        if Key not in self.objects:
+            error = Exception('NoSuchKey')
+            error.response = {'Error': {'Code': 'NoSuchKey'}}
+            raise error
+        return {'Body': io.BytesIO(self.objects[Key])}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        time.sleep(self.latency)
+        self.objects[Key] = Body
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def measure(requests):
+    event = {'queryStringParameters': {
+        'role_arn': 'arn:aws:iam::111111111111:role/CrossAccountRole',
+        'external_id': 'bench12345',
+        'scan_name': 'Benchmark'
+    }}
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = worker.run_scan(event, None)
+        samples.append(time.perf_counter() - start)
+        assert response['statusCode'] == 200, response
+    return samples
+
+def report(label, samples):
+    print(f'{label:<10} p50={percentile(samples, 50) * 1000:8.1f}ms  '
+          f'p99={percentile(samples, 99) * 1000:8.1f}ms  '
+          f'mean={statistics.mean(samples) * 1000:8.1f}ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark run_scan latency against stubbed AWS clients.')
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--describe-latency', type=float, default=0.5, help='Simulated describe_images latency (seconds)')
+    parser.add_argument('--ssm-latency', type=float, default=0.02, help='Simulated ssm get_parameter latency (seconds)')
+    parser.add_argument('--launch-latency', type=float, default=0.05, help='Simulated run_instances latency (seconds)')
+    args = parser.parse_args()
+
+    worker.clients['ec2'] = StubEc2Client(args.describe_latency, args.launch_latency)
+    worker.clients['s3'] = StubS3Client()
+
+    # Before: no cache and no SSM parameter, every request sweeps describe_images
+    worker.clients['ssm'] = StubSsmClient(args.ssm_latency, available=False)
+    worker.ami_cache_ttl = 0
+    worker.ami_cache.clear()
+    before = measure(args.requests)
+
+    # After: SSM parameter lookup on a cold cache, cached for warm invocations
+    worker.clients['ssm'] = StubSsmClient(args.ssm_latency)
+    worker.ami_cache_ttl = 3600
+    worker.ami_cache.clear()
+    after = measure(args.requests)
+
+    report('before', before)
+    report('after', after)
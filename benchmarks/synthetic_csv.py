@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+# Deterministic synthetic Prowler v4 CSVs, so the post-processing stages
+# (merge, trends, delta, UI data, catalog, parquet) can be benchmarked at any
+# scale without an AWS account. Each account has a fixed inventory of findings
+# (check, region, resource) drawn from the seed; every scan of it re-rolls the
+# status of a `drift` share of them, so successive scans have new, resolved
+# and persisting failures to find. The same arguments always write the same
+# bytes.
+#
+#   python benchmarks/synthetic_csv.py --scale medium --scans 3 --out /tmp/corpus
+#   python benchmarks/synthetic_csv.py --rows 250000 --accounts 20 --regional --out /tmp/corpus
+
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'functions'))
+
+from findings import REGION, SERVICE_NAME, column_index, open_reader, write_findings  # noqa: E402
+
+
+# Prowler v4's CSV columns, in its order
+HEADER = [
+    'AUTH_METHOD', 'TIMESTAMP', 'ACCOUNT_UID', 'ACCOUNT_NAME', 'ACCOUNT_EMAIL', 'ACCOUNT_ORGANIZATION_UID',
+    'ACCOUNT_ORGANIZATION_NAME', 'ACCOUNT_TAGS', 'FINDING_UID', 'PROVIDER', 'CHECK_ID', 'CHECK_TITLE', 'CHECK_TYPE',
+    'STATUS', 'STATUS_EXTENDED', 'MUTED', 'SERVICE_NAME', 'SUBSERVICE_NAME', 'SEVERITY', 'RESOURCE_TYPE',
+    'RESOURCE_UID', 'RESOURCE_NAME', 'RESOURCE_DETAILS', 'RESOURCE_TAGS', 'PARTITION', 'REGION', 'DESCRIPTION',
+    'RISK', 'RELATED_URL', 'REMEDIATION_RECOMMENDATION_TEXT', 'REMEDIATION_RECOMMENDATION_URL',
+    'REMEDIATION_CODE_NATIVEIAC', 'REMEDIATION_CODE_TERRAFORM', 'REMEDIATION_CODE_CLI', 'REMEDIATION_CODE_OTHER',
+    'COMPLIANCE', 'CATEGORIES', 'DEPENDS_ON', 'RELATED_TO', 'NOTES', 'PROWLER_VERSION'
+]
+# Findings per scan
+SCALES = {
+    'small': 2000,
+    'medium': 50000,
+    'large': 500000,
+    'xlarge': 2000000
+}
+# Service -> resource type; global services report from one region, and
+# again from every region when the scan runs a Prowler per region
+SERVICES = {
+    'iam': 'AwsIamRole',
+    's3': 'AwsS3Bucket',
+    'ec2': 'AwsEc2Instance',
+    'vpc': 'AwsEc2Vpc',
+    'rds': 'AwsRdsDbInstance',
+    'cloudtrail': 'AwsCloudTrailTrail',
+    'cloudwatch': 'AwsCloudWatchAlarm',
+    'kms': 'AwsKmsKey',
+    'awslambda': 'AwsLambdaFunction',
+    'guardduty': 'AwsGuardDutyDetector',
+    'config': 'AwsConfigRecorder',
+    'sns': 'AwsSnsTopic'
+}
+GLOBAL_SERVICES = ('iam',)
+GLOBAL_REGION = 'us-east-1'
+# Heavier services hold more of the findings, as in a real account
+SERVICE_WEIGHTS = {'ec2': 8, 'iam': 6, 's3': 5, 'vpc': 4, 'cloudwatch': 3, 'rds': 2, 'awslambda': 2}
+REGIONS = ['us-east-1', 'us-east-2', 'us-west-1', 'us-west-2', 'eu-west-1', 'eu-central-1', 'ap-southeast-2',
+           'ap-northeast-1']
+SEVERITIES = ['critical', 'high', 'medium', 'low', 'informational']
+CHECKS_PER_SERVICE = 25
+TARGET_CHECK = 'iam_root_mfa_enabled'
+FAIL_RATIO = 0.35
+DRIFT = 0.05
+START_TS = 1721159874
+PROWLER_VERSION = '4.2.4'
+
+
+def check_catalog() -> list:
+    # Check metadata repeats across findings like Prowler's does, the
+    # per-finding columns are filled in per row
+    checks = []
+    for service in SERVICES:
+        for i in range(CHECKS_PER_SERVICE):
+            check_id = TARGET_CHECK if (service, i) == ('iam', 0) else f'{service}_check_{i:02d}'
+            checks.append({
+                'check_id': check_id,
+                'service': service,
+                'title': f'Ensure {service} resources pass {check_id}',
+                'severity': SEVERITIES[i % len(SEVERITIES)],
+                'description': f'Ensure {service} resources follow best practice. ' * 4,
+                'risk': 'Misconfiguration may expose data or allow unauthorized access. ' * 3,
+                'remediation': f'Follow the {service} remediation guide. ' * 4,
+                'url': f'https://docs.aws.amazon.com/{service}/latest/userguide/{check_id}.html',
+                'compliance': f'CIS-2.0: {1 + i % 5}.{i}|SOC2: cc_{i % 9}_1|ISO27001: A.{5 + i % 12}'
+            })
+    return checks
+
+CHECKS = check_catalog()
+
+
+def account_id(n: int) -> str:
+    return f'{100000000000 + n}'
+
+def inventory(account: str, rows: int, seed: int = 0) -> list:
+    # The account's findings as (check, region, resource number, fails by
+    # default), identical for every scan of it
+    rng = random.Random(f'{seed}:{account}')
+    weights = [SERVICE_WEIGHTS.get(c['service'], 1) for c in CHECKS]
+    findings = []
+    for i, check in enumerate(rng.choices(CHECKS, weights, k=rows)):
+        region = GLOBAL_REGION if check['service'] in GLOBAL_SERVICES else rng.choice(REGIONS)
+        findings.append((check, region, i, rng.random() < FAIL_RATIO))
+    return findings
+
+def scan_rows(account: str, account_name: str, findings: list, ts: int, scan_index: int = 0, seed: int = 0,
+              drift: float = DRIFT):
+    # Rows of scan `scan_index`; every scan after the first re-rolls the
+    # status of a `drift` share of the inventory
+    rng = random.Random(f'{seed}:{account}:{scan_index}')
+    timestamp = datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    for check, region, i, failing in findings:
+        if scan_index and rng.random() < drift:
+            failing = rng.random() < FAIL_RATIO
+        service = check['service']
+        resource = f'arn:aws:{service}:{region}:{account}:resource/{service}-{i}'
+        status = 'FAIL' if failing else 'PASS'
+        yield [
+            'profile', timestamp, account, account_name, f'{account_name.lower()}@example.com', 'o-abcdef1234',
+            'Example Org', '', f'prowler-aws-{check["check_id"]}-{account}-{region}-{service}-{i}', 'aws',
+            check['check_id'], check['title'], 'Software and Configuration Checks', status,
+            f'{resource} {"is not" if failing else "is"} compliant with {check["check_id"]}.', 'False', service, '',
+            check['severity'], SERVICES[service], resource, f'{service}-{i}', '', '', 'aws', region,
+            check['description'], check['risk'], check['url'], check['remediation'], check['url'], '', '', '', '',
+            check['compliance'], 'security', '', '', '', PROWLER_VERSION
+        ]
+
+def write_scan(path: str, account: str, rows: int, ts: int = START_TS, scan_index: int = 0, seed: int = 0,
+               drift: float = DRIFT, account_name: str = None) -> int:
+    findings = inventory(account, rows, seed)
+    return write_findings(path, HEADER, scan_rows(account, account_name or f'customer{account[-4:]}', findings, ts,
+                                                  scan_index, seed, drift))
+
+def generate_history(directory: str, scan_name: str, account: str, rows: int, scans: int, seed: int = 0,
+                     drift: float = DRIFT, start_ts: int = START_TS, interval: int = 86400) -> list:
+    # [(object key, path)] of `scans` successive scans of one account, oldest
+    # first, named like the scanner's own output
+    findings = inventory(account, rows, seed)
+    slug = scan_name.replace(' ', '-')
+    paths = []
+    for n in range(scans):
+        ts = start_ts + n * interval
+        object_key = f'{slug}-{ts}'
+        path = os.path.join(directory, f'{object_key}.csv')
+        write_findings(path, HEADER, scan_rows(account, scan_name, findings, ts, n, seed, drift))
+        paths.append((object_key, path))
+    return paths
+
+def generate_corpus(directory: str, rows: int, scans: int, seed: int = 0) -> list:
+    # One scan each of `scans` accounts sharing `rows` findings, spread over a
+    # month of scan dates
+    paths = []
+    for n in range(scans):
+        account = account_id(n)
+        object_key = f'customer{n}-{START_TS + (n % 30) * 86400}'
+        path = os.path.join(directory, f'{object_key}.csv')
+        write_scan(path, account, rows // scans, int(object_key.rsplit('-', 1)[-1]), seed=seed,
+                   account_name=f'customer{n}')
+        paths.append((object_key, path))
+    return paths
+
+def regional_files(path: str, directory: str) -> list:
+    # Splits a scan into the per-region CSVs a region-parallel scan uploads,
+    # global services' findings repeated in every region's file as Prowler
+    # reports them, for benchmarking the merge
+    f, reader = open_reader(path)
+    with f:
+        header = next(reader)
+        index = column_index(header)
+        region, service = index[REGION], index[SERVICE_NAME]
+        by_region, shared = {r: [] for r in REGIONS}, []
+        for row in reader:
+            (shared if row[service] in GLOBAL_SERVICES else by_region[row[region]]).append(row)
+    base = os.path.splitext(os.path.basename(path))[0]
+    paths = []
+    for name, rows in by_region.items():
+        out = os.path.join(directory, f'{base}-{name}.csv')
+        write_findings(out, header, shared + rows)
+        paths.append(out)
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write deterministic synthetic Prowler CSVs.')
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument('--scale', choices=SCALES, default='small', help='Findings per scan')
+    size.add_argument('--rows', type=int, help='Findings per scan, instead of a scale')
+    parser.add_argument('--accounts', type=int, default=1)
+    parser.add_argument('--scans', type=int, default=1, help='Successive scans per account')
+    parser.add_argument('--drift', type=float, default=DRIFT, help='Share of findings re-rolled between scans')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--regional', action='store_true', help="Also split each account's latest scan by region")
+    parser.add_argument('--out', required=True)
+    args = parser.parse_args()
+
+    rows = args.rows or SCALES[args.scale]
+    os.makedirs(args.out, exist_ok=True)
+    for n in range(args.accounts):
+        history = generate_history(args.out, f'customer{n}', account_id(n), rows, args.scans, args.seed, args.drift)
+        for object_key, path in history:
+            print(f'{path} ({rows} findings, {os.path.getsize(path) / 1e6:.1f} MB)')
+        if args.regional:
+            regional = os.path.join(args.out, 'regional')
+            os.makedirs(regional, exist_ok=True)
+            print(f'{len(regional_files(history[-1][1], regional))} regional files in {regional}')
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+import argparse
+from datetime import datetime
+
+import boto3
+
+import config
+from functions.user_data import render_bake_script
+from render_cft import get_stack_outputs
+
+
+UBUNTU_PARAMETER = '/aws/service/canonical/ubuntu/server/22.04/stable/current/amd64/hvm/ebs-gp2/ami-id'
+
+
+def build_image(prowler_version: str, instance_type: str, outputs: dict) -> str:
+    ec2_client = boto3.client('ec2')
+    ssm_client = boto3.client('ssm')
+    ts = str(int(datetime.utcnow().timestamp()))
+
+    base_ami = ssm_client.get_parameter(Name=UBUNTU_PARAMETER)['Parameter']['Value']
+    response = ec2_client.run_instances(
+        ImageId=base_ami,
+        InstanceType=instance_type,
+        SubnetId=outputs['ScannerSubnetId'],
+        SecurityGroupIds=[outputs['ScannerSecurityGroupId']],
+        MaxCount=1,
+        MinCount=1,
+        IamInstanceProfile={
+            'Arn': outputs['ScannerInstanceProfileArn']
+        },
+        InstanceInitiatedShutdownBehavior='stop',
+        UserData=render_bake_script(prowler_version),
+        TagSpecifications=[
+            {
+                'ResourceType': 'instance',
+                'Tags': [
+                    {'Key': 'Name', 'Value': f'prowler-scanner-builder-{prowler_version}'},
+                    {'Key': 'Role', 'Value': 'ProwlerScannerBuilder'},
+                    {'Key': 'ProwlerVersion', 'Value': prowler_version}
+                ]
+            }
+        ]
+    )
+    instance_id = response['Instances'][0]['InstanceId']
+    print(f'[+] Launched builder instance {instance_id} from {base_ami}, waiting for it to stop')
+
+    # The builder is terminated whether or not the bake succeeds
+    try:
+        # The bake script powers the instance off once every tool is installed
+        ec2_client.get_waiter('instance_stopped').wait(
+            InstanceIds=[instance_id],
+            WaiterConfig={'Delay': 30, 'MaxAttempts': 120}
+        )
+
+        image = ec2_client.create_image(
+            InstanceId=instance_id,
+            Name=f'prowler-scanner-{prowler_version}-{ts}',
+            Description=f'Prowler {prowler_version} scanner with prowler-ui pre-installed',
+            TagSpecifications=[
+                {
+                    'ResourceType': 'image',
+                    'Tags': [
+                        {'Key': 'Role', 'Value': 'ProwlerScanner'},
+                        {'Key': 'ProwlerVersion', 'Value': prowler_version}
+                    ]
+                }
+            ]
+        )
+        image_id = image['ImageId']
+        print(f'[+] Creating image {image_id}, waiting for it to become available')
+        ec2_client.get_waiter('image_available').wait(
+            ImageIds=[image_id],
+            WaiterConfig={'Delay': 30, 'MaxAttempts': 120}
+        )
+    finally:
+        ec2_client.terminate_instances(InstanceIds=[instance_id])
+        print(f'[+] Terminated builder instance {instance_id}')
+
+    # Publish the image where the RunScan function looks it up
+    parameter = f'/prowler-scanner/ami/{prowler_version}'
+    ssm_client.put_parameter(
+        Name=parameter,
+        Value=image_id,
+        Type='String',
+        DataType='aws:ec2:image',
+        Overwrite=True
+    )
+    print(f'[+] Published {image_id} to SSM parameter {parameter}')
+    return image_id
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bake a scanner image with Prowler and prowler-ui pre-installed.')
+    parser.add_argument('--prowler-version', default=config.prowler_version)
+    parser.add_argument('--instance-type', default=config.instance_type)
+    parser.add_argument('--stack-name', default='ProwlerScannerStack')
+    args = parser.parse_args()
+
+    outputs = get_stack_outputs(args.stack_name)
+    build_image(args.prowler_version, args.instance_type, outputs)
@@ -1,5 +1,35 @@
 prowler_version = '4.2.4'
 instance_type = 't2.medium'
+instance_types = ['t2.medium', 't3.medium', 't3a.medium']  # launch priority, used when there's no previous scan to size from
+# Instance types by the previous scan's size, as [max_duration_seconds, max_findings, [types]] with None for no
+# limit; empty runs instance_types one size up per tier (up to 2h/5,000 findings, 6h/50,000, then anything)
+size_tiers = []
+use_spot = False
 team_name = 'AcmeCorp'
 webhook_url = 'https://hooks.zapier.com/hooks/catch/zzzzzz/xxxxx'
-template_bucket = 'yourteam-scan-source-bucket'
\ No newline at end of file
+template_bucket = 'yourteam-scan-source-bucket'
+ami_cache_ttl = 3600
+batch_concurrency = 8
+max_batch_size = 100
+packed_concurrency = 4
+packed_max_accounts = 20
+region_parallelism = 0
+stream_interval = 60
+delta_scans = False
+delta_full_scan_every = 7  # run a full scan after this many delta scans in a row, 0 never forces one
+ui_version = ''  # prowler-ui git ref published by publish_ui.py, empty builds the UI on every scanner
+artifact_store = False  # store scan artifacts gzipped and deduplicated under blobs/ with a manifest per scan
+severities = ['critical', 'high', 'medium']
+compliance = []  # default frameworks, i.e. ['cis_2.0_aws', 'soc2_aws']
+output_formats = ['csv']  # csv is always produced; json-ocsf, json-asff and html can be added
+lambda_runtime = 'python3.12'
+lambda_memory = 512  # MB, also scales the CPU available to cold starts
+queue_launches = False  # queue launches through SQS and start them while fewer than max_in_flight scanners run
+max_in_flight = 20
+launch_attempts = 20  # throttled or capacity-starved launches of a queued scan before it's failed; waiting for a slot doesn't count
+phase_budgets = {'bootstrap': 3600, 'scanning': 43200, 'merging': 43200, 'building_ui': 3600, 'uploading': 3600}  # seconds before the watchdog stops the instance
+stall_timeout = 1800  # seconds without scan output or log growth before the watchdog stops the instance, 0 disables
+emf_metrics = False  # also send scan phase timings to CloudWatch as embedded metric format records
+shards = 1  # instances per scan, split by service; scans can override it with the shards parameter (up to 8)
+shard_timeout = 36000  # seconds shard 0 waits for the other shards before merging without them
+credential_broker = False  # assume the scanned account's role once per instance and share the session with every Prowler process
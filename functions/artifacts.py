@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+# Content-addressed, compressed storage for scan artifacts. Each file is
+# stored once under blobs/sha256/ (gzipped with a Content-Encoding header
+# unless it is already compressed) and artifacts/{object_key}.json lists the
+# files of a scan, so identical site bundles and the CSV copy inside the site
+# cost nothing after the first upload. unpack() rebuilds the original layout:
+# {object_key}/ (the site, or {object_key}.zip with --zip), {object_key}.csv
+# and the cloud-init log.
+#
+#   artifacts.py pack --bucket B --object-key acme-1721159874 --site build --file acme-1721159874.csv=/opt/acme-1721159874.csv
+#   artifacts.py unpack --bucket B --object-key acme-1721159874 --out . --zip
+#   artifacts.py fetch --bucket B --object-key acme-1721159874 --path acme-1721159874.csv --out previous.csv
+
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import time
+import zipfile
+
+from botocore.exceptions import ClientError
+
+
+FORMAT_VERSION = 1
+BLOB_PREFIX = 'blobs/sha256/'
+MANIFEST_PREFIX = 'artifacts/'
+
+# Already compressed, gzipping again only costs CPU
+STORED_EXTENSIONS = ('.gz', '.zip', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.woff', '.woff2', '.parquet')
+
+
+def blob_key(digest: str) -> str:
+    return f'{BLOB_PREFIX}{digest[:2]}/{digest}'
+
+def manifest_key(object_key: str) -> str:
+    return f'{MANIFEST_PREFIX}{object_key}.json'
+
+def is_missing(e: ClientError) -> bool:
+    return e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound')
+
+def blob_exists(s3_client, bucket: str, key: str) -> bool:
+    try:
+        s3_client.head_object(Bucket=bucket, Key=key)
+        return True
+    except ClientError as e:
+        if is_missing(e):
+            return False
+        raise
+
+def site_files(site_dir: str, prefix: str) -> dict:
+    # {path in the manifest: local path} for every file under site_dir
+    files = {}
+    for root, _, names in os.walk(site_dir):
+        for name in names:
+            local = os.path.join(root, name)
+            files[f'{prefix}/' + os.path.relpath(local, site_dir).replace(os.sep, '/')] = local
+    return files
+
+def load_manifest(s3_client, bucket: str, object_key: str) -> dict:
+    try:
+        body = s3_client.get_object(Bucket=bucket, Key=manifest_key(object_key))['Body'].read()
+    except ClientError as e:
+        if is_missing(e):
+            return None
+        raise
+    return json.loads(body)
+
+def pack(s3_client, bucket: str, object_key: str, files: dict, append: bool = False, now=None) -> dict:
+    # Uploads the blobs the bucket does not have yet, then the manifest. With
+    # append the files are added to an existing manifest (e.g. the log).
+    manifest = load_manifest(s3_client, bucket, object_key) if append else None
+    entries = {e['path']: e for e in (manifest or {}).get('files', [])}
+    uploaded = 0
+    for path in sorted(files):
+        with open(files[path], 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        key = blob_key(digest)
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        encoding = None if path.lower().endswith(STORED_EXTENSIONS) else 'gzip'
+        if not blob_exists(s3_client, bucket, key):
+            body = gzip.compress(data, compresslevel=9, mtime=0) if encoding else data
+            extra = {'ContentEncoding': encoding} if encoding else {}
+            s3_client.put_object(Bucket=bucket, Key=key, Body=body, ContentType=content_type, **extra)
+            uploaded += len(body)
+        entries[path] = {
+            'path': path,
+            'sha256': digest,
+            'size': len(data),
+            'encoding': encoding,
+            'content_type': content_type
+        }
+    manifest = {
+        'version': FORMAT_VERSION,
+        'object_key': object_key,
+        'created': (manifest or {}).get('created') or int(now if now is not None else time.time()),
+        'files': [entries[p] for p in sorted(entries)],
+        'size': sum(e['size'] for e in entries.values()),
+        'uploaded': (manifest or {}).get('uploaded', 0) + uploaded
+    }
+    s3_client.put_object(Bucket=bucket, Key=manifest_key(object_key), Body=json.dumps(manifest, indent=1).encode(),
+                         ContentType='application/json')
+    return manifest
+
+def read_blob(s3_client, bucket: str, entry: dict) -> bytes:
+    body = s3_client.get_object(Bucket=bucket, Key=blob_key(entry['sha256']))['Body'].read()
+    data = gzip.decompress(body) if entry.get('encoding') == 'gzip' else body
+    if hashlib.sha256(data).hexdigest() != entry['sha256']:
+        raise ValueError(f'Blob for {entry["path"]} does not match its hash')
+    return data
+
+def write_file(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def unpack(s3_client, bucket: str, object_key: str, out_dir: str, as_zip: bool = False) -> list:
+    manifest = load_manifest(s3_client, bucket, object_key)
+    if manifest is None:
+        raise FileNotFoundError(f'No manifest for {object_key}')
+    written = []
+    for entry in manifest['files']:
+        path = os.path.normpath(os.path.join(out_dir, entry['path']))
+        if not path.startswith(os.path.normpath(out_dir) + os.sep):
+            raise ValueError(f'Refusing to write {entry["path"]} outside {out_dir}')
+        write_file(path, read_blob(s3_client, bucket, entry))
+        written.append(path)
+
+    site_dir = os.path.join(out_dir, object_key)
+    if as_zip and os.path.isdir(site_dir):
+        # Same archive the scanners used to upload, `zip -qr {key}.zip {key}`
+        archive = os.path.join(out_dir, f'{object_key}.zip')
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as z:
+            for path in sorted(p for p in written if p.startswith(site_dir + os.sep)):
+                z.write(path, os.path.relpath(path, out_dir))
+        shutil.rmtree(site_dir)
+        written = [p for p in written if not p.startswith(site_dir + os.sep)] + [archive]
+    return written
+
+def fetch(s3_client, bucket: str, object_key: str, path: str, out: str):
+    # One file of a scan, from its manifest or, for scans stored before the
+    # manifest layout, from the plain object at `path`
+    manifest = load_manifest(s3_client, bucket, object_key)
+    if manifest is None:
+        write_file(out, s3_client.get_object(Bucket=bucket, Key=path)['Body'].read())
+        return
+    for entry in manifest['files']:
+        if entry['path'] == path:
+            write_file(out, read_blob(s3_client, bucket, entry))
+            return
+    raise FileNotFoundError(f'{path} is not in the manifest for {object_key}')
+
+
+if __name__ == '__main__':
+    import boto3
+
+    parser = argparse.ArgumentParser(description='Pack and unpack content-addressed scan artifacts.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name in ('pack', 'unpack', 'fetch'):
+        sub = subparsers.add_parser(name)
+        sub.add_argument('--bucket', required=True)
+        sub.add_argument('--object-key', required=True)
+    subparsers.choices['pack'].add_argument('--site', help='Site directory, stored under {object_key}/')
+    subparsers.choices['pack'].add_argument('--file', action='append', default=[], help='PATH=LOCAL_FILE (repeatable)')
+    subparsers.choices['pack'].add_argument('--append', action='store_true', help='Add to the existing manifest')
+    subparsers.choices['unpack'].add_argument('--out', default='.')
+    subparsers.choices['unpack'].add_argument('--zip', action='store_true', help='Archive the site as {object_key}.zip')
+    subparsers.choices['fetch'].add_argument('--path', required=True)
+    subparsers.choices['fetch'].add_argument('--out', required=True)
+    args = parser.parse_args()
+
+    s3_client = boto3.client('s3')
+    if args.command == 'pack':
+        files = site_files(args.site, args.object_key) if args.site else {}
+        files.update(dict(f.split('=', 1) for f in args.file))
+        manifest = pack(s3_client, args.bucket, args.object_key, files, args.append)
+        print(f'[+] Packed {len(manifest["files"])} files ({manifest["size"]} bytes), '
+              f'uploaded {manifest["uploaded"]} bytes to s3://{args.bucket}/{manifest_key(args.object_key)}')
+    elif args.command == 'unpack':
+        for path in unpack(s3_client, args.bucket, args.object_key, args.out, args.zip):
+            print(path)
+    else:
+        fetch(s3_client, args.bucket, args.object_key, args.path, args.out)
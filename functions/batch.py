@@ -0,0 +1,157 @@
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+
+ROLE_ARN_PATTERN = re.compile(r'^arn:aws[a-z-]*:iam::\d{12}:role/[\w+=,.@/-]{1,512}$')
+EXTERNAL_ID_PATTERN = re.compile(r'^[\w+=,.@:/-]{2,1224}$')
+SCAN_NAME_PATTERN = re.compile(r'^[A-Za-z0-9 _.-]{1,64}$')
+REGION_PATTERN = re.compile(r'^[a-z]{2}(-gov|-iso[a-z]?)?-[a-z]+-\d$')
+MAX_REGION_PARALLELISM = 32
+MAX_SHARDS = 8
+
+# Prowler v4 scan settings. CSV output is always produced since the rest of
+# the pipeline (UI data, trends, parquet) reads it.
+SEVERITIES = ('critical', 'high', 'medium', 'low', 'informational')
+DEFAULT_SEVERITIES = ['critical', 'high', 'medium']
+OUTPUT_FORMATS = ('csv', 'json-ocsf', 'json-asff', 'html')
+COMPLIANCE_PATTERN = re.compile(r'^[a-z0-9][a-z0-9_.-]{0,79}_aws$')
+MAX_COMPLIANCE_FRAMEWORKS = 10
+
+
+def validate_target(target) -> list:
+    if not isinstance(target, dict):
+        return ['target must be an object with `role_arn`, `external_id`, and `scan_name`']
+
+    errors = []
+    for field in ('role_arn', 'external_id', 'scan_name'):
+        if not target.get(field):
+            errors.append(f'`{field}` is required')
+        elif not isinstance(target[field], str):
+            errors.append(f'`{field}` must be a string')
+    if errors:
+        return errors
+
+    if not ROLE_ARN_PATTERN.match(target['role_arn']):
+        errors.append('`role_arn` must be an IAM role ARN, i.e. arn:aws:iam::111111111111:role/CrossAccountRole')
+    if not EXTERNAL_ID_PATTERN.match(target['external_id']):
+        errors.append('`external_id` must be 2-1224 characters of letters, digits and +=,.@:/-_')
+    if not SCAN_NAME_PATTERN.match(target['scan_name']):
+        errors.append('`scan_name` must be 1-64 characters of letters, digits, spaces and ._-')
+
+    # Optional scan settings
+    regions = parse_list(target.get('regions'))
+    if regions is None or not all(REGION_PATTERN.match(r) for r in regions):
+        errors.append('`regions` must be a list (or comma separated string) of region names, i.e. us-east-1')
+    parallelism = target.get('region_parallelism')
+    if parallelism not in (None, ''):
+        try:
+            valid = 0 <= int(parallelism) <= MAX_REGION_PARALLELISM
+        except (TypeError, ValueError):
+            valid = False
+        if not valid:
+            errors.append(f'`region_parallelism` must be an integer between 0 and {MAX_REGION_PARALLELISM}')
+    if parse_bool(target.get('delta')) is None:
+        errors.append('`delta` must be true or false')
+    shards = target.get('shards')
+    if shards not in (None, ''):
+        try:
+            valid = 1 <= int(shards) <= MAX_SHARDS
+        except (TypeError, ValueError):
+            valid = False
+        if not valid:
+            errors.append(f'`shards` must be an integer between 1 and {MAX_SHARDS}')
+    weight = target.get('weight')
+    if weight not in (None, ''):
+        try:
+            valid = not isinstance(weight, bool) and math.isfinite(float(weight)) and float(weight) > 0
+        except (TypeError, ValueError):
+            valid = False
+        if not valid:
+            errors.append('`weight` must be a positive number')
+    errors.extend(validate_prowler_options(target))
+    return errors
+
+def validate_prowler_options(target: dict) -> list:
+    errors = []
+    compliance = parse_list(target.get('compliance'))
+    if compliance is None or not all(COMPLIANCE_PATTERN.match(c) for c in compliance):
+        errors.append('`compliance` must be a list of Prowler AWS frameworks, i.e. cis_2.0_aws,soc2_aws')
+    elif len(compliance) > MAX_COMPLIANCE_FRAMEWORKS:
+        errors.append(f'at most {MAX_COMPLIANCE_FRAMEWORKS} `compliance` frameworks are accepted per scan')
+    severities = parse_list(target.get('severities'))
+    if severities is None or not all(s in SEVERITIES for s in severities):
+        errors.append(f'`severities` must be a list of {", ".join(SEVERITIES)}')
+    formats = parse_list(target.get('output_formats'))
+    if formats is None or not all(f in OUTPUT_FORMATS for f in formats):
+        errors.append(f'`output_formats` must be a list of {", ".join(OUTPUT_FORMATS)}')
+    return errors
+
+def parse_bool(value, default: bool = False) -> bool:
+    if value in (None, ''):
+        return default
+    if isinstance(value, bool):
+        return value
+    return {'true': True, 'false': False}.get(str(value).lower())
+
+def parse_list(value) -> list:
+    # Query strings carry lists as comma separated values, JSON bodies as lists
+    if value in (None, ''):
+        return []
+    if isinstance(value, str):
+        return [v.strip() for v in value.split(',') if v.strip()]
+    if isinstance(value, list) and all(isinstance(v, str) for v in value):
+        return value
+    return None
+
+def scan_options(target: dict, region_parallelism: int = 0, delta: bool = False, severities: list = None,
+                 compliance: list = None, output_formats: list = None, shards: int = 1) -> dict:
+    # Settings for a validated target, falling back to the deployment defaults
+    parallelism = target.get('region_parallelism')
+    shard_count = target.get('shards')
+    return {
+        'regions': parse_list(target.get('regions')),
+        'region_parallelism': int(parallelism) if parallelism not in (None, '') else region_parallelism,
+        'delta': parse_bool(target.get('delta'), delta),
+        'severities': unique(parse_list(target.get('severities')) or severities or DEFAULT_SEVERITIES),
+        'compliance': unique(parse_list(target.get('compliance')) or compliance or []),
+        'output_formats': unique(['csv'] + (parse_list(target.get('output_formats')) or output_formats or [])),
+        'shards': int(shard_count) if shard_count not in (None, '') else shards
+    }
+
+def unique(values: list) -> list:
+    return list(dict.fromkeys(values))
+
+def validate_targets(targets, max_targets: int) -> list:
+    if not isinstance(targets, list) or not targets:
+        return [{'index': None, 'errors': ['`targets` must be a non-empty list']}]
+    if len(targets) > max_targets:
+        return [{'index': None, 'errors': [f'at most {max_targets} targets are accepted per request']}]
+
+    # Scan names become object keys, so they must be unique within a batch
+    invalid = []
+    seen = set()
+    for index, target in enumerate(targets):
+        errors = validate_target(target)
+        if not errors:
+            object_name = target['scan_name'].replace(' ', '-')
+            if object_name in seen:
+                errors.append('`scan_name` is duplicated within the batch')
+            seen.add(object_name)
+        if errors:
+            invalid.append({'index': index, 'errors': errors})
+    return invalid
+
+def launch_batch(targets: list, launch, concurrency: int) -> list:
+    def launch_one(index):
+        target = targets[index]
+        try:
+            result = launch(target)
+            return {'index': index, 'scan_name': target['scan_name'], 'status': 'launched', 'result': result}
+        except Exception as e:
+            print(f'Failed to launch scan {target["scan_name"]}: {e}')
+            return {'index': index, 'scan_name': target['scan_name'], 'status': 'failed', 'error': str(e)}
+
+    # Results keep the request order regardless of completion order
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        return list(executor.map(launch_one, range(len(targets))))
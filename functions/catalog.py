@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+
+# Catalog of the scans in the results bucket, so finding an account's latest
+# scan or the scans of a date range reads a few small objects instead of
+# listing the bucket. Every instance appends one entry per scan under
+# catalog/entries/{day written}/. Compaction folds the entries of finished
+# days into catalog/months/{YYYY-MM}.json (by scan time) and the latest scan
+# per account into catalog/index.json. Queries read the index, the months they
+# need, and only the entries written since the last compaction.
+#
+#   catalog.py add --bucket B --object-key Acme-Corp-1721159874 --scan-name "Acme Corp" --csv /opt/Acme-Corp-1721159874.csv --object output=Acme-Corp-1721159874.zip
+#   catalog.py compact --bucket B
+#   catalog.py latest --bucket B [--account 111111111111]
+#   catalog.py range --bucket B --since 2024-07-01 [--until 2024-07-31]
+#   catalog.py backfill --bucket B
+
+import argparse
+import json
+import re
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from findings import ACCOUNT_UID, column_index, open_reader
+from trends import ordered, severity_counts
+
+
+PREFIX = 'catalog/'
+ENTRIES_PREFIX = f'{PREFIX}entries/'
+MONTHS_PREFIX = f'{PREFIX}months/'
+INDEX_KEY = f'{PREFIX}index.json'
+VERSION = 1
+# Entries of the last two days stay uncompacted, so an entry written just
+# before midnight can't land in a day that was already compacted
+GRACE_DAYS = 2
+# Sorts after every character of a job id, so listing starts past a whole day
+AFTER_DAY = '~'
+# Stored scans: {object_key}.csv, or the artifact store's manifest
+SCAN_KEY = re.compile(r'^(?:(?P<csv>[A-Za-z0-9_.-]+-\d+)\.csv|artifacts/(?P<manifest>[A-Za-z0-9_.-]+-\d+)\.json)$')
+
+
+def day(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m-%d')
+
+def month(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m')
+
+def parse_time(value: str) -> float:
+    # Epoch seconds or an ISO date, i.e. 2024-07-01
+    if re.match(r'^\d+(\.\d+)?$', value):
+        return float(value)
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def scan_ts(object_key: str) -> int:
+    return int(object_key.rsplit('-', 1)[-1])
+
+def csv_account(path: str) -> str:
+    # Every row of a scan carries the same account, the first one will do
+    f, reader = open_reader(path)
+    with f:
+        index = column_index(next(reader, None) or []).get(ACCOUNT_UID)
+        for row in reader:
+            if index is not None and index < len(row) and row[index]:
+                return row[index]
+    return None
+
+def build_entry(object_key: str, scan_name: str, csv_path: str = None, objects: dict = None,
+                now: float = None, started: float = None) -> dict:
+    # The duration runs from when the instance started, the key's timestamp
+    # is the request, which for a queued scan includes its wait for a slot
+    now = now or time.time()
+    ts = scan_ts(object_key)
+    entry = {
+        'object_key': object_key,
+        'scan_name': scan_name,
+        'account': csv_account(csv_path) if csv_path else None,
+        'ts': ts,
+        'duration': round(now - (started or ts)),
+        'objects': objects or {}
+    }
+    if csv_path:
+        fails = severity_counts(csv_path)
+        entry['failed'] = sum(fails.values())
+        entry['severity'] = ordered(fails)
+    return entry
+
+def entry_key(entry: dict, written: float) -> str:
+    return f'{ENTRIES_PREFIX}{day(written)}/{entry["object_key"]}.json'
+
+def add_entry(s3_client, bucket: str, entry: dict, now: float = None) -> str:
+    # One object per scan, so concurrent scanners never overwrite each other
+    key = entry_key(entry, now or time.time())
+    put_json(s3_client, bucket, key, entry)
+    return key
+
+def get_json(s3_client, bucket: str, key: str) -> dict:
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+    except Exception as e:
+        if getattr(e, 'response', {}).get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+            return None
+        raise
+    return json.loads(response['Body'].read())
+
+def put_json(s3_client, bucket: str, key: str, data: dict):
+    s3_client.put_object(Bucket=bucket, Key=key, Body=json.dumps(data, separators=(',', ':')).encode(),
+                         ContentType='application/json')
+
+def empty_index() -> dict:
+    return {'version': VERSION, 'compacted_through': None, 'months': {}, 'latest': {}}
+
+def load_index(s3_client, bucket: str) -> dict:
+    return get_json(s3_client, bucket, INDEX_KEY) or empty_index()
+
+def entry_day(key: str) -> str:
+    return key[len(ENTRIES_PREFIX):].split('/', 1)[0]
+
+def list_entries(s3_client, bucket: str, after: str = None, through: str = None) -> list:
+    # Entry keys written after day `after` up to day `through`, in order; the
+    # listing starts past the compacted days rather than at the beginning
+    params = {'Bucket': bucket, 'Prefix': ENTRIES_PREFIX}
+    if after:
+        params['StartAfter'] = f'{ENTRIES_PREFIX}{after}/{AFTER_DAY}'
+    keys = []
+    for page in s3_client.get_paginator('list_objects_v2').paginate(**params):
+        for obj in page.get('Contents', []):
+            if through and entry_day(obj['Key']) > through:
+                return keys
+            keys.append(obj['Key'])
+    return keys
+
+def load_entries(s3_client, bucket: str, keys: list) -> list:
+    return [entry for entry in (get_json(s3_client, bucket, key) for key in keys) if entry]
+
+def merge(scans: list, entries: list) -> list:
+    # By object key, later entries replace earlier ones; oldest scan first
+    merged = {scan['object_key']: scan for scan in scans}
+    for entry in entries:
+        merged[entry['object_key']] = entry
+    return sorted(merged.values(), key=lambda s: (s['ts'], s['object_key']))
+
+def update_latest(latest: dict, entries: list) -> dict:
+    for entry in entries:
+        account = entry.get('account')
+        if not account:
+            continue
+        current = latest.get(account)
+        if current is None or (entry['ts'], entry['object_key']) >= (current['ts'], current['object_key']):
+            latest[account] = entry
+    return latest
+
+def compact(s3_client, bucket: str, now: float = None) -> dict:
+    # Idempotent: the month files are written before the index that records
+    # them as compacted, a crash in between just redoes the same merge
+    now = now or time.time()
+    index = load_index(s3_client, bucket)
+    through = (datetime.fromtimestamp(now, timezone.utc) - timedelta(days=GRACE_DAYS)).strftime('%Y-%m-%d')
+    if index['compacted_through'] and index['compacted_through'] >= through:
+        return index
+    entries = load_entries(s3_client, bucket, list_entries(s3_client, bucket, index['compacted_through'], through))
+
+    by_month = {}
+    for entry in entries:
+        by_month.setdefault(month(entry['ts']), []).append(entry)
+    for name, month_entries in sorted(by_month.items()):
+        key = f'{MONTHS_PREFIX}{name}.json'
+        scans = merge((get_json(s3_client, bucket, key) or {}).get('scans', []), month_entries)
+        put_json(s3_client, bucket, key, {'version': VERSION, 'month': name, 'scans': scans})
+        index['months'][name] = len(scans)
+
+    index['months'] = dict(sorted(index['months'].items()))
+    update_latest(index['latest'], entries)
+    index['compacted_through'] = through
+    index['generated'] = now
+    put_json(s3_client, bucket, INDEX_KEY, index)
+    return index
+
+def pending_entries(s3_client, bucket: str, index: dict) -> list:
+    return load_entries(s3_client, bucket, list_entries(s3_client, bucket, index['compacted_through']))
+
+def latest_scans(s3_client, bucket: str, account: str = None) -> dict:
+    # {account: latest entry}, from the index and the uncompacted entries
+    index = load_index(s3_client, bucket)
+    latest = update_latest(dict(index['latest']), pending_entries(s3_client, bucket, index))
+    if account:
+        return {account: latest[account]} if account in latest else {}
+    return dict(sorted(latest.items()))
+
+def scans_between(s3_client, bucket: str, since: float = 0, until: float = None, account: str = None,
+                  scan_name: str = None) -> list:
+    # Scans with since <= ts <= until, oldest first; only the month files in
+    # the range are read
+    until = until if until is not None else time.time()
+    index = load_index(s3_client, bucket)
+    scans = []
+    for name in index['months']:
+        if month(since) <= name <= month(until):
+            scans.extend(get_json(s3_client, bucket, f'{MONTHS_PREFIX}{name}.json')['scans'])
+    scans = merge(scans, pending_entries(s3_client, bucket, index))
+    return [
+        scan for scan in scans
+        if since <= scan['ts'] <= until
+        and (account is None or scan.get('account') == account)
+        and (scan_name is None or scan.get('scan_name') == scan_name)
+    ]
+
+def backfill(s3_client, bucket: str, now: float = None) -> int:
+    # One-off listing of the scans stored before the catalog existed, their
+    # severity counts come from the trend report when there is one
+    now = now or time.time()
+    found = {}
+    for prefix in ('', 'artifacts/'):
+        for page in s3_client.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix, Delimiter='/'):
+            for obj in page.get('Contents', []):
+                match = SCAN_KEY.match(obj['Key'])
+                if match:
+                    found.setdefault(match.group('csv') or match.group('manifest'), obj['Key'])
+    for object_key, key in sorted(found.items()):
+        job = get_json(s3_client, bucket, f'jobs/{object_key}.json') or {}
+        entry = {
+            'object_key': object_key,
+            'scan_name': job.get('scan_name') or object_key.rsplit('-', 1)[0],
+            'account': None,
+            'ts': scan_ts(object_key),
+            'duration': job.get('duration'),
+            'objects': {'csv' if key.endswith('.csv') else 'manifest': key}
+        }
+        trend = get_json(s3_client, bucket, f'{object_key}-trend.json')
+        if trend and trend.get('trend'):
+            point = trend['trend'][-1]
+            entry['failed'] = point['failed']
+            entry['severity'] = point['severity']
+            entry['objects'].update(trend=f'{object_key}-trend.json', changes=f'{object_key}-changes.csv')
+        add_entry(s3_client, bucket, entry, now)
+    return len(found)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Catalog of the scans stored in the results bucket.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    add_parser = subparsers.add_parser('add')
+    add_parser.add_argument('--bucket', required=True)
+    add_parser.add_argument('--object-key', required=True)
+    add_parser.add_argument('--scan-name', required=True)
+    add_parser.add_argument('--csv', help='Findings CSV, for the account and severity counts')
+    add_parser.add_argument('--object', action='append', default=[], help='name=key of a stored output, repeatable')
+    add_parser.add_argument('--started', help='Epoch seconds the scan started, defaults to the launch timestamp')
+
+    compact_parser = subparsers.add_parser('compact')
+    compact_parser.add_argument('--bucket', required=True)
+
+    latest_parser = subparsers.add_parser('latest')
+    latest_parser.add_argument('--bucket', required=True)
+    latest_parser.add_argument('--account')
+
+    range_parser = subparsers.add_parser('range')
+    range_parser.add_argument('--bucket', required=True)
+    range_parser.add_argument('--since', type=parse_time, default=0, help='Epoch seconds or a date, i.e. 2024-07-01')
+    range_parser.add_argument('--until', type=parse_time)
+    range_parser.add_argument('--account')
+    range_parser.add_argument('--scan-name')
+
+    backfill_parser = subparsers.add_parser('backfill')
+    backfill_parser.add_argument('--bucket', required=True)
+    args = parser.parse_args()
+
+    import boto3
+    s3_client = boto3.client('s3')
+    if args.command == 'add':
+        objects = dict(o.split('=', 1) for o in args.object)
+        started = float(args.started) if args.started else None
+        entry = build_entry(args.object_key, args.scan_name, args.csv, objects, started=started)
+        print(f'Cataloged {args.object_key} at {add_entry(s3_client, args.bucket, entry)}')
+        raise SystemExit(0)
+    if args.command == 'compact':
+        result = compact(s3_client, args.bucket)
+    elif args.command == 'latest':
+        result = latest_scans(s3_client, args.bucket, args.account)
+    elif args.command == 'range':
+        result = scans_between(s3_client, args.bucket, args.since, args.until, args.account, args.scan_name)
+    else:
+        result = {'backfilled': backfill(s3_client, args.bucket)}
+    json.dump(result, sys.stdout, indent=1)
+    print()
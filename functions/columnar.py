@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+# Converts Prowler CSV output into a Parquet dataset partitioned by scan date,
+# account and severity, and queries it across every stored scan. Runs on the
+# scanner instance (convert) and on operator machines (query); pyarrow is
+# installed in the instance venv and listed in requirements.txt.
+#
+#   columnar.py convert --csv /opt/acme-1721159874.csv --scan-id acme-1721159874 --out /opt/parquet
+#   columnar.py query --root s3://bucket/findings --where check_id=iam_root_mfa_enabled \
+#       --where status=FAIL --group-by account
+
+import argparse
+import json
+import re
+from datetime import datetime, timezone
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.dataset as ds
+
+from findings import DELIMITER
+
+
+# Prowler CSV column -> Parquet column. Every scan is stored with exactly
+# these columns so datasets written by different Prowler versions line up.
+COLUMNS = {
+    'FINDING_UID': 'finding_uid',
+    'PROVIDER': 'provider',
+    'ACCOUNT_UID': 'account',
+    'ACCOUNT_NAME': 'account_name',
+    'REGION': 'region',
+    'CHECK_ID': 'check_id',
+    'CHECK_TITLE': 'check_title',
+    'SERVICE_NAME': 'service_name',
+    'STATUS': 'status',
+    'STATUS_EXTENDED': 'status_extended',
+    'MUTED': 'muted',
+    'SEVERITY': 'severity',
+    'RESOURCE_TYPE': 'resource_type',
+    'RESOURCE_UID': 'resource_uid',
+    'RESOURCE_NAME': 'resource_name',
+    'TIMESTAMP': 'timestamp',
+}
+PARTITIONS = ('scan_date', 'account', 'severity')
+
+SCHEMA = pa.schema(
+    [(name, pa.string()) for name in COLUMNS.values()]
+    + [('scan_id', pa.string()), ('scan_date', pa.string())]
+)
+PARTITIONING = ds.partitioning(pa.schema([(name, pa.string()) for name in PARTITIONS]), flavor='hive')
+
+SCAN_TS_PATTERN = re.compile(r'-(\d{9,})$')
+
+
+def scan_date(scan_id: str) -> str:
+    # object keys end with the launch timestamp, `{scan_name}-{ts}`
+    match = SCAN_TS_PATTERN.search(scan_id)
+    ts = int(match.group(1)) if match else datetime.now(timezone.utc).timestamp()
+    return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%d')
+
+def read_csv(path: str, scan_id: str) -> pa.Table:
+    table = pv.read_csv(
+        path,
+        parse_options=pv.ParseOptions(delimiter=DELIMITER, newlines_in_values=True),
+        convert_options=pv.ConvertOptions(
+            column_types={c: pa.string() for c in COLUMNS},
+            include_columns=list(COLUMNS),
+            include_missing_columns=True,
+            strings_can_be_null=False
+        )
+    )
+    table = table.rename_columns([COLUMNS[c] for c in table.column_names])
+    # Severity and account are partition values, keep their spelling stable
+    table = table.set_column(table.schema.get_field_index('severity'), 'severity',
+                             pc.utf8_lower(pc.fill_null(table['severity'], 'unknown')))
+    table = table.set_column(table.schema.get_field_index('account'), 'account',
+                             pc.fill_null(table['account'], 'unknown'))
+    table = table.append_column('scan_id', pa.array([scan_id] * len(table), pa.string()))
+    table = table.append_column('scan_date', pa.array([scan_date(scan_id)] * len(table), pa.string()))
+    return table.cast(SCHEMA)
+
+def write_partitions(table: pa.Table, root: str, scan_id: str, filesystem=None) -> int:
+    # One file per partition per scan, named after the scan so re-running a
+    # conversion overwrites its own files and never touches other scans'
+    ds.write_dataset(
+        table, root, filesystem=filesystem, format='parquet', partitioning=PARTITIONING,
+        basename_template=f'{scan_id}-{{i}}.parquet', existing_data_behavior='overwrite_or_ignore'
+    )
+    return len(table)
+
+def convert(csv_path: str, root: str, scan_id: str, filesystem=None) -> int:
+    return write_partitions(read_csv(csv_path, scan_id), root, scan_id, filesystem)
+
+def open_dataset(root: str, filesystem=None) -> ds.Dataset:
+    # root is a local directory or an s3://bucket/findings URI
+    return ds.dataset(root, filesystem=filesystem, format='parquet', schema=SCHEMA, partitioning=PARTITIONING)
+
+def build_filter(where: dict = None, since: str = None, until: str = None):
+    # where maps a column to a value or a list of values; scan_date bounds
+    # are inclusive YYYY-MM-DD strings. Partition columns prune whole
+    # directories, the rest are pushed down to Parquet row group statistics.
+    expression = None
+    clauses = []
+    for column, value in (where or {}).items():
+        if isinstance(value, (list, tuple, set)):
+            clauses.append(ds.field(column).isin(list(value)))
+        else:
+            clauses.append(ds.field(column) == value)
+    if since:
+        clauses.append(ds.field('scan_date') >= since)
+    if until:
+        clauses.append(ds.field('scan_date') <= until)
+    for clause in clauses:
+        expression = clause if expression is None else expression & clause
+    return expression
+
+def query(root: str, columns: list = None, where: dict = None, since: str = None, until: str = None,
+          filesystem=None) -> pa.Table:
+    dataset = open_dataset(root, filesystem)
+    return dataset.to_table(columns=columns, filter=build_filter(where, since, until))
+
+def count_by(root: str, group_by: list, where: dict = None, since: str = None, until: str = None,
+             filesystem=None) -> list:
+    # Only the grouping columns are read, sorted by count descending
+    table = query(root, list(group_by), where, since, until, filesystem)
+    counts = table.group_by(list(group_by)).aggregate([([], 'count_all')])
+    rows = counts.rename_columns(list(group_by) + ['count']).to_pylist()
+    return sorted(rows, key=lambda r: (-r['count'], [str(r[c]) for c in group_by]))
+
+def parse_where(clauses: list) -> dict:
+    # column=value or column=a,b,c
+    where = {}
+    for clause in clauses or []:
+        column, _, value = clause.partition('=')
+        where[column] = value.split(',') if ',' in value else value
+    return where
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert Prowler CSV output to partitioned Parquet and query it.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    convert_parser = subparsers.add_parser('convert')
+    convert_parser.add_argument('--csv', required=True)
+    convert_parser.add_argument('--scan-id', required=True, help='The scan object key, {scan_name}-{ts}')
+    convert_parser.add_argument('--out', required=True)
+
+    query_parser = subparsers.add_parser('query')
+    query_parser.add_argument('--root', required=True, help='Dataset directory or s3://bucket/findings')
+    query_parser.add_argument('--where', action='append', help='column=value or column=a,b (repeatable)')
+    query_parser.add_argument('--since', help='First scan date, YYYY-MM-DD')
+    query_parser.add_argument('--until', help='Last scan date, YYYY-MM-DD')
+    query_parser.add_argument('--group-by', help='Comma separated columns to count by')
+    query_parser.add_argument('--columns', default='account,check_id,region,resource_uid,status,severity')
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        count = convert(args.csv, args.out, args.scan_id)
+        print(f'[+] Wrote {count} findings for {args.scan_id} to {args.out}')
+    elif args.group_by:
+        for row in count_by(args.root, args.group_by.split(','), parse_where(args.where), args.since, args.until):
+            print(json.dumps(row))
+    else:
+        table = query(args.root, args.columns.split(','), parse_where(args.where), args.since, args.until)
+        for row in table.to_pylist():
+            print(json.dumps(row))
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+
+# Assumes the customer role once per instance and hands the session to every
+# Prowler process on it, instead of each regional or retried run assuming the
+# role itself. `serve` keeps the session fresh and serves it on loopback in
+# the container credentials format, so Prowler's boto3 picks it up through
+# AWS_CONTAINER_CREDENTIALS_FULL_URI and refreshes from it on its own.
+# `process` prints it for a `credential_process` profile, i.e. delta.py's.
+#
+#   credential_broker.py serve --role-arn arn:aws:iam::111111111111:role/CrossAccountRole --external-id abc12345 --session-name Mission-ProwlerScanner
+#   credential_broker.py process --wait 120
+
+import argparse
+import hmac
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+import urllib.request
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from launch_strategy import error_code
+
+
+PORT = 8297
+TOKEN_FILE = '/opt/broker.token'
+SESSION_DURATION = 43200
+# Sessions assumed with role credentials (role chaining) are capped at an hour
+CHAINED_SESSION_DURATION = 3600
+# botocore refreshes container credentials with 15 minutes left, refreshing
+# before that means clients always get a session with time left on it
+REFRESH_MARGIN = 1800
+# Below this a session is too close to expiry to hand out while refreshing
+MIN_VALIDITY = 60
+THROTTLING_ERRORS = ('Throttling', 'ThrottlingException', 'RequestLimitExceeded', 'TooManyRequestsException')
+
+
+class CredentialBroker:
+    def __init__(self, sts_client, role_arn: str, external_id: str, session_name: str,
+                 duration: int = SESSION_DURATION, refresh_margin: int = REFRESH_MARGIN, attempts: int = 5,
+                 clock=time.time, sleep=time.sleep):
+        self.sts_client = sts_client
+        self.role_arn = role_arn
+        self.external_id = external_id
+        self.session_name = session_name
+        self.duration = duration
+        self.refresh_margin = refresh_margin
+        self.attempts = attempts
+        self.clock = clock
+        self.sleep = sleep
+        self.current = None
+        self.assumed = 0
+        self.lock = threading.Lock()
+
+    def fresh(self, credentials: dict) -> bool:
+        return bool(credentials) and self.clock() < credentials['expiration'] - min(
+            self.refresh_margin, (credentials['expiration'] - credentials['assumed']) / 2)
+
+    def valid(self, credentials: dict) -> bool:
+        return bool(credentials) and self.clock() < credentials['expiration'] - MIN_VALIDITY
+
+    def credentials(self) -> dict:
+        credentials = self.current
+        if self.fresh(credentials):
+            return credentials
+
+        # One caller refreshes; while the session is still valid the others
+        # keep using it rather than queueing behind STS
+        if self.valid(credentials):
+            if not self.lock.acquire(blocking=False):
+                return credentials
+        else:
+            self.lock.acquire()
+        try:
+            if self.fresh(self.current):
+                return self.current
+            try:
+                self.current = self.assume()
+            except Exception as e:
+                if not self.valid(self.current):
+                    raise
+                print(f'Refreshing {self.role_arn} failed, serving the current session: {e}', flush=True)
+            return self.current
+        finally:
+            self.lock.release()
+
+    def assume(self) -> dict:
+        for attempt in range(1, self.attempts + 1):
+            try:
+                response = self.sts_client.assume_role(
+                    RoleArn=self.role_arn,
+                    RoleSessionName=self.session_name,
+                    ExternalId=self.external_id,
+                    DurationSeconds=self.duration
+                )
+            except Exception as e:
+                if error_code(e) == 'ValidationError' and self.duration > CHAINED_SESSION_DURATION:
+                    # The role's maximum, or role chaining, allows less
+                    print(f'{self.duration}s sessions are not allowed, using {CHAINED_SESSION_DURATION}s: {e}',
+                          flush=True)
+                    self.duration = CHAINED_SESSION_DURATION
+                    continue
+                if error_code(e) not in THROTTLING_ERRORS or attempt == self.attempts:
+                    raise
+                self.sleep(min(30, 2 ** attempt))
+                continue
+            self.assumed += 1
+            credentials = response['Credentials']
+            expiration = credentials['Expiration']
+            if isinstance(expiration, datetime):
+                expiration = expiration.timestamp()
+            print(f'Assumed {self.role_arn} until {format_time(expiration)}', flush=True)
+            return {
+                'access_key_id': credentials['AccessKeyId'],
+                'secret_access_key': credentials['SecretAccessKey'],
+                'session_token': credentials['SessionToken'],
+                'expiration': expiration,
+                'assumed': self.clock()
+            }
+        raise RuntimeError(f'Could not assume {self.role_arn}')
+
+
+def format_time(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def container_credentials(credentials: dict) -> dict:
+    # What botocore's container provider reads
+    return {
+        'AccessKeyId': credentials['access_key_id'],
+        'SecretAccessKey': credentials['secret_access_key'],
+        'Token': credentials['session_token'],
+        'Expiration': format_time(credentials['expiration'])
+    }
+
+def process_credentials(payload: dict) -> dict:
+    # What a `credential_process` prints, from a container credentials payload
+    return {
+        'Version': 1,
+        'AccessKeyId': payload['AccessKeyId'],
+        'SecretAccessKey': payload['SecretAccessKey'],
+        'SessionToken': payload['Token'],
+        'Expiration': payload['Expiration']
+    }
+
+def make_server(broker: CredentialBroker, token: str, port: int = PORT) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/credentials':
+                return self.reply(404, {'error': 'not found'})
+            if not hmac.compare_digest(self.headers.get('Authorization', ''), token):
+                return self.reply(401, {'error': 'unauthorized'})
+            try:
+                return self.reply(200, container_credentials(broker.credentials()))
+            except Exception as e:
+                return self.reply(500, {'error': str(e)})
+
+        def reply(self, status: int, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    # Loopback only, botocore refuses plain http to anything else
+    return ThreadingHTTPServer(('127.0.0.1', port), Handler)
+
+def keep_fresh(broker: CredentialBroker, interval: float, stop: threading.Event):
+    # Refreshes ahead of expiry even while no client asks
+    while not stop.wait(interval):
+        try:
+            broker.credentials()
+        except Exception as e:
+            print(f'Refresh failed: {e}', flush=True)
+
+def write_token(path: str) -> str:
+    # `process` waits for the file to exist, so it only appears once the
+    # token is in it
+    token = secrets.token_hex(32)
+    partial = f'{path}.{os.getpid()}.tmp'
+    with open(os.open(partial, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+        f.write(token)
+    os.replace(partial, path)
+    return token
+
+def fetch(url: str, token: str, wait: float = 0, clock=time.time, sleep=time.sleep) -> dict:
+    # Retries until the broker answers or `wait` seconds pass
+    deadline = clock() + wait
+    while True:
+        try:
+            request = urllib.request.Request(url, headers={'Authorization': token})
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return json.loads(response.read())
+        except OSError:
+            if clock() >= deadline:
+                raise
+            sleep(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Share one assumed role session with every process on the instance.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve')
+    serve_parser.add_argument('--role-arn', required=True)
+    serve_parser.add_argument('--external-id', required=True)
+    serve_parser.add_argument('--session-name', required=True)
+    serve_parser.add_argument('--duration', type=int, default=SESSION_DURATION)
+    serve_parser.add_argument('--refresh-margin', type=int, default=REFRESH_MARGIN)
+    serve_parser.add_argument('--region', help='STS region, the regional endpoint avoids the global one')
+    serve_parser.add_argument('--port', type=int, default=PORT)
+    serve_parser.add_argument('--token-file', default=TOKEN_FILE)
+
+    process_parser = subparsers.add_parser('process')
+    process_parser.add_argument('--port', type=int, default=PORT)
+    process_parser.add_argument('--token-file', default=TOKEN_FILE)
+    process_parser.add_argument('--wait', type=float, default=0, help='Seconds to wait for the broker to start')
+    args = parser.parse_args()
+
+    if args.command == 'process':
+        url = f'http://127.0.0.1:{args.port}/credentials'
+        deadline = time.time() + args.wait
+        while not os.path.exists(args.token_file) and time.time() < deadline:
+            time.sleep(1)
+        with open(args.token_file) as f:
+            token = f.read().strip()
+        json.dump(process_credentials(fetch(url, token, max(0, deadline - time.time()))), sys.stdout)
+        raise SystemExit(0)
+
+    import boto3
+    from botocore.config import Config
+    sts_client = boto3.client('sts', region_name=args.region, config=Config(retries={'mode': 'standard'}))
+    broker = CredentialBroker(sts_client, args.role_arn, args.external_id, args.session_name,
+                              args.duration, args.refresh_margin)
+    # Fail fast on a role that can't be assumed, before anything waits on it
+    broker.credentials()
+    server = make_server(broker, write_token(args.token_file), args.port)
+    threading.Thread(target=keep_fresh, args=(broker, 60, threading.Event()), daemon=True).start()
+    print(f'Serving {args.role_arn} on http://127.0.0.1:{args.port}/credentials', flush=True)
+    server.serve_forever()
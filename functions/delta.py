@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+
+from findings import (
+    REGION, RESOURCE_UID, SERVICE_NAME, STATUS, finding_key_getter, key_getter, merge_headers, project,
+    read_findings, write_findings
+)
+
+
+# ARN service namespaces that Prowler names differently
+ARN_SERVICE_ALIASES = {
+    'elasticloadbalancing': 'elbv2',
+    'elasticfilesystem': 'efs',
+    'es': 'opensearch',
+    'logs': 'cloudwatch',
+    'monitoring': 'cloudwatch',
+    'states': 'stepfunctions'
+}
+# inventory/{object_key}.json, written by a delta scan's plan
+INVENTORY_PREFIX = 'inventory/'
+
+
+def arn_service(arn: str) -> str:
+    parts = arn.split(':')
+    if len(parts) < 6 or parts[0] != 'arn':
+        return None
+    return ARN_SERVICE_ALIASES.get(parts[2], parts[2])
+
+def plan_services(header: list, rows: list, inventory: dict = None, previous_inventory: dict = None,
+                  available: set = None) -> dict:
+    # Services to rescan, with the reasons for each: any failed check last
+    # time, resources in the current inventory the previous scan never saw, or
+    # resources in the previous scan's inventory that are gone. Rescanning a
+    # service drops its rows that aren't reported again, see merge_delta.
+    # Inventories map a Prowler service name to a set of resource ARNs. They
+    # hold raw tagging API namespaces too, so services missing from
+    # `available` (the installed Prowler's) are left out: Prowler rejects
+    # unknown services.
+    get = key_getter(header, (SERVICE_NAME, STATUS, RESOURCE_UID))
+    seen = {}
+    reasons = {}
+    for row in rows:
+        service, status, resource = get(row)
+        seen.setdefault(service, set()).add(resource)
+        if status == 'FAIL':
+            reasons.setdefault(service, set()).add('failed')
+
+    for service, resources in (inventory or {}).items():
+        if resources - seen.get(service, set()):
+            reasons.setdefault(service, set()).add('inventory')
+    if inventory is not None:
+        for service, resources in (previous_inventory or {}).items():
+            if resources - inventory.get(service, set()):
+                reasons.setdefault(service, set()).add('inventory')
+    return {service: sorted(r) for service, r in sorted(reasons.items())
+            if service and (available is None or service in available)}
+
+def merge_delta(previous_header: list, previous_rows, current_header: list, current_rows, rescanned: set) -> tuple:
+    # Complete, current findings: the delta run's rows replace every previous
+    # row of a rescanned service, previous rows of other services carry over.
+    # Rows are matched on (check, region, resource) so a check reported again
+    # for a service outside the rescanned set still replaces its old row.
+    header = merge_headers(previous_header, current_header)
+    current = list(project(current_rows, current_header, header))
+    get_key = finding_key_getter(header)
+    current_keys = {get_key(row) for row in current}
+    service_position = header.index(SERVICE_NAME) if SERVICE_NAME in header else None
+
+    stats = {'carried': 0, 'replaced': 0, 'resolved': 0, 'rescanned': len(current)}
+    merged = []
+    for row in project(previous_rows, previous_header, header):
+        key = get_key(row)
+        if key in current_keys:
+            stats['replaced'] += 1
+        elif service_position is not None and row[service_position] in rescanned:
+            stats['resolved'] += 1
+        else:
+            merged.append(row)
+            stats['carried'] += 1
+    merged.extend(current)
+    return header, merged, stats
+
+def merge_delta_files(previous_path: str, current_path: str, rescanned: set, out_path: str) -> dict:
+    previous_header, previous_rows = read_findings(previous_path)
+    current_header, current_rows = read_findings(current_path)
+    header, rows, stats = merge_delta(previous_header, previous_rows, current_header, current_rows, rescanned)
+    write_findings(out_path, header, rows)
+    return stats
+
+def collect_inventory(session, regions: list) -> dict:
+    # Resource ARNs per Prowler service from the tagging API, which lists
+    # resources that carry (or once carried) tags in each region
+    inventory = {}
+    for region in regions:
+        client = session.client('resourcegroupstaggingapi', region_name=region)
+        for page in client.get_paginator('get_resources').paginate(ResourcesPerPage=100):
+            for resource in page['ResourceTagMappingList']:
+                service = arn_service(resource['ResourceARN'])
+                if service:
+                    inventory.setdefault(service, set()).add(resource['ResourceARN'])
+    return inventory
+
+def load_inventory(path: str) -> tuple:
+    # (inventory, delta scans in a row) recorded by the previous delta scan's
+    # plan, nothing when the previous scan was a full one
+    if not path or not os.path.exists(path):
+        return None, 0
+    with open(path) as f:
+        data = json.load(f)
+    return {service: set(arns) for service, arns in data['services'].items()}, data['delta_scans']
+
+def save_inventory(path: str, inventory: dict, delta_scans: int):
+    with open(path, 'w') as f:
+        json.dump({'delta_scans': delta_scans,
+                   'services': {service: sorted(arns) for service, arns in sorted(inventory.items())}}, f)
+
+def delta_scans_before(s3_client, bucket: str, previous_key: str) -> int:
+    # Delta scans in a row up to and including the scan stored at
+    # previous_key ({key}.csv or artifacts/{key}.json); a full scan records
+    # no inventory, so counts as none
+    object_key = previous_key.rsplit('/', 1)[-1].rsplit('.', 1)[0]
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=f'{INVENTORY_PREFIX}{object_key}.json')
+        return json.loads(response['Body'].read())['delta_scans']
+    except Exception as e:
+        print(f'No inventory for {object_key}: {e}')
+        return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Plan and merge incremental (delta) Prowler scans.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    plan = subparsers.add_parser('plan', help='Print the services to rescan, one per line')
+    plan.add_argument('--previous', required=True)
+    plan.add_argument('--profile', help='AWS profile for the scanned account, enables the inventory check')
+    plan.add_argument('--previous-inventory', help="The previous delta scan's inventory, to find removed resources")
+    plan.add_argument('--inventory-out', help='Record the inventory and the delta scans in a row here')
+    plan.add_argument('--prowler-dir', help='Prowler checkout, only its services are planned')
+    merge = subparsers.add_parser('merge', help='Merge a delta run into the previous findings')
+    merge.add_argument('--previous', required=True)
+    merge.add_argument('--current', required=True)
+    merge.add_argument('--services', required=True, help='File of rescanned services, one per line')
+    merge.add_argument('--out', required=True)
+    args = parser.parse_args()
+
+    if args.command == 'plan':
+        header, rows = read_findings(args.previous)
+        inventory = None
+        if args.profile:
+            import boto3
+            regions = sorted({r for (r,) in map(key_getter(header, (REGION,)), rows) if r and r != 'global'})
+            try:
+                inventory = collect_inventory(boto3.Session(profile_name=args.profile), regions)
+            except Exception as e:
+                print(f'Inventory check skipped: {e}', file=sys.stderr)
+        previous_inventory, delta_scans = load_inventory(args.previous_inventory)
+        if args.inventory_out:
+            # without a fresh inventory the previous one stays the baseline
+            save_inventory(args.inventory_out, inventory if inventory is not None else previous_inventory or {},
+                           delta_scans + 1)
+        available = None
+        if args.prowler_dir:
+            from shards import available_services
+            available = available_services(args.prowler_dir)
+        for service, reasons in plan_services(header, rows, inventory, previous_inventory, available).items():
+            print(service)
+    else:
+        with open(args.services) as f:
+            rescanned = {line.strip() for line in f if line.strip()}
+        print(merge_delta_files(args.previous, args.current, rescanned, args.out))
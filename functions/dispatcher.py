@@ -0,0 +1,190 @@
+import json
+import time
+
+from launch_strategy import CAPACITY_ERRORS, NoCapacityError, error_code
+
+
+# Scanner instances that hold a slot, every scanner (and packed batch) is
+# tagged Role=ProwlerScanner by worker.run_scanner_instance
+IN_FLIGHT_FILTERS = [
+    {'Name': 'tag:Role', 'Values': ['ProwlerScanner']},
+    {'Name': 'instance-state-name', 'Values': ['pending', 'running']}
+]
+
+# EC2 is pushing back, stop launching for this batch and retry later
+THROTTLING_ERRORS = (
+    'RequestLimitExceeded',
+    'Throttling',
+    'ThrottlingException',
+    'TooManyRequestsException'
+) + CAPACITY_ERRORS
+
+# Seconds a message waits before it's retried. Throttling backs off
+# exponentially from BASE_DELAY with each failed launch; waiting for a slot
+# backs off from CAPACITY_DELAY with each deferral, up to SQS's 15 minute
+# maximum delay, since slots free up as scans that run for hours finish
+BASE_DELAY = 30
+CAPACITY_DELAY = 60
+MAX_DELAY = 900
+# Throttled or capacity-starved launches of one scan before it's failed
+LAUNCH_ATTEMPTS = 20
+
+
+class MemoryQueue:
+    # Stand-in for the SQS queue and the Lambda event source mapping, so the
+    # dispatcher can be driven locally
+    def __init__(self, visibility_timeout: int = 300):
+        self.visibility_timeout = visibility_timeout
+        self.messages = {}
+        self.sent = 0
+
+    def send(self, body: dict, delay: int = 0, now: float = None):
+        now = time.time() if now is None else now
+        self.sent += 1
+        message_id = str(self.sent)
+        self.messages[message_id] = {'body': json.dumps(body), 'visible': now + delay, 'receives': 0}
+        return message_id
+
+    def receive(self, max_messages: int = 10, now: float = None) -> list:
+        now = time.time() if now is None else now
+        records = []
+        for message_id, message in self.messages.items():
+            if len(records) == max_messages:
+                break
+            if message['visible'] > now:
+                continue
+            message['visible'] = now + self.visibility_timeout
+            message['receives'] += 1
+            records.append({
+                'messageId': message_id,
+                'receiptHandle': message_id,
+                'body': message['body'],
+                'attributes': {'ApproximateReceiveCount': str(message['receives'])}
+            })
+        return records
+
+    def complete(self, records: list, response: dict):
+        # Lambda deletes every record that isn't reported as a failure
+        failed = {f['itemIdentifier'] for f in response.get('batchItemFailures', [])}
+        for record in records:
+            if record['messageId'] not in failed:
+                self.messages.pop(record['messageId'], None)
+
+    def defer(self, receipt_handle: str, delay: int, now: float = None):
+        now = time.time() if now is None else now
+        self.messages[receipt_handle]['visible'] = now + delay
+
+
+class SqsQueue:
+    def __init__(self, sqs_client, queue_url: str):
+        self.sqs_client = sqs_client
+        self.queue_url = queue_url
+
+    def send(self, body: dict, delay: int = 0, now: float = None):
+        response = self.sqs_client.send_message(QueueUrl=self.queue_url, MessageBody=json.dumps(body),
+                                                DelaySeconds=delay)
+        return response['MessageId']
+
+    def defer(self, receipt_handle: str, delay: int, now: float = None):
+        self.sqs_client.change_message_visibility(QueueUrl=self.queue_url, ReceiptHandle=receipt_handle,
+                                                  VisibilityTimeout=delay)
+
+
+def count_in_flight(ec2_client) -> int:
+    count = 0
+    kwargs = {'Filters': IN_FLIGHT_FILTERS}
+    while True:
+        response = ec2_client.describe_instances(**kwargs)
+        count += sum(len(r['Instances']) for r in response['Reservations'])
+        if not response.get('NextToken'):
+            return count
+        kwargs['NextToken'] = response['NextToken']
+
+def is_throttled(e: Exception) -> bool:
+    return isinstance(e, NoCapacityError) or error_code(e) in THROTTLING_ERRORS
+
+def instances_needed(message: dict, max_in_flight: int) -> int:
+    # A sharded scan starts an instance per shard; one with more shards than
+    # the cap waits until every slot is free rather than forever
+    shards = int((message.get('options') or {}).get('shards') or 1)
+    return max(1, min(shards, max_in_flight))
+
+def backoff_delay(attempts: int, base: int = BASE_DELAY, cap: int = MAX_DELAY) -> int:
+    return min(cap, base * 2 ** max(0, attempts - 1))
+
+def requeue(queue, record: dict, message: dict, delay: int, now: float = None) -> bool:
+    # Sends the message again with its counters instead of deferring it, so
+    # waiting never counts toward the queue's maxReceiveCount (that's left
+    # for dispatcher errors); the original is deleted as a processed record.
+    # When the send fails the original is deferred and retried as is.
+    try:
+        queue.send(message, delay, now=now)
+        return True
+    except Exception as e:
+        print(f'Unable to requeue {message["job_id"]}, deferring it: {e}')
+        queue.defer(record['receiptHandle'], delay, now=now)
+        return False
+
+def dispatch(records: list, queue, ec2_client, launch, max_in_flight: int, on_failure=None,
+             max_attempts: int = LAUNCH_ATTEMPTS, now: float = None) -> dict:
+    # Launches queued scans while fewer than max_in_flight scanners run and
+    # returns the Lambda partial batch response. Scans that can't launch yet
+    # are sent again with a delay; only records that couldn't be requeued
+    # are listed as failures, so they stay on the queue until theirs passes.
+    failures = []
+    throttled = False
+    try:
+        slots = max(0, max_in_flight - count_in_flight(ec2_client))
+    except Exception as e:
+        if not is_throttled(e):
+            raise
+        print(f'Unable to count scanners in flight: {e}')
+        slots, throttled = 0, True
+
+    launched = deferred = 0
+    for record in records:
+        message = json.loads(record['body'])
+        needed = instances_needed(message, max_in_flight)
+        if throttled or launched + needed > slots:
+            # Instances launched by this call may not be visible to
+            # describe_instances yet, so they are counted locally
+            deferrals = message.get('deferrals', 0) + 1
+            if throttled:
+                delay = backoff_delay(message.get('attempts', 0) + 1)
+            else:
+                delay = backoff_delay(deferrals, CAPACITY_DELAY)
+            print(f'Deferring {message["job_id"]} for {delay}s ({"throttled" if throttled else "at capacity"})')
+            deferred += 1
+            if not requeue(queue, record, dict(message, deferrals=deferrals), delay, now):
+                failures.append({'itemIdentifier': record['messageId']})
+            continue
+
+        try:
+            launch(message)
+            launched += needed
+        except Exception as e:
+            attempts = message.get('attempts', 0) + 1
+            if is_throttled(e) and attempts < max_attempts:
+                throttled = True
+                delay = backoff_delay(attempts)
+                print(f'Throttled launching {message["job_id"]}, retrying in {delay}s: {e}')
+                deferred += 1
+                if not requeue(queue, record, dict(message, attempts=attempts), delay, now):
+                    failures.append({'itemIdentifier': record['messageId']})
+            else:
+                # Retrying a bad request won't help, record it and drop it
+                print(f'Failed to launch {message["job_id"]} after {attempts} attempts: {e}')
+                if on_failure:
+                    on_failure(message, e)
+
+    print(f'Launched {launched} of {len(records)} queued scans, {deferred} deferred')
+    return {'batchItemFailures': failures}
+
+def fail_dead_letters(records: list, on_failure) -> int:
+    # Messages the dispatcher kept failing on land in the dead letter queue,
+    # their jobs would otherwise stay queued forever
+    for record in records:
+        message = json.loads(record['body'])
+        print(f'Dead-lettered launch of {message["job_id"]}')
+        on_failure(message, RuntimeError('the dispatcher failed on its launch message repeatedly'))
+    return len(records)
@@ -0,0 +1,84 @@
+import csv
+
+
+# Prowler v4 writes semicolon separated CSV output
+DELIMITER = ';'
+
+FINDING_UID = 'FINDING_UID'
+ACCOUNT_UID = 'ACCOUNT_UID'
+CHECK_ID = 'CHECK_ID'
+STATUS = 'STATUS'
+SERVICE_NAME = 'SERVICE_NAME'
+SEVERITY = 'SEVERITY'
+RESOURCE_UID = 'RESOURCE_UID'
+REGION = 'REGION'
+TIMESTAMP = 'TIMESTAMP'
+
+# Prowler's CSV fields can be large (resource details, remediation text)
+csv.field_size_limit(16 * 1024 * 1024)
+
+
+def open_reader(path):
+    f = open(path, newline='')
+    return f, csv.reader(f, delimiter=DELIMITER)
+
+def open_writer(path):
+    f = open(path, 'w', newline='')
+    return f, csv.writer(f, delimiter=DELIMITER, lineterminator='\n')
+
+def read_findings(path) -> tuple:
+    # Returns (header, rows) where rows are lists in header order
+    f, reader = open_reader(path)
+    with f:
+        header = next(reader, None)
+        if header is None:
+            return [], []
+        return header, list(reader)
+
+def write_findings(path, header: list, rows) -> int:
+    f, writer = open_writer(path)
+    count = 0
+    with f:
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+def column_index(header: list) -> dict:
+    return {name: i for i, name in enumerate(header)}
+
+def key_getter(header: list, columns: tuple):
+    # Fast row -> tuple accessor for the given columns, missing columns read
+    # as empty strings
+    index = column_index(header)
+    positions = [index.get(c) for c in columns]
+
+    def get(row):
+        return tuple(row[p] if p is not None and p < len(row) else '' for p in positions)
+    return get
+
+def finding_key_getter(header: list):
+    # A finding is identified by the check, where it ran and what it looked at
+    return key_getter(header, (CHECK_ID, REGION, RESOURCE_UID))
+
+def merge_headers(*headers) -> list:
+    merged = []
+    for header in headers:
+        for column in header:
+            if column not in merged:
+                merged.append(column)
+    return merged
+
+def project(rows, header: list, target: list):
+    # Re-orders rows from `header` onto the `target` column layout
+    if header == target:
+        yield from rows
+        return
+    index = column_index(target)
+    positions = [index[c] for c in header]
+    for row in rows:
+        projected = [''] * len(target)
+        for position, value in zip(positions, row):
+            projected[position] = value
+        yield projected
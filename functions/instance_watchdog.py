@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+import argparse
+import glob
+import os
+import subprocess
+import time
+
+from jobs import S3JobStore, update_phase
+
+
+# Appended to by the user_data `phase` function, one "<epoch> <phase> <job>"
+# line per transition. The header writes the instance's own bootstrap line
+# with job "-" before any job has a phase.
+PHASE_LOG = '/opt/phases.log'
+INSTANCE = '-'
+FINAL_PHASES = ('done', 'failed')
+
+# Wall clock seconds a job may spend in each phase. `done` covers the time
+# left after the last job finished, which should only be the log upload.
+DEFAULT_BUDGETS = {
+    'bootstrap': 3600,
+    'scanning': 43200,
+    'merging': 43200,
+    'building_ui': 3600,
+    'uploading': 3600
+}
+FINISH_BUDGET = 600
+DEFAULT_STALL_TIMEOUT = 1800
+
+
+def parse_budgets(text: str) -> dict:
+    # Phases left out keep their default budget rather than losing it
+    budgets = dict(DEFAULT_BUDGETS)
+    for item in (text or '').split(','):
+        if not item:
+            continue
+        phase, _, seconds = item.partition('=')
+        budgets[phase] = int(seconds)
+    return budgets
+
+def format_budgets(budgets: dict) -> str:
+    return ','.join(f'{phase}={seconds}' for phase, seconds in budgets.items())
+
+def read_phases(path: str) -> list:
+    transitions = []
+    if not os.path.exists(path):
+        return transitions
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3:
+                transitions.append((float(parts[0]), parts[1], parts[2]))
+    return transitions
+
+def job_phases(transitions: list) -> dict:
+    # Latest (phase, since) of every job, the instance's bootstrap line only
+    # counts until the first job reports a phase
+    jobs = {}
+    for at, phase, job in transitions:
+        jobs[job] = (phase, at)
+    if len(jobs) > 1:
+        jobs.pop(INSTANCE, None)
+    return jobs
+
+def progress_mark(patterns: list) -> tuple:
+    # Changes whenever any watched file grows or is rewritten
+    size, mtime = 0, 0
+    for path in {p for pattern in patterns for p in glob.glob(pattern)}:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        size += stat.st_size
+        mtime = max(mtime, stat.st_mtime)
+    return size, mtime
+
+
+class Watchdog:
+    def __init__(self, budgets: dict = None, stall_timeout: int = DEFAULT_STALL_TIMEOUT,
+                 finish_budget: int = FINISH_BUDGET):
+        self.budgets = DEFAULT_BUDGETS if budgets is None else budgets
+        self.stall_timeout = stall_timeout
+        self.finish_budget = finish_budget
+        self.mark = None
+        self.progressed = None
+
+    def check(self, transitions: list, mark: tuple, now: float) -> str:
+        # Returns why the instance should be stopped, None while it's healthy
+        if mark != self.mark:
+            self.mark = mark
+            self.progressed = now
+
+        jobs = job_phases(transitions)
+        active = {job: state for job, state in jobs.items() if state[0] not in FINAL_PHASES}
+        if jobs and not active:
+            finished = max(at for _, at in jobs.values())
+            if now - finished > self.finish_budget:
+                return f'still running {int(now - finished)}s after every job finished'
+            return None
+
+        for job, (phase, since) in sorted(active.items()):
+            budget = self.budgets.get(phase)
+            if budget and now - since > budget:
+                return f'{job} exceeded the {budget}s {phase} budget'
+
+        if self.stall_timeout and now - self.progressed > self.stall_timeout:
+            phases = ', '.join(sorted({phase for phase, _ in active.values()})) or 'bootstrap'
+            return f'no progress in {phases} for {int(now - self.progressed)}s'
+        return None
+
+
+def salvage(s3_client, bucket: str, object_key: str, patterns: list) -> list:
+    # Whatever output exists goes under {object_key}/partial/, next to the
+    # parts the streamer already uploaded
+    keys = []
+    for path in sorted({p for pattern in patterns for p in glob.glob(pattern)}):
+        key = f'{object_key}/partial/{os.path.basename(path)}'
+        try:
+            s3_client.upload_file(path, bucket, key)
+            keys.append(key)
+        except Exception as e:
+            print(f'Unable to upload {path}: {e}')
+    return keys
+
+def fail_jobs(store, jobs: list, reason: str):
+    # update_phase leaves finished jobs alone, so every job can be passed
+    for job in jobs:
+        try:
+            update_phase(store, job, 'failed', detail=f'Stopped by the watchdog: {reason}')
+        except Exception as e:
+            print(f'Unable to record {job} as failed: {e}')
+
+def watch(watchdog: Watchdog, phase_log: str, patterns: list, interval: float = 30,
+          clock=time.time, sleep=time.sleep) -> str:
+    while True:
+        try:
+            reason = watchdog.check(read_phases(phase_log), progress_mark(patterns), clock())
+        except Exception as e:
+            print(f'Watchdog check failed: {e}')
+            reason = None
+        if reason:
+            return reason
+        sleep(interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stop a stalled or over budget scanner instance, keeping its partial output.')
+    parser.add_argument('--bucket', required=True)
+    parser.add_argument('--object-key', required=True, help='Partial output is uploaded under {object_key}/partial/')
+    parser.add_argument('--jobs', required=True, help='Comma separated jobs on this instance, marked failed when stopped')
+    parser.add_argument('--budgets', default=format_budgets(DEFAULT_BUDGETS), help='i.e. scanning=43200,uploading=3600')
+    parser.add_argument('--stall-timeout', type=int, default=DEFAULT_STALL_TIMEOUT,
+                        help='Seconds without any watched file growing, 0 disables')
+    parser.add_argument('--phase-log', default=PHASE_LOG)
+    parser.add_argument('--interval', type=int, default=30)
+    parser.add_argument('--shutdown', default='/opt/shutdown.sh')
+    parser.add_argument('patterns', nargs='+', help='Glob patterns of logs and output files, watched and salvaged')
+    args = parser.parse_args()
+
+    watchdog = Watchdog(parse_budgets(args.budgets), args.stall_timeout)
+    reason = watch(watchdog, args.phase_log, args.patterns, args.interval)
+    print(f'Stopping the instance: {reason}')
+
+    import boto3
+    s3_client = boto3.client('s3')
+    keys = salvage(s3_client, args.bucket, args.object_key, args.patterns)
+    print(f'Uploaded {len(keys)} partial outputs to s3://{args.bucket}/{args.object_key}/partial/')
+    fail_jobs(S3JobStore(s3_client, args.bucket), args.jobs.split(','), reason)
+    subprocess.run(['bash', args.shutdown])
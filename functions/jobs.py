@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import re
+import time
+
+
+# Scan lifecycle, written by the API at launch (or when queueing it, see
+# dispatcher.py) and by the instance as it crosses each phase boundary
+PHASES = ('queued', 'bootstrap', 'scanning', 'merging', 'building_ui', 'uploading', 'done', 'failed')
+FINAL_PHASES = ('done', 'failed')
+JOB_ID_PATTERN = re.compile(r'^[A-Za-z0-9_.-]{1,128}$')
+
+
+class MemoryJobStore:
+    def __init__(self):
+        self.records = {}
+
+    def get(self, job_id: str) -> dict:
+        record = self.records.get(job_id)
+        return json.loads(json.dumps(record)) if record else None
+
+    def put(self, job_id: str, record: dict):
+        self.records[job_id] = json.loads(json.dumps(record))
+
+
+class S3JobStore:
+    # One small JSON object per job, so reading a status is a single GET by
+    # key no matter how many scans the bucket holds
+    def __init__(self, s3_client, bucket: str, prefix: str = 'jobs/'):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def key(self, job_id: str) -> str:
+        return f'{self.prefix}{job_id}.json'
+
+    def get(self, job_id: str) -> dict:
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self.key(job_id))
+        except Exception as e:
+            if getattr(e, 'response', {}).get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                return None
+            raise
+        return json.loads(response['Body'].read())
+
+    def put(self, job_id: str, record: dict):
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=self.key(job_id),
+            Body=json.dumps(record).encode(),
+            ContentType='application/json'
+        )
+
+
+def create_job(store, job_id: str, now: float = None, phase: str = 'bootstrap', **fields) -> dict:
+    now = now or time.time()
+    record = dict(fields, job_id=job_id, phase=phase, created=now, updated=now,
+                  history=[{'phase': phase, 'at': now}])
+    store.put(job_id, record)
+    return record
+
+def update_phase(store, job_id: str, phase: str, now: float = None, **fields) -> dict:
+    if phase not in PHASES:
+        raise ValueError(f'Unknown phase {phase}, expected one of {", ".join(PHASES)}')
+    now = now or time.time()
+    record = store.get(job_id) or {'job_id': job_id, 'created': now, 'history': []}
+
+    # A finished job stays finished, late writers (i.e. the exit trap) can't
+    # flip a completed scan to failed
+    if record.get('phase') in FINAL_PHASES:
+        return record
+
+    record.update(fields)
+    record['phase'] = phase
+    record['updated'] = now
+    record['history'].append({'phase': phase, 'at': now})
+    if phase in FINAL_PHASES:
+        record['finished'] = now
+        record['duration'] = now - started_at(record)
+    store.put(job_id, record)
+    return record
+
+def started_at(record: dict) -> float:
+    # Queued jobs are created when they're enqueued, their scan starts when
+    # they last leave the queue (a failed launch puts them back); the wait
+    # shouldn't count toward the duration that sizes the customer's next scan
+    start = None
+    for entry in record.get('history', []):
+        if entry['phase'] == 'queued':
+            start = None
+        elif start is None:
+            start = entry['at']
+    return start or record['created']
+
+def annotate_job(store, job_id: str, **fields) -> dict:
+    # Adds fields without a phase transition
+    record = store.get(job_id)
+    if record is None:
+        return None
+    record.update(fields)
+    store.put(job_id, record)
+    return record
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Record a scan job phase transition.')
+    parser.add_argument('--bucket', required=True)
+    parser.add_argument('--job', required=True)
+    parser.add_argument('--phase', required=True, choices=PHASES)
+    parser.add_argument('--detail', help='Free form detail, i.e. an error message')
+    parser.add_argument('--results', help='Findings CSV of a finished scan, its size is kept to size the next scan')
+    args = parser.parse_args()
+
+    import boto3
+    from findings import read_findings
+    from launch_strategy import save_size_hint
+
+    s3_client = boto3.client('s3')
+    fields = {'detail': args.detail} if args.detail else {}
+    if args.results:
+        fields['findings'] = len(read_findings(args.results)[1])
+    record = update_phase(S3JobStore(s3_client, args.bucket), args.job, args.phase, **fields)
+    print(f'Job {args.job} is {record["phase"]}')
+
+    if record['phase'] == 'done' and args.results and record.get('scan_name'):
+        save_size_hint(s3_client, args.bucket, record['scan_name'], record['duration'], record['findings'])
@@ -0,0 +1,109 @@
+import json
+
+
+# Instance sizes by how heavy the previous scan of the same customer was.
+# Each tier is (max_duration_seconds, max_findings); the first tier that fits
+# both limits wins. Tier n runs the configured instance types n sizes up
+# unless `size_tiers` in config.py lists the types per tier.
+SIZE_LIMITS = [
+    (2 * 3600, 5000),
+    (6 * 3600, 50000),
+    (None, None)
+]
+SIZE_LADDER = ['nano', 'micro', 'small', 'medium', 'large', 'xlarge', '2xlarge', '4xlarge', '8xlarge']
+
+# Errors that mean "try the next option" rather than "the request is wrong"
+CAPACITY_ERRORS = (
+    'InsufficientInstanceCapacity',
+    'InsufficientCapacity',
+    'SpotMaxPriceTooLow',
+    'MaxSpotInstanceCountExceeded',
+    'VcpuLimitExceeded',
+    'Unsupported'
+)
+
+SPOT_OPTIONS = {
+    'MarketType': 'spot',
+    'SpotOptions': {
+        'SpotInstanceType': 'one-time',
+        'InstanceInterruptionBehavior': 'terminate'
+    }
+}
+
+
+class NoCapacityError(Exception):
+    pass
+
+
+def hint_key(scan_name: str) -> str:
+    return f'hints/{scan_name.replace(" ", "-")}.json'
+
+def load_size_hint(s3_client, bucket: str, scan_name: str) -> dict:
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=hint_key(scan_name))
+        return json.loads(response['Body'].read())
+    except Exception as e:
+        print(f'No size hint for {scan_name}: {e}')
+        return None
+
+def save_size_hint(s3_client, bucket: str, scan_name: str, duration: float, findings: int):
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=hint_key(scan_name),
+        Body=json.dumps({'duration': duration, 'findings': findings}).encode(),
+        ContentType='application/json'
+    )
+
+def larger_type(instance_type: str, steps: int) -> str:
+    # t3.medium -> t3.large for one step; sizes off the ladder (metal, 12xlarge)
+    # stay as they are
+    family, _, size = instance_type.partition('.')
+    if size not in SIZE_LADDER:
+        return instance_type
+    return f'{family}.{SIZE_LADDER[min(SIZE_LADDER.index(size) + steps, len(SIZE_LADDER) - 1)]}'
+
+def size_tiers(instance_types: list) -> list:
+    # (max_duration_seconds, max_findings, instance types in priority order)
+    # per tier, from the configured types
+    tiers = []
+    for steps, (max_duration, max_findings) in enumerate(SIZE_LIMITS):
+        types = list(dict.fromkeys(larger_type(t, steps) for t in instance_types))
+        tiers.append((max_duration, max_findings, types))
+    return tiers
+
+def select_instance_types(hint: dict, default_types: list, tiers: list = None) -> list:
+    # Without history there is nothing to size from, use the configured types
+    if not hint:
+        return list(default_types)
+    tiers = tiers or size_tiers(default_types)
+    duration = hint.get('duration') or 0
+    findings = hint.get('findings') or 0
+    for max_duration, max_findings, instance_types in tiers:
+        if (max_duration is None or duration <= max_duration) and (max_findings is None or findings <= max_findings):
+            return list(instance_types)
+    return list(tiers[-1][2])
+
+def launch_attempts(instance_types: list, use_spot: bool) -> list:
+    # Spot across every type first, then the same types on demand
+    attempts = [(t, 'spot') for t in instance_types] if use_spot else []
+    return attempts + [(t, 'on-demand') for t in instance_types]
+
+def error_code(e: Exception) -> str:
+    return getattr(e, 'response', {}).get('Error', {}).get('Code', '')
+
+def launch_with_strategy(ec2_client, params: dict, instance_types: list, use_spot: bool) -> tuple:
+    # Returns (run_instances response, market, list of failed attempts)
+    failures = []
+    for instance_type, market in launch_attempts(instance_types, use_spot):
+        request = dict(params, InstanceType=instance_type)
+        if market == 'spot':
+            request['InstanceMarketOptions'] = SPOT_OPTIONS
+        try:
+            return ec2_client.run_instances(**request), market, failures
+        except Exception as e:
+            code = error_code(e)
+            if code not in CAPACITY_ERRORS:
+                raise
+            print(f'Unable to launch {market} {instance_type}: {code}')
+            failures.append({'instance_type': instance_type, 'market': market, 'error': code})
+    raise NoCapacityError(f'No capacity for any of {", ".join(instance_types)}: {failures}')
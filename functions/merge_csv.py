@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+
+from findings import FINDING_UID, column_index, open_reader, write_findings
+
+
+def merge_findings(paths: list, out_path: str) -> dict:
+    # Header is the first file's header followed by any columns first seen in
+    # later files. Rows keep file order then in-file order, and duplicates
+    # (global services report the same finding from every region) are dropped
+    # by FINDING_UID, or by the whole row when that column is absent.
+    header = []
+    sources = []
+    for path in paths:
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            continue
+        f, reader = open_reader(path)
+        file_header = next(reader, None)
+        if not file_header:
+            f.close()
+            continue
+        for column in file_header:
+            if column not in header:
+                header.append(column)
+        sources.append((f, reader, file_header))
+
+    stats = {'files': len(sources), 'rows_in': 0, 'rows_out': 0, 'duplicates': 0}
+
+    def rows():
+        seen = set()
+        index = column_index(header)
+        uid_position = index.get(FINDING_UID)
+        for f, reader, file_header in sources:
+            # Map each file's columns onto the merged header
+            positions = [index[c] for c in file_header]
+            with f:
+                for row in reader:
+                    stats['rows_in'] += 1
+                    merged = [''] * len(header)
+                    for position, value in zip(positions, row):
+                        merged[position] = value
+                    key = merged[uid_position] if uid_position is not None and merged[uid_position] else tuple(merged)
+                    if key in seen:
+                        stats['duplicates'] += 1
+                        continue
+                    seen.add(key)
+                    yield merged
+
+    if not header:
+        open(out_path, 'w').close()
+        return stats
+    stats['rows_out'] = write_findings(out_path, header, rows())
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Merge per-region Prowler CSV outputs into a single CSV.')
+    parser.add_argument('output')
+    parser.add_argument('inputs', nargs='+')
+    args = parser.parse_args()
+
+    # Never read the output as one of the inputs when globbing
+    inputs = sorted(p for p in args.inputs if os.path.abspath(p) != os.path.abspath(args.output))
+    print(merge_findings(inputs, args.output))
@@ -0,0 +1,59 @@
+import heapq
+import math
+
+from launch_strategy import larger_type
+
+
+# A single `prowler aws` process peaks around 1.5GiB on large accounts, and
+# the rest of the instance (OS, UI build) needs some headroom. The configured
+# instance types are sized for one scan, each size up doubles the memory.
+MEMORY_PER_SCAN_GIB = 2
+BASE_MEMORY_GIB = 2
+DEFAULT_WEIGHT = 1.0
+
+
+def types_for_concurrency(concurrency: int, instance_types: list) -> list:
+    memory = BASE_MEMORY_GIB + concurrency * MEMORY_PER_SCAN_GIB
+    steps = max(0, math.ceil(math.log2(memory / (BASE_MEMORY_GIB + MEMORY_PER_SCAN_GIB))))
+    return list(dict.fromkeys(larger_type(t, steps) for t in instance_types))
+
+def estimate_duration(weights: list, concurrency: int) -> float:
+    # Longest-first onto `concurrency` parallel slots, the result is the makespan
+    slots = [0.0] * max(1, concurrency)
+    for weight in sorted(weights, reverse=True):
+        heapq.heapreplace(slots, slots[0] + weight)
+    return max(slots)
+
+# Pack accounts onto as few scanner instances as the limits allow. `accounts`
+# is a list of dicts with an optional `weight` (expected scan duration, in any
+# unit). Returns one plan per instance with the indexes of its accounts, the
+# per-instance concurrency and the configured instance types sized up for it.
+def plan_instances(accounts: list, concurrency: int, max_accounts_per_instance: int, instance_types: list) -> list:
+    if not accounts:
+        return []
+    concurrency = max(1, concurrency)
+    per_instance = max(1, max_accounts_per_instance)
+    instance_count = math.ceil(len(accounts) / per_instance)
+
+    # Longest processing time first: heaviest account goes to the least loaded
+    # instance that still has room, which balances the per-instance makespan
+    weights = [float(a.get('weight') or DEFAULT_WEIGHT) for a in accounts]
+    order = sorted(range(len(accounts)), key=lambda i: (-weights[i], i))
+    bins = [{'load': 0.0, 'accounts': []} for _ in range(instance_count)]
+    for index in order:
+        open_bins = [b for b in bins if len(b['accounts']) < per_instance]
+        target = min(open_bins, key=lambda b: b['load'])
+        target['load'] += weights[index]
+        target['accounts'].append(index)
+
+    plans = []
+    for b in bins:
+        indexes = sorted(b['accounts'])
+        instance_concurrency = min(concurrency, len(indexes))
+        plans.append({
+            'accounts': indexes,
+            'concurrency': instance_concurrency,
+            'instance_types': types_for_concurrency(instance_concurrency, instance_types),
+            'estimated_duration': estimate_duration([weights[i] for i in indexes], instance_concurrency)
+        })
+    return plans
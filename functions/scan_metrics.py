@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+# Where a scan's wall time goes. The API records its launch timings in the
+# job record; on the instance the user_data `step` function marks each step
+# in /opt/steps.log and `phase` each job phase in /opt/phases.log. `build`
+# turns those, plus per-service durations parsed from the Prowler logs, into
+# one metrics object per scan at metrics/{object_key}.json, optionally also
+# sent to CloudWatch as embedded metric format (EMF) records. `aggregate`
+# reports percentiles per timing across every stored scan.
+#
+#   scan_metrics.py build --bucket B --object-key Acme-Corp-1721159874 --logs '/opt/Acme-Corp-1721159874*.log'
+#   scan_metrics.py aggregate --bucket B [--since 2024-07-01]
+
+import argparse
+import glob
+import json
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from jobs import S3JobStore
+
+
+METRICS_PREFIX = 'metrics/'
+NAMESPACE = 'ProwlerScanner'
+PHASE_LOG = '/opt/phases.log'
+TIMING_GROUPS = ('launch', 'steps', 'phases', 'services')
+FINAL_PHASES = ('done', 'failed')
+
+# Prowler's log file records are JSON-like lines with a timestamp and the
+# module that logged them; messages aren't escaped, so fields are matched
+# rather than parsed
+LOG_RECORD = re.compile(r'"timestamp": "(?P<timestamp>[^"]+)".*?"module": "(?P<module>[^"]+)"')
+LOG_TIME_FORMATS = ('%Y-%m-%d %H:%M:%S,%f', '%Y-%m-%d %H:%M:%S', '%m/%d/%Y %I:%M:%S %p')
+
+# Modules that aren't a service; their time is reported as `other`
+CORE_MODULES = ('aws_provider', 'aws_regions', 'check', 'compliance', 'outputs', 'prowler', 'utils')
+
+
+class Stopwatch:
+    # Laps of a request path, i.e. {'ami_lookup': 0.004, 'run_instances': 0.81}
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.started = self.last = clock()
+        self.timings = {}
+
+    def lap(self, name: str):
+        now = self.clock()
+        self.timings[name] = round(now - self.last, 3)
+        self.last = now
+
+    def total(self) -> dict:
+        return dict(self.timings, total=round(self.last - self.started, 3))
+
+
+def metrics_key(object_key: str) -> str:
+    return f'{METRICS_PREFIX}{object_key}.json'
+
+def read_marks(path: str, job: str = None) -> list:
+    # (epoch, name) from a step log, or from a phase log for one job
+    marks = []
+    try:
+        with open(path) as f:
+            lines = f.readlines()
+    except OSError:
+        return marks
+    for line in lines:
+        parts = line.split()
+        if len(parts) < 2:
+            continue
+        if job is not None and (len(parts) < 3 or parts[2] not in (job, '-')):
+            continue
+        marks.append((float(parts[0]), parts[1]))
+    return marks
+
+def durations(marks: list, end: float) -> dict:
+    # Each mark runs until the next one, the last until `end`; repeated
+    # names (i.e. a phase re-entered) add up
+    totals = {}
+    for (at, name), (following, _) in zip(marks, marks[1:] + [(end, None)]):
+        totals[name] = round(totals.get(name, 0) + max(0, following - at), 3)
+    return totals
+
+def parse_log_time(text: str) -> float:
+    for fmt in LOG_TIME_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).timestamp()
+        except ValueError:
+            continue
+    return None
+
+def module_service(module: str) -> str:
+    # Checks are modules named {service}_{check}, service clients
+    # {service}_service and {service}_client
+    if module in CORE_MODULES or '_' not in module:
+        return 'other'
+    return module.split('_', 1)[0]
+
+def service_durations(lines) -> dict:
+    # The time between two log records is charged to the service that logged
+    # the first, so a check's duration runs until the next check logs
+    totals = {}
+    previous = None
+    for line in lines:
+        match = LOG_RECORD.search(line)
+        if not match:
+            continue
+        at = parse_log_time(match.group('timestamp'))
+        if at is None:
+            continue
+        if previous:
+            service, started = previous
+            totals[service] = round(totals.get(service, 0) + max(0, at - started), 3)
+        previous = (module_service(match.group('module')), at)
+    return totals
+
+def log_service_durations(patterns: list) -> dict:
+    # Region parallel scans log one file per region, their times add up
+    totals = {}
+    for path in sorted({p for pattern in patterns for p in glob.glob(pattern)}):
+        with open(path, errors='replace') as f:
+            for service, seconds in service_durations(f).items():
+                totals[service] = round(totals.get(service, 0) + seconds, 3)
+    return totals
+
+def build_metrics(object_key: str, job: dict = None, steps: list = None, phases: list = None,
+                  services: dict = None, now: float = None) -> dict:
+    now = now or time.time()
+    job = job or {}
+    metrics = {
+        'object_key': object_key,
+        'scan_name': job.get('scan_name'),
+        'instance_type': job.get('instance_type'),
+        'market': job.get('market'),
+        'generated': now,
+        'launch': job.get('timings') or {},
+        'steps': durations(steps or [], now),
+        'phases': {phase: seconds for phase, seconds in durations(phases or [], now).items()
+                   if phase not in FINAL_PHASES},
+        'services': services or {}
+    }
+    if job.get('created'):
+        metrics['total'] = round(now - job['created'], 3)
+    return metrics
+
+def flatten(metrics: dict) -> dict:
+    # {'launch.ami_lookup': 0.12, 'steps.scan': 2410.5, ...}
+    return {f'{group}.{name}': seconds for group in TIMING_GROUPS
+            for name, seconds in (metrics.get(group) or {}).items()}
+
+def emf_records(metrics: dict, namespace: str = NAMESPACE) -> list:
+    # One EMF record per timing group, each timing a metric in seconds
+    # dimensioned by group
+    records = []
+    for group in TIMING_GROUPS:
+        timings = metrics.get(group) or {}
+        if not timings:
+            continue
+        record = {
+            '_aws': {
+                'Timestamp': int(metrics.get('generated', time.time()) * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': namespace,
+                    'Dimensions': [['Group']],
+                    'Metrics': [{'Name': name, 'Unit': 'Seconds'} for name in timings]
+                }]
+            },
+            'Group': group,
+            'ObjectKey': metrics.get('object_key'),
+            **timings
+        }
+        records.append(record)
+    return records
+
+def send_emf(logs_client, log_group: str, stream: str, records: list):
+    try:
+        logs_client.create_log_stream(logGroupName=log_group, logStreamName=stream)
+    except Exception as e:
+        if getattr(e, 'response', {}).get('Error', {}).get('Code') != 'ResourceAlreadyExistsException':
+            raise
+    events = [{'timestamp': r['_aws']['Timestamp'], 'message': json.dumps(r)} for r in records]
+    if events:
+        logs_client.put_log_events(logGroupName=log_group, logStreamName=stream, events=events)
+
+def percentile(values: list, p: float) -> float:
+    # Linear interpolation between the closest ranks
+    values = sorted(values)
+    if not values:
+        return None
+    rank = (len(values) - 1) * p / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+def aggregate(metrics_list: list, percentiles: tuple = (50, 95)) -> dict:
+    samples = {}
+    for metrics in metrics_list:
+        for name, seconds in flatten(metrics).items():
+            samples.setdefault(name, []).append(seconds)
+        if metrics.get('total') is not None:
+            samples.setdefault('total', []).append(metrics['total'])
+    return {
+        name: dict({'count': len(values)}, **{f'p{p}': round(percentile(values, p), 3) for p in percentiles})
+        for name, values in sorted(samples.items())
+    }
+
+def render_table(summary: dict, percentiles: tuple = (50, 95)) -> str:
+    header = ['timing', 'count'] + [f'p{p}' for p in percentiles]
+    rows = [[name, str(stats['count'])] + [f'{stats[f"p{p}"]:.1f}' for p in percentiles]
+            for name, stats in summary.items()]
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    lines = ['  '.join(cell.ljust(width) for cell, width in zip(row, widths)) for row in [header] + rows]
+    return '\n'.join(lines)
+
+def load_metrics(s3_client, bucket: str, since: datetime = None, concurrency: int = 16) -> list:
+    keys = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=METRICS_PREFIX):
+        for item in page.get('Contents', []):
+            if since and item['LastModified'].replace(tzinfo=None) < since:
+                continue
+            keys.append(item['Key'])
+
+    def load(key):
+        return json.loads(s3_client.get_object(Bucket=bucket, Key=key)['Body'].read())
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(load, keys))
+
+def publish(s3_client, bucket: str, metrics: dict):
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=metrics_key(metrics['object_key']),
+        Body=json.dumps(metrics, indent=1).encode(),
+        ContentType='application/json'
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Record and summarize scan phase timings.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build')
+    build_parser.add_argument('--bucket', required=True)
+    build_parser.add_argument('--object-key', required=True)
+    build_parser.add_argument('--steps', help='Step log, only for instances that run a single scan')
+    build_parser.add_argument('--phases', default=PHASE_LOG)
+    build_parser.add_argument('--logs', nargs='*', default=[], help='Prowler log files, glob patterns')
+    build_parser.add_argument('--log-group', help='Also send the timings as EMF records to this log group')
+
+    aggregate_parser = subparsers.add_parser('aggregate')
+    aggregate_parser.add_argument('--bucket', required=True)
+    aggregate_parser.add_argument('--since', type=datetime.fromisoformat, help='Only scans stored since, i.e. 2024-07-01')
+    aggregate_parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    import boto3
+    s3_client = boto3.client('s3')
+    if args.command == 'build':
+        job = S3JobStore(s3_client, args.bucket).get(args.object_key)
+        metrics = build_metrics(
+            args.object_key, job,
+            steps=read_marks(args.steps) if args.steps else [],
+            phases=read_marks(args.phases, args.object_key),
+            services=log_service_durations(args.logs)
+        )
+        publish(s3_client, args.bucket, metrics)
+        if args.log_group:
+            send_emf(boto3.client('logs'), args.log_group, args.object_key, emf_records(metrics))
+        json.dump(metrics, sys.stdout, indent=1)
+        print()
+    else:
+        summary = aggregate(load_metrics(s3_client, args.bucket, args.since))
+        if args.json:
+            json.dump(summary, sys.stdout, indent=1)
+            print()
+        else:
+            print(render_table(summary))
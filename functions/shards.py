@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+# Splits one account's scan across instances by Prowler service. Shards are
+# balanced on the per-service runtimes of the customer's last scan (see
+# scan_metrics.py), or on DEFAULT_SERVICE_WEIGHTS without history. Every
+# shard but the first runs an explicit `--service` list; shard 0 runs the
+# rest with `--excluded-service`, so services missing from the weights are
+# still scanned. Shard 0 also waits for the others and merges their CSVs
+# into the scan's single standard CSV before building the report.
+#
+#   shards.py args --services s3 ec2 --prowler-dir /opt/prowler
+#   shards.py merge --bucket B --object-key Acme-Corp-1721159874 --shards 4 --current /opt/shard0.csv --out /opt/Acme-Corp-1721159874.csv
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+from jobs import FINAL_PHASES, S3JobStore, annotate_job
+from merge_csv import merge_findings
+
+
+# Relative weights of the services that dominate a typical large account,
+# every other service counts as one
+DEFAULT_SERVICE_WEIGHTS = {
+    'ec2': 40,
+    'iam': 25,
+    's3': 20,
+    'cloudwatch': 15,
+    'vpc': 12,
+    'rds': 8,
+    'awslambda': 8,
+    'cloudtrail': 6,
+    'kms': 5,
+    'elbv2': 5,
+    'ssm': 4,
+    'ecr': 4,
+    'sns': 3,
+    'sqs': 3,
+    'dynamodb': 3
+}
+IGNORED_SERVICES = ('other',)
+# Printed by `args` for a shard with nothing left to scan
+SKIP = 'skip'
+
+
+def shard_job_id(object_key: str, index: int) -> str:
+    # Shard 0 carries the scan's own job, the others report on their own
+    return object_key if index == 0 else f'{object_key}-shard{index}'
+
+def shard_key(object_key: str, index: int) -> str:
+    return f'{object_key}/shards/{index}.csv'
+
+def latest_service_runtimes(s3_client, bucket: str, scan_name: str) -> dict:
+    # Per-service seconds of this customer's most recent scan. A sharded scan
+    # has a metrics object per shard (metrics/{key}-shard{N}.json besides
+    # shard 0's metrics/{key}.json), each with the services that shard ran.
+    slug = scan_name.replace(' ', '-')
+    pattern = re.compile(rf'^metrics/{re.escape(slug)}-(\d+)(?:-shard\d+)?\.json$')
+    scans = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=f'metrics/{slug}-'):
+        for obj in page.get('Contents', []):
+            match = pattern.match(obj['Key'])
+            if match:
+                scans.setdefault(int(match.group(1)), []).append(obj['Key'])
+    if not scans:
+        return {}
+    runtimes = {}
+    for key in sorted(scans[max(scans)]):
+        metrics = json.loads(s3_client.get_object(Bucket=bucket, Key=key)['Body'].read())
+        for service, seconds in (metrics.get('services') or {}).items():
+            if service not in IGNORED_SERVICES and seconds > 0:
+                runtimes[service] = runtimes.get(service, 0) + seconds
+    return runtimes
+
+def plan_shards(runtimes: dict, count: int, defaults: dict = None) -> list:
+    weights = {s: float(t) for s, t in (runtimes or defaults or DEFAULT_SERVICE_WEIGHTS).items()
+               if s not in IGNORED_SERVICES}
+    count = max(1, min(count, len(weights) + 1))
+
+    # Longest processing time first, the heaviest service goes to the least
+    # loaded shard; shard 0 starts with one unit for the unlisted services
+    shards = [{'index': i, 'services': [], 'weight': 1.0 if i == 0 else 0.0} for i in range(count)]
+    for service in sorted(weights, key=lambda s: (-weights[s], s)):
+        target = min(shards, key=lambda s: (s['weight'], s['index']))
+        target['services'].append(service)
+        target['weight'] += weights[service]
+
+    listed = sorted(s for shard in shards[1:] for s in shard['services'])
+    plans = []
+    for shard in shards:
+        plan = {'index': shard['index'], 'weight': round(shard['weight'], 3)}
+        if shard['index'] == 0:
+            plan['excluded_services'] = listed
+        else:
+            plan['services'] = sorted(shard['services'])
+        plans.append(plan)
+    return plans
+
+def available_services(prowler_dir: str) -> set:
+    services_dir = os.path.join(prowler_dir, 'prowler', 'providers', 'aws', 'services')
+    return {name for name in os.listdir(services_dir) if os.path.isdir(os.path.join(services_dir, name))}
+
+def shard_arguments(services: list = None, excluded: list = None, available: set = None) -> str:
+    # Prowler arguments for one shard, or SKIP for a listed shard with nothing
+    # left to scan. Names this Prowler version doesn't have are dropped since
+    # Prowler rejects unknown services.
+    if services is not None:
+        services = [s for s in services if available is None or s in available]
+        return f'--service {" ".join(services)}' if services else SKIP
+    excluded = [s for s in excluded or [] if available is None or s in available]
+    return f'--excluded-service {" ".join(excluded)}' if excluded else ''
+
+def wait_for_shards(store, job_ids: list, timeout: float, interval: float = 30, clock=time.time,
+                    sleep=time.sleep) -> dict:
+    # Latest phase of every shard job once they are all finished, or at the
+    # deadline with whatever phase each one reached
+    deadline = clock() + timeout
+    while True:
+        phases = {}
+        for job_id in job_ids:
+            record = store.get(job_id)
+            phases[job_id] = record.get('phase') if record else None
+        pending = [j for j, p in phases.items() if p not in FINAL_PHASES]
+        # Printing doubles as progress for the instance watchdog
+        print(f'Waiting on {len(pending)} of {len(job_ids)} shards: {", ".join(pending)}', flush=True)
+        if not pending or clock() >= deadline:
+            return phases
+        sleep(interval)
+
+def merge_shards(s3_client, store, bucket: str, object_key: str, count: int, current: str, out: str,
+                 timeout: float, workdir: str, interval: float = 30, clock=time.time, sleep=time.sleep) -> dict:
+    job_ids = [shard_job_id(object_key, i) for i in range(1, count)]
+    phases = wait_for_shards(store, job_ids, timeout, interval, clock, sleep)
+
+    paths = [current]
+    merged, missing = [0], []
+    os.makedirs(workdir, exist_ok=True)
+    for index in range(1, count):
+        if phases[shard_job_id(object_key, index)] != 'done':
+            missing.append(index)
+            continue
+        path = os.path.join(workdir, f'{index}.csv')
+        s3_client.download_file(bucket, shard_key(object_key, index), path)
+        paths.append(path)
+        merged.append(index)
+
+    stats = merge_findings(paths, out)
+    summary = dict(stats, shards_merged=merged, shards_missing=missing)
+    annotate_job(store, object_key, shards_merged=merged, shards_missing=missing)
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Shard a Prowler scan by service and merge the shards.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    args_parser = subparsers.add_parser('args')
+    args_parser.add_argument('--services', nargs='*', help='Services of a listed shard')
+    args_parser.add_argument('--excluded', nargs='*', help='Services shard 0 leaves to the other shards')
+    args_parser.add_argument('--prowler-dir', default='/opt/prowler')
+
+    merge_parser = subparsers.add_parser('merge')
+    merge_parser.add_argument('--bucket', required=True)
+    merge_parser.add_argument('--object-key', required=True)
+    merge_parser.add_argument('--shards', type=int, required=True)
+    merge_parser.add_argument('--current', required=True, help="This instance's shard CSV")
+    merge_parser.add_argument('--out', required=True)
+    merge_parser.add_argument('--timeout', type=int, default=43200, help='Seconds to wait for the other shards')
+    args = parser.parse_args()
+
+    if args.command == 'args':
+        print(shard_arguments(args.services, args.excluded, available_services(args.prowler_dir)))
+        raise SystemExit(0)
+
+    import boto3
+    s3_client = boto3.client('s3')
+    summary = merge_shards(s3_client, S3JobStore(s3_client, args.bucket), args.bucket, args.object_key,
+                           args.shards, args.current, args.out, args.timeout, f'/opt/shards/{args.object_key}')
+    json.dump(summary, sys.stdout, indent=1)
+    print()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+import argparse
+import glob
+import json
+import os
+import signal
+import time
+
+
+# Streams scan output to S3 while Prowler runs. New data in every watched file
+# is uploaded as a standalone part object (CSV parts repeat the header) and a
+# manifest listing every part is rewritten after each upload, so a crashed
+# instance loses at most one interval of work.
+
+
+def csv_record_ends(data: bytes) -> list:
+    # Offsets just past each complete CSV record in data. A newline only ends
+    # a record outside a quoted field, i.e. after an even number of quote
+    # characters (escaped quotes are doubled so they keep the parity).
+    ends = []
+    in_quotes = False
+    for i, byte in enumerate(data):
+        if byte == 0x22:
+            in_quotes = not in_quotes
+        elif byte == 0x0a and not in_quotes:
+            ends.append(i + 1)
+    return ends
+
+def line_ends(data: bytes) -> list:
+    ends = []
+    position = data.find(b'\n')
+    while position != -1:
+        ends.append(position + 1)
+        position = data.find(b'\n', position + 1)
+    return ends
+
+
+class OutputStreamer:
+    def __init__(self, s3_client, bucket: str, object_key: str, patterns: list, state_path: str = None, clock=time.time):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.object_key = object_key
+        self.patterns = patterns
+        self.state_path = state_path
+        self.clock = clock
+        self.manifest = {
+            'object_key': object_key,
+            'started': clock(),
+            'updated': clock(),
+            'complete': False,
+            'sources': {},
+            'parts': []
+        }
+        if state_path and os.path.exists(state_path):
+            with open(state_path) as f:
+                self.manifest = json.load(f)
+
+    @property
+    def manifest_key(self) -> str:
+        return f'{self.object_key}/manifest.json'
+
+    def poll(self) -> list:
+        uploaded = []
+        paths = sorted({p for pattern in self.patterns for p in glob.glob(pattern)})
+        for path in paths:
+            part = self.upload_new_data(path)
+            if part:
+                uploaded.append(part)
+        if uploaded:
+            self.save_manifest()
+        return uploaded
+
+    def finalize(self) -> dict:
+        self.poll()
+        self.manifest['complete'] = True
+        self.save_manifest()
+        return self.manifest
+
+    def upload_new_data(self, path: str) -> dict:
+        name = os.path.basename(path)
+        is_csv = name.endswith('.csv')
+        source = self.manifest['sources'].setdefault(name, {'offset': 0, 'header': None})
+
+        with open(path, 'rb') as f:
+            f.seek(source['offset'])
+            data = f.read()
+        ends = csv_record_ends(data) if is_csv else line_ends(data)
+        if not ends:
+            return None
+        chunk = data[:ends[-1]]
+        source['offset'] += len(chunk)
+
+        # The first record of a CSV is its header, later parts repeat it so
+        # each part can be read on its own
+        records = len(ends)
+        if is_csv and source['header'] is None:
+            source['header'] = chunk[:ends[0]].decode()
+            chunk = chunk[ends[0]:]
+            records -= 1
+        if not records:
+            return None
+
+        sequence = len(self.manifest['parts'])
+        extension = 'csv' if is_csv else 'log'
+        key = f'{self.object_key}/parts/{sequence:05d}-{os.path.splitext(name)[0]}.{extension}'
+        payload = source['header'].encode() + chunk if is_csv else chunk
+        self.s3_client.put_object(Bucket=self.bucket, Key=key, Body=payload)
+
+        part = {
+            'key': key,
+            'source': name,
+            'bytes': len(payload),
+            'records': records,
+            'created': self.clock()
+        }
+        self.manifest['parts'].append(part)
+        return part
+
+    def save_manifest(self):
+        self.manifest['updated'] = self.clock()
+        body = json.dumps(self.manifest, indent=2)
+        if self.state_path:
+            with open(self.state_path, 'w') as f:
+                f.write(body)
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=self.manifest_key,
+            Body=body.encode(),
+            ContentType='application/json'
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stream growing scan output files to S3 as part objects.')
+    parser.add_argument('--bucket', required=True)
+    parser.add_argument('--object-key', required=True)
+    parser.add_argument('--interval', type=int, default=60, help='Seconds between uploads')
+    parser.add_argument('--state', help='Local state file, lets a restarted streamer resume')
+    parser.add_argument('--finalize', action='store_true', help='Upload remaining data, mark the manifest complete and exit')
+    parser.add_argument('patterns', nargs='+', help='Glob patterns of files to stream')
+    args = parser.parse_args()
+
+    import boto3
+    streamer = OutputStreamer(boto3.client('s3'), args.bucket, args.object_key, args.patterns, args.state)
+    if args.finalize:
+        manifest = streamer.finalize()
+        print(f'Streamed {len(manifest["parts"])} parts to s3://{args.bucket}/{streamer.manifest_key}')
+        raise SystemExit(0)
+
+    # Upload on an interval until stopped, a final poll runs on SIGTERM
+    running = True
+
+    def stop(signum, frame):
+        global running
+        running = False
+    signal.signal(signal.SIGTERM, stop)
+
+    while running:
+        try:
+            streamer.poll()
+        except Exception as e:
+            print(f'Failed to stream output: {e}')
+        for _ in range(args.interval):
+            if not running:
+                break
+            time.sleep(1)
+    streamer.poll()
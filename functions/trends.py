@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+# Compares successive scans of the same customer: findings that are new,
+# resolved or persisting since the previous scan, and failed findings per
+# severity across the scan history. Only the previous scan's failed findings
+# are held in memory (a hash index on the finding key); the current scan is
+# streamed through it, so memory stays bounded by one scan's failures.
+#
+#   trends.py diff PREVIOUS.csv CURRENT.csv [--changes changes.csv]
+#   trends.py report --bucket B --scan-name "Acme Corp" --object-key Acme-Corp-1721159874 --current /opt/Acme-Corp-1721159874.csv
+
+import argparse
+import json
+import os
+import re
+import sys
+
+from findings import (
+    CHECK_ID, REGION, RESOURCE_UID, SERVICE_NAME, SEVERITY, STATUS, column_index, finding_key_getter, key_getter,
+    open_reader, open_writer
+)
+
+
+CHANGES = ('new', 'resolved', 'persisting')
+CHANGE_HEADER = ['CHANGE', CHECK_ID, REGION, RESOURCE_UID, SERVICE_NAME, SEVERITY]
+SEVERITY_ORDER = ('critical', 'high', 'medium', 'low', 'informational')
+
+
+def stream_findings(path):
+    # (header, row iterator) without loading the file
+    f, reader = open_reader(path)
+    header = next(reader, None) or []
+    if not header:
+        f.close()
+
+    def rows():
+        with f:
+            yield from reader
+    return header, rows()
+
+def index_failures(path) -> dict:
+    # finding key -> (severity, service) for every failed finding
+    header, rows = stream_findings(path)
+    if not header:
+        return {}
+    get_key = finding_key_getter(header)
+    get = key_getter(header, (STATUS, SEVERITY, SERVICE_NAME))
+    failures = {}
+    for row in rows:
+        status, severity, service = get(row)
+        if status == 'FAIL':
+            failures[get_key(row)] = (severity.lower(), service)
+    return failures
+
+def empty_counts() -> dict:
+    return {change: {} for change in CHANGES}
+
+def count(counts: dict, change: str, severity: str):
+    counts[change][severity] = counts[change].get(severity, 0) + 1
+
+def diff_scans(previous_path, current_path, on_change=None) -> dict:
+    # Counts of new, resolved and persisting failed findings by severity.
+    # on_change(change, key, severity, service) sees every finding.
+    previous = index_failures(previous_path) if previous_path else {}
+    counts = empty_counts()
+    header, rows = stream_findings(current_path)
+    if header:
+        get_key = finding_key_getter(header)
+        get = key_getter(header, (STATUS, SEVERITY, SERVICE_NAME))
+        for row in rows:
+            status, severity, service = get(row)
+            if status != 'FAIL':
+                continue
+            key = get_key(row)
+            # pop so whatever is left in `previous` was resolved
+            change = 'persisting' if previous.pop(key, None) else 'new'
+            count(counts, change, severity.lower())
+            if on_change:
+                on_change(change, key, severity.lower(), service)
+    for key, (severity, service) in previous.items():
+        count(counts, 'resolved', severity)
+        if on_change:
+            on_change('resolved', key, severity, service)
+    return counts
+
+def severity_counts(path) -> dict:
+    header, rows = stream_findings(path)
+    counts = {}
+    if not header:
+        return counts
+    index = column_index(header)
+    status, severity = index.get(STATUS), index.get(SEVERITY)
+    for row in rows:
+        if status is not None and row[status] == 'FAIL':
+            level = row[severity].lower() if severity is not None else ''
+            counts[level] = counts.get(level, 0) + 1
+    return counts
+
+def ordered(counts: dict) -> dict:
+    result = {s: counts[s] for s in SEVERITY_ORDER if s in counts}
+    result.update({s: c for s, c in sorted(counts.items()) if s not in result})
+    return result
+
+def compare(scans: list, changes_path: str = None) -> dict:
+    # scans is [(scan id, csv path)] oldest first; the last two are diffed
+    # and every scan contributes a point to the trend
+    if not scans:
+        raise ValueError('No scans to compare')
+    trend = []
+    for scan_id, path in scans:
+        fails = severity_counts(path)
+        trend.append({'scan': scan_id, 'failed': sum(fails.values()), 'severity': ordered(fails)})
+
+    previous_id, previous_path = scans[-2] if len(scans) > 1 else (None, None)
+    current_id, current_path = scans[-1]
+    if changes_path:
+        f, writer = open_writer(changes_path)
+        with f:
+            writer.writerow(CHANGE_HEADER)
+            counts = diff_scans(previous_path, current_path,
+                                lambda change, key, severity, service: writer.writerow([change, *key, service, severity]))
+    else:
+        counts = diff_scans(previous_path, current_path)
+
+    return {
+        'current': current_id,
+        'previous': previous_id,
+        'totals': {change: sum(counts[change].values()) for change in CHANGES},
+        'changes': {change: ordered(counts[change]) for change in CHANGES},
+        'trend': trend
+    }
+
+def scan_pattern(scan_name: str):
+    # {slug}-{ts}.csv, or the artifact store's artifacts/{slug}-{ts}.json
+    slug = re.escape(scan_name.replace(' ', '-'))
+    return re.compile(rf'^(?:{slug}-(\d+)\.csv|artifacts/{slug}-(\d+)\.json)$')
+
+def list_scans(s3_client, bucket: str, scan_name: str) -> list:
+    # [(ts, key)] for every stored scan of this customer, oldest first,
+    # listing only the customer's prefixes
+    slug = scan_name.replace(' ', '-')
+    pattern = scan_pattern(scan_name)
+    scans = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for prefix in (f'{slug}-', f'artifacts/{slug}-'):
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                match = pattern.match(obj['Key'])
+                if match:
+                    scans[int(match.group(1) or match.group(2))] = obj['Key']
+    return sorted(scans.items())
+
+def download_scan(s3_client, bucket: str, key: str, out: str) -> str:
+    if key.startswith('artifacts/'):
+        from artifacts import fetch
+        object_key = key[len('artifacts/'):-len('.json')]
+        fetch(s3_client, bucket, object_key, f'{object_key}.csv', out)
+    else:
+        s3_client.download_file(bucket, key, out)
+    return out
+
+def report(s3_client, bucket: str, scan_name: str, object_key: str, current: str, history: int = 5,
+           workdir: str = '/opt/trends') -> dict:
+    # Diffs the current scan against the previous one and uploads
+    # {object_key}-trend.json and {object_key}-changes.csv next to the scan
+    workdir = os.path.join(workdir, object_key)
+    os.makedirs(workdir, exist_ok=True)
+    current_ts = int(object_key.rsplit('-', 1)[-1])
+    previous = [(ts, key) for ts, key in list_scans(s3_client, bucket, scan_name) if ts < current_ts][-history:]
+    scans = [(f'{scan_name.replace(" ", "-")}-{ts}', download_scan(s3_client, bucket, key, os.path.join(workdir, f'{ts}.csv')))
+             for ts, key in previous]
+    scans.append((object_key, current))
+
+    changes_path = os.path.join(workdir, f'{object_key}-changes.csv')
+    summary = compare(scans, changes_path)
+    s3_client.put_object(Bucket=bucket, Key=f'{object_key}-trend.json', Body=json.dumps(summary, indent=1).encode(),
+                         ContentType='application/json')
+    s3_client.upload_file(changes_path, bucket, f'{object_key}-changes.csv', ExtraArgs={'ContentType': 'text/csv'})
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Diff successive Prowler scans of the same customer.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    diff_parser = subparsers.add_parser('diff')
+    diff_parser.add_argument('scans', nargs='+', help='CSV files, oldest first')
+    diff_parser.add_argument('--changes', help='Write one row per new, resolved and persisting finding here')
+
+    report_parser = subparsers.add_parser('report')
+    report_parser.add_argument('--bucket', required=True)
+    report_parser.add_argument('--scan-name', required=True)
+    report_parser.add_argument('--object-key', required=True)
+    report_parser.add_argument('--current', required=True)
+    report_parser.add_argument('--history', type=int, default=5, help='Previous scans to include in the trend')
+    args = parser.parse_args()
+
+    if args.command == 'diff':
+        summary = compare([(os.path.basename(p), p) for p in args.scans], args.changes)
+    else:
+        import boto3
+        summary = report(boto3.client('s3'), args.bucket, args.scan_name, args.object_key, args.current, args.history)
+    json.dump(summary, sys.stdout, indent=1)
+    print()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+# Compiles a scan's Prowler CSV into the data file the shared prowler-ui
+# bundle loads at runtime, replacing the per-scan compile_prowler_data.py +
+# npm build step. The file holds the same findings array compile_prowler_data.py
+# writes into src/data, one object per CSV row keyed by column name, gzipped
+# and uploaded with Content-Encoding: gzip so the bundle fetches plain JSON.
+#
+#   ui_data.py --csv /opt/acme-1721159874.csv --out /opt/acme-1721159874.json.gz
+
+import argparse
+import gzip
+import json
+
+from findings import SEVERITY, SERVICE_NAME, STATUS, key_getter, read_findings
+
+
+SEVERITY_ORDER = ('critical', 'high', 'medium', 'low', 'informational')
+
+
+def summarize(header: list, rows: list) -> dict:
+    get = key_getter(header, (STATUS, SEVERITY, SERVICE_NAME))
+    by_status, by_severity, by_service = {}, {}, {}
+    for row in rows:
+        status, severity, service = get(row)
+        severity = severity.lower()
+        by_status[status] = by_status.get(status, 0) + 1
+        counts = by_severity.setdefault(severity, {})
+        counts[status] = counts.get(status, 0) + 1
+        counts = by_service.setdefault(service, {})
+        counts[status] = counts.get(status, 0) + 1
+    ordered = {s: by_severity[s] for s in SEVERITY_ORDER if s in by_severity}
+    ordered.update({s: c for s, c in sorted(by_severity.items()) if s not in ordered})
+    return {
+        'total': len(rows),
+        'status': dict(sorted(by_status.items())),
+        'severity': ordered,
+        'service': dict(sorted(by_service.items()))
+    }
+
+def compile_scan(header: list, rows: list) -> list:
+    # Short rows read as empty strings, like the UI's own compile step
+    return [{column: row[i] if i < len(row) else '' for i, column in enumerate(header)} for row in rows]
+
+def write_data_file(path: str, data: list) -> int:
+    # mtime=0 keeps the output byte-for-byte reproducible
+    payload = json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode()
+    with open(path, 'wb') as f:
+        f.write(gzip.compress(payload, compresslevel=9, mtime=0))
+    return len(payload)
+
+def read_data_file(path: str) -> list:
+    with gzip.open(path, 'rt') as f:
+        return json.load(f)
+
+def compile_file(csv_path: str, out_path: str) -> dict:
+    header, rows = read_findings(csv_path)
+    write_data_file(out_path, compile_scan(header, rows))
+    return summarize(header, rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile Prowler CSV output into a prowler-ui data file.')
+    parser.add_argument('--csv', required=True)
+    parser.add_argument('--out', required=True)
+    args = parser.parse_args()
+
+    summary = compile_file(args.csv, args.out)
+    print(f'[+] Compiled {summary["total"]} findings {json.dumps(summary["status"])} to {args.out}')
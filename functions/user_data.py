@@ -0,0 +1,680 @@
+# Renders the cloud-init user_data scripts run by scanner instances. The
+# legacy path installs every tool at boot; the baked path expects an image
+# produced by build_image.py with the same tools already under /opt.
+
+BAKED_MARKER = '/opt/.prowler-baked'
+# matches artifacts.MANIFEST_PREFIX, kept literal since build_image.py
+# imports this module as functions.user_data
+ARTIFACT_MANIFEST_PREFIX = 'artifacts/'
+# matches delta.INVENTORY_PREFIX, for the same reason
+INVENTORY_PREFIX = 'inventory/'
+DEFAULT_SEVERITIES = ['critical', 'high', 'medium']
+# matches instance_watchdog.DEFAULT_STALL_TIMEOUT
+DEFAULT_STALL_TIMEOUT = 1800
+# seconds shard 0 waits for the other shards, within the merging budget
+DEFAULT_SHARD_TIMEOUT = 36000
+NODE_VERSION = 'v18.20.4'
+
+
+def render_user_data(*, aws_region: str, bucket_name: str, object_key: str, scan_name: str,
+                     role_arn: str, external_id: str, team_name: str, prowler_version: str,
+                     webhook_url: str = '', baked: bool = False, regions: list = None,
+                     region_parallelism: int = 0, stream_interval: int = 60, previous_key: str = None,
+                     ui_version: str = '', artifact_store: bool = False, severities: list = None,
+                     compliance: list = None, output_formats: list = None, phase_budgets: dict = None,
+                     stall_timeout: int = DEFAULT_STALL_TIMEOUT, metrics_log_group: str = '',
+                     shard: dict = None, shard_count: int = 1, shard_timeout: int = DEFAULT_SHARD_TIMEOUT,
+                     broker: bool = False) -> str:
+    sections = [render_header(aws_region, bucket_name, object_key)]
+    sections.extend(render_install_steps(prowler_version, baked))
+    sections.append(render_step('tooling'))
+    sections.append(render_tooling(bucket_name))
+    sections.append(render_watchdog(bucket_name, object_key, [object_key],
+                                    [f'/opt/prowler/output/{object_key}*.csv', f'/opt/{object_key}*.log'],
+                                    phase_budgets, stall_timeout))
+    if broker:
+        sections.append(render_step('credentials'))
+        sections.append(render_broker(role_arn, external_id, team_name, aws_region))
+    sections.append(render_phase('scanning'))
+    sections.append(render_step('scan'))
+
+    # Delta scans only rescan the services the previous results call for,
+    # a sharded scan (shard 0 of shard_count) only its share of the services
+    if shard:
+        filters = ['$(cat /opt/shard-args.txt)']
+    else:
+        filters = ['--service $(cat /opt/services.txt)'] if previous_key else []
+    scan_sections = render_scan_sections(bucket_name, object_key, role_arn, external_id, team_name, aws_region,
+                                         regions, region_parallelism, stream_interval, filters,
+                                         prowler_options(severities, compliance, output_formats), broker)
+    if shard:
+        sections.extend(render_shard_scan(object_key, shard, scan_sections))
+        sections.append(render_phase('merging'))
+        sections.append(render_step('merge'))
+        sections.append(render_shard_merge(bucket_name, object_key, shard_count, shard_timeout))
+    elif previous_key:
+        sections.append(render_delta_plan(bucket_name, object_key, previous_key, role_arn, external_id, broker))
+        sections.append('if [[ -s /opt/services.txt ]]; then\n')
+        sections.extend(scan_sections)
+        sections.append(render_delta_merge(object_key))
+        sections.append(f'else\n# nothing failed and nothing changed, the previous results are still current\n'
+                        f'cp /opt/previous.csv /opt/{object_key}.csv\nfi\n')
+    else:
+        sections.extend(scan_sections)
+    sections.append(render_phase('building_ui'))
+    if ui_version:
+        # the shared bundle renders the report, only the data file is per scan
+        sections.append(render_step('ui_data'))
+        sections.append(render_ui_data(object_key))
+        sections.append(render_phase('uploading'))
+        sections.append(render_step('upload'))
+        sections.append(render_report_upload(bucket_name, object_key, scan_name, webhook_url,
+                                             report_url(aws_region, bucket_name, ui_version, object_key),
+                                             artifact_store))
+    else:
+        if not baked:
+            sections.append(render_step('ui_install'))
+            sections.append(render_ui_install())
+        sections.append(render_step('ui_build'))
+        sections.append(render_ui_build(object_key))
+        sections.append(render_phase('uploading'))
+        sections.append(render_step('upload'))
+        sections.append(render_upload(bucket_name, object_key, scan_name, webhook_url, artifact_store))
+    if has_extra_reports(compliance, output_formats):
+        sections.append(render_step('reports_upload'))
+        sections.append(render_reports_upload(bucket_name, object_key))
+    sections.append(render_step('trends'))
+    sections.append(render_trends(bucket_name, object_key, scan_name))
+    sections.append(render_step('columnar'))
+    sections.append(render_columnar(bucket_name, object_key))
+    sections.append(render_step('catalog'))
+    sections.append(render_catalog(bucket_name, object_key, scan_name,
+                                   scan_objects(object_key, ui_version, artifact_store, compliance, output_formats,
+                                                webhook_url)))
+    sections.append(render_phase('done', results=f'/opt/{object_key}.csv'))
+    sections.append(render_metrics(bucket_name, object_key, [f'/opt/{object_key}*.log'], metrics_log_group,
+                                   steps=True))
+    sections.append(render_finish(bucket_name, object_key, artifact_store))
+    return '\n'.join(sections)
+
+def render_shard_user_data(*, aws_region: str, bucket_name: str, object_key: str, shard: dict,
+                           role_arn: str, external_id: str, team_name: str, prowler_version: str,
+                           baked: bool = False, regions: list = None, region_parallelism: int = 0,
+                           stream_interval: int = 60, severities: list = None, compliance: list = None,
+                           output_formats: list = None, phase_budgets: dict = None,
+                           stall_timeout: int = DEFAULT_STALL_TIMEOUT, metrics_log_group: str = '',
+                           broker: bool = False) -> str:
+    # Shards 1..N-1 of a sharded scan only scan their services and hand the
+    # CSV to shard 0 (rendered by render_user_data), which merges and reports.
+    # The job id matches shards.shard_job_id.
+    job_id = f'{object_key}-shard{shard["index"]}'
+    sections = [render_header(aws_region, bucket_name, job_id)]
+    sections.extend(render_install_steps(prowler_version, baked))
+    sections.append(render_step('tooling'))
+    sections.append(render_tooling(bucket_name))
+    sections.append(render_watchdog(bucket_name, job_id, [job_id],
+                                    [f'/opt/prowler/output/{job_id}*.csv', f'/opt/{job_id}*.log'],
+                                    phase_budgets, stall_timeout))
+    if broker:
+        sections.append(render_step('credentials'))
+        sections.append(render_broker(role_arn, external_id, team_name, aws_region))
+    sections.append(render_phase('scanning'))
+    sections.append(render_step('scan'))
+    scan_sections = render_scan_sections(bucket_name, job_id, role_arn, external_id, team_name, aws_region,
+                                         regions, region_parallelism, stream_interval,
+                                         ['$(cat /opt/shard-args.txt)'],
+                                         prowler_options(severities, compliance, output_formats), broker)
+    sections.extend(render_shard_scan(job_id, shard, scan_sections))
+    sections.append(render_phase('uploading'))
+    sections.append(render_step('upload'))
+    sections.append(rf"""# hand this shard's findings to shard 0
+aws s3 cp /opt/{job_id}.csv s3://{bucket_name}/{object_key}/shards/{shard["index"]}.csv
+""")
+    if has_extra_reports(compliance, output_formats):
+        sections.append(render_reports_upload(bucket_name, job_id))
+    sections.append(render_phase('done'))
+    sections.append(render_metrics(bucket_name, job_id, [f'/opt/{job_id}*.log'], metrics_log_group, steps=True))
+    sections.append(render_finish(bucket_name, job_id))
+    return '\n'.join(sections)
+
+def render_packed_user_data(*, aws_region: str, bucket_name: str, batch_key: str, targets: list,
+                            concurrency: int, team_name: str, prowler_version: str,
+                            webhook_url: str = '', baked: bool = False, ui_version: str = '',
+                            artifact_store: bool = False, severities: list = None, compliance: list = None,
+                            output_formats: list = None, phase_budgets: dict = None,
+                            stall_timeout: int = DEFAULT_STALL_TIMEOUT, metrics_log_group: str = '') -> str:
+    # One instance scans every target, running `concurrency` Prowler processes
+    # at once. Each target is a dict of role_arn, external_id, scan_name and
+    # object_key, all validated by the API before they reach the script.
+    target_lines = '\n'.join(
+        f"{t['object_key']} {t['role_arn']} {t['external_id']} \"{t['scan_name']}\"" for t in targets
+    )
+    if ui_version:
+        report_steps = [
+            render_phase('building_ui', '$OBJECT_KEY'),
+            render_ui_data('$OBJECT_KEY'),
+            render_phase('uploading', '$OBJECT_KEY'),
+            render_report_upload(bucket_name, '$OBJECT_KEY', '$SCAN_NAME', webhook_url,
+                                 report_url(aws_region, bucket_name, ui_version, '$OBJECT_KEY'), artifact_store)
+        ]
+    else:
+        report_steps = [
+            '# UI builds share /opt/prowler-ui, so only one runs at a time',
+            '(',
+            '    flock 9',
+            render_phase('building_ui', '$OBJECT_KEY'),
+            render_ui_build('$OBJECT_KEY'),
+            render_phase('uploading', '$OBJECT_KEY'),
+            render_upload(bucket_name, '$OBJECT_KEY', '$SCAN_NAME', webhook_url, artifact_store),
+            ') 9>/opt/ui.lock'
+        ]
+    if has_extra_reports(compliance, output_formats):
+        report_steps.append(render_reports_upload(bucket_name, '$OBJECT_KEY'))
+    scan_steps = '\n'.join([
+        render_phase('scanning', '$OBJECT_KEY'),
+        render_scan('$ROLE_ARN', '$EXTERNAL_ID', team_name, '$OBJECT_KEY',
+                    options=prowler_options(severities, compliance, output_formats)),
+        *report_steps,
+        render_trends(bucket_name, '$OBJECT_KEY', '$SCAN_NAME'),
+        render_columnar(bucket_name, '$OBJECT_KEY'),
+        render_catalog(bucket_name, '$OBJECT_KEY', '$SCAN_NAME',
+                       scan_objects('$OBJECT_KEY', ui_version, artifact_store, compliance, output_formats,
+                                    webhook_url)),
+        render_phase('done', '$OBJECT_KEY', '/opt/$OBJECT_KEY.csv'),
+        render_metrics(bucket_name, '$OBJECT_KEY', ['/opt/$OBJECT_KEY.log'], metrics_log_group)
+    ])
+    sections = [render_header(aws_region, bucket_name, batch_key),
+                render_tools(prowler_version, baked, ui=not ui_version), render_tooling(bucket_name),
+                render_watchdog(bucket_name, batch_key, [t['object_key'] for t in targets],
+                                ['/opt/prowler/output/*.csv', '/opt/*.log', '/opt/*.out'],
+                                phase_budgets, stall_timeout)]
+    sections.append(rf"""# queue of accounts to scan on this instance
+cat > /opt/targets.txt <<'TARGETS'
+{target_lines}
+TARGETS
+
+scan_account() {{
+set -xe
+export OBJECT_KEY="$1" ROLE_ARN="$2" EXTERNAL_ID="$3" SCAN_NAME="$4"
+{scan_steps}
+}}
+export -f scan_account
+
+# scan accounts in parallel, a failed account does not stop the others
+xargs -P {concurrency} -L 1 bash -c 'scan_account "$0" "$@" > "/opt/$0.out" 2>&1 || phase failed "$0" "see /opt/$0.out"' \
+    < /opt/targets.txt || echo "One or more account scans failed, see /opt/*.out"
+""")
+    sections.append(render_finish(bucket_name, batch_key, artifact_store))
+    return '\n'.join(sections)
+
+def render_install_steps(prowler_version: str, baked: bool) -> list:
+    if baked:
+        return [render_step('baked_check'), render_baked_check(prowler_version)]
+    return [render_step('system_install'), render_system_install(),
+            render_step('prowler_install'), render_prowler_checkout(prowler_version)]
+
+def render_scan_sections(bucket_name: str, object_key: str, role_arn: str, external_id: str, team_name: str,
+                         aws_region: str, regions: list, region_parallelism: int, stream_interval: int,
+                         filters: list, options: list, broker: bool = False) -> list:
+    # The Prowler run(s) with their output streamed to the bucket
+    if region_parallelism > 0:
+        stream_patterns = [f'/opt/prowler/output/{object_key}-*.csv', f'/opt/{object_key}-*.log']
+        scan = render_regional_scan(role_arn, external_id, team_name, object_key,
+                                    aws_region, regions, region_parallelism, filters, options, broker)
+    else:
+        stream_patterns = [f'/opt/prowler/output/{object_key}.csv', f'/opt/{object_key}.log']
+        region_filter = [f'--region {" ".join(regions)}'] if regions else []
+        scan = render_scan(role_arn, external_id, team_name, object_key, region_filter + filters, options,
+                           broker)
+    return [
+        render_stream_start(bucket_name, object_key, stream_patterns, stream_interval),
+        scan,
+        render_stream_finish(bucket_name, object_key, stream_patterns)
+    ]
+
+def render_bake_script(prowler_version: str) -> str:
+    sections = [
+        '#!/bin/bash\nset -xe\n',
+        render_prowler_install(prowler_version),
+        render_ui_install(),
+        rf"""# record the baked version and power off so the image can be captured
+echo {prowler_version} > {BAKED_MARKER}
+cloud-init clean --logs
+shutdown -h now
+"""
+    ]
+    return '\n'.join(sections)
+
+def render_header(aws_region: str, bucket_name: str, job_id: str) -> str:
+    return rf"""#!/bin/bash
+set -xe
+
+# get ec2 metadata token
+export TOKEN=$(curl -s -X PUT -H "X-aws-ec2-metadata-token-ttl-seconds: 21600" http://169.254.169.254/latest/api/token)
+export INSTANCE_ID=$(curl -s -H "X-aws-ec2-metadata-token: $TOKEN" http://169.254.169.254/latest/meta-data/instance-id)
+
+# setup shutdown script
+echo /opt/venv/bin/aws ec2 terminate-instances --instance-ids $INSTANCE_ID --region {aws_region} > /opt/shutdown.sh
+
+# record job phase transitions, locally for the watchdog and in the job
+# record (a no-op until the tooling is installed)
+echo "$(date +%s) bootstrap -" > /opt/phases.log
+phase() {{
+    echo "$(date +%s) $1 ${{2:-{job_id}}}" >> /opt/phases.log
+    python3 /opt/tooling/jobs.py --bucket {bucket_name} --job "${{2:-{job_id}}}" --phase "$1" \
+        ${{3:+--detail "$3"}} ${{4:+--results "$4"}} || true
+}}
+export -f phase
+
+# mark the start of each step, timed by scan_metrics.py
+step() {{
+    echo "$(date +%s.%N) $1" >> /opt/steps.log
+}}
+
+# setup script trap, always cleanup (flushing any streamed output first)
+cleanup() {{
+    rc=$?
+    if [[ -n "$STREAM_PID" ]]; then kill $STREAM_PID && wait $STREAM_PID; fi
+    if [[ $rc -ne 0 ]]; then phase failed "" "user_data exited with status $rc"; fi
+    bash /opt/shutdown.sh
+}}
+trap cleanup EXIT
+"""
+
+def render_tools(prowler_version: str, baked: bool, ui: bool = True) -> str:
+    if baked:
+        return render_baked_check(prowler_version)
+    if not ui:
+        return render_prowler_install(prowler_version)
+    return '\n'.join([render_prowler_install(prowler_version), render_ui_install()])
+
+def render_prowler_install(prowler_version: str) -> str:
+    return '\n'.join([render_system_install(), render_prowler_checkout(prowler_version)])
+
+def render_system_install() -> str:
+    return r"""# install system packages and the virtualenv prowler runs from
+apt update
+apt install -y python3-venv zip
+python3 -m venv /opt/venv
+source /opt/venv/bin/activate
+pip install awscli
+"""
+
+def render_prowler_checkout(prowler_version: str) -> str:
+    return rf"""# install prowler and dependencies
+git clone https://github.com/prowler-cloud/prowler /opt/prowler
+cd /opt/prowler
+git checkout {prowler_version}
+sed -i "s/azure.*//" pyproject.toml
+sed -i "s/microsoft.*//" pyproject.toml
+sed -i "s/google.*//" pyproject.toml
+sed -i "s/shodan.*//" pyproject.toml
+pip install .
+pip install pyarrow
+"""
+
+def render_baked_check(prowler_version: str) -> str:
+    return rf"""# tools are pre-installed in the baked image, confirm the version matches
+grep -qx "{prowler_version}" {BAKED_MARKER}
+source /opt/venv/bin/activate
+"""
+
+def render_phase(phase: str, job_id: str = None, results: str = None) -> str:
+    if results:
+        return f'phase {phase} "{job_id or ""}" "" {results}\n'
+    return f'phase {phase} {job_id}\n' if job_id else f'phase {phase}\n'
+
+def render_tooling(bucket_name: str) -> str:
+    # helper modules from functions/, synced to the bucket by the stack
+    return rf"""# fetch scanner tooling
+aws s3 cp --recursive --quiet s3://{bucket_name}/tooling/ /opt/tooling/
+"""
+
+def render_watchdog(bucket_name: str, object_key: str, jobs: list, patterns: list,
+                    phase_budgets: dict = None, stall_timeout: int = DEFAULT_STALL_TIMEOUT) -> str:
+    # The watchdog outlives this script, it stops an instance whose jobs run
+    # over a phase budget or whose output stops growing, after uploading what
+    # there is to {object_key}/partial/
+    quoted = ' '.join(f"'{p}'" for p in patterns + ['/var/log/cloud-init-output.log'])
+    budgets = ''
+    if phase_budgets:
+        budgets = f' --budgets {",".join(f"{phase}={seconds}" for phase, seconds in phase_budgets.items())}'
+    return rf"""# stop the instance if a scan stalls or runs over budget
+nohup python3 /opt/tooling/instance_watchdog.py --bucket {bucket_name} --object-key {object_key} \
+    --jobs {",".join(jobs)}{budgets} --stall-timeout {stall_timeout} \
+    {quoted} > /var/log/prowler-watchdog.log 2>&1 &
+"""
+
+def render_shard_scan(object_key: str, shard: dict, scan_sections: list) -> list:
+    # The shard's Prowler arguments are resolved on the instance, against the
+    # services its Prowler version has (see shards.shard_arguments)
+    if 'services' in shard:
+        selection = f'--services {" ".join(shard["services"])}'
+    else:
+        selection = f'--excluded {" ".join(shard["excluded_services"])}'
+    return [
+        rf"""# shard {shard["index"]} of a sharded scan
+python3 /opt/tooling/shards.py args {selection} --prowler-dir /opt/prowler > /opt/shard-args.txt
+cat /opt/shard-args.txt
+if [[ "$(cat /opt/shard-args.txt)" != "skip" ]]; then
+""",
+        *scan_sections,
+        f'else\n# none of this shard\'s services exist in this Prowler version\n: > /opt/{object_key}.csv\nfi\n'
+    ]
+
+def render_shard_merge(bucket_name: str, object_key: str, shard_count: int, timeout: int) -> str:
+    return rf"""# wait for the other shards and merge their findings into /opt/{object_key}.csv
+mv /opt/{object_key}.csv /opt/{object_key}-shard0.csv
+python3 /opt/tooling/shards.py merge --bucket {bucket_name} --object-key {object_key} --shards {shard_count} \
+    --timeout {timeout} --current /opt/{object_key}-shard0.csv --out /opt/{object_key}.csv
+"""
+
+def render_stream_start(bucket_name: str, object_key: str, patterns: list, interval: int) -> str:
+    quoted = ' '.join(f"'{p}'" for p in patterns)
+    return rf"""# stream scan output to s3://{bucket_name}/{object_key}/ while prowler runs
+python3 /opt/tooling/stream_upload.py --bucket {bucket_name} --object-key {object_key} \
+    --interval {interval} --state /opt/{object_key}.stream.json {quoted} &
+STREAM_PID=$!
+"""
+
+def render_stream_finish(bucket_name: str, object_key: str, patterns: list) -> str:
+    quoted = ' '.join(f"'{p}'" for p in patterns)
+    return rf"""# stop streaming, upload what is left and mark the manifest complete
+kill $STREAM_PID && wait $STREAM_PID || true
+STREAM_PID=
+python3 /opt/tooling/stream_upload.py --bucket {bucket_name} --object-key {object_key} \
+    --state /opt/{object_key}.stream.json --finalize {quoted}
+"""
+
+def render_ui_install() -> str:
+    return rf"""# install nodejs (v18 LTS)
+cd /opt
+wget -qO node.tar.gz https://nodejs.org/dist/{NODE_VERSION}/node-{NODE_VERSION}-linux-x64.tar.xz
+mkdir -p nodejs
+tar xf node.tar.gz -C nodejs --strip-components=1
+cp -r nodejs/* /usr/
+
+# install prowler-ui visualizer
+git clone https://github.com/lfglance/prowler-ui /opt/prowler-ui
+cd /opt/prowler-ui
+npm install
+"""
+
+def render_filters(filters: list) -> str:
+    return ''.join(f' \\\n    {f}' for f in filters or [])
+
+def prowler_options(severities: list = None, compliance: list = None, output_formats: list = None) -> list:
+    # Every requested framework and format comes out of the one Prowler run
+    options = [f'--severity {" ".join(severities or DEFAULT_SEVERITIES)}']
+    if compliance:
+        options.append(f'--compliance {" ".join(compliance)}')
+    options.append(f'--output-formats {" ".join(output_formats or ["csv"])}')
+    return options
+
+def has_extra_reports(compliance: list, output_formats: list) -> bool:
+    return bool(compliance) or bool(set(output_formats or []) - {'csv'})
+
+def render_options(options: list) -> str:
+    return ''.join(f'    {o} \\\n' for o in options or prowler_options())
+
+def render_broker(role_arn: str, external_id: str, team_name: str, aws_region: str) -> str:
+    # See credential_broker.py; the check fails the script when the role
+    # can't be assumed
+    return rf"""# assume the customer role once, every prowler process shares the session
+nohup python3 /opt/tooling/credential_broker.py serve --role-arn {role_arn} --external-id {external_id} \
+    --session-name {team_name}-ProwlerScanner --region {aws_region} > /var/log/prowler-broker.log 2>&1 &
+python3 /opt/tooling/credential_broker.py process --wait 120 > /dev/null
+"""
+
+def render_credentials(role_arn: str, external_id: str, team_name: str, broker: bool) -> tuple:
+    # Environment prefix and role options of a Prowler command: the broker's
+    # session (port and token file match credential_broker.py), or Prowler
+    # assuming the role itself
+    if broker:
+        return ('AWS_CONTAINER_CREDENTIALS_FULL_URI=http://127.0.0.1:8297/credentials '
+                'AWS_CONTAINER_AUTHORIZATION_TOKEN=$(cat /opt/broker.token) ', '')
+    return '', (f'    --role {role_arn} \\\n'
+                f'    --role-session-name {team_name}-ProwlerScanner \\\n'
+                f'    --external-id {external_id} \\\n'
+                f'    --session-duration 43200 \\\n')
+
+def render_scan(role_arn: str, external_id: str, team_name: str, object_key: str, filters: list = None,
+                options: list = None, broker: bool = False) -> str:
+    environment, role = render_credentials(role_arn, external_id, team_name, broker)
+    return rf"""cd /opt/prowler
+aws sts get-caller-identity
+
+# run prowler and collect output to /opt/{object_key}.csv
+{environment}python3 prowler.py aws \
+{role}    --output-filename {object_key} \
+    --log-level INFO \
+    --log-file /opt/{object_key}.log \
+{render_options(options)}    --ignore-exit-code-3{render_filters(filters)}
+cp output/{object_key}.csv /opt/{object_key}.csv
+"""
+
+def render_regional_scan(role_arn: str, external_id: str, team_name: str, object_key: str,
+                         aws_region: str, regions: list, parallelism: int, filters: list = None,
+                         options: list = None, broker: bool = False) -> str:
+    # Without an explicit list, scan every region enabled in this account
+    if regions:
+        region_list = f'echo {" ".join(regions)}'
+    else:
+        region_list = f"aws ec2 describe-regions --region {aws_region} --query 'Regions[].RegionName' --output text"
+    environment, role = render_credentials(role_arn, external_id, team_name, broker)
+    return rf"""cd /opt/prowler
+aws sts get-caller-identity
+
+# run one prowler process per region, then merge them into /opt/{object_key}.csv
+{region_list} | tr '\t ' '\n\n' | grep . > /opt/regions.txt
+{environment}xargs -P {parallelism} -I{{}} python3 prowler.py aws \
+{role}    --output-filename {object_key}-{{}} \
+    --log-level INFO \
+    --log-file /opt/{object_key}-{{}}.log \
+{render_options(options)}    --ignore-exit-code-3{render_filters(filters)} \
+    --region {{}} < /opt/regions.txt \
+    || echo "One or more regional scans failed, merging the regions that completed"
+python3 /opt/tooling/merge_csv.py output/{object_key}.csv output/{object_key}-*.csv
+cp output/{object_key}.csv /opt/{object_key}.csv
+"""
+
+def render_delta_plan(bucket_name: str, object_key: str, previous_key: str, role_arn: str, external_id: str,
+                      broker: bool = False) -> str:
+    # previous_key is a plain {key}.csv or, for scans kept in the artifact
+    # store, its artifacts/{key}.json manifest. The profile lets the planner
+    # read the scanned account's inventory, which is kept under inventory/ so
+    # the next delta scan can tell which resources are gone.
+    if previous_key.startswith(ARTIFACT_MANIFEST_PREFIX):
+        previous = previous_key[len(ARTIFACT_MANIFEST_PREFIX):-len('.json')]
+        download = (f'python3 /opt/tooling/artifacts.py fetch --bucket {bucket_name} --object-key {previous} '
+                    f'--path {previous}.csv --out /opt/previous.csv')
+    else:
+        previous = previous_key[:-len('.csv')]
+        download = f'aws s3 cp s3://{bucket_name}/{previous_key} /opt/previous.csv'
+    if broker:
+        profile = 'credential_process = python3 /opt/tooling/credential_broker.py process'
+    else:
+        profile = f'role_arn = {role_arn}\nexternal_id = {external_id}\ncredential_source = Ec2InstanceMetadata'
+    return rf"""# delta scan: plan the services to rescan from s3://{bucket_name}/{previous_key}
+{download}
+cat > /opt/aws-config <<'PROFILE'
+[profile target]
+{profile}
+PROFILE
+aws s3 cp s3://{bucket_name}/{INVENTORY_PREFIX}{previous}.json /opt/previous-inventory.json \
+    || echo "No inventory from {previous}, it was a full scan"
+AWS_CONFIG_FILE=/opt/aws-config python3 /opt/tooling/delta.py plan --previous /opt/previous.csv --profile target \
+    --previous-inventory /opt/previous-inventory.json --inventory-out /opt/inventory.json --prowler-dir /opt/prowler \
+    > /opt/services.txt
+cat /opt/services.txt
+aws s3 cp /opt/inventory.json s3://{bucket_name}/{INVENTORY_PREFIX}{object_key}.json \
+    || echo "Saving the inventory failed"
+"""
+
+def render_delta_merge(object_key: str) -> str:
+    return rf"""# merge the delta run into the previous findings
+python3 /opt/tooling/delta.py merge --previous /opt/previous.csv --current /opt/{object_key}.csv \
+    --services /opt/services.txt --out /opt/{object_key}.csv
+"""
+
+def render_ui_build(object_key: str) -> str:
+    return rf"""# build prowler-ui site
+cd /opt/prowler-ui
+rm -rf src/data build
+mkdir -p src/data
+python3 compile_prowler_data.py /opt/{object_key}.csv
+npm run build
+"""
+
+def render_upload(bucket_name: str, object_key: str, scan_name: str, webhook_url: str,
+                  artifact_store: bool = False) -> str:
+    if artifact_store:
+        # the site and CSV go to the content-addressed store, the raw_data.csv
+        # copy and unchanged bundle files dedupe against existing blobs
+        upload = rf"""# store site files and raw data as compressed, content-addressed blobs
+cp /opt/{object_key}.csv build/raw_data.csv
+python3 /opt/tooling/artifacts.py pack --bucket {bucket_name} --object-key {object_key} --site build \
+    --file {object_key}.csv=/opt/{object_key}.csv
+"""
+        if webhook_url:
+            # the manifest is internal, whoever gets the webhook needs a
+            # report they can download and open
+            upload += rf"""
+# the webhook links a downloadable copy of the site
+mv build {object_key}
+zip -qr {object_key}.zip {object_key}
+aws s3 cp {object_key}.zip s3://{bucket_name}/
+rm -rf {object_key} {object_key}.zip
+aws s3 presign s3://{bucket_name}/{object_key}.zip --expires-in 604800 > /opt/{object_key}.url
+"""
+        else:
+            upload += 'rm -rf build\n'
+    else:
+        upload = rf"""# move site files and raw data to S3
+cp /opt/{object_key}.csv build/raw_data.csv
+mv build {object_key}
+zip -qr {object_key}.zip {object_key}
+aws s3 cp {object_key}.zip s3://{bucket_name}/
+rm -rf {object_key} {object_key}.zip
+aws s3 presign s3://{bucket_name}/{object_key}.zip --expires-in 604800 > /opt/{object_key}.url
+aws s3 cp /opt/{object_key}.csv s3://{bucket_name}/{object_key}.csv
+"""
+    return '\n'.join([upload, render_webhook(object_key, scan_name, webhook_url)])
+
+def render_webhook(object_key: str, scan_name: str, webhook_url: str) -> str:
+    return rf"""# notify Zapier webhook if present
+if [[ "{webhook_url}" ]];
+then
+    echo "{{\"scan_name\": \"{scan_name}\", \"url\": \"$(cat /opt/{object_key}.url)\"}}" > /opt/{object_key}.json
+    curl "{webhook_url}" -X POST -d "@/opt/{object_key}.json"
+fi
+"""
+
+def report_url(aws_region: str, bucket_name: str, ui_version: str, object_key: str) -> str:
+    # the shared bundle published by publish_ui.py loads ui-data/{key}.json
+    return f'https://{bucket_name}.s3.{aws_region}.amazonaws.com/ui/{ui_version}/index.html?scan={object_key}'
+
+def render_ui_data(object_key: str) -> str:
+    return rf"""# compile the report data file for the shared prowler-ui bundle
+python3 /opt/tooling/ui_data.py --csv /opt/{object_key}.csv --out /opt/{object_key}.json.gz
+"""
+
+def render_report_upload(bucket_name: str, object_key: str, scan_name: str, webhook_url: str, url: str,
+                         artifact_store: bool = False) -> str:
+    if artifact_store:
+        csv_upload = (f'python3 /opt/tooling/artifacts.py pack --bucket {bucket_name} --object-key {object_key} '
+                      f'--file {object_key}.csv=/opt/{object_key}.csv')
+    else:
+        csv_upload = f'aws s3 cp /opt/{object_key}.csv s3://{bucket_name}/{object_key}.csv'
+    upload = rf"""# upload the report data file and raw data to S3
+aws s3 cp /opt/{object_key}.json.gz s3://{bucket_name}/ui-data/{object_key}.json \
+    --content-type application/json --content-encoding gzip
+{csv_upload}
+echo "{url}" > /opt/{object_key}.url
+"""
+    return '\n'.join([upload, render_webhook(object_key, scan_name, webhook_url)])
+
+def render_reports_upload(bucket_name: str, object_key: str) -> str:
+    # compliance CSVs and any extra output formats, per region when split
+    return rf"""# upload compliance reports and additional output formats
+cd /opt/prowler
+for report in output/{object_key}.* output/{object_key}-* output/compliance/{object_key}_* output/compliance/{object_key}-*; do
+    if [[ -f "$report" && "$report" != output/{object_key}*.csv ]]; then
+        aws s3 cp "$report" "s3://{bucket_name}/reports/{object_key}/${{report#output/}}"
+    fi
+done
+"""
+
+def render_trends(bucket_name: str, object_key: str, scan_name: str) -> str:
+    return rf"""# compare with this customer's previous scans, next to the scan in the bucket
+python3 /opt/tooling/trends.py report --bucket {bucket_name} --scan-name "{scan_name}" --object-key {object_key} \
+    --current /opt/{object_key}.csv > /opt/{object_key}-trend.json || echo "Trend report failed for {object_key}"
+"""
+
+def render_columnar(bucket_name: str, object_key: str) -> str:
+    # the CSV is already uploaded, a failed conversion should not fail the scan
+    return rf"""# add the findings to the partitioned parquet store
+if python3 /opt/tooling/columnar.py convert --csv /opt/{object_key}.csv --scan-id {object_key} \
+    --out /opt/parquet/{object_key}; then
+    aws s3 cp --recursive --quiet /opt/parquet/{object_key}/ s3://{bucket_name}/findings/
+else
+    echo "Parquet conversion failed for {object_key}"
+fi
+"""
+
+def scan_objects(object_key: str, ui_version: str = '', artifact_store: bool = False, compliance: list = None,
+                 output_formats: list = None, webhook_url: str = '') -> dict:
+    # Where a finished scan's outputs are in the bucket, as recorded in its
+    # catalog entry
+    if ui_version:
+        objects = {'output': f'ui-data/{object_key}.json'}
+    elif artifact_store:
+        objects = {'output': f'{ARTIFACT_MANIFEST_PREFIX}{object_key}.json'}
+    else:
+        objects = {'output': f'{object_key}.zip'}
+    if artifact_store:
+        objects['manifest'] = f'{ARTIFACT_MANIFEST_PREFIX}{object_key}.json'
+        if webhook_url and not ui_version:
+            objects['zip'] = f'{object_key}.zip'
+    else:
+        objects['csv'] = f'{object_key}.csv'
+    objects.update(trend=f'{object_key}-trend.json', changes=f'{object_key}-changes.csv',
+                   metrics=f'metrics/{object_key}.json')
+    if has_extra_reports(compliance, output_formats):
+        objects['reports'] = f'reports/{object_key}/'
+    return objects
+
+def render_catalog(bucket_name: str, object_key: str, scan_name: str, objects: dict) -> str:
+    # the results are stored either way, a missing entry only hides the scan
+    # from catalog queries until a backfill; the duration runs from bootstrap
+    options = ' '.join(f'--object {name}={key}' for name, key in objects.items())
+    return rf"""# add the scan to the results catalog
+python3 /opt/tooling/catalog.py add --bucket {bucket_name} --object-key {object_key} --scan-name "{scan_name}" \
+    --csv /opt/{object_key}.csv {options} --started "$(head -n 1 /opt/phases.log | cut -d ' ' -f 1)" \
+    || echo "Cataloging failed for {object_key}"
+"""
+
+def render_step(name: str) -> str:
+    return f'step {name}\n'
+
+def render_metrics(bucket_name: str, object_key: str, logs: list, log_group: str = '', steps: bool = False) -> str:
+    # timings are diagnostics, a failure here should not fail the scan
+    quoted = ' '.join(f"'{p}'" for p in logs)
+    options = (' --steps /opt/steps.log' if steps else '') + (f' --log-group {log_group}' if log_group else '')
+    return rf"""# record where the scan's time went at s3://{bucket_name}/metrics/{object_key}.json
+python3 /opt/tooling/scan_metrics.py build --bucket {bucket_name} --object-key {object_key}{options} \
+    --logs {quoted} > /opt/{object_key}-metrics.json || echo "Recording metrics failed for {object_key}"
+"""
+
+def render_finish(bucket_name: str, object_key: str, artifact_store: bool = False) -> str:
+    if artifact_store:
+        save_log = (f'python3 /opt/tooling/artifacts.py pack --append --bucket {bucket_name} --object-key {object_key} '
+                    f'--file {object_key}-$INSTANCE_ID.log=/var/log/cloud-init-output.log')
+    else:
+        save_log = f'aws s3 cp /var/log/cloud-init-output.log s3://{bucket_name}/{object_key}-$INSTANCE_ID.log'
+    return rf"""# save cloud-init logs for debugging purposes
+{save_log}
+
+# shutdown as soon as the results are uploaded
+bash /opt/shutdown.sh
+"""
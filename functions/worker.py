@@ -1,9 +1,25 @@
 import json
+import threading
+import time
+from functools import partial
 from os import environ
 from datetime import datetime
 
 import boto3
 
+from batch import launch_batch, scan_options, validate_target, validate_targets
+from catalog import compact, latest_scans, parse_time, scans_between
+from delta import delta_scans_before
+from dispatcher import LAUNCH_ATTEMPTS, SqsQueue, dispatch, fail_dead_letters
+from instance_watchdog import parse_budgets
+from jobs import JOB_ID_PATTERN, S3JobStore, annotate_job, create_job, update_phase
+from launch_strategy import launch_with_strategy, load_size_hint, select_instance_types
+from planner import plan_instances
+from scan_metrics import Stopwatch, emf_records
+from shards import latest_service_runtimes, plan_shards, shard_job_id
+from trends import list_scans
+from user_data import render_packed_user_data, render_shard_user_data, render_user_data, report_url
+
 
 aws_region = environ.get('AWS_REGION')
 subnet_id = environ.get('SUBNET_ID')
@@ -12,11 +28,70 @@ instance_profile = environ.get('INSTANCE_PROFILE')
 security_group_id = environ.get('SECURITY_GROUP_ID')
 prowler_version = environ.get('PROWLER_VERSION', '4.2.4')
 instance_type = environ.get('INSTANCE_TYPE', 't2.medium')
+default_instance_types = environ.get('INSTANCE_TYPES', instance_type).split(',')
+size_tiers = json.loads(environ.get('SIZE_TIERS') or '[]')
+use_spot = environ.get('USE_SPOT', 'false').lower() == 'true'
 team_name = environ.get('TEAM_NAME', 'Mission')
 webhook_url = environ.get('WEBHOOK_URL', '')
+ami_parameter = environ.get('AMI_PARAMETER', '/aws/service/canonical/ubuntu/server/22.04/stable/current/amd64/hvm/ebs-gp2/ami-id')
+ami_cache_ttl = int(environ.get('AMI_CACHE_TTL', '3600'))
+batch_concurrency = int(environ.get('BATCH_CONCURRENCY', '8'))
+max_batch_size = int(environ.get('MAX_BATCH_SIZE', '100'))
+region_parallelism = int(environ.get('REGION_PARALLELISM', '0'))
+delta_scans = environ.get('DELTA_SCANS', 'false').lower() == 'true'
+delta_full_scan_every = int(environ.get('DELTA_FULL_SCAN_EVERY', '7'))
+default_severities = [s for s in environ.get('SEVERITIES', 'critical,high,medium').split(',') if s]
+default_compliance = [c for c in environ.get('COMPLIANCE', '').split(',') if c]
+default_output_formats = [f for f in environ.get('OUTPUT_FORMATS', 'csv').split(',') if f]
+stream_interval = int(environ.get('STREAM_INTERVAL', '60'))
+phase_budgets = parse_budgets(environ.get('PHASE_BUDGETS', ''))
+stall_timeout = int(environ.get('STALL_TIMEOUT', '1800'))
+metrics_log_group = environ.get('METRICS_LOG_GROUP', '')
+packed_concurrency = int(environ.get('PACKED_CONCURRENCY', '4'))
+packed_max_accounts = int(environ.get('PACKED_MAX_ACCOUNTS', '20'))
+ui_version = environ.get('UI_VERSION', '')
+artifact_store = environ.get('ARTIFACT_STORE', 'false').lower() == 'true'
+launch_queue_url = environ.get('LAUNCH_QUEUE_URL', '')
+max_in_flight = int(environ.get('MAX_IN_FLIGHT', '20'))
+launch_attempts = int(environ.get('LAUNCH_ATTEMPTS', str(LAUNCH_ATTEMPTS)))
+default_shards = int(environ.get('SHARDS', '1'))
+shard_timeout = int(environ.get('SHARD_TIMEOUT', '36000'))
+credential_broker = environ.get('CREDENTIAL_BROKER', 'false').lower() == 'true'
+baked_image_parameter = environ.get('BAKED_IMAGE_PARAMETER', f'/prowler-scanner/ami/{prowler_version}')
+
+# boto3 clients are created on first use and reused by warm invocations, so
+# each handler only pays for the clients its request path needs (a warm
+# run_scan with a cached AMI never builds the SSM client, get_status only S3)
+clients = {}
+clients_lock = threading.Lock()
+
+# Resolved AMIs by SSM parameter name, kept at module level so they survive
+# warm invocations
+ami_cache = {}
+
+
+USAGE = 'Invalid url parameters provided. Needs `role_arn`, `external_id`, and `scan_name` present, i.e. https://apigw.com/?role_arn=arn:aws:xxxxxx&scan_name=yyyy&external_id=zzzzz&compliance=cis_2.0_aws,soc2_aws&severities=critical,high&output_formats=csv,html'
+
 
-ec2_client = boto3.client('ec2')
-s3_client = boto3.client('s3')
+def create_client(service: str):
+    return boto3.client(service, region_name=aws_region)
+
+def get_client(service: str):
+    client = clients.get(service)
+    if client is None:
+        # run_batch launches from threads and the default boto3 session is not
+        # safe to build clients from concurrently
+        with clients_lock:
+            client = clients.get(service)
+            if client is None:
+                client = clients[service] = create_client(service)
+    return client
+
+def get_job_store() -> S3JobStore:
+    return S3JobStore(get_client('s3'), bucket_name)
+
+def get_launch_queue() -> SqsQueue:
+    return SqsQueue(get_client('sqs'), launch_queue_url)
 
 
 def run_scan(event, context):
@@ -24,173 +99,566 @@ def run_scan(event, context):
     ts = str(int(now.timestamp()))
 
     # Extract URL parameters and ensure accuracy
-    params = event.get('queryStringParameters', {})
+    params = event.get('queryStringParameters') or {}
     print(f'Received new request: {params}')
     if not params:
-        msg = 'Invalid url parameters provided. Needs `role_arn`, `external_id`, and `scan_name` present, i.e. https://apigw.com/?role_arn=arn:aws:xxxxxx&scan_name=yyyy&external_id=zzzzz&compliance=aws'
-        print(msg)
+        print(USAGE)
         return {
             'statusCode': 400,
-            'body': json.dumps({"error": msg})
+            'body': json.dumps({"error": USAGE})
         }
 
-    role_arn = params.get('role_arn')
-    scan_name = params.get('scan_name')
-    external_id = params.get('external_id')
-
-    # Confirm required parameters are provided
-    if not role_arn and not scan_name and not external_id:
-        msg = 'Invalid url parameters provided. Needs `role_arn`, `external_id`, and `scan_name` present, i.e. https://apigw.com/?role_arn=arn:aws:xxxxxx&scan_name=yyyy&external_id=zzzzz&compliance=aws'
-        print(msg)
+    # Confirm required parameters are provided and well formed
+    errors = validate_target(params)
+    if errors:
+        print(errors)
         return {
             'statusCode': 400,
-            'body': json.dumps({'error': msg})
+            'body': json.dumps({'error': USAGE, 'details': errors})
         }
 
-    # Fan out tasks to all regions
-    object_key = f'{scan_name.replace(" ", "-")}-{ts}'
-    user_data = rf"""#!/bin/bash
-set -xe
-
-# get ec2 metadata token
-export TOKEN=$(curl -s -X PUT -H "X-aws-ec2-metadata-token-ttl-seconds: 21600" http://169.254.169.254/latest/api/token)
-export INSTANCE_ID=$(curl -s -H "X-aws-ec2-metadata-token: $TOKEN" http://169.254.169.254/latest/meta-data/instance-id)
-
-# setup shutdown script
-echo /opt/venv/bin/aws ec2 terminate-instances --instance-ids $INSTANCE_ID --region {aws_region} > /opt/shutdown.sh
-
-# setup script trap, always cleanup
-cleanup() {{
-    bash /opt/shutdown.sh
-}}
-trap cleanup EXIT
-
-# install prowler and dependencies
-apt update
-apt install -y python3-venv zip
-python3 -m venv /opt/venv
-source /opt/venv/bin/activate
-pip install awscli
-aws sts get-caller-identity
-git clone https://github.com/prowler-cloud/prowler /opt/prowler
-cd /opt/prowler
-git checkout {prowler_version}
-sed -i "s/azure.*//" pyproject.toml
-sed -i "s/microsoft.*//" pyproject.toml
-sed -i "s/google.*//" pyproject.toml
-sed -i "s/shodan.*//" pyproject.toml
-pip install .
-
-# run prowler and collect output to /opt/results.csv
-python3 prowler.py aws \
-    --role {role_arn} \
-    --role-session-name {team_name}-ProwlerScanner \
-    --external-id {external_id} \
-    --session-duration 43200 \
-    --output-filename {object_key} \
-    --log-level INFO \
-    --log-file /opt/scan.log \
-    --severity critical high medium \
-    --ignore-exit-code-3
-cp output/{object_key}.csv /opt/results.csv
-
-# install nodejs (v18 LTS)
-cd /opt
-wget -qO node.tar.gz https://nodejs.org/dist/v18.20.4/node-v18.20.4-linux-x64.tar.xz
-mkdir -p nodejs
-tar xf node.tar.gz -C nodejs --strip-components=1
-cp -r nodejs/* /usr/
-
-# install prowler-ui visualizer and build site
-git clone https://github.com/lfglance/prowler-ui
-cd prowler-ui
-npm install
-mkdir -p src/data
-python3 compile_prowler_data.py /opt/results.csv
-npm run build
-
-# move site files and raw data to S3
-cp /opt/results.csv build/raw_data.csv
-mv build {object_key}
-zip -r {object_key}.zip {object_key}
-aws s3 cp {object_key}.zip s3://{bucket_name}/
-cd /opt
-aws s3 presign s3://{bucket_name}/{object_key}.zip --expires-in 604800 > url.txt
-aws s3 cp /opt/results.csv s3://{bucket_name}/{object_key}.csv
-
-# save cloud-init logs for debugging purposes
-aws s3 cp /var/log/cloud-init-output.log s3://{bucket_name}/{object_key}-$INSTANCE_ID.log
-
-# notify Zapier webhook if present
-if [[ "{webhook_url}" ]];
-then
-    echo "{{\"scan_name\": \"{scan_name}\", \"url\": \"$(cat url.txt)\"}}" > payload.json
-    curl "{webhook_url}" -X POST -d "@payload.json"
-fi
-
-# shutdown when completed
-sleep 300 && bash /opt/shutdown.sh
-"""
+    # With a launch queue the dispatcher starts the instance once there's room
+    launch = enqueue_scan if launch_queue_url else launch_scan
+    try:
+        res_data = launch(params['role_arn'], params['external_id'], params['scan_name'], ts,
+                          target_options(params))
+        print(res_data)
+        return {
+            'statusCode': 202 if launch_queue_url else 200,
+            'body': json.dumps(res_data)
+        }
+    except Exception as e:
+        print(str(e))
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'message': str(e)})
+        }
+
+def run_batch(event, context):
+    now = datetime.utcnow()
+    ts = str(int(now.timestamp()))
 
     try:
-        response = ec2_client.run_instances(
-            ImageId=get_ubuntu_ami(),
-            InstanceType=instance_type,
-            SubnetId=subnet_id,
-            SecurityGroupIds=[security_group_id],
-            MaxCount=1,
-            MinCount=1,
-            IamInstanceProfile={
-                'Arn': instance_profile
-            },
-            UserData=user_data,
-            TagSpecifications=[
-                {
-                    'ResourceType': 'instance',
-                    'Tags': [
-                        {'Key': 'Name', 'Value': f'prowler-scanner-{scan_name}'},
-                        {'Key': 'Role', 'Value': 'ProwlerScanner'},
-                        {'Key': 'Environment', 'Value': 'Production'},
-                        {'Key': 'LaunchTimestamp', 'Value': ts}
-                    ]
-                }
-            ]
+        body = json.loads(event.get('body') or '{}')
+    except ValueError:
+        body = None
+    targets = body.get('targets') if isinstance(body, dict) else None
+    print(f'Received new batch request with {len(targets) if isinstance(targets, list) else 0} targets')
+
+    # Validate every target before launching anything
+    invalid = validate_targets(targets, max_batch_size)
+    if invalid:
+        print(invalid)
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Invalid batch request, no scans were launched.', 'invalid': invalid})
+        }
+
+    if body.get('mode') == 'packed':
+        results = launch_packed_batch(targets, ts)
+    else:
+        launch = enqueue_scan if launch_queue_url else launch_scan
+        results = launch_batch(
+            targets,
+            lambda t: launch(t['role_arn'], t['external_id'], t['scan_name'], ts,
+                             target_options(t)),
+            batch_concurrency
         )
-        data = response['Instances'][0]
-        res_data = {
-            'message': f'Launched EC2 instance to run Prowler scan ({scan_name})',
-            'instance_profile': instance_profile,
-            'prowler_version': prowler_version,
-            'sg_id': security_group_id,
-            'instance_id': data['InstanceId'],
-            'instance_type': data['InstanceType'],
-            'subnet_id': data['SubnetId'],
-            'vpc_id': data['VpcId'],
-            'ip_address': data['PrivateIpAddress'],
-            'connection': f'aws ssm start-session --target {data["InstanceId"]}',
-            'output_bucket': bucket_name,
-            'output_object': f'{object_key}.zip'
+    launched = len([r for r in results if r['status'] == 'launched'])
+    verb = 'Queued' if launch_queue_url else 'Launched'
+    res_data = {
+        'message': f'{verb} {launched} of {len(results)} Prowler scans',
+        'launched': launched,
+        'failed': len(results) - launched,
+        'results': results
+    }
+    print(res_data)
+
+    # 207 signals a partial failure, callers should inspect each result
+    if launched == len(results):
+        status_code = 200
+    elif launched:
+        status_code = 207
+    else:
+        status_code = 500
+    return {
+        'statusCode': status_code,
+        'body': json.dumps(res_data)
+    }
+
+def get_status(event, context):
+    params = event.get('queryStringParameters') or {}
+    job_id = params.get('job', '')
+    if not JOB_ID_PATTERN.match(job_id):
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Needs a `job` parameter, the `job_id` returned when the scan was launched, i.e. https://apigw.com/status?job=AcmeCorp-1721159874'})
         }
-        print(res_data)
+
+    try:
+        record = get_job_store().get(job_id)
+    except Exception as e:
+        print(str(e))
         return {
-            'statusCode': 200,
-            'body': json.dumps(res_data)
+            'statusCode': 500,
+            'body': json.dumps({'message': str(e)})
+        }
+    if not record:
+        return {
+            'statusCode': 404,
+            'body': json.dumps({'error': f'No scan job {job_id}'})
+        }
+    return {
+        'statusCode': 200,
+        'body': json.dumps(record)
+    }
+
+def query_scans(event, context):
+    # The catalog answers these without listing the bucket, see catalog.py
+    params = event.get('queryStringParameters') or {}
+    try:
+        since = parse_time(params['since']) if params.get('since') else 0
+        until = parse_time(params['until']) if params.get('until') else None
+    except ValueError:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': '`since` and `until` must be epoch seconds or dates, i.e. https://apigw.com/scans?since=2024-07-01&until=2024-07-31'})
         }
+
+    try:
+        if params.get('latest', '').lower() == 'true':
+            result = {'latest': latest_scans(get_client('s3'), bucket_name, params.get('account'))}
+        else:
+            result = {'scans': scans_between(get_client('s3'), bucket_name, since, until, params.get('account'),
+                                             params.get('scan_name'))}
     except Exception as e:
         print(str(e))
         return {
             'statusCode': 500,
             'body': json.dumps({'message': str(e)})
         }
+    return {
+        'statusCode': 200,
+        'body': json.dumps(result)
+    }
+
+def compact_catalog(event, context):
+    # Scheduled daily by the stack
+    index = compact(get_client('s3'), bucket_name)
+    print(f'Catalog compacted through {index["compacted_through"]}, {sum(index["months"].values())} scans')
+    return {'compacted_through': index['compacted_through']}
+
+def dispatch_scans(event, context):
+    # SQS event source of the launch queue, the function runs with a reserved
+    # concurrency of one so admissions never race each other
+    return dispatch(event.get('Records', []), get_launch_queue(), get_client('ec2'), launch_queued_scan,
+                    max_in_flight, on_failure=fail_queued_scan, max_attempts=launch_attempts)
+
+def fail_dead_lettered_scans(event, context):
+    # SQS event source of the launch dead letter queue
+    return {'failed': fail_dead_letters(event.get('Records', []), fail_queued_scan)}
+
+def target_options(target: dict) -> dict:
+    return scan_options(target, region_parallelism, delta_scans, default_severities, default_compliance,
+                        default_output_formats, default_shards)
+
+def enqueue_scan(role_arn: str, external_id: str, scan_name: str, ts: str, options: dict = None) -> dict:
+    options = options or target_options({})
+    object_key = f'{scan_name.replace(" ", "-")}-{ts}'
+    create_job(get_job_store(), object_key, phase='queued', scan_name=scan_name, prowler_version=prowler_version)
+    get_launch_queue().send({
+        'job_id': object_key,
+        'role_arn': role_arn,
+        'external_id': external_id,
+        'scan_name': scan_name,
+        'ts': ts,
+        'options': options
+    })
+    return {
+        'message': f'Queued Prowler scan ({scan_name}), it launches once fewer than {max_in_flight} scans are running',
+        'job_id': object_key,
+        'status': f'/status?job={object_key}',
+        'prowler_version': prowler_version,
+        'output_bucket': bucket_name,
+        **scan_outputs(object_key),
+        'output_manifest': f'{object_key}/manifest.json',
+        'regions': options['regions'] or 'all',
+        'severities': options['severities'],
+        'compliance': options['compliance'],
+        'output_formats': options['output_formats'],
+        'reports_prefix': f'reports/{object_key}/'
+    }
+
+def launch_queued_scan(message: dict) -> dict:
+    if message.get('mode') == 'packed':
+        return launch_packed_scan(message['plan'], message['targets'], message['ts'], queued=True)
+    return launch_scan(message['role_arn'], message['external_id'], message['scan_name'], message['ts'],
+                       message['options'], queued=True)
+
+def fail_queued_scan(message: dict, error: Exception):
+    # A packed message carries a job per account it scans
+    if message.get('mode') == 'packed':
+        job_ids = [target['object_key'] for target in message['targets']]
+    else:
+        job_ids = [message['job_id']]
+    for job_id in job_ids:
+        update_phase(get_job_store(), job_id, 'failed', detail=f'Launch failed: {error}')
+
+def launch_scan(role_arn: str, external_id: str, scan_name: str, ts: str, options: dict = None,
+                queued: bool = False) -> dict:
+    options = options or target_options({})
+
+    # Fan out tasks to all regions
+    object_key = f'{scan_name.replace(" ", "-")}-{ts}'
+    stopwatch = Stopwatch()
+    image_id, baked = get_scanner_image()
+    stopwatch.lap('ami_lookup')
+    previous_key = None
+    shard_count = options.get('shards', 1)
+    if options['delta'] and shard_count == 1:
+        previous_key = find_previous_results(scan_name)
+        # Delta scans only see what their inventory check sees, a full scan
+        # every so often catches the rest
+        if (previous_key and delta_full_scan_every
+                and delta_scans_before(get_client('s3'), bucket_name, previous_key) >= delta_full_scan_every):
+            print(f'{delta_full_scan_every} delta scans of {scan_name} in a row, running a full scan')
+            previous_key = None
+        stopwatch.lap('previous_results')
+    settings = dict(
+        aws_region=aws_region,
+        bucket_name=bucket_name,
+        object_key=object_key,
+        role_arn=role_arn,
+        external_id=external_id,
+        team_name=team_name,
+        prowler_version=prowler_version,
+        baked=baked,
+        regions=options['regions'],
+        region_parallelism=options['region_parallelism'],
+        stream_interval=stream_interval,
+        severities=options['severities'],
+        compliance=options['compliance'],
+        output_formats=options['output_formats'],
+        phase_budgets=phase_budgets,
+        stall_timeout=stall_timeout,
+        metrics_log_group=metrics_log_group,
+        broker=credential_broker
+    )
+    plan = None
+    if shard_count > 1:
+        plan = plan_shards(latest_service_runtimes(get_client('s3'), bucket_name, scan_name), shard_count)
+        stopwatch.lap('shard_plan')
+    user_data = render_user_data(
+        scan_name=scan_name,
+        webhook_url=webhook_url,
+        previous_key=previous_key,
+        ui_version=ui_version,
+        artifact_store=artifact_store,
+        shard=plan[0] if plan else None,
+        shard_count=len(plan) if plan else 1,
+        shard_timeout=shard_timeout,
+        **settings
+    )
+    stopwatch.lap('render')
+
+    # Size from the previous scan of this customer when there is one
+    hint = load_size_hint(get_client('s3'), bucket_name, scan_name)
+    instance_types = select_instance_types(hint, default_instance_types, size_tiers)
+    stopwatch.lap('size_hint')
+    # The record is written before anything launches, so an instance never
+    # reports into a job that doesn't exist yet. A queued job already has its
+    # record, moving it on keeps the queue wait in its history.
+    store = get_job_store()
+    record_job = partial(update_phase, phase='bootstrap') if queued else create_job
+    record_job(store, object_key, scan_name=scan_name, prowler_version=prowler_version, launched=int(ts))
+    stopwatch.lap('job_record')
+    shards = []
+    try:
+        if plan:
+            # The other shards go first so they are scanning by the time
+            # shard 0 waits on them
+            shards = launch_shards(plan[1:], image_id, instance_types, settings, scan_name, ts)
+            stopwatch.lap('shards')
+        data, market, failures = run_scanner_instance(image_id, instance_types, user_data, scan_name, ts)
+    except Exception as e:
+        stop_shards(shards)
+        # The dispatcher decides whether a queued launch is retried or failed
+        if queued:
+            update_phase(store, object_key, 'queued', detail=f'Launch failed: {e}')
+        else:
+            update_phase(store, object_key, 'failed', detail=f'Launch failed: {e}')
+        raise
+    stopwatch.lap('run_instances')
+    timings = stopwatch.total()
+
+    annotate_job(
+        store, object_key,
+        instance_id=data['InstanceId'],
+        instance_type=data['InstanceType'],
+        market=market,
+        timings=timings,
+        **({'shards': shards} if shards else {})
+    )
+    if metrics_log_group:
+        # Lambda turns EMF records in its own log into metrics
+        for record in emf_records({'object_key': object_key, 'launch': timings}):
+            print(json.dumps(record))
+    return {
+        'message': f'Launched EC2 instance to run Prowler scan ({scan_name})',
+        'job_id': object_key,
+        'status': f'/status?job={object_key}',
+        'instance_profile': instance_profile,
+        'prowler_version': prowler_version,
+        'baked_image': baked,
+        'sg_id': security_group_id,
+        'instance_id': data['InstanceId'],
+        'instance_type': data['InstanceType'],
+        'market': market,
+        'launch_failures': failures,
+        'size_hint': hint,
+        'subnet_id': data['SubnetId'],
+        'vpc_id': data['VpcId'],
+        'ip_address': data['PrivateIpAddress'],
+        'connection': f'aws ssm start-session --target {data["InstanceId"]}',
+        'output_bucket': bucket_name,
+        **scan_outputs(object_key),
+        'output_manifest': f'{object_key}/manifest.json',
+        'regions': options['regions'] or 'all',
+        'region_parallelism': options['region_parallelism'],
+        'delta_from': previous_key,
+        'severities': options['severities'],
+        'compliance': options['compliance'],
+        'output_formats': options['output_formats'],
+        'reports_prefix': f'reports/{object_key}/',
+        'metrics_object': f'metrics/{object_key}.json',
+        'timings': timings,
+        'shards': shards
+    }
+
+def launch_shards(plan: list, image_id: str, instance_types: list, settings: dict, scan_name: str,
+                  ts: str) -> list:
+    # Shards 1..N-1 of a sharded scan, launched concurrently, each with its own
+    # job record so shard 0 can tell when their CSVs are ready. The records
+    # carry shard_of rather than scan_name, which would make them the
+    # customer's latest size hint.
+    store = get_job_store()
+
+    def launch(shard):
+        job_id = shard_job_id(settings['object_key'], shard['index'])
+        create_job(store, job_id, shard_of=settings['object_key'], prowler_version=prowler_version,
+                   launched=int(ts))
+        try:
+            data, market, _ = run_scanner_instance(image_id, instance_types,
+                                                   render_shard_user_data(shard=shard, **settings),
+                                                   shard['scan_name'], ts)
+        except Exception as e:
+            update_phase(store, job_id, 'failed', detail=f'Launch failed: {e}')
+            raise
+        annotate_job(store, job_id, instance_id=data['InstanceId'], instance_type=data['InstanceType'],
+                     market=market)
+        return {'index': shard['index'], 'job_id': job_id, 'instance_id': data['InstanceId'],
+                'services': shard['services']}
+
+    targets = [dict(shard, scan_name=f'{scan_name}-shard{shard["index"]}') for shard in plan]
+    results = launch_batch(targets, launch, len(targets))
+    shards = [r['result'] for r in results if r['status'] == 'launched']
+    if len(shards) < len(results):
+        stop_shards(shards)
+        raise RuntimeError(f'Failed to launch {len(results) - len(shards)} of {len(results)} shards: '
+                           f'{"; ".join(r["error"] for r in results if r["status"] == "failed")}')
+    return shards
+
+def stop_shards(shards: list):
+    # Shard 0 merges and reports, without it the other shards are wasted
+    if shards:
+        get_client('ec2').terminate_instances(InstanceIds=[s['instance_id'] for s in shards])
+        for shard in shards:
+            update_phase(get_job_store(), shard['job_id'], 'failed', detail='Stopped, the sharded scan failed to launch')
+
+def scan_outputs(object_key: str) -> dict:
+    # With a shared UI bundle each scan only stores a data file
+    if ui_version:
+        return {
+            'output_object': f'ui-data/{object_key}.json',
+            'report_url': report_url(aws_region, bucket_name, ui_version, object_key)
+        }
+    if artifact_store:
+        return {'output_object': f'artifacts/{object_key}.json'}
+    return {'output_object': f'{object_key}.zip'}
+
+def launch_packed_batch(targets: list, ts: str) -> list:
+    # Several accounts share each instance, see planner.plan_instances. With a
+    # launch queue each instance is queued as one message and takes one slot.
+    plans = plan_instances(targets, packed_concurrency, packed_max_accounts, default_instance_types)
+    for i, plan in enumerate(plans):
+        plan['scan_name'] = f'batch-{ts}-{i}'
+    launch = enqueue_packed_scan if launch_queue_url else launch_packed_scan
+    plan_results = launch_batch(plans, lambda p: launch(p, packed_targets(p, targets, ts), ts), batch_concurrency)
+
+    results = [None] * len(targets)
+    for plan, plan_result in zip(plans, plan_results):
+        for index in plan['accounts']:
+            result = dict(plan_result, index=index, scan_name=targets[index]['scan_name'])
+            if plan_result['status'] == 'launched':
+                object_key = f'{targets[index]["scan_name"].replace(" ", "-")}-{ts}'
+                result['result'] = dict(plan_result['result'], **scan_outputs(object_key), job_id=object_key)
+            results[index] = result
+    return results
+
+def packed_targets(plan: dict, targets: list, ts: str) -> list:
+    return [{
+        'role_arn': targets[index]['role_arn'],
+        'external_id': targets[index]['external_id'],
+        'scan_name': targets[index]['scan_name'],
+        'object_key': f'{targets[index]["scan_name"].replace(" ", "-")}-{ts}'
+    } for index in plan['accounts']]
+
+def enqueue_packed_scan(plan: dict, plan_targets: list, ts: str) -> dict:
+    batch_key = plan['scan_name']
+    store = get_job_store()
+    for target in plan_targets:
+        create_job(store, target['object_key'], phase='queued', scan_name=target['scan_name'],
+                   prowler_version=prowler_version, batch=batch_key)
+    get_launch_queue().send({
+        'job_id': batch_key,
+        'mode': 'packed',
+        'ts': ts,
+        'plan': plan,
+        'targets': plan_targets
+    })
+    return {
+        'message': f'Queued {len(plan_targets)} Prowler scans on one instance ({batch_key}), '
+                   f'it launches once fewer than {max_in_flight} scans are running',
+        'prowler_version': prowler_version,
+        'concurrency': plan['concurrency'],
+        'output_bucket': bucket_name
+    }
+
+def launch_packed_scan(plan: dict, plan_targets: list, ts: str, queued: bool = False) -> dict:
+    batch_key = plan['scan_name']
+    image_id, baked = get_scanner_image()
+    user_data = render_packed_user_data(
+        aws_region=aws_region,
+        bucket_name=bucket_name,
+        batch_key=batch_key,
+        targets=plan_targets,
+        concurrency=plan['concurrency'],
+        team_name=team_name,
+        prowler_version=prowler_version,
+        webhook_url=webhook_url,
+        baked=baked,
+        ui_version=ui_version,
+        artifact_store=artifact_store,
+        severities=default_severities,
+        compliance=default_compliance,
+        output_formats=default_output_formats,
+        phase_budgets=phase_budgets,
+        stall_timeout=stall_timeout,
+        metrics_log_group=metrics_log_group
+    )
+
+    # Records go in before the launch, like launch_scan's
+    store = get_job_store()
+    record_job = partial(update_phase, phase='bootstrap') if queued else create_job
+    for target in plan_targets:
+        record_job(store, target['object_key'], scan_name=target['scan_name'], prowler_version=prowler_version,
+                   batch=batch_key, launched=int(ts))
+    try:
+        data, market, failures = run_scanner_instance(image_id, plan['instance_types'], user_data, batch_key, ts)
+    except Exception as e:
+        # The dispatcher decides whether a queued launch is retried or failed
+        phase = 'queued' if queued else 'failed'
+        for target in plan_targets:
+            update_phase(store, target['object_key'], phase, detail=f'Launch failed: {e}')
+        raise
+    for target in plan_targets:
+        annotate_job(store, target['object_key'], instance_id=data['InstanceId'], instance_type=data['InstanceType'],
+                     market=market)
+    return {
+        'message': f'Launched EC2 instance to run {len(plan_targets)} Prowler scans ({batch_key})',
+        'prowler_version': prowler_version,
+        'baked_image': baked,
+        'instance_id': data['InstanceId'],
+        'instance_type': data['InstanceType'],
+        'market': market,
+        'launch_failures': failures,
+        'concurrency': plan['concurrency'],
+        'connection': f'aws ssm start-session --target {data["InstanceId"]}',
+        'output_bucket': bucket_name,
+        'log_object': f'{batch_key}-{data["InstanceId"]}.log'
+    }
+
+def find_previous_results(scan_name: str) -> str:
+    # Latest stored scan of this customer, a CSV or an artifact manifest
+    scans = list_scans(get_client('s3'), bucket_name, scan_name)
+    return scans[-1][1] if scans else None
+
+def run_scanner_instance(image_id: str, instance_types: list, user_data: str, name: str, ts: str) -> tuple:
+    params = {
+        'ImageId': image_id,
+        'SubnetId': subnet_id,
+        'SecurityGroupIds': [security_group_id],
+        'MaxCount': 1,
+        'MinCount': 1,
+        'IamInstanceProfile': {
+            'Arn': instance_profile
+        },
+        'UserData': user_data,
+        'TagSpecifications': [
+            {
+                'ResourceType': 'instance',
+                'Tags': [
+                    {'Key': 'Name', 'Value': f'prowler-scanner-{name}'},
+                    {'Key': 'Role', 'Value': 'ProwlerScanner'},
+                    {'Key': 'Environment', 'Value': 'Production'},
+                    {'Key': 'LaunchTimestamp', 'Value': ts}
+                ]
+            }
+        ]
+    }
+    response, market, failures = launch_with_strategy(get_client('ec2'), params, instance_types, use_spot)
+    return response['Instances'][0], market, failures
+
+def get_scanner_image() -> tuple:
+    # Prefer the pre-baked image for this Prowler version (see build_image.py)
+    baked_ami = get_cached_parameter(baked_image_parameter)
+    if baked_ami:
+        return baked_ami, True
+    return get_ubuntu_ami(), False
 
 def get_ubuntu_ami() -> str:
+    # Canonical publishes the current AMI as a public SSM parameter, which is
+    # a single small lookup; the full describe_images sweep is the cold fallback
+    ami_id = get_cached_parameter(ami_parameter)
+    if not ami_id:
+        ami_id = describe_ubuntu_ami()
+        ami_cache[ami_parameter] = {'ami_id': ami_id, 'expires': time.time() + ami_cache_ttl}
+    return ami_id
+
+def get_cached_parameter(name: str) -> str:
+    now = time.time()
+    cached = ami_cache.get(name)
+    if cached and now < cached['expires']:
+        return cached['ami_id']
+
+    try:
+        ami_id = get_client('ssm').get_parameter(Name=name)['Parameter']['Value']
+    except Exception as e:
+        print(f'Unable to resolve AMI from SSM parameter {name}: {e}')
+        ami_id = None
+
+    # Misses are cached too so a missing baked image costs one lookup per TTL
+    ami_cache[name] = {'ami_id': ami_id, 'expires': now + ami_cache_ttl}
+    return ami_id
+
+def describe_ubuntu_ami() -> str:
     filters = [
         {'Name': 'name', 'Values': ['ubuntu/images/hvm-ssd/ubuntu-jammy-22.04-amd64-server-*']},
         {'Name': 'state', 'Values': ['available']}
     ]
 
-    # Describe images with the filters
-    response = ec2_client.describe_images(Filters=filters)
+    # Describe images with the filters, scoped to Canonical's owner ID
+    response = get_client('ec2').describe_images(Owners=['099720109477'], Filters=filters)
 
     # Sort images by creation date to get the latest one
     images = sorted(response['Images'], key=lambda x: x['CreationDate'], reverse=True)
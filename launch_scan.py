@@ -1,26 +1,89 @@
 #!/usr/bin/env python3
 
+import argparse
+import csv
+import json
+import sys
 from pprint import pprint
 
-import boto3
-import requests
+from scan_client import ScanClient, load_stack_outputs, render_progress
 
 
-scan_name = input('scan_name? ')
-role_arn = input('role_arn? ')
-external_id = input('external_id? ')
+BATCH_SIZE = 100
 
 
-cloudformation_client = boto3.client('cloudformation')
+def get_endpoint(stack_name='ProwlerScannerStack', refresh=False):
+    outputs = load_stack_outputs(stack_name, refresh=refresh)
+    if 'Endpoint' not in outputs:
+        raise Exception(f'No Endpoint output found on stack {stack_name}')
+    return outputs['Endpoint']
 
-response = cloudformation_client.describe_stacks(StackName='ProwlerScannerStack')
-for output in response['Stacks'][0]['Outputs']:
-    if output['OutputKey'] == 'Endpoint':
-        endpoint = output['OutputValue']
-        req = requests.get(endpoint, params={
-            'external_id': external_id,
-            'role_arn': role_arn,
-            'scan_name': scan_name
-        })
-        req.raise_for_status()
-        pprint(req.json())
+def load_targets(path) -> list:
+    # JSON files hold a list of targets or {"targets": [...]}, anything else is read as CSV
+    with open(path) as f:
+        if path.endswith('.json'):
+            data = json.load(f)
+            return data['targets'] if isinstance(data, dict) else data
+        return [
+            {k: v.strip() for k, v in row.items() if k in ('scan_name', 'role_arn', 'external_id')}
+            for row in csv.DictReader(f)
+        ]
+
+def prompt_target() -> dict:
+    return {
+        'scan_name': input('scan_name? '),
+        'role_arn': input('role_arn? '),
+        'external_id': input('external_id? '),
+    }
+
+def report(results) -> list:
+    job_ids = []
+    for result in results:
+        if result['status'] == 'launched':
+            job_ids.append(result['result']['job_id'])
+            print(f'[+] {result["scan_name"]}: {result["result"].get("instance_id", "queued")} -> {result["result"]["output_object"]}')
+        else:
+            print(f'[!] {result["scan_name"]}: {result["error"]}')
+    print(f'[+] Launched {len(job_ids)} of {len(results)} scans')
+    return job_ids
+
+def print_progress(records):
+    # Redraw the table in place on a terminal, append otherwise
+    if sys.stdout.isatty():
+        print('\033[H\033[J', end='')
+    print(render_progress(records), flush=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Launch Prowler scans through the deployed API.')
+    parser.add_argument('--targets', help='CSV (scan_name,role_arn,external_id) or JSON file of scan targets to launch in bulk')
+    parser.add_argument('--scan-name', help='Launch a single scan without prompting')
+    parser.add_argument('--role-arn')
+    parser.add_argument('--external-id')
+    parser.add_argument('--stack-name', default='ProwlerScannerStack')
+    parser.add_argument('--refresh-outputs', action='store_true', help='Ignore the cached stack outputs')
+    parser.add_argument('--per-target', action='store_true', help='Submit one request per target instead of POST /batch chunks')
+    parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight at once')
+    parser.add_argument('--rate', type=float, default=5, help='Requests per second across all workers')
+    parser.add_argument('--wait', action='store_true', help='Poll job status until every scan is done or failed')
+    parser.add_argument('--poll-interval', type=float, default=30)
+    parser.add_argument('--timeout', type=float, help='Stop waiting after this many seconds')
+    args = parser.parse_args()
+
+    client = ScanClient(get_endpoint(args.stack_name, args.refresh_outputs), rate=args.rate, concurrency=args.concurrency)
+    if args.targets:
+        targets = load_targets(args.targets)
+        results = client.launch_many(targets, chunk_size=0 if args.per_target else BATCH_SIZE)
+    elif args.scan_name:
+        targets = [{'scan_name': args.scan_name, 'role_arn': args.role_arn, 'external_id': args.external_id}]
+        results = client.launch_many(targets)
+    else:
+        results = [client.launch(prompt_target())]
+        pprint(results[0].get('result', results[0]))
+
+    job_ids = report(results)
+    if args.wait and job_ids:
+        records = client.wait(job_ids, interval=args.poll_interval, timeout=args.timeout, on_progress=print_progress)
+        failed = [j for j, r in records.items() if r.get('phase') != 'done']
+        raise SystemExit(1 if failed or len(job_ids) < len(results) else 0)
+    raise SystemExit(1 if len(job_ids) < len(results) else 0)
@@ -1,3 +1,5 @@
+import json
+
 import aws_cdk as core
 from constructs import Construct
 from aws_cdk import (
@@ -6,8 +8,13 @@ from aws_cdk import (
     aws_lambda as _lambda,
     aws_iam as iam,
     aws_s3 as s3,
+    aws_s3_deployment as s3deploy,
     aws_lambda as _lambda,
     aws_apigateway as apigateway,
+    aws_lambda_event_sources as lambda_event_sources,
+    aws_sqs as sqs,
+    aws_events as events,
+    aws_events_targets as targets,
     aws_logs
 )
 
@@ -37,10 +44,17 @@ class ProwlerScanner(core.Stack):
             auto_delete_objects=True
         )
 
+        # Only the reports are public; job records, the catalog, inventories,
+        # findings, metrics and size hints list or describe every customer
         bucket.add_to_resource_policy(
             iam.PolicyStatement(
                 actions=["s3:GetObject"],
-                resources=[bucket.arn_for_objects("*")],
+                resources=[
+                    bucket.arn_for_objects("*.zip"),  # {scan_name}-{ts}.zip report archives
+                    bucket.arn_for_objects("reports/*"),
+                    bucket.arn_for_objects("ui/*"),
+                    bucket.arn_for_objects("ui-data/*")
+                ],
                 principals=[iam.ArnPrincipal("*")]
             )
         )
@@ -51,6 +65,14 @@ class ProwlerScanner(core.Stack):
             enabled=True
         )
 
+        # Helper modules the scanner instances run (CSV merge etc.), fetched at boot
+        s3deploy.BucketDeployment(
+            self, "ScannerTooling",
+            sources=[s3deploy.Source.asset("functions", exclude=["__pycache__", "*.pyc"])],
+            destination_bucket=bucket,
+            destination_key_prefix="tooling/"
+        )
+
         security_group = ec2.SecurityGroup(self, "ProwlerSecurityGroup",
             vpc=vpc,
             description="Security group for EC2 instances (all egress).",
@@ -106,8 +128,37 @@ class ProwlerScanner(core.Stack):
 
         bucket.grant_write(ec2_role)
 
+        # Scan timings as CloudWatch metrics (EMF), from the instances and
+        # the launching Lambda; every scan's timings are also kept in the
+        # bucket under metrics/
+        emf_metrics = getattr(config, 'emf_metrics', False)
+        if emf_metrics:
+            metrics_log_group = aws_logs.LogGroup(
+                self, 'ScanMetricsLogGroup',
+                retention=aws_logs.RetentionDays.ONE_MONTH
+            )
+            metrics_log_group.grant_write(ec2_role)
+
         ### Setup Lambda function to receive requests
 
+        # Optional launch queue, the API records the job and queues it and a
+        # dispatcher starts instances while fewer than max_in_flight run
+        queue_launches = getattr(config, 'queue_launches', False)
+        if queue_launches:
+            launch_dead_letters = sqs.Queue(self, "LaunchDeadLetterQueue",
+                retention_period=core.Duration.days(14)
+            )
+            launch_queue = sqs.Queue(self, "LaunchQueue",
+                visibility_timeout=core.Duration.minutes(10),  # 6x the dispatcher timeout
+                retention_period=core.Duration.days(4),
+                dead_letter_queue=sqs.DeadLetterQueue(
+                    # Deferred launches are sent again rather than received
+                    # again, so only dispatcher errors count toward this
+                    max_receive_count=5,
+                    queue=launch_dead_letters
+                )
+            )
+
         lambda_env = {
             "BUCKET_NAME": bucket.bucket_name,
             "SUBNET_ID": subnet_id,
@@ -115,8 +166,34 @@ class ProwlerScanner(core.Stack):
             "INSTANCE_PROFILE": instance_profile.attr_arn,
             "PROWLER_VERSION": config.prowler_version,
             "INSTANCE_TYPE": config.instance_type,
+            "INSTANCE_TYPES": ",".join(getattr(config, 'instance_types', [config.instance_type])),
+            "SIZE_TIERS": json.dumps(getattr(config, 'size_tiers', [])),
+            "USE_SPOT": str(getattr(config, 'use_spot', False)).lower(),
             "TEAM_NAME": config.team_name,
-            "WEBHOOK_URL": config.webhook_url
+            "WEBHOOK_URL": config.webhook_url,
+            "AMI_CACHE_TTL": str(getattr(config, 'ami_cache_ttl', 3600)),
+            "BATCH_CONCURRENCY": str(getattr(config, 'batch_concurrency', 8)),
+            "MAX_BATCH_SIZE": str(getattr(config, 'max_batch_size', 100)),
+            "PACKED_CONCURRENCY": str(getattr(config, 'packed_concurrency', 4)),
+            "PACKED_MAX_ACCOUNTS": str(getattr(config, 'packed_max_accounts', 20)),
+            "REGION_PARALLELISM": str(getattr(config, 'region_parallelism', 0)),
+            "STREAM_INTERVAL": str(getattr(config, 'stream_interval', 60)),
+            "PHASE_BUDGETS": ",".join(f"{p}={s}" for p, s in getattr(config, 'phase_budgets', {}).items()),
+            "STALL_TIMEOUT": str(getattr(config, 'stall_timeout', 1800)),
+            "METRICS_LOG_GROUP": metrics_log_group.log_group_name if emf_metrics else "",
+            "DELTA_SCANS": str(getattr(config, 'delta_scans', False)).lower(),
+            "DELTA_FULL_SCAN_EVERY": str(getattr(config, 'delta_full_scan_every', 7)),
+            "UI_VERSION": getattr(config, 'ui_version', ''),
+            "ARTIFACT_STORE": str(getattr(config, 'artifact_store', False)).lower(),
+            "SEVERITIES": ",".join(getattr(config, 'severities', ['critical', 'high', 'medium'])),
+            "COMPLIANCE": ",".join(getattr(config, 'compliance', [])),
+            "OUTPUT_FORMATS": ",".join(getattr(config, 'output_formats', ['csv'])),
+            "LAUNCH_QUEUE_URL": launch_queue.queue_url if queue_launches else "",
+            "MAX_IN_FLIGHT": str(getattr(config, 'max_in_flight', 20)),
+            "LAUNCH_ATTEMPTS": str(getattr(config, 'launch_attempts', 20)),
+            "SHARDS": str(getattr(config, 'shards', 1)),
+            "SHARD_TIMEOUT": str(getattr(config, 'shard_timeout', 36000)),
+            "CREDENTIAL_BROKER": str(getattr(config, 'credential_broker', False)).lower()
         }
 
         lambda_role = iam.Role(
@@ -135,18 +212,37 @@ class ProwlerScanner(core.Stack):
                             resources=[ec2_role.role_arn]
                         )
                     ]
+                ),
+                'ReadAmiParameters': iam.PolicyDocument(
+                    statements=[
+                        iam.PolicyStatement(
+                            actions=["ssm:GetParameter"],
+                            effect=iam.Effect.ALLOW,
+                            resources=[
+                                f"arn:aws:ssm:{self.region}::parameter/aws/service/canonical/*",
+                                f"arn:aws:ssm:{self.region}:{self.account}:parameter/prowler-scanner/*"
+                            ]
+                        )
+                    ]
                 )
             }
         )
 
+        # Shared by every handler; more memory also means more CPU for the
+        # boto3 import and client construction on a cold start
+        function_settings = {
+            "runtime": _lambda.Runtime(getattr(config, 'lambda_runtime', 'python3.12'), _lambda.RuntimeFamily.PYTHON),
+            "memory_size": getattr(config, 'lambda_memory', 512),
+            "code": _lambda.Code.from_asset("functions", exclude=["__pycache__", "*.pyc"]),
+            "role": lambda_role,
+            "environment": lambda_env
+        }
+
         run_instance_function = _lambda.Function(
             self, "RunScan",
-            runtime=_lambda.Runtime.PYTHON_3_9,
             handler="worker.run_scan",
-            code=_lambda.Code.from_asset("functions"),
-            role=lambda_role,
-            timeout=core.Duration.seconds(5),
-            environment=lambda_env
+            timeout=core.Duration.seconds(29),  # a sharded launch starts an instance per shard
+            **function_settings
         )
 
         aws_logs.LogGroup(
@@ -155,6 +251,114 @@ class ProwlerScanner(core.Stack):
             retention=aws_logs.RetentionDays.ONE_WEEK
         )
 
+        # Job records live in the results bucket under jobs/
+        bucket.grant_read_write(lambda_role, "jobs/*")
+        bucket.grant_read(lambda_role, "hints/*")
+        bucket.grant_read(lambda_role, "*.csv")  # previous results for delta scans
+        bucket.grant_read(lambda_role, "artifacts/*")
+        bucket.grant_read(lambda_role, "inventory/*")  # delta scans in a row, see functions/delta.py
+        bucket.grant_read_write(lambda_role, "catalog/*")  # scan catalog, see functions/catalog.py
+
+        run_batch_function = _lambda.Function(
+            self, "RunBatch",
+            handler="worker.run_batch",
+            timeout=core.Duration.seconds(29),  # API Gateway integration limit
+            **function_settings
+        )
+
+        aws_logs.LogGroup(
+            self, 'RunBatchLogGroup',
+            log_group_name=f"/aws/lambda/{run_batch_function.function_name}",
+            retention=aws_logs.RetentionDays.ONE_WEEK
+        )
+
+        status_function = _lambda.Function(
+            self, "ScanStatus",
+            handler="worker.get_status",
+            timeout=core.Duration.seconds(5),
+            **function_settings
+        )
+
+        aws_logs.LogGroup(
+            self, 'ScanStatusLogGroup',
+            log_group_name=f"/aws/lambda/{status_function.function_name}",
+            retention=aws_logs.RetentionDays.ONE_WEEK
+        )
+
+        catalog_function = _lambda.Function(
+            self, "ScanCatalog",
+            handler="worker.query_scans",
+            timeout=core.Duration.seconds(29),
+            **function_settings
+        )
+
+        aws_logs.LogGroup(
+            self, 'ScanCatalogLogGroup',
+            log_group_name=f"/aws/lambda/{catalog_function.function_name}",
+            retention=aws_logs.RetentionDays.ONE_WEEK
+        )
+
+        # Folds the catalog entries written by the instances into the month
+        # files and the latest-per-account index
+        compaction_function = _lambda.Function(
+            self, "CompactCatalog",
+            handler="worker.compact_catalog",
+            timeout=core.Duration.minutes(5),
+            **function_settings
+        )
+        events.Rule(
+            self, "CompactCatalogSchedule",
+            schedule=events.Schedule.rate(core.Duration.days(1)),
+            targets=[targets.LambdaFunction(compaction_function)]
+        )
+
+        aws_logs.LogGroup(
+            self, 'CompactCatalogLogGroup',
+            log_group_name=f"/aws/lambda/{compaction_function.function_name}",
+            retention=aws_logs.RetentionDays.ONE_WEEK
+        )
+
+        if queue_launches:
+            launch_queue.grant_send_messages(lambda_role)
+
+            dispatcher_function = _lambda.Function(
+                self, "DispatchScans",
+                handler="worker.dispatch_scans",
+                timeout=core.Duration.seconds(100),
+                reserved_concurrent_executions=1,  # admissions are serialized, see dispatcher.py
+                **function_settings
+            )
+            dispatcher_function.add_event_source(lambda_event_sources.SqsEventSource(
+                launch_queue,
+                batch_size=10,
+                max_batching_window=core.Duration.seconds(5),
+                report_batch_item_failures=True
+            ))
+
+            aws_logs.LogGroup(
+                self, 'DispatchScansLogGroup',
+                log_group_name=f"/aws/lambda/{dispatcher_function.function_name}",
+                retention=aws_logs.RetentionDays.ONE_WEEK
+            )
+
+            # Marks the jobs of dead-lettered launches failed
+            dead_letter_function = _lambda.Function(
+                self, "FailDeadLetteredScans",
+                handler="worker.fail_dead_lettered_scans",
+                timeout=core.Duration.seconds(30),
+                **function_settings
+            )
+            dead_letter_function.add_event_source(lambda_event_sources.SqsEventSource(
+                launch_dead_letters,
+                batch_size=10
+            ))
+
+            aws_logs.LogGroup(
+                self, 'FailDeadLetteredScansLogGroup',
+                log_group_name=f"/aws/lambda/{dead_letter_function.function_name}",
+                retention=aws_logs.RetentionDays.ONE_WEEK
+            )
+
         ### Setup API Gateway to expose HTTP endpoint for requests
 
         api = apigateway.RestApi(self, "ProwlerApi",
@@ -166,6 +370,15 @@ class ProwlerScanner(core.Stack):
 
         api.root.add_method("GET", lambda_integration)   # GET /
 
+        batch_resource = api.root.add_resource("batch")
+        batch_resource.add_method("POST", apigateway.LambdaIntegration(run_batch_function))   # POST /batch
+
+        status_resource = api.root.add_resource("status")
+        status_resource.add_method("GET", apigateway.LambdaIntegration(status_function))   # GET /status
+
+        scans_resource = api.root.add_resource("scans")
+        scans_resource.add_method("GET", apigateway.LambdaIntegration(catalog_function))   # GET /scans
+
         ### Outputs
 
         core.CfnOutput(self, "CrossAccountRoleArn",
@@ -180,6 +393,21 @@ class ProwlerScanner(core.Stack):
             description="The name of the bucket where resulting React sites are stored."
         )
 
+        core.CfnOutput(self, "ScannerSubnetId",
+            value=subnet_id,
+            description="The subnet scanner instances (and the image builder) launch into."
+        )
+
+        core.CfnOutput(self, "ScannerSecurityGroupId",
+            value=security_group.security_group_id,
+            description="The security group attached to scanner instances."
+        )
+
+        core.CfnOutput(self, "ScannerInstanceProfileArn",
+            value=instance_profile.attr_arn,
+            description="The instance profile attached to scanner instances."
+        )
+
         core.CfnOutput(self, "Endpoint",
             value=api.url,
             export_name="Endpoint",
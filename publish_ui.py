@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import argparse
+import mimetypes
+import os
+import subprocess
+import tempfile
+
+import boto3
+from botocore.exceptions import ClientError
+
+import config
+from render_cft import get_stack_outputs
+
+
+UI_REPOSITORY = 'https://github.com/lfglance/prowler-ui'
+
+
+def bundle_prefix(ui_version: str) -> str:
+    return f'ui/{ui_version}/'
+
+def is_published(s3_client, bucket: str, ui_version: str) -> bool:
+    try:
+        s3_client.head_object(Bucket=bucket, Key=f'{bundle_prefix(ui_version)}index.html')
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+            return False
+        raise
+
+def build_bundle(ui_version: str, workdir: str, repository: str = UI_REPOSITORY) -> str:
+    # Relative asset paths so the bundle works from any prefix; scans are
+    # picked with ?scan=<object_key> and loaded from ../../ui-data/
+    source = os.path.join(workdir, 'prowler-ui')
+    subprocess.run(['git', 'clone', '--quiet', repository, source], check=True)
+    subprocess.run(['git', 'checkout', '--quiet', ui_version], cwd=source, check=True)
+    subprocess.run(['npm', 'ci'], cwd=source, check=True)
+    subprocess.run(['npm', 'run', 'build'], cwd=source, check=True,
+                   env=dict(os.environ, PUBLIC_URL='.', REACT_APP_DATA_PREFIX='../../ui-data/'))
+    return os.path.join(source, 'build')
+
+def upload_bundle(s3_client, bucket: str, ui_version: str, build_dir: str) -> int:
+    prefix = bundle_prefix(ui_version)
+    paths = sorted(
+        os.path.relpath(os.path.join(root, name), build_dir).replace(os.sep, '/')
+        for root, _, files in os.walk(build_dir) for name in files
+    )
+    # index.html goes last so a half uploaded bundle never looks published
+    paths.sort(key=lambda p: p == 'index.html')
+    for path in paths:
+        extra = {'ContentType': mimetypes.guess_type(path)[0] or 'application/octet-stream'}
+        # hashed build assets never change within a version, the entry page may be republished
+        extra['CacheControl'] = 'no-cache' if path == 'index.html' else 'public, max-age=31536000, immutable'
+        s3_client.upload_file(os.path.join(build_dir, path), bucket, prefix + path, ExtraArgs=extra)
+    return len(paths)
+
+def publish_ui(ui_version: str, outputs: dict, force: bool = False) -> str:
+    s3_client = boto3.client('s3')
+    bucket = outputs['BucketName']
+    region = s3_client.meta.region_name
+    url = f'https://{bucket}.s3.{region}.amazonaws.com/{bundle_prefix(ui_version)}index.html'
+    if not force and is_published(s3_client, bucket, ui_version):
+        print(f'[+] prowler-ui {ui_version} is already published at {url}')
+        return url
+
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f'[+] Building prowler-ui {ui_version}')
+        build_dir = build_bundle(ui_version, workdir)
+        count = upload_bundle(s3_client, bucket, ui_version, build_dir)
+    print(f'[+] Published {count} files to {url}')
+    return url
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build prowler-ui once and publish it to the results bucket.')
+    parser.add_argument('--ui-version', default=getattr(config, 'ui_version', ''), help='prowler-ui git ref')
+    parser.add_argument('--stack-name', default='ProwlerScannerStack')
+    parser.add_argument('--force', action='store_true', help='Rebuild and upload even if the version is published')
+    args = parser.parse_args()
+    if not args.ui_version:
+        parser.error('set ui_version in config.py or pass --ui-version')
+
+    publish_ui(args.ui_version, get_stack_outputs(args.stack_name), args.force)
@@ -1,10 +1,39 @@
 #!/usr/bin/env python3
 
+# Renders the remote role template customers launch by hand. With
+# --accounts or --organization it also renders a StackSet version of it and
+# an onboarding manifest: one scan target per account with the expected role
+# ARN and an external ID derived from a local secret, so re-rendering gives
+# the same IDs. The manifest's `targets` go straight to the batch API
+# (`launch_scan.py --targets onboarding.json`), and --deploy rolls the role
+# out as stack instances with each account's external ID.
+#
+#   render_cft.py
+#   render_cft.py --accounts accounts.csv [--deploy --region us-east-1]
+#   render_cft.py --organization --deploy --region us-east-1 --ou ou-abcd-12345678
+
+import argparse
+import csv
+import hashlib
+import hmac
 import json
-import boto3
+import os
+import re
+import secrets
+
+
+ROLE_NAME = 'CrossAccountRole'
+STACK_SET_NAME = 'ProwlerScannerRemote'
+TEMPLATE_FILE = 'html/ProwlerScannerRemote.json'
+STACK_SET_TEMPLATE_FILE = 'html/ProwlerScannerRemoteStackSet.json'
+ACCOUNT_ID_PATTERN = re.compile(r'^\d{12}$')
+# Matches batch.SCAN_NAME_PATTERN
+SCAN_NAME_INVALID = re.compile(r'[^A-Za-z0-9 _.-]')
+EXTERNAL_ID_LENGTH = 32
 
 
 def get_stack_outputs(stack_name):
+    import boto3
     client = boto3.client('cloudformation')
     response = client.describe_stacks(StackName=stack_name)
     outputs = response['Stacks'][0]['Outputs']
@@ -119,12 +148,167 @@ def render_cloudformation_template(role_arn) -> dict:
     }
     return template
 
+def render_stackset_template(role_arn) -> dict:
+    # The same role for every account of a StackSet, each stack instance sets
+    # its own ExternalId through parameter overrides. The role name is global,
+    # so the StackSet deploys to a single region.
+    template = render_cloudformation_template(role_arn)
+    template['Description'] = 'Creates the cross-account IAM role for Prowler Scanner in every StackSet account.'
+    # Outputs go to the administrator, there's no customer to address
+    del template['Outputs']['Message']
+    return template
+
+def load_secret(path: str) -> bytes:
+    # Created on first use; losing it means new external IDs for every account
+    if not os.path.exists(path):
+        with open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w') as f:
+            f.write(secrets.token_hex(32))
+    with open(path) as f:
+        return f.read().strip().encode()
+
+def derive_external_id(secret: bytes, account_id: str) -> str:
+    # Hex, so it meets the template's alphanumeric ExternalId pattern
+    return hmac.new(secret, account_id.encode(), hashlib.sha256).hexdigest()[:EXTERNAL_ID_LENGTH]
+
+def account_scan_name(account_id: str, name: str = '') -> str:
+    # The account ID keeps scan names unique within a batch
+    name = SCAN_NAME_INVALID.sub('', name or '').strip()[:64 - 13]
+    return f'{name}-{account_id}' if name else account_id
+
+def load_accounts(path: str) -> list:
+    # CSV with an account_id column and an optional name column
+    with open(path) as f:
+        return [
+            {'account_id': row['account_id'].strip(), 'name': (row.get('name') or '').strip()}
+            for row in csv.DictReader(f)
+        ]
+
+def organization_accounts(organizations_client) -> list:
+    accounts = []
+    for page in organizations_client.get_paginator('list_accounts').paginate():
+        for account in page['Accounts']:
+            if account['Status'] == 'ACTIVE':
+                accounts.append({'account_id': account['Id'], 'name': account['Name']})
+    return accounts
+
+def build_manifest(accounts: list, secret: bytes, role_name: str = ROLE_NAME,
+                   stack_set_name: str = STACK_SET_NAME) -> dict:
+    # Sorted by account ID and free of timestamps, so the same accounts and
+    # secret always render the same manifest
+    by_id = {}
+    for account in accounts:
+        account_id = str(account['account_id'])
+        if not ACCOUNT_ID_PATTERN.match(account_id):
+            raise ValueError(f'Invalid AWS account ID: {account_id!r}')
+        if account_id in by_id:
+            raise ValueError(f'Account {account_id} is listed more than once')
+        by_id[account_id] = account.get('name', '')
+    return {
+        'stack_set_name': stack_set_name,
+        'role_name': role_name,
+        'targets': [
+            {
+                'account_id': account_id,
+                'scan_name': account_scan_name(account_id, by_id[account_id]),
+                'role_arn': f'arn:aws:iam::{account_id}:role/{role_name}',
+                'external_id': derive_external_id(secret, account_id)
+            }
+            for account_id in sorted(by_id)
+        ]
+    }
+
+def stack_instance_requests(manifest: dict, region: str, ou: str = None, max_concurrent: int = 10) -> list:
+    # One create_stack_instances call per account since each has its own
+    # ExternalId; with an OU the StackSet is service managed and targets the
+    # account within it
+    requests = []
+    for target in manifest['targets']:
+        request = {
+            'StackSetName': manifest['stack_set_name'],
+            'Regions': [region],
+            'ParameterOverrides': [{'ParameterKey': 'ExternalId', 'ParameterValue': target['external_id']}],
+            'OperationPreferences': {'MaxConcurrentCount': max_concurrent, 'FailureToleranceCount': max_concurrent}
+        }
+        if ou:
+            request['DeploymentTargets'] = {'OrganizationalUnitIds': [ou], 'Accounts': [target['account_id']],
+                                            'AccountFilterType': 'INTERSECTION'}
+        else:
+            request['Accounts'] = [target['account_id']]
+        requests.append(request)
+    return requests
+
+def deploy_stack_set(cloudformation_client, template: dict, manifest: dict, region: str, ou: str = None) -> list:
+    # Managed execution queues the per-account operations instead of failing
+    # on the one already running. Accounts that already have an instance keep
+    # it, so re-running only onboards new accounts.
+    name = manifest['stack_set_name']
+    try:
+        cloudformation_client.describe_stack_set(StackSetName=name)
+    except cloudformation_client.exceptions.StackSetNotFoundException:
+        settings = {
+            'StackSetName': name,
+            'TemplateBody': json.dumps(template),
+            # Every stack instance overrides it
+            'Parameters': [{'ParameterKey': 'ExternalId', 'ParameterValue': 'unset'}],
+            'Capabilities': ['CAPABILITY_NAMED_IAM'],
+            'ManagedExecution': {'Active': True}
+        }
+        if ou:
+            settings['PermissionModel'] = 'SERVICE_MANAGED'
+            settings['AutoDeployment'] = {'Enabled': False}
+        cloudformation_client.create_stack_set(**settings)
+
+    deployed = set()
+    for page in cloudformation_client.get_paginator('list_stack_instances').paginate(StackSetName=name):
+        deployed.update(s['Account'] for s in page['Summaries'] if s['Region'] == region)
+    operations = []
+    for request in stack_instance_requests(manifest, region, ou):
+        accounts = request.get('Accounts') or request['DeploymentTargets']['Accounts']
+        if accounts[0] in deployed:
+            continue
+        operations.append(cloudformation_client.create_stack_instances(**request)['OperationId'])
+    return operations
+
+def write_json(data: dict, path: str, indent: int = None):
+    with open(path, 'w') as file:
+        print(f'[+] Saved {path}')
+        file.write(json.dumps(data, indent=indent))
+
 
 if __name__ == '__main__':
-    stack_name = 'ProwlerScannerStack'
-    outputs = get_stack_outputs(stack_name)
+    parser = argparse.ArgumentParser(description='Render the remote role template and onboard accounts in bulk.')
+    parser.add_argument('--stack-name', default='ProwlerScannerStack')
+    parser.add_argument('--accounts', help='CSV of accounts to onboard (account_id,name)')
+    parser.add_argument('--organization', action='store_true', help='Onboard every active account of the organization')
+    parser.add_argument('--manifest', default='onboarding.json')
+    parser.add_argument('--secret-file', default='.onboarding-secret', help='Seed of the external IDs, created if missing')
+    parser.add_argument('--stack-set-name', default=STACK_SET_NAME)
+    parser.add_argument('--deploy', action='store_true', help='Create the StackSet and its missing stack instances')
+    parser.add_argument('--region', help='Region of the stack instances, required with --deploy')
+    parser.add_argument('--ou', help='Organizational unit of a service managed StackSet')
+    args = parser.parse_args()
+
+    outputs = get_stack_outputs(args.stack_name)
     cft = render_cloudformation_template(outputs['CrossAccountRoleArn'])
-    file_name = 'html/ProwlerScannerRemote.json'
-    with open(file_name, 'w') as file:
-        print(f'[+] Saved rendered template to {file_name}')
-        file.write(json.dumps(cft))
+    write_json(cft, TEMPLATE_FILE)
+    if not (args.accounts or args.organization):
+        raise SystemExit(0)
+
+    stack_set_template = render_stackset_template(outputs['CrossAccountRoleArn'])
+    write_json(stack_set_template, STACK_SET_TEMPLATE_FILE)
+    if args.organization:
+        import boto3
+        accounts = organization_accounts(boto3.client('organizations'))
+    else:
+        accounts = load_accounts(args.accounts)
+    manifest = build_manifest(accounts, load_secret(args.secret_file), stack_set_name=args.stack_set_name)
+    write_json(manifest, args.manifest, indent=1)
+    print(f'[+] {len(manifest["targets"])} accounts, launch their scans with: python launch_scan.py --targets {args.manifest}')
+
+    if args.deploy:
+        if not args.region:
+            parser.error('--deploy needs --region')
+        import boto3
+        operations = deploy_stack_set(boto3.client('cloudformation', region_name=args.region),
+                                      stack_set_template, manifest, args.region, args.ou)
+        print(f'[+] Started {len(operations)} stack instance operations on {args.stack_set_name}')
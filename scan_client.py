@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+CACHE_DIR = os.path.expanduser('~/.cache/prowler-scanner')
+FINAL_PHASES = ('done', 'failed')
+
+# Launches are not idempotent: a 500 or 502 can come after the Lambda
+# started instances (and /batch answers 500 when every target failed), a 504
+# may mean API Gateway gave up waiting on a launch. Only throttling and an
+# unavailable service are known not to have launched anything.
+LAUNCH_RETRY_STATUSES = (429, 503)
+READ_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def load_stack_outputs(stack_name='ProwlerScannerStack', ttl=86400, refresh=False, cache_dir=CACHE_DIR) -> dict:
+    # describe_stacks is slow and throttled, outputs rarely change
+    cache_path = os.path.join(cache_dir, f'{stack_name}.json')
+    if not refresh and os.path.exists(cache_path) and time.time() - os.path.getmtime(cache_path) < ttl:
+        with open(cache_path) as f:
+            return json.load(f)
+
+    import boto3
+    response = boto3.client('cloudformation').describe_stacks(StackName=stack_name)
+    outputs = {o['OutputKey']: o['OutputValue'] for o in response['Stacks'][0]['Outputs']}
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(cache_path, 'w') as f:
+        json.dump(outputs, f)
+    return outputs
+
+
+class RateLimiter:
+    # Token bucket shared by every worker thread
+    def __init__(self, rate: float, burst: int = 1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+
+class ScanClient:
+    def __init__(self, endpoint: str, rate: float = 5, concurrency: int = 16, max_retries: int = 5,
+                 backoff: float = 0.5, max_backoff: float = 20, timeout: float = 30, sleep=time.sleep):
+        self.endpoint = endpoint.rstrip('/') + '/'
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.sleep = sleep
+        self.limiter = RateLimiter(rate, burst=max(1, int(rate)), sleep=sleep)
+
+        # One pooled session, sized so every worker thread keeps its connection
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method: str, path: str, retry_statuses: tuple, **kwargs) -> requests.Response:
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                response = self.session.request(method, self.endpoint + path, timeout=self.timeout, **kwargs)
+                if response.status_code not in retry_statuses:
+                    return response
+                # Honour Retry-After when the API sends one
+                delay = float(response.headers.get('Retry-After') or 0)
+            except requests.ConnectionError:
+                if attempt == self.max_retries:
+                    raise
+                response, delay = None, 0
+            if attempt == self.max_retries:
+                return response
+            self.sleep(max(delay, min(self.max_backoff, self.backoff * 2 ** attempt)))
+        return response
+
+    def launch(self, target: dict) -> dict:
+        response = self.request('GET', '', LAUNCH_RETRY_STATUSES, params=target)
+        body = response.json()
+        # 202 when the deployment queues launches, the job starts out queued
+        if response.status_code not in (200, 202):
+            return {'scan_name': target.get('scan_name'), 'status': 'failed', 'http_status': response.status_code,
+                    'error': body.get('error') or body.get('message')}
+        return {'scan_name': target.get('scan_name'), 'status': 'launched', 'result': body}
+
+    def launch_batch(self, targets: list) -> list:
+        response = self.request('POST', 'batch', LAUNCH_RETRY_STATUSES, json={'targets': targets})
+        body = response.json()
+        if 'results' not in body:
+            error = body.get('error') or body.get('message')
+            return [{'scan_name': t.get('scan_name'), 'status': 'failed', 'http_status': response.status_code,
+                     'error': error, 'details': body.get('invalid')} for t in targets]
+        return body['results']
+
+    def launch_many(self, targets: list, chunk_size: int = 0) -> list:
+        # Per-target launches, or POST /batch chunks when chunk_size is set,
+        # submitted concurrently; results keep the target order, and a target
+        # the API couldn't be reached for fails on its own
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            if not chunk_size:
+                return list(executor.map(self.try_launch, targets))
+            chunks = [targets[i:i + chunk_size] for i in range(0, len(targets), chunk_size)]
+            return [r for results in executor.map(self.try_launch_batch, chunks) for r in results]
+
+    def try_launch(self, target: dict) -> dict:
+        try:
+            return self.launch(target)
+        except requests.ConnectionError as e:
+            return unreachable(target, e)
+
+    def try_launch_batch(self, targets: list) -> list:
+        try:
+            return self.launch_batch(targets)
+        except requests.ConnectionError as e:
+            return [unreachable(t, e) for t in targets]
+
+    def status(self, job_id: str) -> dict:
+        response = self.request('GET', 'status', READ_RETRY_STATUSES, params={'job': job_id})
+        if response.status_code != 200:
+            return {'job_id': job_id, 'phase': 'unknown', 'detail': response.text}
+        return response.json()
+
+    def wait(self, job_ids: list, interval: float = 30, timeout: float = None, on_progress=None) -> dict:
+        # Polls each unfinished job through GET /status until all are done
+        # or failed; every poll is a single keyed read per job
+        records = {job_id: {'job_id': job_id, 'phase': 'unknown'} for job_id in job_ids}
+        started = time.monotonic()
+        while True:
+            pending = [j for j, r in records.items() if r.get('phase') not in FINAL_PHASES]
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                for record in executor.map(self.status, pending):
+                    records[record['job_id']] = record
+            if on_progress:
+                on_progress(records)
+            if all(r.get('phase') in FINAL_PHASES for r in records.values()):
+                return records
+            if timeout is not None and time.monotonic() - started > timeout:
+                return records
+            self.sleep(interval)
+
+
+def unreachable(target: dict, error: Exception) -> dict:
+    return {'scan_name': target.get('scan_name'), 'status': 'failed', 'http_status': None, 'error': str(error)}
+
+def render_progress(records: dict, now: float = None) -> str:
+    now = time.time() if now is None else now
+    rows = [('JOB', 'PHASE', 'ELAPSED', 'DETAIL')]
+    for job_id, record in sorted(records.items()):
+        elapsed = ''
+        if record.get('created') is not None:
+            finished = record.get('finished')
+            seconds = int((now if finished is None else finished) - record['created'])
+            elapsed = f'{seconds // 3600}h{seconds % 3600 // 60:02d}m'
+        rows.append((job_id, record.get('phase', ''), elapsed, record.get('detail') or ''))
+
+    widths = [max(len(str(r[i])) for r in rows) for i in range(3)]
+    lines = [f'{r[0]:<{widths[0]}}  {r[1]:<{widths[1]}}  {r[2]:>{widths[2]}}  {r[3]}'.rstrip() for r in rows]
+    counts = {}
+    for record in records.values():
+        counts[record.get('phase')] = counts.get(record.get('phase'), 0) + 1
+    lines.append(', '.join(f'{phase}: {count}' for phase, count in sorted(counts.items(), key=lambda c: str(c[0]))))
+    return '\n'.join(lines)
@@ -0,0 +1,74 @@
+import io
+import os
+import sys
+
+import pytest
+
+# Lambda code is deployed from `functions/` and imports its siblings as
+# top-level modules, so mirror that layout for the tests.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'functions'))
+
+# Operator scripts such as scan_client.py live at the repo root.
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), '..'))
+
+# Benchmarks import their siblings the same way.
+sys.path.insert(2, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+
+class StubS3:
+    # In-memory bucket for the modules that take an S3 client: objects by
+    # key, every put in order and every listing so tests can check what was
+    # read. Listings come back page_size keys at a time, in key order like S3.
+    def __init__(self, page_size=1000):
+        self.objects = {}
+        self.extra = {}
+        self.puts = []
+        self.listings = []
+        self.page_size = page_size
+
+    def missing(self, operation):
+        from botocore.exceptions import ClientError
+        return ClientError({'Error': {'Code': 'NoSuchKey' if operation == 'GetObject' else '404'}}, operation)
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body.encode() if isinstance(Body, str) else Body
+        self.extra[Key] = kwargs
+        self.puts.append(Key)
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise self.missing('HeadObject')
+        return {}
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise self.missing('GetObject')
+        return {'Body': io.BytesIO(self.objects[Key])}
+
+    def download_file(self, bucket, key, path):
+        if key not in self.objects:
+            raise self.missing('HeadObject')
+        with open(path, 'wb') as f:
+            f.write(self.objects[key])
+
+    def upload_file(self, path, bucket, key, ExtraArgs=None):
+        with open(path, 'rb') as f:
+            self.put_object(bucket, key, f.read(), **(ExtraArgs or {}))
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Bucket, Prefix='', StartAfter='', Delimiter=None):
+        self.listings.append((Prefix, StartAfter))
+        keys = [k for k in sorted(self.objects) if k.startswith(Prefix) and k > StartAfter]
+        if Delimiter:
+            keys = [k for k in keys if Delimiter not in k[len(Prefix):]]
+        if not keys:
+            yield {}
+        for i in range(0, len(keys), self.page_size):
+            yield {'Contents': [{'Key': k} for k in keys[i:i + self.page_size]]}
+
+
+@pytest.fixture
+def s3():
+    return StubS3()
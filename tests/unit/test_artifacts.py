@@ -0,0 +1,108 @@
+import gzip
+import json
+import os
+import zipfile
+
+import pytest
+
+from artifacts import blob_key, fetch, manifest_key, pack, site_files, unpack
+
+
+BUNDLE = b'function render() { return "prowler"; }\n' * 200
+CSV = b'FINDING_UID;STATUS\n' + b''.join(b'f%d;FAIL\n' % i for i in range(1000))
+
+
+def make_scan(tmp_path, object_key):
+    site = tmp_path / object_key / 'build'
+    (site / 'static' / 'js').mkdir(parents=True)
+    (site / 'index.html').write_text(f'<title>{object_key}</title>')
+    (site / 'static' / 'js' / 'main.js').write_bytes(BUNDLE)
+    (site / 'raw_data.csv').write_bytes(CSV)
+    (site / 'logo.png').write_bytes(b'\x89PNG not really')
+    csv_path = tmp_path / object_key / 'scan.csv'
+    csv_path.write_bytes(CSV)
+    files = site_files(str(site), object_key)
+    files[f'{object_key}.csv'] = str(csv_path)
+    return files
+
+
+def test_pack_compresses_and_deduplicates(tmp_path, s3):
+    manifest = pack(s3, 'results', 'acme-1', make_scan(tmp_path, 'acme-1'), now=1)
+
+    assert [e['path'] for e in manifest['files']] == [
+        'acme-1.csv', 'acme-1/index.html', 'acme-1/logo.png', 'acme-1/raw_data.csv', 'acme-1/static/js/main.js'
+    ]
+    # raw_data.csv and the CSV share one blob
+    blobs = [k for k in s3.puts if k.startswith('blobs/')]
+    assert len(blobs) == 4
+    blob = blob_key(manifest['files'][0]['sha256'])
+    assert s3.extra[blob] == {'ContentType': 'text/csv', 'ContentEncoding': 'gzip'}
+    assert gzip.decompress(s3.objects[blob]) == CSV
+    png = manifest['files'][2]
+    assert png['encoding'] is None
+    assert manifest['uploaded'] < manifest['size'] / 5
+
+    # a second scan with the same bundle only uploads what changed
+    s3.puts.clear()
+    second = pack(s3, 'results', 'globex-2', make_scan(tmp_path, 'globex-2'), now=2)
+    assert [k for k in s3.puts if k.startswith('blobs/')] == [blob_key(second['files'][1]['sha256'])]
+    assert s3.puts[-1] == manifest_key('globex-2')
+
+
+def test_unpack_reproduces_the_layout(tmp_path, s3):
+    pack(s3, 'results', 'acme-1', make_scan(tmp_path, 'acme-1'))
+    out = tmp_path / 'out'
+
+    unpack(s3, 'results', 'acme-1', str(out))
+
+    assert (out / 'acme-1.csv').read_bytes() == CSV
+    assert (out / 'acme-1' / 'static' / 'js' / 'main.js').read_bytes() == BUNDLE
+    assert (out / 'acme-1' / 'index.html').read_text() == '<title>acme-1</title>'
+
+
+def test_unpack_as_zip_matches_the_old_archive(tmp_path, s3):
+    pack(s3, 'results', 'acme-1', make_scan(tmp_path, 'acme-1'))
+    out = tmp_path / 'out'
+
+    written = unpack(s3, 'results', 'acme-1', str(out), as_zip=True)
+
+    assert sorted(os.path.basename(p) for p in written) == ['acme-1.csv', 'acme-1.zip']
+    assert not (out / 'acme-1').exists()
+    with zipfile.ZipFile(out / 'acme-1.zip') as z:
+        assert sorted(z.namelist()) == ['acme-1/index.html', 'acme-1/logo.png', 'acme-1/raw_data.csv',
+                                        'acme-1/static/js/main.js']
+        assert z.read('acme-1/raw_data.csv') == CSV
+
+
+def test_append_adds_files_to_the_manifest(tmp_path, s3):
+    pack(s3, 'results', 'acme-1', make_scan(tmp_path, 'acme-1'), now=1)
+    log = tmp_path / 'cloud-init-output.log'
+    log.write_text('done\n')
+
+    manifest = pack(s3, 'results', 'acme-1', {'acme-1-i-123.log': str(log)}, append=True, now=5)
+
+    assert manifest['created'] == 1
+    assert len(manifest['files']) == 6
+    assert json.loads(s3.objects[manifest_key('acme-1')]) == manifest
+
+
+def test_fetch_reads_manifest_or_plain_object(tmp_path, s3):
+    pack(s3, 'results', 'acme-1', make_scan(tmp_path, 'acme-1'))
+    s3.put_object(Bucket='results', Key='old-1.csv', Body=b'plain')
+
+    fetch(s3, 'results', 'acme-1', 'acme-1.csv', str(tmp_path / 'a.csv'))
+    fetch(s3, 'results', 'old-1', 'old-1.csv', str(tmp_path / 'b.csv'))
+
+    assert (tmp_path / 'a.csv').read_bytes() == CSV
+    assert (tmp_path / 'b.csv').read_bytes() == b'plain'
+    with pytest.raises(FileNotFoundError):
+        fetch(s3, 'results', 'acme-1', 'missing.csv', str(tmp_path / 'c.csv'))
+
+
+def test_corrupt_blob_is_rejected(tmp_path, s3):
+    manifest = pack(s3, 'results', 'acme-1', make_scan(tmp_path, 'acme-1'))
+    key = blob_key(manifest['files'][0]['sha256'])
+    s3.objects[key] = gzip.compress(b'tampered')
+
+    with pytest.raises(ValueError):
+        unpack(s3, 'results', 'acme-1', str(tmp_path / 'out'))
@@ -0,0 +1,135 @@
+import threading
+import time
+
+from batch import MAX_SHARDS, launch_batch, scan_options, validate_target, validate_targets
+
+
+def target(name, account='111111111111'):
+    return {
+        'role_arn': f'arn:aws:iam::{account}:role/CrossAccountRole',
+        'external_id': 'abc12345',
+        'scan_name': name
+    }
+
+def test_validate_target_accepts_valid():
+    assert validate_target(target('Acme Corp')) == []
+
+def test_validate_target_requires_fields():
+    errors = validate_target({'role_arn': 'arn:aws:iam::111111111111:role/x'})
+    assert '`external_id` is required' in errors
+    assert '`scan_name` is required' in errors
+
+def test_validate_target_rejects_shell_characters():
+    bad = target('acme; rm -rf /')
+    assert validate_target(bad)
+    bad = dict(target('acme'), external_id='$(whoami)')
+    assert validate_target(bad)
+    bad = dict(target('acme'), role_arn='arn:aws:iam::123:role/x')
+    assert validate_target(bad)
+
+def test_validate_target_rejects_non_string_fields():
+    assert validate_target(target(12345)) == ['`scan_name` must be a string']
+    errors = validate_target(dict(target('acme'), role_arn=['arn:aws:iam::111111111111:role/x'], external_id=42))
+    assert errors == ['`role_arn` must be a string', '`external_id` must be a string']
+    assert validate_targets([target('a'), target(['b'])], 100) == [{'index': 1, 'errors': ['`scan_name` must be a string']}]
+
+def test_validate_targets_reports_every_invalid_entry():
+    targets = [target('a'), {'scan_name': 'b'}, target('c'), 'nope']
+    invalid = validate_targets(targets, 100)
+    assert [i['index'] for i in invalid] == [1, 3]
+
+def test_validate_targets_rejects_duplicates_and_oversize():
+    invalid = validate_targets([target('Acme Corp'), target('Acme-Corp')], 100)
+    assert invalid[0]['index'] == 1
+    assert validate_targets([target(str(i)) for i in range(5)], 4)[0]['index'] is None
+    assert validate_targets([], 4)
+    assert validate_targets(None, 4)
+
+def test_launch_batch_partial_failure_keeps_order():
+    def launch(t):
+        if t['scan_name'] == 'b':
+            raise Exception('InsufficientInstanceCapacity')
+        return {'instance_id': f'i-{t["scan_name"]}'}
+
+    results = launch_batch([target('a'), target('b'), target('c')], launch, 2)
+    assert [r['status'] for r in results] == ['launched', 'failed', 'launched']
+    assert results[1]['error'] == 'InsufficientInstanceCapacity'
+    assert results[2]['result'] == {'instance_id': 'i-c'}
+
+def test_launch_batch_bounds_concurrency():
+    lock = threading.Lock()
+    state = {'active': 0, 'peak': 0}
+
+    def launch(t):
+        with lock:
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+        time.sleep(0.01)
+        with lock:
+            state['active'] -= 1
+        return {}
+
+    results = launch_batch([target(str(i)) for i in range(20)], launch, 3)
+    assert len(results) == 20
+    assert state['peak'] <= 3
+
+def test_region_options():
+    assert validate_target(dict(target('a'), regions='us-east-1,eu-west-1', region_parallelism='4')) == []
+    assert validate_target(dict(target('a'), regions=['us-gov-west-1'])) == []
+    assert validate_target(dict(target('a'), regions='us-east-1;reboot'))
+    assert validate_target(dict(target('a'), regions=[1]))
+    assert validate_target(dict(target('a'), region_parallelism='lots'))
+    assert validate_target(dict(target('a'), region_parallelism=64))
+
+def test_scan_options_defaults():
+    assert scan_options(target('a'), 0) == {
+        'regions': [], 'region_parallelism': 0, 'delta': False,
+        'severities': ['critical', 'high', 'medium'], 'compliance': [], 'output_formats': ['csv'], 'shards': 1
+    }
+    options = scan_options(dict(target('a'), regions='us-east-1, eu-west-1', region_parallelism='0', delta='true'), 8)
+    assert options == {
+        'regions': ['us-east-1', 'eu-west-1'], 'region_parallelism': 0, 'delta': True,
+        'severities': ['critical', 'high', 'medium'], 'compliance': [], 'output_formats': ['csv'], 'shards': 1
+    }
+    assert scan_options(target('a'), 8)['region_parallelism'] == 8
+    assert scan_options(dict(target('a'), delta=False), 0, True)['delta'] is False
+    assert scan_options(target('a'), 0, True)['delta'] is True
+
+def test_shard_options():
+    assert validate_target(dict(target('a'), shards='4')) == []
+    assert validate_target(dict(target('a'), shards=0))
+    assert validate_target(dict(target('a'), shards='many'))
+    assert validate_target(dict(target('a'), shards=MAX_SHARDS + 1))
+    assert scan_options(dict(target('a'), shards='4'), 0)['shards'] == 4
+    assert scan_options(target('a'), 0, shards=2)['shards'] == 2
+
+def test_weight_validation():
+    assert validate_target(dict(target('acme'), weight=2.5)) == []
+    assert validate_target(dict(target('acme'), weight='3')) == []
+    for weight in ('abc', 0, -1, 'nan', 'inf', True, [1]):
+        assert validate_target(dict(target('acme'), weight=weight)) == ['`weight` must be a positive number']
+
+def test_delta_option_validation():
+    assert validate_target(dict(target('a'), delta='TRUE')) == []
+    assert validate_target(dict(target('a'), delta='sometimes'))
+
+def test_prowler_option_validation():
+    valid = dict(target('a'), compliance='cis_2.0_aws,soc2_aws', severities=['critical', 'low'],
+                 output_formats='html,json-ocsf')
+    assert validate_target(valid) == []
+    assert validate_target(dict(target('a'), compliance='aws'))
+    assert validate_target(dict(target('a'), compliance='cis_2.0_aws;reboot'))
+    assert validate_target(dict(target('a'), compliance=[f'framework{i}_aws' for i in range(11)]))
+    assert validate_target(dict(target('a'), severities='urgent'))
+    assert validate_target(dict(target('a'), output_formats='pdf'))
+
+def test_prowler_options_from_target_and_defaults():
+    options = scan_options(dict(target('a'), compliance='cis_2.0_aws,cis_2.0_aws,soc2_aws', output_formats='html'), 0)
+    assert options['compliance'] == ['cis_2.0_aws', 'soc2_aws']
+    assert options['output_formats'] == ['csv', 'html']
+
+    defaults = scan_options(target('a'), 0, severities=['critical'], compliance=['cis_2.0_aws'],
+                            output_formats=['csv', 'json-ocsf'])
+    assert defaults['severities'] == ['critical']
+    assert defaults['compliance'] == ['cis_2.0_aws']
+    assert defaults['output_formats'] == ['csv', 'json-ocsf']
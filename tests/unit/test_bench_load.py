@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+pytest.importorskip('boto3')
+
+import worker  # noqa: E402
+from batch import validate_target  # noqa: E402
+from bench_load import (  # noqa: E402
+    SDK_ATTEMPTS, Faults, make_stubs, patched_worker, run_load, summarize, synthetic_events
+)
+
+
+def test_launches_and_rejections_are_counted():
+    events = synthetic_events(40, customers=5, invalid=0.25, seed=3)
+    rejected = sum(1 for e in events if not e['queryStringParameters'] or validate_target(e['queryStringParameters']))
+    assert 0 < rejected < 40
+
+    faults = Faults()
+    stubs = make_stubs(faults)
+    clients = worker.clients
+    with patched_worker(stubs):
+        samples, elapsed = run_load(events, concurrency=4)
+    assert worker.clients is clients
+
+    summary = summarize(samples, elapsed, faults)
+    assert summary['status'] == {'200': 40 - rejected, '400': rejected}
+    assert summary['errors'] == {'validation': rejected}
+    assert summary['error_rate'] == 0
+    assert summary['api_calls']['RunInstances'] == 40 - rejected
+    assert stubs['ec2'].launched == 40 - rejected
+
+def test_capacity_errors_fail_the_launch():
+    faults = Faults(capacity=1.0)
+    with patched_worker(make_stubs(faults)):
+        samples, elapsed = run_load(synthetic_events(5, options=0), concurrency=2)
+    summary = summarize(samples, elapsed, faults)
+    assert summary['status'] == {'500': 5}
+    assert summary['error_rate'] == 1
+    assert summary['errors'] == {'No capacity for any of ' + ', '.join(worker.default_instance_types): 5}
+
+def test_throttling_is_retried_before_it_surfaces():
+    slept = []
+    faults = Faults(throttle=1.0, retry_base=0.5, sleep=slept.append)
+    with pytest.raises(Exception) as error:
+        faults.call('PutObject', throttle_code='SlowDown')
+    assert error.value.response['Error']['Code'] == 'SlowDown'
+    assert faults.calls == {'PutObject': SDK_ATTEMPTS}
+    assert len(slept) == SDK_ATTEMPTS - 1
+    assert all(0 <= s <= 0.5 * 2 ** (n + 1) for n, s in enumerate(slept))
+
+def test_queued_launches_enqueue():
+    stubs = make_stubs(Faults())
+    queue_url = worker.launch_queue_url
+    with patched_worker(stubs, queued=True):
+        samples, _ = run_load(synthetic_events(6, options=0), concurrency=3)
+    assert worker.launch_queue_url == queue_url
+    assert {s['status'] for s in samples} == {202}
+    assert len(stubs['sqs'].messages) == 6
+    assert json.loads(stubs['sqs'].messages[0])['options']['severities']
+
+def test_summary_percentiles():
+    samples = [{'status': 200, 'latency': n / 1000} for n in range(1, 101)]
+    summary = summarize(samples, 2.0)
+    assert summary['throughput'] == 50
+    assert summary['latency_ms']['p50'] == 51.0
+    assert summary['latency_ms']['p99'] == 99.0
+    assert summary['latency_ms']['max'] == 100.0
@@ -0,0 +1,133 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from catalog import (
+    INDEX_KEY, add_entry, backfill, build_entry, compact, latest_scans, list_entries, parse_time, scans_between
+)
+from findings import write_findings
+
+
+DAY = 86400
+JULY_16 = 1721088000  # 2024-07-16T00:00:00Z
+
+
+@pytest.fixture
+def s3(s3):
+    # Two keys per page, so listings cross page boundaries
+    s3.page_size = 2
+    return s3
+
+
+def entry(object_key, account, failed=1):
+    ts = int(object_key.rsplit('-', 1)[-1])
+    return {'object_key': object_key, 'scan_name': object_key.rsplit('-', 1)[0], 'account': account, 'ts': ts,
+            'duration': 3600, 'failed': failed, 'severity': {'high': failed}, 'objects': {}}
+
+def seed(s3):
+    # Acme scanned in June and twice in July, Globex once in July; each entry
+    # written an hour after its scan
+    for e in (entry(f'Acme-{JULY_16 - 30 * DAY}', '111111111111'), entry(f'Acme-{JULY_16}', '111111111111'),
+              entry(f'Globex-{JULY_16 + 3600}', '222222222222'), entry(f'Acme-{JULY_16 + 2 * DAY}', '111111111111', 5)):
+        add_entry(s3, 'bucket', e, now=e['ts'] + 3600)
+
+
+def test_entry_from_the_scan_csv(tmp_path):
+    path = str(tmp_path / 'Acme-1721159874.csv')
+    write_findings(path, ['ACCOUNT_UID', 'STATUS', 'SEVERITY'], [
+        ['111111111111', 'FAIL', 'high'], ['111111111111', 'PASS', 'low'], ['111111111111', 'FAIL', 'Critical']])
+    e = build_entry('Acme-1721159874', 'Acme', path, {'output': 'Acme-1721159874.zip'}, now=1721163474)
+    assert e == {'object_key': 'Acme-1721159874', 'scan_name': 'Acme', 'account': '111111111111',
+                 'ts': 1721159874, 'duration': 3600, 'objects': {'output': 'Acme-1721159874.zip'},
+                 'failed': 2, 'severity': {'critical': 1, 'high': 1}}
+
+def test_duration_runs_from_the_start_of_the_scan():
+    # Queued an hour before the instance started
+    e = build_entry('Acme-1721159874', 'Acme', now=1721170674, started=1721163474)
+    assert e['duration'] == 7200
+
+def test_entries_are_partitioned_by_day_written(s3):
+    key = add_entry(s3, 'bucket', entry('Acme-1721159874', '1'), now=1721159874)
+    assert key == 'catalog/entries/2024-07-16/Acme-1721159874.json'
+
+def test_compaction_keeps_recent_days_pending(s3):
+    seed(s3)
+    index = compact(s3, 'bucket', now=JULY_16 + 3 * DAY)
+    assert index['compacted_through'] == '2024-07-17'
+    assert index['months'] == {'2024-06': 1, '2024-07': 2}
+    assert index['latest']['111111111111']['ts'] == JULY_16
+    month = json.loads(s3.objects['catalog/months/2024-07.json'])
+    assert [s['object_key'] for s in month['scans']] == [f'Acme-{JULY_16}', f'Globex-{JULY_16 + 3600}']
+
+    # The entry written on the 18th is still served from the pending entries
+    assert latest_scans(s3, 'bucket')['111111111111']['failed'] == 5
+
+def test_compaction_is_idempotent_and_incremental(s3):
+    seed(s3)
+    compact(s3, 'bucket', now=JULY_16 + 3 * DAY)
+    first = s3.objects[INDEX_KEY]
+    assert compact(s3, 'bucket', now=JULY_16 + 3 * DAY + 60)['compacted_through'] == '2024-07-17'
+    assert s3.objects[INDEX_KEY] == first
+
+    s3.listings.clear()
+    index = compact(s3, 'bucket', now=JULY_16 + 5 * DAY)
+    assert index['months'] == {'2024-06': 1, '2024-07': 3}
+    assert index['latest']['111111111111']['failed'] == 5
+    # only the entries written after the 17th are listed
+    assert s3.listings == [('catalog/entries/', 'catalog/entries/2024-07-17/~')]
+
+def test_rewritten_entries_replace_the_compacted_scan(s3):
+    seed(s3)
+    compact(s3, 'bucket', now=JULY_16 + 3 * DAY)
+    add_entry(s3, 'bucket', entry(f'Acme-{JULY_16}', '111111111111', failed=9), now=JULY_16 + 4 * DAY)
+    compact(s3, 'bucket', now=JULY_16 + 6 * DAY)
+    scans = scans_between(s3, 'bucket', JULY_16, JULY_16 + 1)
+    assert [(s['object_key'], s['failed']) for s in scans] == [(f'Acme-{JULY_16}', 9)]
+
+def test_range_and_latest_queries_never_list_the_bucket(s3):
+    s3.objects.update({f'Acme-{n}.csv': b'' for n in range(50)})
+    seed(s3)
+    compact(s3, 'bucket', now=JULY_16 + 3 * DAY)
+    s3.listings.clear()
+
+    july = scans_between(s3, 'bucket', parse_time('2024-07-01'), parse_time('2024-07-31'))
+    assert [s['object_key'] for s in july] == [f'Acme-{JULY_16}', f'Globex-{JULY_16 + 3600}',
+                                               f'Acme-{JULY_16 + 2 * DAY}']
+    assert [s['object_key'] for s in scans_between(s3, 'bucket', account='222222222222')] == [
+        f'Globex-{JULY_16 + 3600}']
+    assert list(latest_scans(s3, 'bucket')) == ['111111111111', '222222222222']
+    assert latest_scans(s3, 'bucket', '333333333333') == {}
+    assert all(prefix == 'catalog/entries/' for prefix, _ in s3.listings)
+
+def test_queries_before_any_compaction(s3):
+    seed(s3)
+    assert len(scans_between(s3, 'bucket', 0, JULY_16 + 10 * DAY)) == 4
+    assert latest_scans(s3, 'bucket')['222222222222']['object_key'] == f'Globex-{JULY_16 + 3600}'
+
+def test_list_entries_stops_after_the_last_day(s3):
+    seed(s3)
+    keys = list_entries(s3, 'bucket', after='2024-06-16', through='2024-07-16')
+    assert [k.split('/')[2] for k in keys] == ['2024-07-16', '2024-07-16']
+
+def test_backfill_from_stored_scans(s3):
+    s3.objects.update({
+        'Acme-1721159874.csv': b'',
+        'Acme-1721159874.zip': b'',
+        'Acme-1721159874-changes.csv': b'',
+        'Acme-1721159874-trend.json': json.dumps(
+            {'trend': [{'scan': 'Acme-1721159874', 'failed': 3, 'severity': {'high': 3}}]}).encode(),
+        'artifacts/Globex-1721159999.json': b'{}',
+        'jobs/Globex-1721159999.json': json.dumps({'scan_name': 'Globex Inc', 'duration': 1200}).encode(),
+        'reports/Acme-1721159874/x.html': b''
+    })
+    assert backfill(s3, 'bucket', now=1721246400) == 2
+    scans = scans_between(s3, 'bucket', 0, 1721246400)
+    assert [(s['scan_name'], s.get('failed'), s['duration']) for s in scans] == [
+        ('Acme', 3, None), ('Globex Inc', None, 1200)]
+    assert scans[1]['objects'] == {'manifest': 'artifacts/Globex-1721159999.json'}
+
+def test_parse_time():
+    assert parse_time('1721159874') == 1721159874
+    assert parse_time('2024-07-16') == JULY_16
+    assert datetime.fromtimestamp(parse_time('2024-07-16T12:00:00'), timezone.utc).hour == 12
@@ -0,0 +1,92 @@
+import os
+
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from columnar import SCHEMA, build_filter, convert, count_by, parse_where, query, read_csv, scan_date  # noqa: E402
+from findings import write_findings  # noqa: E402
+
+
+HEADER = ['FINDING_UID', 'ACCOUNT_UID', 'REGION', 'CHECK_ID', 'SERVICE_NAME', 'STATUS', 'SEVERITY',
+          'RESOURCE_UID', 'STATUS_EXTENDED', 'EXTRA_COLUMN']
+
+
+def finding(uid, account, check, status, severity, region='us-east-1'):
+    return [uid, account, region, check, check.split('_')[0], status, severity, f'arn:{uid}', 'multi\nline', 'x']
+
+
+def write_scan(tmp_path, scan_id, rows):
+    path = str(tmp_path / f'{scan_id}.csv')
+    write_findings(path, HEADER, rows)
+    return path
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    root = str(tmp_path / 'findings')
+    convert(write_scan(tmp_path, 'acme-1721159874', [
+        finding('a1', '111111111111', 'iam_root_mfa', 'FAIL', 'Critical'),
+        finding('a2', '111111111111', 's3_bucket_public', 'PASS', 'high'),
+        finding('a3', '111111111111', 's3_bucket_public', 'FAIL', 'high', 'eu-west-1'),
+    ]), root, 'acme-1721159874')
+    convert(write_scan(tmp_path, 'globex-1721246274', [
+        finding('g1', '222222222222', 'iam_root_mfa', 'FAIL', 'critical'),
+        finding('g2', '222222222222', 'ec2_open_ssh', 'PASS', 'medium'),
+    ]), root, 'globex-1721246274')
+    return root
+
+
+def test_scan_date_from_object_key():
+    assert scan_date('acme-corp-1721159874') == '2024-07-16'
+
+
+def test_read_csv_normalizes_schema(tmp_path):
+    table = read_csv(write_scan(tmp_path, 'acme-1721159874', [finding('a1', '1', 'iam_root_mfa', 'FAIL', 'Critical')]),
+                     'acme-1721159874')
+
+    assert table.schema == SCHEMA
+    row = table.to_pylist()[0]
+    assert row['severity'] == 'critical'
+    assert row['status_extended'] == 'multi\nline'
+    assert row['check_title'] is None
+    assert row['scan_date'] == '2024-07-16'
+
+
+def test_partitions_by_date_account_and_severity(dataset):
+    assert os.path.exists(os.path.join(dataset, 'scan_date=2024-07-16', 'account=111111111111', 'severity=high',
+                                       'acme-1721159874-0.parquet'))
+    assert os.path.exists(os.path.join(dataset, 'scan_date=2024-07-17', 'account=222222222222', 'severity=critical'))
+
+
+def test_reconverting_a_scan_replaces_its_files(tmp_path, dataset):
+    convert(write_scan(tmp_path, 'acme-1721159874', [finding('a1', '111111111111', 'iam_root_mfa', 'PASS', 'critical')]),
+            dataset, 'acme-1721159874')
+
+    rows = query(dataset, ['finding_uid', 'status'], {'account': '111111111111', 'severity': 'critical'}).to_pylist()
+    assert rows == [{'finding_uid': 'a1', 'status': 'PASS'}]
+
+
+def test_query_filters_and_prunes_columns(dataset):
+    table = query(dataset, ['account', 'region'], {'check_id': 's3_bucket_public', 'status': 'FAIL'})
+
+    assert table.column_names == ['account', 'region']
+    assert table.to_pylist() == [{'account': '111111111111', 'region': 'eu-west-1'}]
+
+
+def test_query_date_range(dataset):
+    table = query(dataset, ['finding_uid'], since='2024-07-17')
+
+    assert sorted(table['finding_uid'].to_pylist()) == ['g1', 'g2']
+
+
+def test_count_by(dataset):
+    rows = count_by(dataset, ['account'], {'check_id': 'iam_root_mfa', 'status': 'FAIL'})
+
+    assert rows == [{'account': '111111111111', 'count': 1}, {'account': '222222222222', 'count': 1}]
+    assert count_by(dataset, ['severity'], {'status': ['FAIL', 'PASS']})[0] == {'severity': 'critical', 'count': 2}
+
+
+def test_parse_where():
+    assert parse_where(['status=FAIL', 'severity=high,critical']) == {'status': 'FAIL', 'severity': ['high', 'critical']}
+    assert build_filter() is None
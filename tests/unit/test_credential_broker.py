@@ -0,0 +1,184 @@
+import json
+import os
+import stat
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+
+import pytest
+from botocore.exceptions import ClientError
+
+from credential_broker import (
+    CHAINED_SESSION_DURATION, CredentialBroker, container_credentials, fetch, make_server, process_credentials,
+    write_token
+)
+
+
+class StubSts:
+    # Sessions last `duration` seconds from the stub clock; `gate`, when
+    # set, holds every assume_role call until it is released
+    def __init__(self, clock, errors=None, gate=None):
+        self.clock = clock
+        self.errors = list(errors or [])
+        self.gate = gate
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def assume_role(self, RoleArn, RoleSessionName, ExternalId, DurationSeconds):
+        with self.lock:
+            self.calls.append(DurationSeconds)
+            number = len(self.calls)
+        if self.gate:
+            self.gate.wait(5)
+        if self.errors:
+            raise ClientError({'Error': {'Code': self.errors.pop(0)}}, 'AssumeRole')
+        return {'Credentials': {
+            'AccessKeyId': f'ASIA{number}',
+            'SecretAccessKey': 'secret',
+            'SessionToken': 'token',
+            'Expiration': datetime.fromtimestamp(self.clock() + DurationSeconds, timezone.utc)
+        }}
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_broker(sts, clock, **kwargs):
+    return CredentialBroker(sts, 'arn:aws:iam::111111111111:role/CrossAccountRole', 'abc12345',
+                            'Mission-ProwlerScanner', clock=clock, sleep=lambda s: None, **kwargs)
+
+def run_threads(count, target):
+    results = [None] * count
+
+    def run(i):
+        results[i] = target()
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_session_is_reused_until_the_refresh_margin():
+    clock = Clock()
+    sts = StubSts(clock)
+    broker = make_broker(sts, clock, duration=3600, refresh_margin=900)
+    first = broker.credentials()
+    clock.now += 2600
+    assert broker.credentials() is first
+    clock.now += 100
+    refreshed = broker.credentials()
+    assert refreshed['access_key_id'] == 'ASIA2'
+    assert refreshed['expiration'] == clock.now + 3600
+    assert len(sts.calls) == 2
+
+def test_concurrent_first_use_assumes_once():
+    clock = Clock()
+    gate = threading.Event()
+    sts = StubSts(clock, gate=gate)
+    broker = make_broker(sts, clock)
+    threads, results = run_threads(16, broker.credentials)
+    gate.set()
+    for thread in threads:
+        thread.join()
+    assert len(sts.calls) == 1
+    assert {r['access_key_id'] for r in results} == {'ASIA1'}
+
+def test_callers_keep_the_valid_session_while_one_refreshes():
+    clock = Clock()
+    sts = StubSts(clock)
+    broker = make_broker(sts, clock, duration=3600, refresh_margin=900)
+    broker.credentials()
+    clock.now += 3000
+
+    # The refresh blocks in STS, every other caller gets the current session
+    sts.gate = threading.Event()
+    refresher, _ = run_threads(1, broker.credentials)
+    while len(sts.calls) < 2:
+        time.sleep(0.001)
+    threads, results = run_threads(16, broker.credentials)
+    for thread in threads:
+        thread.join(5)
+    assert {r['access_key_id'] for r in results} == {'ASIA1'}
+    sts.gate.set()
+    refresher[0].join()
+    assert broker.credentials()['access_key_id'] == 'ASIA2'
+    assert len(sts.calls) == 2
+
+def test_expired_session_makes_callers_wait_for_one_refresh():
+    clock = Clock()
+    sts = StubSts(clock)
+    broker = make_broker(sts, clock, duration=3600)
+    broker.credentials()
+    clock.now += 3600
+    sts.gate = threading.Event()
+    threads, results = run_threads(16, broker.credentials)
+    sts.gate.set()
+    for thread in threads:
+        thread.join()
+    assert len(sts.calls) == 2
+    assert {r['access_key_id'] for r in results} == {'ASIA2'}
+
+def test_failed_refresh_serves_the_current_session():
+    clock = Clock()
+    sts = StubSts(clock)
+    broker = make_broker(sts, clock, duration=3600, refresh_margin=900, attempts=2)
+    broker.credentials()
+    clock.now += 3000
+    sts.errors = ['Throttling', 'Throttling']
+    assert broker.credentials()['access_key_id'] == 'ASIA1'
+    clock.now += 600
+    with pytest.raises(ClientError):
+        sts.errors = ['AccessDenied']
+        broker.credentials()
+
+def test_throttling_is_retried():
+    clock = Clock()
+    sts = StubSts(clock, errors=['Throttling', 'Throttling'])
+    assert make_broker(sts, clock).credentials()['access_key_id'] == 'ASIA3'
+
+def test_long_sessions_fall_back_to_an_hour():
+    clock = Clock()
+    sts = StubSts(clock, errors=['ValidationError'])
+    broker = make_broker(sts, clock)
+    credentials = broker.credentials()
+    assert sts.calls == [43200, CHAINED_SESSION_DURATION]
+    assert credentials['expiration'] == clock.now + CHAINED_SESSION_DURATION
+
+def test_payload_formats():
+    credentials = {'access_key_id': 'ASIA1', 'secret_access_key': 's', 'session_token': 't',
+                   'expiration': 1721159874}
+    payload = container_credentials(credentials)
+    assert payload == {'AccessKeyId': 'ASIA1', 'SecretAccessKey': 's', 'Token': 't',
+                       'Expiration': '2024-07-16T19:57:54Z'}
+    assert process_credentials(payload)['Version'] == 1
+    assert process_credentials(payload)['SessionToken'] == 't'
+
+def test_endpoint_requires_the_token():
+    clock = Clock()
+    broker = make_broker(StubSts(clock), clock)
+    server = make_server(broker, 'secret-token', port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/credentials'
+    try:
+        assert fetch(url, 'secret-token')['AccessKeyId'] == 'ASIA1'
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(urllib.request.Request(url, headers={'Authorization': 'wrong'}))
+        assert error.value.code == 401
+        assert json.loads(error.value.read()) == {'error': 'unauthorized'}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_token_file_appears_whole(tmp_path):
+    path = tmp_path / 'broker.token'
+    token = write_token(str(path))
+    assert path.read_text() == token and len(token) == 64
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert os.listdir(tmp_path) == ['broker.token']
@@ -0,0 +1,126 @@
+import random
+import time
+
+from delta import arn_service, load_inventory, merge_delta, merge_delta_files, plan_services, save_inventory
+from findings import read_findings, write_findings
+
+
+HEADER = ['FINDING_UID', 'CHECK_ID', 'SERVICE_NAME', 'STATUS', 'SEVERITY', 'REGION', 'RESOURCE_UID']
+SERVICES = ['ec2', 's3', 'iam', 'rds', 'lambda', 'cloudtrail', 'kms', 'elbv2', 'efs', 'sns']
+
+
+def row(service, check, region, resource, status='PASS'):
+    return [f'{check}-{region}-{resource}', f'{service}_{check}', service, status, 'high', region,
+            f'arn:aws:{service}:{region}:111111111111:{resource}']
+
+def synthetic(count, seed=1, fail_services=('s3',)):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        service = SERVICES[i % len(SERVICES)]
+        status = 'FAIL' if service in fail_services and rng.random() < 0.3 else 'PASS'
+        rows.append(row(service, f'check{i % 7}', rng.choice(['us-east-1', 'eu-west-1']), f'res{i}', status))
+    return rows
+
+def test_plan_services_from_failures_and_inventory():
+    rows = [
+        row('s3', 'a', 'us-east-1', 'bucket1', 'FAIL'),
+        row('ec2', 'a', 'us-east-1', 'i-1'),
+        row('rds', 'a', 'us-east-1', 'db1')
+    ]
+    inventory = {
+        'ec2': {'arn:aws:ec2:us-east-1:111111111111:i-1', 'arn:aws:ec2:us-east-1:111111111111:i-2'},
+        'rds': {'arn:aws:rds:us-east-1:111111111111:db1'}
+    }
+    assert plan_services(HEADER, rows) == {'s3': ['failed']}
+    assert plan_services(HEADER, rows, inventory) == {'ec2': ['inventory'], 's3': ['failed']}
+
+def test_removed_resources_are_rescanned_and_dropped():
+    previous = [
+        row('rds', 'a', 'us-east-1', 'db1'),
+        row('rds', 'a', 'us-east-1', 'db2'),
+        row('ec2', 'a', 'us-east-1', 'i-1')
+    ]
+    previous_inventory = {'rds': {previous[0][-1], previous[1][-1]}, 'ec2': {previous[2][-1]}}
+    inventory = {'rds': {previous[0][-1]}, 'ec2': {previous[2][-1]}}
+    assert plan_services(HEADER, previous, inventory) == {}
+    assert plan_services(HEADER, previous, inventory, previous_inventory) == {'rds': ['inventory']}
+    # without a fresh inventory nothing can be called removed
+    assert plan_services(HEADER, previous, None, previous_inventory) == {}
+
+    _, merged, stats = merge_delta(HEADER, previous, HEADER, [previous[0]], {'rds'})
+    assert merged == [previous[2], previous[0]]
+    assert stats['resolved'] == 1
+
+def test_plan_only_names_installed_prowler_services():
+    rows = [row('s3', 'a', 'us-east-1', 'bucket1', 'FAIL')]
+    inventory = {
+        'events': {'arn:aws:events:us-east-1:111111111111:rule/r'},
+        'resource-groups': {'arn:aws:resource-groups:us-east-1:111111111111:group/g'},
+        'ec2': {'arn:aws:ec2:us-east-1:111111111111:i-1'}
+    }
+    assert list(plan_services(HEADER, rows, inventory)) == ['ec2', 'events', 'resource-groups', 's3']
+    assert plan_services(HEADER, rows, inventory, available={'ec2', 's3', 'iam'}) == {
+        'ec2': ['inventory'], 's3': ['failed']
+    }
+
+def test_inventory_round_trip(tmp_path):
+    path = str(tmp_path / 'inventory.json')
+    assert load_inventory(path) == (None, 0)
+    save_inventory(path, {'ec2': {'arn:b', 'arn:a'}}, 3)
+    assert load_inventory(path) == ({'ec2': {'arn:a', 'arn:b'}}, 3)
+
+def test_arn_service():
+    assert arn_service('arn:aws:elasticloadbalancing:us-east-1:1:loadbalancer/app/x') == 'elbv2'
+    assert arn_service('arn:aws:s3:::bucket') == 's3'
+    assert arn_service('not-an-arn') is None
+
+def test_merge_delta_replaces_rescanned_services():
+    previous = [
+        row('s3', 'a', 'us-east-1', 'bucket1', 'FAIL'),
+        row('s3', 'a', 'us-east-1', 'bucket2', 'FAIL'),
+        row('ec2', 'a', 'us-east-1', 'i-1')
+    ]
+    current = [row('s3', 'a', 'us-east-1', 'bucket1', 'PASS')]
+    header, merged, stats = merge_delta(HEADER, previous, HEADER, current, {'s3'})
+
+    assert header == HEADER
+    assert merged == [previous[2], current[0]]
+    assert stats == {'carried': 1, 'replaced': 1, 'resolved': 1, 'rescanned': 1}
+
+def test_merge_delta_handles_header_differences():
+    previous_header = ['CHECK_ID', 'SERVICE_NAME', 'REGION', 'RESOURCE_UID', 'STATUS']
+    current_header = ['CHECK_ID', 'REGION', 'RESOURCE_UID', 'SERVICE_NAME', 'STATUS', 'NOTES']
+    previous = [['ec2_a', 'ec2', 'r1', 'i-1', 'PASS'], ['iam_b', 'iam', 'r1', 'root', 'FAIL']]
+    current = [['iam_b', 'r1', 'root', 'iam', 'PASS', 'fixed']]
+    header, merged, _ = merge_delta(previous_header, previous, current_header, current, {'iam'})
+
+    assert header == previous_header + ['NOTES']
+    assert merged == [['ec2_a', 'ec2', 'r1', 'i-1', 'PASS', ''], ['iam_b', 'iam', 'r1', 'root', 'PASS', 'fixed']]
+
+def test_merge_delta_files_at_scale(tmp_path):
+    # 120k previous findings, s3 failed last time and is rescanned; a tenth of
+    # those findings are now fixed and a handful of new buckets appeared
+    previous = synthetic(120000)
+    s3_rows = [r for r in previous if r[2] == 's3']
+    current = [r[:3] + ['PASS' if i % 10 == 0 else r[3]] + r[4:] for i, r in enumerate(s3_rows)]
+    current += [row('s3', 'check0', 'us-east-1', f'new{i}', 'FAIL') for i in range(50)]
+
+    previous_path = str(tmp_path / 'previous.csv')
+    current_path = str(tmp_path / 'current.csv')
+    out_path = str(tmp_path / 'merged.csv')
+    write_findings(previous_path, HEADER, previous)
+    write_findings(current_path, HEADER, current)
+
+    start = time.perf_counter()
+    assert sorted(plan_services(*read_findings(previous_path))) == ['s3']
+    stats = merge_delta_files(previous_path, current_path, {'s3'}, out_path)
+    elapsed = time.perf_counter() - start
+
+    header, merged = read_findings(out_path)
+    assert len(merged) == len(previous) + 50
+    assert stats['replaced'] == len(s3_rows)
+    assert stats['carried'] == len(previous) - len(s3_rows)
+    merged_s3 = {r[6]: r[3] for r in merged if r[2] == 's3'}
+    assert merged_s3 == {r[6]: r[3] for r in current}
+    assert elapsed < 30
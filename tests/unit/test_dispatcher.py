@@ -0,0 +1,255 @@
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+from dispatcher import (
+    BASE_DELAY, CAPACITY_DELAY, MAX_DELAY, MemoryQueue, backoff_delay, count_in_flight, dispatch, fail_dead_letters
+)
+from jobs import MemoryJobStore, create_job, update_phase
+from launch_strategy import NoCapacityError
+
+
+class StubEc2:
+    # Tracks scanner instances and fails the next launches with the queued codes
+    def __init__(self, running=0, page_size=3):
+        self.instances = [f'i-{n}' for n in range(running)]
+        self.page_size = page_size
+        self.errors = []
+        self.launched = 0
+        self.peak = len(self.instances)
+
+    def describe_instances(self, Filters, NextToken=None):
+        assert {'Name': 'tag:Role', 'Values': ['ProwlerScanner']} in Filters
+        start = int(NextToken or 0)
+        page = self.instances[start:start + self.page_size]
+        response = {'Reservations': [{'Instances': [{'InstanceId': i} for i in page]}]}
+        if start + self.page_size < len(self.instances):
+            response['NextToken'] = str(start + self.page_size)
+        return response
+
+    def run_instances(self, **kwargs):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.launched += 1
+        self.instances.append(f'i-new-{self.launched}')
+        self.peak = max(self.peak, len(self.instances))
+        return {'Instances': [{'InstanceId': self.instances[-1]}]}
+
+    def finish(self, count):
+        del self.instances[:count]
+
+
+def launcher(ec2):
+    def launch(message):
+        return ec2.run_instances(Name=message['job_id'])
+    return launch
+
+def enqueue(queue, count, now=0):
+    for n in range(count):
+        queue.send({'job_id': f'Acme-{n}'}, now=now)
+
+def only_message(queue):
+    assert len(queue.messages) == 1
+    return next(iter(queue.messages.values()))
+
+def drain(queue, ec2, max_in_flight, now, **kwargs):
+    records = queue.receive(now=now)
+    response = dispatch(records, queue, ec2, launcher(ec2), max_in_flight, now=now, **kwargs)
+    queue.complete(records, response)
+    return response
+
+
+def test_counts_every_page_of_tagged_instances():
+    assert count_in_flight(StubEc2(running=7, page_size=3)) == 7
+    assert count_in_flight(StubEc2()) == 0
+
+def test_admits_up_to_the_free_slots():
+    queue, ec2 = MemoryQueue(), StubEc2(running=2)
+    enqueue(queue, 5)
+
+    response = drain(queue, ec2, 4, now=0)
+
+    assert ec2.launched == 2
+    # The rest are sent again rather than left to be redelivered
+    assert response['batchItemFailures'] == []
+    assert len(queue.messages) == 3
+    assert queue.receive(now=CAPACITY_DELAY - 1) == []
+    assert len(queue.receive(now=CAPACITY_DELAY)) == 3
+
+def test_full_cap_launches_nothing():
+    queue, ec2 = MemoryQueue(), StubEc2(running=4)
+    enqueue(queue, 2)
+
+    response = drain(queue, ec2, 4, now=0)
+
+    assert ec2.launched == 0
+    assert response['batchItemFailures'] == []
+    assert len(queue.messages) == 2
+
+def test_waiting_for_a_slot_backs_off_and_never_counts_as_a_receive():
+    queue, ec2 = MemoryQueue(), StubEc2(running=4)
+    enqueue(queue, 1)
+    now = 0
+    # Hours at capacity, far more deferrals than any maxReceiveCount
+    for deferral in range(1, 30):
+        drain(queue, ec2, 4, now=now)
+        message = only_message(queue)
+        assert message['receives'] == 0
+        assert message['visible'] == now + min(MAX_DELAY, CAPACITY_DELAY * 2 ** (deferral - 1))
+        assert json.loads(message['body'])['deferrals'] == deferral
+        now = message['visible']
+
+    ec2.finish(1)
+    drain(queue, ec2, 4, now=now)
+    assert ec2.launched == 1 and not queue.messages
+
+def test_sharded_scans_take_a_slot_per_shard():
+    queue, ec2 = MemoryQueue(), StubEc2(running=1)
+    queue.send({'job_id': 'Acme-0', 'options': {'shards': 3}}, now=0)
+    queue.send({'job_id': 'Acme-1', 'options': {'shards': 3}}, now=0)
+    queue.send({'job_id': 'Acme-2', 'options': {'shards': 1}}, now=0)
+
+    def launch(message):
+        for _ in range(message['options']['shards']):
+            ec2.run_instances()
+    records = queue.receive(now=0)
+    queue.complete(records, dispatch(records, queue, ec2, launch, 5, now=0))
+
+    # 4 free slots: the first sharded scan and the single one fit, the
+    # second sharded scan would overshoot the cap
+    assert ec2.peak == 5
+    assert [json.loads(m['body'])['job_id'] for m in queue.messages.values()] == ['Acme-1']
+
+def test_scans_with_more_shards_than_the_cap_wait_for_every_slot():
+    queue, ec2 = MemoryQueue(), StubEc2(running=1)
+    queue.send({'job_id': 'Acme-0', 'options': {'shards': 8}}, now=0)
+    drain(queue, ec2, 4, now=0)
+    assert len(queue.messages) == 1
+
+    ec2.finish(1)
+    drain(queue, ec2, 4, now=CAPACITY_DELAY)
+    assert ec2.launched == 1 and not queue.messages
+
+def test_throttling_defers_the_rest_of_the_batch():
+    queue, ec2 = MemoryQueue(), StubEc2()
+    ec2.errors = [ClientError({'Error': {'Code': 'RequestLimitExceeded'}}, 'RunInstances')]
+    enqueue(queue, 3)
+
+    response = drain(queue, ec2, 10, now=0)
+
+    assert ec2.launched == 0
+    assert response['batchItemFailures'] == []
+    bodies = sorted((json.loads(m['body']) for m in queue.messages.values()), key=lambda b: b['job_id'])
+    assert [(b['job_id'], b.get('attempts'), b.get('deferrals')) for b in bodies] == [
+        ('Acme-0', 1, None), ('Acme-1', None, 1), ('Acme-2', None, 1)]
+
+def test_throttling_backs_off_with_each_attempt():
+    queue, ec2 = MemoryQueue(), StubEc2()
+    enqueue(queue, 1)
+    now = 0
+    for attempt in range(1, 4):
+        ec2.errors = [NoCapacityError('No capacity for any of t3.medium')]
+        drain(queue, ec2, 10, now=now)
+        message = only_message(queue)
+        assert message['visible'] == now + backoff_delay(attempt)
+        now = message['visible']
+
+    drain(queue, ec2, 10, now=now)
+    assert ec2.launched == 1 and not queue.messages
+
+def test_launch_attempts_are_bounded():
+    queue, ec2, store = MemoryQueue(), StubEc2(), MemoryJobStore()
+    create_job(store, 'Acme-0', now=1, phase='queued')
+    enqueue(queue, 1)
+
+    def fail(message, error):
+        update_phase(store, message['job_id'], 'failed', now=2, detail=str(error))
+    now = 0
+    for _ in range(3):
+        ec2.errors = [NoCapacityError('No capacity for any of t3.medium')]
+        drain(queue, ec2, 10, now=now, on_failure=fail, max_attempts=3)
+        now += MAX_DELAY
+
+    assert not queue.messages
+    assert store.get('Acme-0')['phase'] == 'failed'
+
+def test_failed_requeue_defers_the_original():
+    class FailingSendQueue(MemoryQueue):
+        def send(self, body, delay=0, now=None):
+            if self.sent:
+                raise ClientError({'Error': {'Code': 'ThrottlingException'}}, 'SendMessage')
+            return super().send(body, delay, now)
+    queue, ec2 = FailingSendQueue(), StubEc2(running=4)
+    enqueue(queue, 1)
+
+    response = drain(queue, ec2, 4, now=0)
+
+    assert response == {'batchItemFailures': [{'itemIdentifier': '1'}]}
+    assert queue.messages['1']['visible'] == CAPACITY_DELAY
+
+def test_dead_letters_fail_their_jobs():
+    queue, store = MemoryQueue(), MemoryJobStore()
+    create_job(store, 'Acme-0', now=1, phase='queued')
+    enqueue(queue, 1)
+
+    def fail(message, error):
+        update_phase(store, message['job_id'], 'failed', now=2, detail=str(error))
+    assert fail_dead_letters(queue.receive(now=0), fail) == 1
+    assert store.get('Acme-0')['phase'] == 'failed'
+
+@pytest.mark.parametrize('attempts, delay', [(1, 30), (2, 60), (4, 240), (20, 900)])
+def test_backoff_delay(attempts, delay):
+    assert backoff_delay(attempts) == delay
+
+def test_bad_requests_are_recorded_and_dropped():
+    queue, ec2, store = MemoryQueue(), StubEc2(), MemoryJobStore()
+    create_job(store, 'Acme-0', now=1, phase='queued')
+    error = ClientError({'Error': {'Code': 'InvalidParameterValue'}}, 'RunInstances')
+    ec2.errors = [error]
+    enqueue(queue, 1)
+
+    def fail(message, error):
+        update_phase(store, message['job_id'], 'failed', now=2, detail=str(error))
+    response = drain(queue, ec2, 10, now=0, on_failure=fail)
+
+    assert response == {'batchItemFailures': []}
+    assert not queue.messages
+    record = store.get('Acme-0')
+    assert record['phase'] == 'failed' and record['detail'] == str(error)
+    assert [h['phase'] for h in record['history']] == ['queued', 'failed']
+
+def test_throttled_count_defers_everything():
+    class ThrottledEc2(StubEc2):
+        def describe_instances(self, **kwargs):
+            raise ClientError({'Error': {'Code': 'RequestLimitExceeded'}}, 'DescribeInstances')
+    queue, ec2 = MemoryQueue(), ThrottledEc2()
+    enqueue(queue, 2)
+
+    drain(queue, ec2, 10, now=0)
+
+    assert ec2.launched == 0
+    assert len(queue.messages) == 2
+    assert queue.receive(now=BASE_DELAY - 1) == []
+
+def test_simulated_backlog_never_exceeds_the_cap():
+    queue, ec2 = MemoryQueue(visibility_timeout=600), StubEc2(running=1)
+    enqueue(queue, 40)
+
+    # Each minute the dispatcher drains a batch and two scans finish
+    for minute in range(60):
+        drain(queue, ec2, 5, now=minute * 60)
+        ec2.finish(2)
+        if not queue.messages:
+            break
+
+    assert ec2.launched == 40
+    assert ec2.peak == 5
+    assert not queue.messages
+
+def test_queue_messages_round_trip_as_json():
+    queue = MemoryQueue()
+    queue.send({'job_id': 'Acme-1', 'options': {'regions': ['eu-west-1']}}, now=0)
+    record = queue.receive(now=0)[0]
+    assert json.loads(record['body'])['options'] == {'regions': ['eu-west-1']}
+    assert record['attributes']['ApproximateReceiveCount'] == '1'
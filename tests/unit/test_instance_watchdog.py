@@ -0,0 +1,122 @@
+import pytest
+
+from instance_watchdog import (
+    DEFAULT_BUDGETS, Watchdog, fail_jobs, job_phases, parse_budgets, progress_mark, read_phases, salvage, watch
+)
+from jobs import MemoryJobStore, create_job, update_phase
+
+
+BUDGETS = {'bootstrap': 600, 'scanning': 3600, 'building_ui': 600, 'uploading': 300}
+
+
+def run_timeline(watchdog, events, until, step=60, growing=lambda now: True):
+    # Replays phase transitions (at, phase, job), checking every `step`
+    # seconds; the watched files grow whenever growing(now) is true
+    transitions, size = [(0, 'bootstrap', '-')], 0
+    for now in range(0, until + 1, step):
+        transitions += [e for e in events if now - step < e[0] <= now]
+        if growing(now):
+            size += 1
+        reason = watchdog.check(sorted(transitions), (size, 0), now)
+        if reason:
+            return now, reason
+    return None, None
+
+
+def test_healthy_scan_runs_to_completion():
+    events = [(120, 'scanning', 'Acme-1'), (3000, 'building_ui', 'Acme-1'), (3300, 'uploading', 'Acme-1'),
+              (3400, 'done', 'Acme-1')]
+    assert run_timeline(Watchdog(BUDGETS, 900), events, 3900) == (None, None)
+
+def test_phase_over_budget():
+    events = [(120, 'scanning', 'Acme-1'), (3000, 'building_ui', 'Acme-1')]
+    now, reason = run_timeline(Watchdog(BUDGETS, 0), events, 7200)
+    assert now == 3660
+    assert reason == 'Acme-1 exceeded the 600s building_ui budget'
+
+def test_stalled_scan_is_detected():
+    events = [(120, 'scanning', 'Acme-1')]
+    now, reason = run_timeline(Watchdog(BUDGETS, 900), events, 3600, growing=lambda now: now < 1200)
+    assert now == 1140 + 960
+    assert reason.startswith('no progress in scanning for 960s')
+
+def test_stall_detection_can_be_disabled():
+    events = [(120, 'scanning', 'Acme-1')]
+    assert run_timeline(Watchdog(BUDGETS, 0), events, 3600, growing=lambda now: False) == (None, None)
+
+def test_bootstrap_budget_applies_before_any_job_phase():
+    now, reason = run_timeline(Watchdog(BUDGETS, 0), [], 1200)
+    assert now == 660 and reason == '- exceeded the 600s bootstrap budget'
+
+def test_instance_lingering_after_every_job_finished():
+    events = [(60, 'scanning', 'Acme-1'), (120, 'done', 'Acme-1')]
+    now, reason = run_timeline(Watchdog(BUDGETS, 0, finish_budget=300), events, 1200)
+    assert now == 480 and reason.startswith('still running')
+
+def test_packed_jobs_are_budgeted_separately():
+    # Staggered accounts keep entering scanning, but one of them hangs
+    events = [(60, 'scanning', 'A-1'), (60, 'scanning', 'B-1'), (1800, 'building_ui', 'A-1'),
+              (1900, 'done', 'A-1'), (1900, 'scanning', 'C-1'), (3000, 'failed', 'C-1')]
+    now, reason = run_timeline(Watchdog(BUDGETS, 0), events, 7200)
+    assert now == 3720
+    assert reason == 'B-1 exceeded the 3600s scanning budget'
+
+def test_job_phases_drop_the_instance_line():
+    assert job_phases([(0, 'bootstrap', '-')]) == {'-': ('bootstrap', 0)}
+    assert job_phases([(0, 'bootstrap', '-'), (5, 'scanning', 'A-1')]) == {'A-1': ('scanning', 5)}
+
+def test_read_phases_and_progress_mark(tmp_path):
+    log = tmp_path / 'phases.log'
+    log.write_text('100 bootstrap -\n160 scanning Acme-1\ntruncated\n')
+    assert read_phases(str(log)) == [(100.0, 'bootstrap', '-'), (160.0, 'scanning', 'Acme-1')]
+    assert read_phases(str(tmp_path / 'missing.log')) == []
+
+    output = tmp_path / 'Acme-1.csv'
+    output.write_text('a;b\n')
+    before = progress_mark([str(tmp_path / '*.csv')])
+    output.write_text('a;b\n1;2\n')
+    assert progress_mark([str(tmp_path / '*.csv')]) != before
+
+@pytest.mark.parametrize('text, expected', [
+    ('', {}),
+    ('scanning=7200', {'scanning': 7200}),
+    ('scanning=7200,uploading=600', {'scanning': 7200, 'uploading': 600}),
+    ('cleanup=300', {'cleanup': 300})
+])
+def test_parse_budgets_merge_over_the_defaults(text, expected):
+    assert parse_budgets(text) == dict(DEFAULT_BUDGETS, **expected)
+
+def test_watch_returns_the_first_reason(tmp_path):
+    log = tmp_path / 'phases.log'
+    log.write_text('0 scanning Acme-1\n')
+    clock = iter(range(0, 10000, 100))
+    reason = watch(Watchdog({'scanning': 250}, 0), str(log), [], clock=lambda: next(clock), sleep=lambda s: None)
+    assert reason == 'Acme-1 exceeded the 250s scanning budget'
+
+def test_salvage_uploads_partial_output(tmp_path, s3):
+    upload_file = s3.upload_file
+
+    def upload_unless_locked(path, bucket, key):
+        if path.endswith('locked.log'):
+            raise OSError('permission denied')
+        upload_file(path, bucket, key)
+    s3.upload_file = upload_unless_locked
+    for name in ('Acme-1.csv', 'Acme-1.log', 'locked.log'):
+        (tmp_path / name).write_text('x')
+
+    keys = salvage(s3, 'bucket', 'Acme-1', [str(tmp_path / '*.csv'), str(tmp_path / '*.log')])
+
+    assert keys == ['Acme-1/partial/Acme-1.csv', 'Acme-1/partial/Acme-1.log']
+    assert s3.puts == keys
+
+def test_fail_jobs_keeps_finished_jobs():
+    store = MemoryJobStore()
+    create_job(store, 'A-1', now=1)
+    create_job(store, 'B-1', now=1)
+    update_phase(store, 'B-1', 'done', now=2)
+
+    fail_jobs(store, ['A-1', 'B-1'], 'no progress in scanning for 1800s')
+
+    assert store.get('A-1')['phase'] == 'failed'
+    assert store.get('A-1')['detail'] == 'Stopped by the watchdog: no progress in scanning for 1800s'
+    assert store.get('B-1')['phase'] == 'done'
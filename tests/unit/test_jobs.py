@@ -0,0 +1,59 @@
+import pytest
+
+from jobs import MemoryJobStore, create_job, update_phase
+
+
+def test_job_lifecycle():
+    store = MemoryJobStore()
+    create_job(store, 'Acme-1', now=100, scan_name='Acme', instance_id='i-1')
+    update_phase(store, 'Acme-1', 'scanning', now=400)
+    update_phase(store, 'Acme-1', 'building_ui', now=4000)
+    update_phase(store, 'Acme-1', 'uploading', now=4100)
+    record = update_phase(store, 'Acme-1', 'done', now=4150)
+
+    assert record['phase'] == 'done'
+    assert record['instance_id'] == 'i-1'
+    assert [h['phase'] for h in record['history']] == ['bootstrap', 'scanning', 'building_ui', 'uploading', 'done']
+    assert record['duration'] == 4050
+    assert store.get('Acme-1') == record
+
+def test_queue_wait_is_not_scan_duration():
+    store = MemoryJobStore()
+    create_job(store, 'Acme-1', now=100, phase='queued')
+    update_phase(store, 'Acme-1', 'bootstrap', now=3700)
+    record = update_phase(store, 'Acme-1', 'done', now=5000)
+    assert record['duration'] == 1300
+
+    create_job(store, 'Acme-2', now=100, phase='queued')
+    assert update_phase(store, 'Acme-2', 'failed', now=900)['duration'] == 0
+
+    # a failed launch puts the job back in the queue, the scan starts at the
+    # launch that worked
+    create_job(store, 'Acme-3', now=100, phase='queued')
+    for phase, now in (('bootstrap', 200), ('queued', 210), ('bootstrap', 3700)):
+        update_phase(store, 'Acme-3', phase, now=now)
+    assert update_phase(store, 'Acme-3', 'done', now=5000)['duration'] == 1300
+
+def test_finished_jobs_stay_finished():
+    store = MemoryJobStore()
+    create_job(store, 'Acme-1', now=100)
+    update_phase(store, 'Acme-1', 'done', now=200)
+    record = update_phase(store, 'Acme-1', 'failed', now=300, detail='exit trap')
+    assert record['phase'] == 'done'
+    assert 'detail' not in store.get('Acme-1')
+
+def test_failure_detail_and_unknown_jobs():
+    store = MemoryJobStore()
+    record = update_phase(store, 'Orphan-1', 'failed', now=50, detail='user_data exited with status 1')
+    assert record['detail'] == 'user_data exited with status 1'
+    assert store.get('missing') is None
+
+def test_unknown_phase_rejected():
+    with pytest.raises(ValueError):
+        update_phase(MemoryJobStore(), 'Acme-1', 'sleeping')
+
+def test_store_returns_copies():
+    store = MemoryJobStore()
+    record = create_job(store, 'Acme-1', now=1)
+    record['phase'] = 'tampered'
+    assert store.get('Acme-1')['phase'] == 'bootstrap'
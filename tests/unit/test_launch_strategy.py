@@ -0,0 +1,100 @@
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+from launch_strategy import (
+    SPOT_OPTIONS, hint_key, larger_type, launch_with_strategy, load_size_hint, save_size_hint, select_instance_types,
+    size_tiers
+)
+
+
+class StubEc2:
+    # Fails the listed (instance_type, market) attempts with the given code
+    def __init__(self, failures=None):
+        self.failures = failures or {}
+        self.calls = []
+
+    def run_instances(self, **kwargs):
+        market = 'spot' if 'InstanceMarketOptions' in kwargs else 'on-demand'
+        self.calls.append((kwargs['InstanceType'], market))
+        code = self.failures.get((kwargs['InstanceType'], market))
+        if code:
+            raise ClientError({'Error': {'Code': code}}, 'RunInstances')
+        return {'Instances': [{'InstanceId': 'i-1', 'InstanceType': kwargs['InstanceType']}]}
+
+
+@pytest.mark.parametrize('hint, expected', [
+    (None, ['t3.medium', 'm6g.medium']),
+    ({}, ['t3.medium', 'm6g.medium']),
+    ({'duration': 1800, 'findings': 900}, ['t3.medium', 'm6g.medium']),
+    ({'duration': 1800, 'findings': 20000}, ['t3.large', 'm6g.large']),
+    ({'duration': 5 * 3600, 'findings': 100}, ['t3.large', 'm6g.large']),
+    ({'duration': 9 * 3600, 'findings': 100}, ['t3.xlarge', 'm6g.xlarge']),
+    ({'duration': 600, 'findings': 250000}, ['t3.xlarge', 'm6g.xlarge'])
+])
+def test_select_instance_types(hint, expected):
+    assert select_instance_types(hint, ['t3.medium', 'm6g.medium']) == expected
+
+def test_configured_size_tiers():
+    tiers = [[3600, None, ['c5.large']], [None, None, ['c5.2xlarge', 'c5.xlarge']]]
+    assert select_instance_types(None, ['t3.medium'], tiers) == ['t3.medium']
+    assert select_instance_types({'duration': 600}, ['t3.medium'], tiers) == ['c5.large']
+    assert select_instance_types({'duration': 7200}, ['t3.medium'], tiers) == ['c5.2xlarge', 'c5.xlarge']
+
+def test_size_tiers_step_up_the_configured_types():
+    assert larger_type('t3.micro', 2) == 't3.medium'
+    assert larger_type('m5.8xlarge', 1) == 'm5.8xlarge'
+    assert larger_type('m5.metal', 1) == 'm5.metal'
+    assert [types for _, _, types in size_tiers(['t3.large', 'm5.xlarge'])] == [
+        ['t3.large', 'm5.xlarge'], ['t3.xlarge', 'm5.2xlarge'], ['t3.2xlarge', 'm5.4xlarge']
+    ]
+
+@pytest.mark.parametrize('types, use_spot, failures, launched, calls', [
+    # first choice succeeds
+    (['t3.large', 'm5.large'], True, {}, ('t3.large', 'spot'), 1),
+    # spot capacity for every type runs out, falls back to on demand
+    (['t3.large', 'm5.large'], True, {
+        ('t3.large', 'spot'): 'InsufficientInstanceCapacity',
+        ('m5.large', 'spot'): 'SpotMaxPriceTooLow'
+    }, ('t3.large', 'on-demand'), 3),
+    # spot tries the next type before giving up on spot
+    (['t3.large', 'm5.large'], True, {('t3.large', 'spot'): 'InsufficientInstanceCapacity'}, ('m5.large', 'spot'), 2),
+    # on demand only walks the priority list
+    (['t3.large', 'm5.large'], False, {('t3.large', 'on-demand'): 'Unsupported'}, ('m5.large', 'on-demand'), 2)
+])
+def test_launch_with_strategy(types, use_spot, failures, launched, calls):
+    ec2 = StubEc2(failures)
+    response, market, failed = launch_with_strategy(ec2, {'ImageId': 'ami-1'}, types, use_spot)
+    assert (response['Instances'][0]['InstanceType'], market) == launched
+    assert len(ec2.calls) == calls
+    assert len(failed) == calls - 1
+
+def test_spot_request_options():
+    class Recorder(StubEc2):
+        def run_instances(self, **kwargs):
+            self.kwargs = kwargs
+            return super().run_instances(**kwargs)
+
+    ec2 = Recorder()
+    launch_with_strategy(ec2, {'ImageId': 'ami-1'}, ['t3.large'], True)
+    assert ec2.kwargs['InstanceMarketOptions'] == SPOT_OPTIONS
+    assert ec2.kwargs['ImageId'] == 'ami-1'
+
+def test_non_capacity_errors_raise_immediately():
+    ec2 = StubEc2({('t3.large', 'spot'): 'UnauthorizedOperation'})
+    with pytest.raises(ClientError):
+        launch_with_strategy(ec2, {}, ['t3.large', 'm5.large'], True)
+    assert len(ec2.calls) == 1
+
+def test_exhausted_capacity_raises():
+    failures = {(t, m): 'InsufficientInstanceCapacity' for t in ('a', 'b') for m in ('spot', 'on-demand')}
+    with pytest.raises(Exception, match='No capacity'):
+        launch_with_strategy(StubEc2(failures), {}, ['a', 'b'], True)
+
+def test_size_hint_round_trip(s3):
+    assert load_size_hint(s3, 'b', 'Acme Corp') is None
+    save_size_hint(s3, 'b', 'Acme Corp', 3600.0, 1234)
+    assert hint_key('Acme Corp') == 'hints/Acme-Corp.json'
+    assert load_size_hint(s3, 'b', 'Acme Corp') == {'duration': 3600.0, 'findings': 1234}
+    assert json.loads(s3.objects['hints/Acme-Corp.json'])['findings'] == 1234
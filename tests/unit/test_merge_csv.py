@@ -0,0 +1,74 @@
+from findings import read_findings, write_findings
+from merge_csv import merge_findings
+
+
+HEADER = ['FINDING_UID', 'CHECK_ID', 'REGION', 'RESOURCE_UID', 'STATUS']
+
+
+def write(path, header, rows):
+    write_findings(str(path), header, rows)
+    return str(path)
+
+def test_merge_keeps_file_then_row_order(tmp_path):
+    east = write(tmp_path / 'scan-us-east-1.csv', HEADER, [
+        ['f1', 'ec2_a', 'us-east-1', 'arn:1', 'FAIL'],
+        ['f2', 'ec2_b', 'us-east-1', 'arn:2', 'PASS']
+    ])
+    west = write(tmp_path / 'scan-us-west-2.csv', HEADER, [
+        ['f3', 'ec2_a', 'us-west-2', 'arn:3', 'FAIL']
+    ])
+    out = str(tmp_path / 'scan.csv')
+    stats = merge_findings([east, west], out)
+
+    header, rows = read_findings(out)
+    assert header == HEADER
+    assert [r[0] for r in rows] == ['f1', 'f2', 'f3']
+    assert stats == {'files': 2, 'rows_in': 3, 'rows_out': 3, 'duplicates': 0}
+
+def test_merge_drops_global_duplicates(tmp_path):
+    iam = ['f9', 'iam_root_mfa', 'us-east-1', 'arn:aws:iam::1:root', 'FAIL']
+    east = write(tmp_path / 'a.csv', HEADER, [iam, ['f1', 'ec2_a', 'us-east-1', 'arn:1', 'FAIL']])
+    west = write(tmp_path / 'b.csv', HEADER, [iam])
+    out = str(tmp_path / 'scan.csv')
+    stats = merge_findings([east, west], out)
+
+    _, rows = read_findings(out)
+    assert [r[0] for r in rows] == ['f9', 'f1']
+    assert stats['duplicates'] == 1
+
+def test_merge_without_uid_dedups_whole_rows(tmp_path):
+    header = ['CHECK_ID', 'REGION']
+    a = write(tmp_path / 'a.csv', header, [['c1', 'r1'], ['c1', 'r1'], ['c1', 'r2']])
+    out = str(tmp_path / 'scan.csv')
+    merge_findings([a], out)
+    assert read_findings(out)[1] == [['c1', 'r1'], ['c1', 'r2']]
+
+def test_merge_unions_headers(tmp_path):
+    a = write(tmp_path / 'a.csv', ['FINDING_UID', 'CHECK_ID'], [['f1', 'c1']])
+    b = write(tmp_path / 'b.csv', ['CHECK_ID', 'FINDING_UID', 'NOTES'], [['c2', 'f2', 'n']])
+    out = str(tmp_path / 'scan.csv')
+    merge_findings([a, b], out)
+
+    header, rows = read_findings(out)
+    assert header == ['FINDING_UID', 'CHECK_ID', 'NOTES']
+    assert rows == [['f1', 'c1', ''], ['f2', 'c2', 'n']]
+
+def test_merge_skips_missing_and_empty_files(tmp_path):
+    empty = tmp_path / 'empty.csv'
+    empty.write_text('')
+    a = write(tmp_path / 'a.csv', HEADER, [['f1', 'c', 'r', 'arn', 'PASS']])
+    out = str(tmp_path / 'scan.csv')
+    stats = merge_findings([str(empty), str(tmp_path / 'missing.csv'), a], out)
+    assert stats['files'] == 1
+    assert read_findings(out)[1] == [['f1', 'c', 'r', 'arn', 'PASS']]
+
+def test_merge_of_nothing_writes_empty_file(tmp_path):
+    out = tmp_path / 'scan.csv'
+    merge_findings([], str(out))
+    assert out.read_text() == ''
+
+def test_fields_with_delimiters_round_trip(tmp_path):
+    a = write(tmp_path / 'a.csv', ['FINDING_UID', 'NOTES'], [['f1', 'a;b\n"quoted"']])
+    out = str(tmp_path / 'scan.csv')
+    merge_findings([a], out)
+    assert read_findings(out)[1] == [['f1', 'a;b\n"quoted"']]
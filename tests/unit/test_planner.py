@@ -0,0 +1,65 @@
+import random
+
+from planner import estimate_duration, plan_instances, types_for_concurrency
+
+
+TYPES = ['t3.medium']
+
+
+def accounts(weights):
+    return [{'scan_name': f'acct-{i}', 'weight': w} for i, w in enumerate(weights)]
+
+def test_every_account_planned_exactly_once():
+    random.seed(7)
+    synthetic = accounts([random.uniform(0.2, 6) for _ in range(83)])
+    plans = plan_instances(synthetic, concurrency=4, max_accounts_per_instance=20, instance_types=TYPES)
+    assert len(plans) == 5
+    planned = sorted(i for p in plans for i in p['accounts'])
+    assert planned == list(range(83))
+    assert all(len(p['accounts']) <= 20 for p in plans)
+
+def test_small_batches_use_a_single_instance():
+    plans = plan_instances(accounts([1, 1, 1]), concurrency=4, max_accounts_per_instance=20, instance_types=TYPES)
+    assert len(plans) == 1
+    assert plans[0]['concurrency'] == 3
+    assert plans[0]['accounts'] == [0, 1, 2]
+
+def test_heavy_accounts_are_spread_across_instances():
+    plans = plan_instances(accounts([10, 10, 1, 1, 1, 1]), concurrency=1, max_accounts_per_instance=3,
+                           instance_types=TYPES)
+    loads = sorted(p['estimated_duration'] for p in plans)
+    assert loads == [12, 12]
+
+def test_packing_cuts_instance_hours():
+    # 100 accounts of ~1h of scanning each plus a fixed boot overhead
+    random.seed(3)
+    weights = [random.uniform(0.5, 1.5) for _ in range(100)]
+    overhead = 0.25
+    single = sum(w + overhead for w in weights)
+    plans = plan_instances(accounts(weights), concurrency=8, max_accounts_per_instance=50, instance_types=TYPES)
+    packed = sum(p['estimated_duration'] + overhead for p in plans)
+    assert packed * 5 < single
+
+def test_instance_size_grows_with_concurrency():
+    types = ['t3.medium', 't3a.medium']
+    assert types_for_concurrency(1, types) == types
+    assert types_for_concurrency(2, types) == ['t3.large', 't3a.large']
+    assert types_for_concurrency(4, types) == ['t3.xlarge', 't3a.xlarge']
+    assert types_for_concurrency(8, types) == ['t3.2xlarge', 't3a.2xlarge']
+    assert types_for_concurrency(500, types) == ['t3.8xlarge', 't3a.8xlarge']
+
+def test_sizes_follow_the_configured_types():
+    assert types_for_concurrency(4, ['m6i.large', 'c5.metal']) == ['m6i.2xlarge', 'c5.metal']
+    plans = plan_instances(accounts([1, 1]), concurrency=2, max_accounts_per_instance=20,
+                           instance_types=['m6i.medium'])
+    assert plans[0]['instance_types'] == ['m6i.large']
+
+def test_estimate_duration():
+    assert estimate_duration([4, 3, 3, 2], 2) == 6
+    assert estimate_duration([5], 4) == 5
+    assert estimate_duration([], 2) == 0
+
+def test_empty_and_default_weights():
+    assert plan_instances([], 4, 20, TYPES) == []
+    plans = plan_instances([{'scan_name': 'a'}, {'scan_name': 'b'}], 1, 20, TYPES)
+    assert plans[0]['estimated_duration'] == 2
@@ -0,0 +1,120 @@
+import json
+
+import pytest
+
+from batch import validate_targets
+from render_cft import (
+    account_scan_name, build_manifest, deploy_stack_set, derive_external_id, load_accounts, load_secret,
+    organization_accounts, render_stackset_template, stack_instance_requests
+)
+
+
+SCANNER_ROLE = 'arn:aws:iam::999999999999:role/ProwlerScannerStack-EC2Role'
+SECRET = b'0123456789abcdef'
+ACCOUNTS = [
+    {'account_id': '222222222222', 'name': 'Acme Prod (EU)'},
+    {'account_id': '111111111111', 'name': ''}
+]
+
+
+def test_stackset_template_sets_the_external_id_per_instance():
+    template = render_stackset_template(SCANNER_ROLE)
+    role = template['Resources']['CrossAccountRole']
+    assert role['Properties']['AssumeRolePolicyDocument']['Statement'][0]['Principal'] == {'AWS': SCANNER_ROLE}
+    assert 'Default' not in template['Parameters']['ExternalId']
+    assert 'Message' not in template['Outputs']
+    assert json.dumps(template) == json.dumps(render_stackset_template(SCANNER_ROLE))
+
+def test_manifest_is_deterministic_and_sorted():
+    manifest = build_manifest(ACCOUNTS, SECRET)
+    assert manifest == build_manifest(list(reversed(ACCOUNTS)), SECRET)
+    assert [t['account_id'] for t in manifest['targets']] == ['111111111111', '222222222222']
+    first, second = manifest['targets']
+    assert first['scan_name'] == '111111111111'
+    assert second['scan_name'] == 'Acme Prod EU-222222222222'
+    assert second['role_arn'] == 'arn:aws:iam::222222222222:role/CrossAccountRole'
+    assert second['external_id'] == derive_external_id(SECRET, '222222222222')
+    assert first['external_id'] != second['external_id']
+    assert build_manifest(ACCOUNTS, b'other')['targets'][0]['external_id'] != first['external_id']
+
+def test_manifest_targets_are_a_valid_batch():
+    manifest = build_manifest(ACCOUNTS, SECRET)
+    external_id = manifest['targets'][0]['external_id']
+    assert len(external_id) == 32 and external_id.isalnum()
+    assert validate_targets(manifest['targets'], 100) == []
+
+def test_invalid_and_duplicate_accounts_are_rejected():
+    with pytest.raises(ValueError):
+        build_manifest([{'account_id': '1234'}], SECRET)
+    with pytest.raises(ValueError):
+        build_manifest(ACCOUNTS + [{'account_id': '111111111111', 'name': 'again'}], SECRET)
+
+def test_scan_names_fit_the_api_limit():
+    name = account_scan_name('111111111111', 'x' * 80)
+    assert len(name) == 64 and name.endswith('-111111111111')
+
+def test_accounts_from_csv_and_organizations(tmp_path):
+    path = tmp_path / 'accounts.csv'
+    path.write_text('account_id,name\n111111111111, Acme \n222222222222,\n')
+    assert load_accounts(str(path)) == [{'account_id': '111111111111', 'name': 'Acme'},
+                                        {'account_id': '222222222222', 'name': ''}]
+
+    class StubOrganizations:
+        def get_paginator(self, name):
+            return self
+
+        def paginate(self):
+            yield {'Accounts': [{'Id': '111111111111', 'Name': 'Acme', 'Status': 'ACTIVE'},
+                                {'Id': '333333333333', 'Name': 'Closed', 'Status': 'SUSPENDED'}]}
+    assert organization_accounts(StubOrganizations()) == [{'account_id': '111111111111', 'name': 'Acme'}]
+
+def test_secret_is_created_once(tmp_path):
+    path = str(tmp_path / 'secret')
+    secret = load_secret(path)
+    assert len(secret) == 64 and load_secret(path) == secret
+
+def test_stack_instance_requests():
+    manifest = build_manifest(ACCOUNTS, SECRET)
+    requests = stack_instance_requests(manifest, 'us-east-1')
+    assert requests[0]['Accounts'] == ['111111111111']
+    assert requests[0]['ParameterOverrides'] == [
+        {'ParameterKey': 'ExternalId', 'ParameterValue': manifest['targets'][0]['external_id']}]
+    targets = stack_instance_requests(manifest, 'us-east-1', ou='ou-abcd-12345678')[1]['DeploymentTargets']
+    assert targets == {'OrganizationalUnitIds': ['ou-abcd-12345678'], 'Accounts': ['222222222222'],
+                       'AccountFilterType': 'INTERSECTION'}
+
+def test_deploy_only_adds_missing_instances():
+    class StackSetNotFound(Exception):
+        pass
+
+    class StubCloudFormation:
+        class exceptions:
+            StackSetNotFoundException = StackSetNotFound
+
+        def __init__(self):
+            self.created = None
+            self.instances = []
+
+        def describe_stack_set(self, StackSetName):
+            raise StackSetNotFound()
+
+        def create_stack_set(self, **kwargs):
+            self.created = kwargs
+
+        def get_paginator(self, name):
+            return self
+
+        def paginate(self, StackSetName):
+            yield {'Summaries': [{'Account': '111111111111', 'Region': 'us-east-1'}]}
+
+        def create_stack_instances(self, **kwargs):
+            self.instances.append(kwargs)
+            return {'OperationId': f'op-{len(self.instances)}'}
+
+    cloudformation = StubCloudFormation()
+    template = render_stackset_template(SCANNER_ROLE)
+    operations = deploy_stack_set(cloudformation, template, build_manifest(ACCOUNTS, SECRET), 'us-east-1')
+    assert operations == ['op-1']
+    assert cloudformation.instances[0]['Accounts'] == ['222222222222']
+    assert cloudformation.created['ManagedExecution'] == {'Active': True}
+    assert json.loads(cloudformation.created['TemplateBody']) == template
@@ -0,0 +1,207 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import requests
+
+from scan_client import RateLimiter, ScanClient, render_progress
+
+
+class StandIn:
+    # Local stand-in for the API: queued responses per path, then launches
+    # succeed and each job finishes after a fixed number of status polls
+    def __init__(self):
+        self.responses = {}
+        self.requests = []
+        self.polls = {}
+        self.lock = threading.Lock()
+
+    def respond(self, method, path, query, body):
+        with self.lock:
+            self.requests.append((method, path, query))
+            queued = self.responses.get(path)
+            if queued:
+                return queued.pop(0)
+            if path == '/status':
+                job = query['job'][0]
+                self.polls[job] = self.polls.get(job, 0) + 1
+                phase = 'done' if self.polls[job] >= 2 else 'scanning'
+                return 200, {'job_id': job, 'phase': phase, 'created': 1000}
+            if path == '/batch':
+                return 200, {'results': [
+                    {'scan_name': t['scan_name'], 'status': 'launched',
+                     'result': {'job_id': f'{t["scan_name"]}-1', 'instance_id': 'i-1', 'output_object': 'x'}}
+                    for t in body['targets']]}
+            return 200, {'job_id': f'{query["scan_name"][0]}-1', 'instance_id': 'i-1', 'output_object': 'x'}
+
+
+@pytest.fixture
+def api():
+    stand_in = StandIn()
+
+    class Handler(BaseHTTPRequestHandler):
+        def handle_one(self, method):
+            url = urlparse(self.path)
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length)) if length else None
+            status, payload = stand_in.respond(method, url.path, parse_qs(url.query), body)
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self.handle_one('GET')
+
+        def do_POST(self):
+            self.handle_one('POST')
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    stand_in.endpoint = f'http://127.0.0.1:{server.server_port}/'
+    yield stand_in
+    server.shutdown()
+    server.server_close()
+
+
+def client(api, **kwargs):
+    return ScanClient(api.endpoint, rate=1000, sleep=lambda s: None, **kwargs)
+
+
+def targets(count):
+    return [{'scan_name': f'acct{i}', 'role_arn': 'arn:aws:iam::111111111111:role/R', 'external_id': 'ext12345'}
+            for i in range(count)]
+
+
+def test_launch_many_keeps_target_order(api):
+    results = client(api, concurrency=4).launch_many(targets(10))
+
+    assert [r['scan_name'] for r in results] == [f'acct{i}' for i in range(10)]
+    assert all(r['status'] == 'launched' for r in results)
+    assert len(api.requests) == 10
+
+
+def test_launch_many_chunks_batches(api):
+    results = client(api).launch_many(targets(5), chunk_size=2)
+
+    assert [r['scan_name'] for r in results] == [f'acct{i}' for i in range(5)]
+    assert [r[1] for r in api.requests] == ['/batch'] * 3
+
+
+def test_retries_throttling_and_unavailable(api):
+    api.responses['/'] = [(429, {'message': 'Too Many Requests'}), (503, {'message': 'Service Unavailable'})]
+
+    result = client(api).launch(targets(1)[0])
+
+    assert result['status'] == 'launched'
+    assert len(api.requests) == 3
+
+
+@pytest.mark.parametrize('status', [500, 502])
+def test_launches_do_not_retry_server_errors(api, status):
+    # The instance may already be running, a retry would launch another
+    api.responses['/'] = [(status, {'message': 'Internal server error'})]
+    api.responses['/batch'] = [(status, {'message': 'Internal server error'})]
+
+    c = client(api)
+    assert c.launch(targets(1)[0])['http_status'] == status
+    assert [r['http_status'] for r in c.launch_batch(targets(2))] == [status, status]
+    assert len(api.requests) == 2
+
+
+def test_unreachable_targets_fail_alone(api, monkeypatch):
+    c = client(api, max_retries=0)
+    launch = c.launch
+
+    def flaky(target):
+        if target['scan_name'] == 'acct1':
+            raise requests.ConnectionError('connection reset')
+        return launch(target)
+    monkeypatch.setattr(c, 'launch', flaky)
+
+    results = c.launch_many(targets(3))
+
+    assert [r['status'] for r in results] == ['launched', 'failed', 'launched']
+    assert results[1]['error'] == 'connection reset'
+
+
+def test_unreachable_batches_fail_their_targets():
+    c = ScanClient('http://127.0.0.1:9/', rate=1000, max_retries=1, sleep=lambda s: None)
+
+    results = c.launch_many(targets(3), chunk_size=2)
+
+    assert [(r['scan_name'], r['status']) for r in results] == [('acct0', 'failed'), ('acct1', 'failed'),
+                                                                 ('acct2', 'failed')]
+
+
+def test_launch_does_not_retry_gateway_timeout(api):
+    api.responses['/'] = [(504, {'message': 'Endpoint request timed out'})]
+
+    result = client(api).launch(targets(1)[0])
+
+    assert result['status'] == 'failed'
+    assert result['http_status'] == 504
+    assert len(api.requests) == 1
+
+
+def test_gives_up_after_max_retries(api):
+    api.responses['/'] = [(503, {'message': 'unavailable'})] * 5
+
+    result = client(api, max_retries=2).launch(targets(1)[0])
+
+    assert result['status'] == 'failed'
+    assert len(api.requests) == 3
+
+
+def test_client_errors_are_not_retried(api):
+    api.responses['/'] = [(400, {'error': 'role_arn is invalid'})]
+
+    result = client(api).launch(targets(1)[0])
+
+    assert result == {'scan_name': 'acct0', 'status': 'failed', 'http_status': 400, 'error': 'role_arn is invalid'}
+
+
+def test_wait_polls_until_final(api):
+    progress = []
+    records = client(api).wait(['a-1', 'b-1'], interval=0, on_progress=lambda r: progress.append(dict(r)))
+
+    assert {j: r['phase'] for j, r in records.items()} == {'a-1': 'done', 'b-1': 'done'}
+    assert len(progress) == 2
+    assert api.polls == {'a-1': 2, 'b-1': 2}
+
+
+def test_rate_limiter_spaces_requests():
+    now = [0.0]
+    waits = []
+
+    def sleep(seconds):
+        waits.append(seconds)
+        now[0] += seconds
+
+    limiter = RateLimiter(2, burst=1, clock=lambda: now[0], sleep=sleep)
+    for _ in range(3):
+        limiter.acquire()
+
+    assert now[0] == pytest.approx(1.0)
+
+
+def test_render_progress():
+    table = render_progress({
+        'a-1': {'phase': 'done', 'created': 0, 'finished': 3900},
+        'b-1': {'phase': 'scanning', 'created': 0, 'detail': 'us-east-1'},
+    }, now=60)
+
+    assert table.splitlines() == [
+        'JOB  PHASE     ELAPSED  DETAIL',
+        'a-1  done        1h05m',
+        'b-1  scanning    0h01m  us-east-1',
+        'done: 1, scanning: 1',
+    ]
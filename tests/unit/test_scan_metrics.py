@@ -0,0 +1,119 @@
+import json
+
+import pytest
+
+from scan_metrics import (
+    Stopwatch, aggregate, build_metrics, durations, emf_records, log_service_durations, module_service,
+    percentile, read_marks, render_table, send_emf, service_durations
+)
+
+
+def log_line(timestamp, module, message='x'):
+    return (f'{{"timestamp": "{timestamp}", "filename": "{module}.py:10", "level": "INFO", '
+            f'"module": "{module}", "message": "{message}"}}\n')
+
+
+def test_durations_run_until_the_next_mark():
+    marks = [(0, 'system_install'), (90, 'prowler_install'), (240, 'scan'), (3840, 'ui_build')]
+    assert durations(marks, end=4000) == {'system_install': 90, 'prowler_install': 150, 'scan': 3600,
+                                          'ui_build': 160}
+    assert durations([(0, 'scanning'), (10, 'building_ui'), (20, 'scanning')], end=25) == {
+        'scanning': 15, 'building_ui': 10}
+
+def test_read_marks_for_one_job(tmp_path):
+    log = tmp_path / 'phases.log'
+    log.write_text('100 bootstrap -\n160 scanning A-1\n170 scanning B-1\n900 done A-1\n')
+    assert read_marks(str(log), 'A-1') == [(100, 'bootstrap'), (160, 'scanning'), (900, 'done')]
+    steps = tmp_path / 'steps.log'
+    steps.write_text('100.5 system_install\n190.25 prowler_install\n')
+    assert read_marks(str(steps)) == [(100.5, 'system_install'), (190.25, 'prowler_install')]
+    assert read_marks(str(tmp_path / 'missing.log')) == []
+
+@pytest.mark.parametrize('module, service', [
+    ('s3_bucket_default_encryption', 's3'),
+    ('ec2_service', 'ec2'),
+    ('awslambda_function_url_public', 'awslambda'),
+    ('check', 'other'),
+    ('aws_provider', 'other')
+])
+def test_module_service(module, service):
+    assert module_service(module) == service
+
+def test_service_durations_charge_the_gap_to_the_logging_service():
+    lines = [
+        log_line('2024-07-16 12:00:00,000', 'aws_provider'),
+        log_line('2024-07-16 12:00:05,000', 's3_service'),
+        log_line('2024-07-16 12:01:05,000', 's3_bucket_default_encryption', 'message with "quotes"'),
+        log_line('2024-07-16 12:01:35,500', 'iam_service'),
+        'Traceback (most recent call last):\n',
+        log_line('2024-07-16 12:02:00,500', 'check')
+    ]
+    assert service_durations(lines) == {'other': 5, 's3': 90.5, 'iam': 25}
+
+def test_region_logs_add_up(tmp_path):
+    for region in ('eu-west-1', 'us-east-1'):
+        (tmp_path / f'Acme-1-{region}.log').write_text(
+            log_line('2024-07-16 12:00:00,000', 'ec2_service') + log_line('2024-07-16 12:00:30,000', 'check'))
+    assert log_service_durations([str(tmp_path / 'Acme-1*.log')]) == {'ec2': 60}
+
+def test_build_metrics():
+    job = {'scan_name': 'Acme', 'instance_type': 't3.medium', 'created': 1000,
+           'timings': {'ami_lookup': 0.01, 'run_instances': 0.8, 'total': 0.9}}
+    metrics = build_metrics(
+        'Acme-1', job,
+        steps=[(1060, 'system_install'), (1150, 'scan'), (4750, 'upload')],
+        phases=[(1060, 'bootstrap'), (1150, 'scanning'), (4750, 'uploading'), (4790, 'done')],
+        services={'s3': 1200},
+        now=4800
+    )
+    assert metrics['launch']['run_instances'] == 0.8
+    assert metrics['steps'] == {'system_install': 90, 'scan': 3600, 'upload': 50}
+    assert metrics['phases'] == {'bootstrap': 90, 'scanning': 3600, 'uploading': 40}
+    assert metrics['services'] == {'s3': 1200}
+    assert metrics['total'] == 3800
+
+def test_emf_records_per_group():
+    records = emf_records({'object_key': 'Acme-1', 'generated': 1721159874.5,
+                           'launch': {'ami_lookup': 0.01}, 'steps': {}, 'phases': {'scanning': 3600}})
+    assert [r['Group'] for r in records] == ['launch', 'phases']
+    record = records[1]
+    assert record['_aws']['Timestamp'] == 1721159874500
+    assert record['_aws']['CloudWatchMetrics'][0]['Metrics'] == [{'Name': 'scanning', 'Unit': 'Seconds'}]
+    assert record['scanning'] == 3600 and record['ObjectKey'] == 'Acme-1'
+
+def test_send_emf_reuses_the_stream():
+    class AlreadyExists(Exception):
+        response = {'Error': {'Code': 'ResourceAlreadyExistsException'}}
+
+    class StubLogs:
+        def __init__(self):
+            self.events = []
+
+        def create_log_stream(self, **kwargs):
+            raise AlreadyExists()
+
+        def put_log_events(self, logGroupName, logStreamName, events):
+            self.events.extend(events)
+
+    logs = StubLogs()
+    send_emf(logs, 'metrics', 'Acme-1', emf_records({'object_key': 'Acme-1', 'generated': 1, 'launch': {'a': 1}}))
+    assert json.loads(logs.events[0]['message'])['a'] == 1
+
+def test_percentiles_and_aggregate():
+    assert percentile([1, 2, 3, 4], 50) == 2.5
+    assert percentile([5], 95) == 5
+    assert percentile([], 50) is None
+
+    scans = [{'steps': {'scan': seconds}, 'phases': {'scanning': seconds + 10}, 'total': seconds + 100}
+             for seconds in range(100, 2100, 100)]
+    summary = aggregate(scans)
+    assert summary['steps.scan'] == {'count': 20, 'p50': 1050, 'p95': 1905}
+    assert summary['total']['p50'] == 1150
+    assert render_table(summary).splitlines()[0].split() == ['timing', 'count', 'p50', 'p95']
+
+def test_stopwatch_laps():
+    ticks = iter([10.0, 10.25, 11.0])
+    stopwatch = Stopwatch(clock=lambda: next(ticks))
+    stopwatch.lap('ami_lookup')
+    stopwatch.lap('run_instances')
+    assert stopwatch.total() == {'ami_lookup': 0.25, 'run_instances': 0.75, 'total': 1.0}
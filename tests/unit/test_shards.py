@@ -0,0 +1,113 @@
+import json
+
+from findings import read_findings, write_findings
+from jobs import MemoryJobStore, create_job, update_phase
+from shards import (
+    DEFAULT_SERVICE_WEIGHTS, SKIP, latest_service_runtimes, merge_shards, plan_shards, shard_arguments, shard_job_id,
+    wait_for_shards
+)
+
+
+HEADER = ['FINDING_UID', 'CHECK_ID', 'REGION', 'RESOURCE_UID', 'STATUS']
+
+
+def test_plan_balances_synthetic_runtimes():
+    runtimes = {'ec2': 3000, 'iam': 1800, 's3': 1500, 'rds': 600, 'kms': 300, 'sns': 120, 'sqs': 100}
+    plan = plan_shards(runtimes, 3)
+    assert [p['index'] for p in plan] == [0, 1, 2]
+    assert plan[1]['services'] == ['ec2']
+    assert plan[2]['services'] == ['iam', 'kms', 'sns']
+    # shard 0 scans whatever the others don't list, here s3, rds and sqs
+    assert plan[0]['excluded_services'] == ['ec2', 'iam', 'kms', 'sns']
+    assert [p['weight'] for p in plan] == [2201, 3000, 2220]
+
+def test_plan_without_history_uses_default_weights():
+    plan = plan_shards({}, 4)
+    assert len(plan) == 4
+    assert plan[1]['services'] == ['ec2']
+    assert plan[0]['excluded_services'] == sorted(s for p in plan[1:] for s in p['services'])
+
+def test_plan_never_has_more_shards_than_services():
+    assert len(plan_shards({'ec2': 10}, 8)) == 2
+    assert len(plan_shards({'ec2': 10}, 1)) == 1
+
+def test_latest_service_runtimes(s3):
+    s3.objects.update({
+        'metrics/Acme-Corp-100.json': json.dumps({'services': {'ec2': 5}}).encode(),
+        'metrics/Acme-Corp-200.json': json.dumps({'services': {'ec2': 50, 'other': 9, 'iam': 0}}).encode(),
+        'metrics/Acme-Corp-200-shard1.json': json.dumps({'services': {'s3': 1}}).encode(),
+        'metrics/Acme-Corp-Two-300.json': json.dumps({'services': {'ec2': 1}}).encode()
+    })
+    # Every shard's services, from the latest scan only
+    assert latest_service_runtimes(s3, 'bucket', 'Acme Corp') == {'ec2': 50, 's3': 1}
+    assert latest_service_runtimes(s3, 'bucket', 'Other') == {}
+
+def test_second_sharded_scan_plans_from_every_shard(s3):
+    # The first scan has no history and plans on the default weights; each
+    # shard writes metrics for the services it ran, shard 0 for everything
+    # the others didn't list
+    first = plan_shards({}, 3)
+    listed = set(first[0]['excluded_services'])
+    runtimes = dict({s: 100 * w for s, w in DEFAULT_SERVICE_WEIGHTS.items()}, eks=100, guardduty=100)
+    for shard in first:
+        services = shard['services'] if shard['index'] else [s for s in runtimes if s not in listed]
+        suffix = f'-shard{shard["index"]}' if shard['index'] else ''
+        s3.objects[f'metrics/Acme-100{suffix}.json'] = json.dumps(
+            {'services': {s: runtimes[s] for s in services}}).encode()
+
+    assert latest_service_runtimes(s3, 'bucket', 'Acme') == runtimes
+    second = plan_shards(latest_service_runtimes(s3, 'bucket', 'Acme'), 3)
+    # The services the other shards ran stay on listed shards instead of
+    # all falling back onto shard 0
+    assert {'ec2', 'iam'} <= set(second[0]['excluded_services'])
+    assert second[0]['excluded_services'] == sorted(s for shard in second[1:] for s in shard['services'])
+
+def test_shard_arguments_drop_unknown_services():
+    available = {'ec2', 's3', 'iam'}
+    assert shard_arguments(['s3', 'gone'], available=available) == '--service s3'
+    assert shard_arguments(['gone'], available=available) == SKIP
+    assert shard_arguments(excluded=['iam', 'gone'], available=available) == '--excluded-service iam'
+    assert shard_arguments(excluded=[], available=available) == ''
+
+def test_wait_for_shards_stops_at_the_deadline():
+    store = MemoryJobStore()
+    create_job(store, 'A-1-shard1', now=0)
+    create_job(store, 'A-1-shard2', now=0)
+    update_phase(store, 'A-1-shard1', 'done', now=1)
+    clock = iter(range(0, 1000, 30))
+    sleeps = []
+    phases = wait_for_shards(store, ['A-1-shard1', 'A-1-shard2'], 100, clock=lambda: next(clock),
+                             sleep=sleeps.append)
+    assert phases == {'A-1-shard1': 'done', 'A-1-shard2': 'bootstrap'}
+    assert sleeps == [30, 30, 30]
+
+def test_merge_shards_skips_unfinished_shards(tmp_path, s3):
+    store = MemoryJobStore()
+    create_job(store, 'A-1', now=0)
+    for index in (1, 2, 3):
+        create_job(store, shard_job_id('A-1', index), now=0)
+    update_phase(store, 'A-1-shard1', 'done', now=1)
+    update_phase(store, 'A-1-shard2', 'failed', now=1)
+    update_phase(store, 'A-1-shard3', 'done', now=1)
+
+    def csv(rows):
+        path = tmp_path / 'shard.csv'
+        write_findings(str(path), HEADER, rows)
+        return path.read_bytes()
+    iam = ['f9', 'iam_root_mfa', 'us-east-1', 'arn:aws:iam::1:root', 'FAIL']
+    s3.objects.update({
+        'A-1/shards/1.csv': csv([['f1', 's3_a', 'us-east-1', 'arn:1', 'FAIL'], iam]),
+        'A-1/shards/3.csv': csv([['f3', 'rds_a', 'us-east-1', 'arn:3', 'PASS']])
+    })
+    current = tmp_path / 'A-1-shard0.csv'
+    write_findings(str(current), HEADER, [['f0', 'ec2_a', 'us-east-1', 'arn:0', 'FAIL'], iam])
+    out = str(tmp_path / 'A-1.csv')
+
+    summary = merge_shards(s3, store, 'bucket', 'A-1', 4, str(current), out, 0, str(tmp_path / 'work'),
+                           sleep=lambda s: None)
+
+    _, rows = read_findings(out)
+    assert [r[0] for r in rows] == ['f0', 'f9', 'f1', 'f3']
+    assert summary['shards_merged'] == [0, 1, 3] and summary['shards_missing'] == [2]
+    assert summary['duplicates'] == 1
+    assert store.get('A-1')['shards_missing'] == [2]
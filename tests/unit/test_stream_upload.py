@@ -0,0 +1,82 @@
+import csv
+import io
+import json
+
+from stream_upload import OutputStreamer, csv_record_ends
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def parts(s3):
+    manifest = json.loads(s3.objects['scan-1/manifest.json'])
+    return manifest, [s3.objects[p['key']].decode() for p in manifest['parts']]
+
+def test_csv_record_ends_respects_quotes():
+    data = b'a;b\n"x\ny";z\n"unterminated\n'
+    assert csv_record_ends(data) == [4, 12]
+
+def test_streams_only_new_complete_records(tmp_path, s3):
+    output = tmp_path / 'scan-1.csv'
+    output.write_bytes(b'CHECK_ID;STATUS\nc1;FAIL\nc2;PA')
+    streamer = OutputStreamer(s3, 'results', 'scan-1', [str(tmp_path / '*.csv')], clock=Clock())
+
+    assert len(streamer.poll()) == 1
+    with open(output, 'ab') as f:
+        f.write(b'SS\n"c3\nmultiline";FAIL\n')
+    assert len(streamer.poll()) == 1
+    assert streamer.poll() == []
+
+    manifest, bodies = parts(s3)
+    assert bodies[0] == 'CHECK_ID;STATUS\nc1;FAIL\n'
+    assert bodies[1] == 'CHECK_ID;STATUS\nc2;PASS\n"c3\nmultiline";FAIL\n'
+    assert [p['records'] for p in manifest['parts']] == [1, 2]
+    assert manifest['complete'] is False
+
+    # Every part is a standalone CSV and together they hold every row
+    rows = [r for body in bodies for r in list(csv.reader(io.StringIO(body), delimiter=';'))[1:]]
+    assert rows == [['c1', 'FAIL'], ['c2', 'PASS'], ['c3\nmultiline', 'FAIL']]
+
+def test_header_only_file_uploads_nothing(tmp_path, s3):
+    (tmp_path / 'scan-1.csv').write_bytes(b'CHECK_ID;STATUS\n')
+    streamer = OutputStreamer(s3, 'results', 'scan-1', [str(tmp_path / '*.csv')])
+    assert streamer.poll() == []
+    assert s3.objects == {}
+
+def test_logs_stream_by_line_and_finalize_marks_complete(tmp_path, s3):
+    log = tmp_path / 'scan-1.log'
+    log.write_text('line 1\nline 2\npartial')
+    streamer = OutputStreamer(s3, 'results', 'scan-1', [str(log)])
+    streamer.poll()
+    log.write_text('line 1\nline 2\npartial line 3\n')
+    manifest = streamer.finalize()
+
+    assert manifest['complete'] is True
+    _, bodies = parts(s3)
+    assert bodies == ['line 1\nline 2\n', 'partial line 3\n']
+    assert manifest['parts'][0]['key'] == 'scan-1/parts/00000-scan-1.log'
+
+def test_multiple_sources_and_resume_from_state(tmp_path, s3):
+    state = str(tmp_path / 'state.json')
+    east = tmp_path / 'scan-1-us-east-1.csv'
+    east.write_bytes(b'CHECK_ID\nc1\n')
+    pattern = str(tmp_path / 'scan-1-*.csv')
+    OutputStreamer(s3, 'results', 'scan-1', [pattern], state_path=state).poll()
+
+    # A restarted streamer picks up where the previous one stopped
+    west = tmp_path / 'scan-1-us-west-2.csv'
+    west.write_bytes(b'CHECK_ID\nc2\n')
+    with open(east, 'ab') as f:
+        f.write(b'c3\n')
+    OutputStreamer(s3, 'results', 'scan-1', [pattern], state_path=state).finalize()
+
+    manifest, bodies = parts(s3)
+    assert bodies == ['CHECK_ID\nc1\n', 'CHECK_ID\nc3\n', 'CHECK_ID\nc2\n']
+    assert [p['source'] for p in manifest['parts']] == [
+        'scan-1-us-east-1.csv', 'scan-1-us-east-1.csv', 'scan-1-us-west-2.csv'
+    ]
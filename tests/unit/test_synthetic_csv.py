@@ -0,0 +1,52 @@
+from findings import read_findings
+from merge_csv import merge_findings
+from synthetic_csv import HEADER, TARGET_CHECK, generate_corpus, generate_history, regional_files, write_scan
+from trends import diff_scans
+
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_same_arguments_write_the_same_bytes(tmp_path):
+    first, second, other = (str(tmp_path / name) for name in ('a.csv', 'b.csv', 'c.csv'))
+    assert write_scan(first, '111111111111', 500) == 500
+    write_scan(second, '111111111111', 500)
+    write_scan(other, '111111111111', 500, seed=1)
+    assert read_bytes(first) == read_bytes(second)
+    assert read_bytes(first) != read_bytes(other)
+
+def test_successive_scans_drift(tmp_path):
+    (_, previous), (object_key, current) = generate_history(str(tmp_path), 'Acme Corp', '111111111111', 2000, 2)
+    assert object_key == 'Acme-Corp-1721246274'
+    header, rows = read_findings(current)
+    assert header == HEADER
+    assert {row[header.index('ACCOUNT_UID')] for row in rows} == {'111111111111'}
+
+    counts = diff_scans(previous, current)
+    new, resolved, persisting = (sum(counts[c].values()) for c in ('new', 'resolved', 'persisting'))
+    assert 0 < new < persisting / 10
+    assert 0 < resolved < persisting / 10
+
+def test_regional_files_merge_back_to_the_scan(tmp_path):
+    path = str(tmp_path / 'Acme-1721159874.csv')
+    write_scan(path, '111111111111', 1000)
+    regional = tmp_path / 'regional'
+    regional.mkdir()
+    parts = regional_files(path, str(regional))
+    assert len(parts) == 8
+
+    stats = merge_findings(parts, str(tmp_path / 'merged.csv'))
+    assert stats['rows_out'] == 1000
+    assert stats['duplicates'] > 0
+    _, merged = read_findings(str(tmp_path / 'merged.csv'))
+    _, original = read_findings(path)
+    assert sorted(merged) == sorted(original)
+
+def test_corpus_spreads_rows_over_accounts(tmp_path):
+    paths = generate_corpus(str(tmp_path), 600, 3)
+    assert [key for key, _ in paths] == ['customer0-1721159874', 'customer1-1721246274', 'customer2-1721332674']
+    header, rows = read_findings(paths[0][1])
+    assert len(rows) == 200
+    assert TARGET_CHECK in {row[header.index('CHECK_ID')] for _, p in paths for row in read_findings(p)[1]}
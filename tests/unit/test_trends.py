@@ -0,0 +1,128 @@
+import json
+import time
+
+from findings import read_findings, write_findings
+from trends import CHANGE_HEADER, compare, diff_scans, list_scans, report
+
+
+HEADER = ['FINDING_UID', 'CHECK_ID', 'SERVICE_NAME', 'STATUS', 'SEVERITY', 'RESOURCE_UID', 'REGION']
+
+
+def finding(check, resource, status, severity='high', region='us-east-1'):
+    return [f'{check}-{resource}', check, check.split('_')[0], status, severity, resource, region]
+
+
+def write(tmp_path, name, rows, header=HEADER):
+    path = str(tmp_path / name)
+    write_findings(path, header, rows)
+    return path
+
+
+def test_diff_classifies_failed_findings(tmp_path):
+    previous = write(tmp_path, 'a.csv', [
+        finding('iam_mfa', 'root', 'FAIL', 'critical'),
+        finding('s3_public', 'bucket-a', 'FAIL'),
+        finding('s3_public', 'bucket-b', 'FAIL'),
+        finding('ec2_ssh', 'sg-1', 'PASS', 'medium'),
+    ])
+    current = write(tmp_path, 'b.csv', [
+        finding('iam_mfa', 'root', 'FAIL', 'Critical'),
+        finding('s3_public', 'bucket-a', 'PASS'),
+        finding('ec2_ssh', 'sg-1', 'FAIL', 'medium'),
+        finding('ec2_ssh', 'sg-1', 'FAIL', 'medium', 'eu-west-1'),
+    ])
+    changes = []
+
+    counts = diff_scans(previous, current, lambda *c: changes.append(c))
+
+    assert counts == {
+        'new': {'medium': 2},
+        'resolved': {'high': 2},
+        'persisting': {'critical': 1},
+    }
+    assert ('resolved', ('s3_public', 'us-east-1', 'bucket-b'), 'high', 's3') in changes
+
+
+def test_header_order_does_not_matter(tmp_path):
+    previous = write(tmp_path, 'a.csv', [finding('iam_mfa', 'root', 'FAIL')])
+    reordered = list(reversed(HEADER))
+    current = write(tmp_path, 'b.csv', [list(reversed(finding('iam_mfa', 'root', 'FAIL')))], reordered)
+
+    assert diff_scans(previous, current)['persisting'] == {'high': 1}
+
+
+def test_compare_trend_and_changes_file(tmp_path):
+    scans = [
+        ('acme-1', write(tmp_path, '1.csv', [finding('iam_mfa', 'root', 'FAIL', 'critical')])),
+        ('acme-2', write(tmp_path, '2.csv', [finding('iam_mfa', 'root', 'FAIL', 'critical'),
+                                             finding('s3_public', 'b', 'FAIL', 'low')])),
+        ('acme-3', write(tmp_path, '3.csv', [finding('s3_public', 'b', 'FAIL', 'low'),
+                                             finding('s3_public', 'c', 'FAIL', 'high')])),
+    ]
+    changes_path = str(tmp_path / 'changes.csv')
+
+    summary = compare(scans, changes_path)
+
+    assert summary['current'] == 'acme-3'
+    assert summary['previous'] == 'acme-2'
+    assert summary['totals'] == {'new': 1, 'resolved': 1, 'persisting': 1}
+    assert [(t['scan'], t['failed']) for t in summary['trend']] == [('acme-1', 1), ('acme-2', 2), ('acme-3', 2)]
+    assert list(summary['trend'][2]['severity']) == ['high', 'low']
+    header, rows = read_findings(changes_path)
+    assert header == CHANGE_HEADER
+    assert sorted(r[0] for r in rows) == ['new', 'persisting', 'resolved']
+
+
+def test_first_scan_is_all_new(tmp_path):
+    summary = compare([('acme-1', write(tmp_path, '1.csv', [finding('iam_mfa', 'root', 'FAIL')]))])
+
+    assert summary['previous'] is None
+    assert summary['totals'] == {'new': 1, 'resolved': 0, 'persisting': 0}
+
+
+def csv_bytes(tmp_path, rows):
+    with open(write(tmp_path, 'tmp.csv', rows), 'rb') as f:
+        return f.read()
+
+
+def test_list_scans_matches_only_this_customer(tmp_path, s3):
+    s3.objects.update({
+        'Acme-100.csv': b'', 'Acme-300.csv': b'', 'artifacts/Acme-200.json': b'', 'Acme-Corp-400.csv': b'',
+        'Acme-100-trend.json': b'', 'Acme-100.zip': b''
+    })
+
+    assert list_scans(s3, 'results', 'Acme') == [(100, 'Acme-100.csv'), (200, 'artifacts/Acme-200.json'),
+                                                 (300, 'Acme-300.csv')]
+
+
+def test_report_uploads_summary_next_to_the_scan(tmp_path, s3):
+    s3.objects.update({
+        'Acme-Corp-100.csv': csv_bytes(tmp_path, [finding('iam_mfa', 'root', 'FAIL')]),
+        'Acme-Corp-900.csv': b'later scan, ignored',
+    })
+    current = write(tmp_path, 'current.csv', [finding('s3_public', 'b', 'FAIL')])
+
+    summary = report(s3, 'results', 'Acme Corp', 'Acme-Corp-500', current, workdir=str(tmp_path / 'work'))
+
+    assert summary['previous'] == 'Acme-Corp-100'
+    assert json.loads(s3.objects['Acme-Corp-500-trend.json']) == summary
+    assert b'resolved;iam_mfa;us-east-1;root' in s3.objects['Acme-Corp-500-changes.csv']
+
+
+def test_diff_of_two_200k_row_scans(tmp_path):
+    rows = 200000
+    previous = [finding(f'check_{i % 300}', f'arn:aws:s3:::bucket-{i}', 'FAIL' if i % 3 else 'PASS',
+                        ('critical', 'high', 'medium', 'low')[i % 4]) for i in range(rows)]
+    # shift by 10% so a slice is resolved, a slice is new and the rest persists
+    current = [finding(f'check_{i % 300}', f'arn:aws:s3:::bucket-{i}', 'FAIL' if i % 3 else 'PASS',
+                       ('critical', 'high', 'medium', 'low')[i % 4]) for i in range(rows // 10, rows + rows // 10)]
+    previous_path = write(tmp_path, 'previous.csv', previous)
+    current_path = write(tmp_path, 'current.csv', current)
+
+    start = time.perf_counter()
+    counts = diff_scans(previous_path, current_path)
+    elapsed = time.perf_counter() - start
+
+    totals = {change: sum(c.values()) for change, c in counts.items()}
+    assert totals == {'new': 13333, 'resolved': 13333, 'persisting': 120000}
+    assert elapsed < 10
@@ -0,0 +1,82 @@
+import gzip
+import json
+
+from findings import write_findings
+from ui_data import compile_file, compile_scan, read_data_file, summarize, write_data_file
+
+
+HEADER = ['FINDING_UID', 'ACCOUNT_UID', 'REGION', 'CHECK_ID', 'CHECK_TITLE', 'SERVICE_NAME', 'STATUS',
+          'STATUS_EXTENDED', 'SEVERITY', 'RESOURCE_UID', 'DESCRIPTION', 'UNUSED']
+DESCRIPTION = 'Ensure MFA is enabled for the root account. ' * 10
+
+
+def finding(uid, check, service, status, severity, region='us-east-1'):
+    return [uid, '111111111111', region, check, f'Title {check}', service, status, f'{uid}; "quoted"\nnext line',
+            severity, f'arn:aws:{service}::{uid}', DESCRIPTION, 'dropped']
+
+
+ROWS = [
+    finding('f1', 'iam_root_mfa', 'iam', 'FAIL', 'critical'),
+    finding('f2', 'iam_root_mfa', 'iam', 'PASS', 'critical', 'us-west-2'),
+    finding('f3', 's3_public', 's3', 'FAIL', 'High'),
+    finding('f4', 'ec2_ssh', 'ec2', 'MANUAL', 'low'),
+]
+
+
+def test_findings_are_rows_keyed_by_column():
+    findings = compile_scan(HEADER, ROWS)
+
+    assert len(findings) == 4
+    assert list(findings[0]) == HEADER
+    assert findings[0]['STATUS_EXTENDED'] == 'f1; "quoted"\nnext line'
+    assert findings[2]['SEVERITY'] == 'High'
+    assert findings[3]['UNUSED'] == 'dropped'
+
+
+def test_short_rows_read_as_empty_strings():
+    findings = compile_scan(HEADER, [ROWS[0][:4]])
+
+    assert findings[0]['CHECK_ID'] == 'iam_root_mfa'
+    assert findings[0]['DESCRIPTION'] == ''
+
+
+def test_summary_counts():
+    summary = summarize(HEADER, ROWS)
+
+    assert summary['total'] == 4
+    assert summary['status'] == {'FAIL': 2, 'MANUAL': 1, 'PASS': 1}
+    assert list(summary['severity']) == ['critical', 'high', 'low']
+    assert summary['severity']['critical'] == {'FAIL': 1, 'PASS': 1}
+    assert summary['service']['iam'] == {'FAIL': 1, 'PASS': 1}
+
+
+def test_data_file_is_gzipped_json_and_reproducible(tmp_path):
+    data = compile_scan(HEADER, ROWS)
+    first, second = tmp_path / 'a.json.gz', tmp_path / 'b.json.gz'
+    write_data_file(str(first), data)
+    write_data_file(str(second), data)
+
+    assert first.read_bytes() == second.read_bytes()
+    assert json.loads(gzip.decompress(first.read_bytes())) == data
+
+
+def test_compile_file_is_smaller_than_the_csv(tmp_path):
+    csv_path = tmp_path / 'scan.csv'
+    rows = [finding(f'f{i}', f'check_{i % 20}', 'iam', 'FAIL', 'high') for i in range(500)]
+    write_findings(str(csv_path), HEADER, rows)
+    out = tmp_path / 'scan.json.gz'
+
+    summary = compile_file(str(csv_path), str(out))
+
+    assert summary['total'] == 500
+    assert len(read_data_file(str(out))) == 500
+    assert out.stat().st_size < csv_path.stat().st_size / 10
+
+
+def test_empty_scan(tmp_path):
+    csv_path = tmp_path / 'empty.csv'
+    csv_path.write_text('')
+    out = tmp_path / 'empty.json.gz'
+
+    assert compile_file(str(csv_path), str(out))['total'] == 0
+    assert read_data_file(str(out)) == []
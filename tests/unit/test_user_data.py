@@ -0,0 +1,298 @@
+from user_data import (
+    BAKED_MARKER, prowler_options, render_bake_script, render_packed_user_data, render_shard_user_data,
+    render_user_data
+)
+
+
+def render(baked):
+    return render_user_data(
+        aws_region='us-west-2',
+        bucket_name='results-bucket',
+        object_key='AcmeCorp-1721159874',
+        scan_name='AcmeCorp',
+        role_arn='arn:aws:iam::111111111111:role/CrossAccountRole',
+        external_id='abc12345',
+        team_name='Mission',
+        prowler_version='4.2.4',
+        webhook_url='https://hooks.example.com/x',
+        baked=baked
+    )
+
+def test_legacy_user_data_installs_tools():
+    script = render(baked=False)
+    assert script.startswith('#!/bin/bash\nset -xe\n')
+    assert 'apt install -y python3-venv zip' in script
+    assert 'git checkout 4.2.4' in script
+    assert 'npm install' in script
+    assert BAKED_MARKER not in script
+
+def test_baked_user_data_skips_installs():
+    script = render(baked=True)
+    assert script.startswith('#!/bin/bash\nset -xe\n')
+    assert 'apt ' not in script
+    assert 'pip install' not in script
+    assert 'git clone' not in script
+    assert 'npm install' not in script
+    assert f'grep -qx "4.2.4" {BAKED_MARKER}' in script
+
+def test_both_paths_run_scan_and_upload():
+    for baked in (False, True):
+        script = render(baked)
+        assert '--role arn:aws:iam::111111111111:role/CrossAccountRole' in script
+        assert '--external-id abc12345' in script
+        assert '--output-filename AcmeCorp-1721159874' in script
+        assert 'npm run build' in script
+        assert 'aws s3 cp AcmeCorp-1721159874.zip s3://results-bucket/' in script
+        assert 'trap cleanup EXIT' in script
+
+def test_watchdog_replaces_the_idle_sleep():
+    script = render_user_data(
+        aws_region='us-west-2', bucket_name='results-bucket', object_key='AcmeCorp-1721159874', scan_name='AcmeCorp',
+        role_arn='arn:aws:iam::111111111111:role/CrossAccountRole', external_id='abc12345', team_name='Mission',
+        prowler_version='4.2.4', phase_budgets={'scanning': 7200}, stall_timeout=900
+    )
+    assert 'sleep 300' not in script
+    assert script.rstrip().endswith('bash /opt/shutdown.sh')
+    assert '--jobs AcmeCorp-1721159874 --budgets scanning=7200 --stall-timeout 900' in script
+    # started once the tooling it runs from is fetched
+    assert script.index('tooling/instance_watchdog.py') > script.index('s3://results-bucket/tooling/')
+    assert 'echo "$(date +%s) $1 ${2:-AcmeCorp-1721159874}" >> /opt/phases.log' in script
+
+def test_bake_script_installs_and_powers_off():
+    script = render_bake_script('4.2.4')
+    assert 'pip install .' in script
+    assert 'npm install' in script
+    assert f'echo 4.2.4 > {BAKED_MARKER}' in script
+    assert script.rstrip().endswith('shutdown -h now')
+    assert 'prowler.py aws' not in script
+
+def test_packed_user_data_queues_every_target():
+    targets = [
+        {'object_key': f'Acct{i}-1721159874', 'scan_name': f'Acct {i}', 'external_id': 'abc12345',
+         'role_arn': f'arn:aws:iam::11111111111{i}:role/CrossAccountRole'}
+        for i in range(3)
+    ]
+    script = render_packed_user_data(
+        aws_region='us-west-2',
+        bucket_name='results-bucket',
+        batch_key='batch-1721159874-0',
+        targets=targets,
+        concurrency=2,
+        team_name='Mission',
+        prowler_version='4.2.4'
+    )
+    assert script.count('prowler.py aws') == 1
+    assert script.count('npm install') == 1
+    assert 'xargs -P 2 -L 1' in script
+    assert 'Acct1-1721159874 arn:aws:iam::111111111111:role/CrossAccountRole abc12345 "Acct 1"' in script
+    assert 'flock 9' in script
+    assert 's3://results-bucket/batch-1721159874-0-$INSTANCE_ID.log' in script
+    assert '--jobs Acct0-1721159874,Acct1-1721159874,Acct2-1721159874' in script
+
+def test_region_parallel_scan_merges_outputs():
+    script = render_user_data(
+        aws_region='us-west-2',
+        bucket_name='results-bucket',
+        object_key='AcmeCorp-1721159874',
+        scan_name='AcmeCorp',
+        role_arn='arn:aws:iam::111111111111:role/CrossAccountRole',
+        external_id='abc12345',
+        team_name='Mission',
+        prowler_version='4.2.4',
+        region_parallelism=6
+    )
+    assert 'aws s3 cp --recursive --quiet s3://results-bucket/tooling/ /opt/tooling/' in script
+    assert 'aws ec2 describe-regions --region us-west-2' in script
+    assert 'xargs -P 6 -I{} python3 prowler.py aws' in script
+    assert '--output-filename AcmeCorp-1721159874-{}' in script
+    assert '--region {} < /opt/regions.txt' in script
+    assert 'merge_csv.py output/AcmeCorp-1721159874.csv output/AcmeCorp-1721159874-*.csv' in script
+
+def test_region_filter_without_parallelism():
+    script = render_user_data(
+        aws_region='us-west-2',
+        bucket_name='results-bucket',
+        object_key='AcmeCorp-1721159874',
+        scan_name='AcmeCorp',
+        role_arn='arn:aws:iam::111111111111:role/CrossAccountRole',
+        external_id='abc12345',
+        team_name='Mission',
+        prowler_version='4.2.4',
+        regions=['us-east-1', 'eu-west-1']
+    )
+    assert '--region us-east-1 eu-west-1' in script
+    assert 'xargs' not in script
+
+def test_output_is_streamed_during_the_scan():
+    script = render(baked=False)
+    start = script.index('stream_upload.py --bucket results-bucket --object-key AcmeCorp-1721159874')
+    scan = script.index('python3 prowler.py aws')
+    finish = script.index('--finalize')
+    assert start < scan < finish
+    assert "'/opt/prowler/output/AcmeCorp-1721159874.csv' '/opt/AcmeCorp-1721159874.log' &" in script
+
+def test_delta_scan_only_rescans_planned_services():
+    script = render_user_data(
+        aws_region='us-west-2',
+        bucket_name='results-bucket',
+        object_key='AcmeCorp-1721159874',
+        scan_name='AcmeCorp',
+        role_arn='arn:aws:iam::111111111111:role/CrossAccountRole',
+        external_id='abc12345',
+        team_name='Mission',
+        prowler_version='4.2.4',
+        previous_key='AcmeCorp-1720000000.csv'
+    )
+    assert 'aws s3 cp s3://results-bucket/AcmeCorp-1720000000.csv /opt/previous.csv' in script
+    plan = script.index('delta.py plan')
+    guard = script.index('if [[ -s /opt/services.txt ]]; then')
+    scan = script.index('--service $(cat /opt/services.txt)')
+    merge = script.index('delta.py merge')
+    skip = script.index('cp /opt/previous.csv /opt/AcmeCorp-1721159874.csv')
+    assert plan < guard < scan < merge < skip
+    assert 'delta.py' not in render(baked=False)
+
+    previous = script.index('aws s3 cp s3://results-bucket/inventory/AcmeCorp-1720000000.json '
+                            '/opt/previous-inventory.json')
+    save = script.index('aws s3 cp /opt/inventory.json s3://results-bucket/inventory/AcmeCorp-1721159874.json')
+    assert previous < plan < save
+    assert '--previous-inventory /opt/previous-inventory.json --inventory-out /opt/inventory.json' in script
+    assert '--prowler-dir /opt/prowler' in script[plan:guard]
+
+def test_findings_are_added_to_the_parquet_store():
+    script = render(baked=False)
+    assert 'pip install pyarrow' in script
+    convert = script.index('columnar.py convert --csv /opt/AcmeCorp-1721159874.csv --scan-id AcmeCorp-1721159874')
+    assert script.index('aws s3 cp /opt/AcmeCorp-1721159874.csv') < convert < script.index('phase done')
+    assert 's3://results-bucket/findings/' in script
+
+def test_shared_ui_bundle_skips_the_per_scan_build():
+    script = render_user_data(
+        aws_region='us-west-2', bucket_name='results-bucket', object_key='AcmeCorp-1721159874',
+        scan_name='AcmeCorp', role_arn='arn:aws:iam::111111111111:role/CrossAccountRole', external_id='abc12345',
+        team_name='Mission', prowler_version='4.2.4', ui_version='v1.2.0'
+    )
+    assert 'npm' not in script
+    assert 'nodejs' not in script
+    assert 'zip -qr' not in script
+    assert 'ui_data.py --csv /opt/AcmeCorp-1721159874.csv' in script
+    assert 's3://results-bucket/ui-data/AcmeCorp-1721159874.json' in script
+    assert '--content-encoding gzip' in script
+    assert ('https://results-bucket.s3.us-west-2.amazonaws.com/ui/v1.2.0/index.html?scan=AcmeCorp-1721159874'
+            in script)
+
+def test_packed_shared_ui_bundle_needs_no_lock():
+    script = render_packed_user_data(
+        aws_region='us-west-2', bucket_name='results-bucket', batch_key='batch-1-0',
+        targets=[{'object_key': 'A-1', 'role_arn': 'arn:aws:iam::111111111111:role/R', 'external_id': 'abc12345',
+                  'scan_name': 'A'}],
+        concurrency=2, team_name='Mission', prowler_version='4.2.4', ui_version='v1.2.0'
+    )
+    assert 'flock' not in script
+    assert 'npm' not in script
+    assert 'ui_data.py --csv /opt/$OBJECT_KEY.csv --out /opt/$OBJECT_KEY.json.gz' in script
+
+def test_artifact_store_packs_instead_of_zipping():
+    script = render_user_data(
+        aws_region='us-west-2', bucket_name='results-bucket', object_key='AcmeCorp-1721159874',
+        scan_name='AcmeCorp', role_arn='arn:aws:iam::111111111111:role/CrossAccountRole', external_id='abc12345',
+        team_name='Mission', prowler_version='4.2.4', artifact_store=True,
+        previous_key='artifacts/AcmeCorp-1720000000.json'
+    )
+    assert 'zip -qr' not in script
+    assert ('artifacts.py pack --bucket results-bucket --object-key AcmeCorp-1721159874 --site build'
+            in script)
+    assert 'aws s3 presign' not in script
+    assert '--append --bucket results-bucket --object-key AcmeCorp-1721159874' in script
+    assert ('artifacts.py fetch --bucket results-bucket --object-key AcmeCorp-1720000000 '
+            '--path AcmeCorp-1720000000.csv --out /opt/previous.csv') in script
+
+def test_artifact_store_webhook_links_a_downloadable_zip():
+    script = render_user_data(
+        aws_region='us-west-2', bucket_name='results-bucket', object_key='AcmeCorp-1721159874',
+        scan_name='AcmeCorp', role_arn='arn:aws:iam::111111111111:role/CrossAccountRole', external_id='abc12345',
+        team_name='Mission', prowler_version='4.2.4', artifact_store=True, webhook_url='https://hooks.example.com/x'
+    )
+    pack = script.index('artifacts.py pack --bucket results-bucket --object-key AcmeCorp-1721159874 --site build')
+    assert pack < script.index('zip -qr AcmeCorp-1721159874.zip AcmeCorp-1721159874')
+    assert ('aws s3 presign s3://results-bucket/AcmeCorp-1721159874.zip --expires-in 604800 '
+            '> /opt/AcmeCorp-1721159874.url') in script
+    assert 'presign s3://results-bucket/artifacts/' not in script
+    assert '--object zip=AcmeCorp-1721159874.zip' in script
+
+def test_trend_report_runs_after_upload():
+    script = render(baked=True)
+    trend = script.index('trends.py report --bucket results-bucket --scan-name "AcmeCorp" --object-key AcmeCorp-1721159874')
+    assert script.index('aws s3 cp /opt/AcmeCorp-1721159874.csv') < trend < script.index('phase done')
+
+def test_prowler_options():
+    assert prowler_options() == ['--severity critical high medium', '--output-formats csv']
+    assert prowler_options(['critical'], ['cis_2.0_aws', 'soc2_aws'], ['csv', 'html']) == [
+        '--severity critical', '--compliance cis_2.0_aws soc2_aws', '--output-formats csv html'
+    ]
+
+def test_frameworks_and_formats_share_one_prowler_run():
+    script = render_user_data(
+        aws_region='us-west-2', bucket_name='results-bucket', object_key='AcmeCorp-1721159874',
+        scan_name='AcmeCorp', role_arn='arn:aws:iam::111111111111:role/CrossAccountRole', external_id='abc12345',
+        team_name='Mission', prowler_version='4.2.4', severities=['critical', 'high'],
+        compliance=['cis_2.0_aws', 'soc2_aws'], output_formats=['csv', 'json-ocsf']
+    )
+    assert script.count('python3 prowler.py aws') == 1
+    assert '    --severity critical high \\\n    --compliance cis_2.0_aws soc2_aws \\\n' in script
+    assert '--output-formats csv json-ocsf' in script
+    assert 'output/compliance/AcmeCorp-1721159874_*' in script
+    assert 's3://results-bucket/reports/AcmeCorp-1721159874/' in script
+
+def test_csv_only_scans_skip_the_reports_upload():
+    assert 'reports/' not in render(baked=True)
+
+def test_steps_are_marked_and_metrics_recorded():
+    script = render(baked=False)
+    steps = [line.split()[1] for line in script.splitlines() if line.startswith('step ')]
+    assert steps == ['system_install', 'prowler_install', 'tooling', 'scan', 'ui_install', 'ui_build', 'upload',
+                     'trends', 'columnar', 'catalog']
+    assert "scan_metrics.py build --bucket results-bucket --object-key AcmeCorp-1721159874 --steps /opt/steps.log" in script
+    assert '--log-group' not in script
+    assert script.index('scan_metrics.py build') > script.index('phase done')
+
+def test_sharded_scan_merges_the_other_shards():
+    settings = dict(
+        aws_region='us-west-2', bucket_name='results-bucket', object_key='AcmeCorp-1721159874',
+        role_arn='arn:aws:iam::111111111111:role/CrossAccountRole', external_id='abc12345', team_name='Mission',
+        prowler_version='4.2.4'
+    )
+    script = render_user_data(scan_name='AcmeCorp', shard={'index': 0, 'excluded_services': ['ec2', 'iam']},
+                              shard_count=3, **settings)
+    args = script.index('shards.py args --excluded ec2 iam')
+    scan = script.index('$(cat /opt/shard-args.txt)')
+    merge = script.index('shards.py merge --bucket results-bucket --object-key AcmeCorp-1721159874 --shards 3')
+    assert args < scan < script.index('phase merging') < merge < script.index('npm run build')
+
+    shard = render_shard_user_data(shard={'index': 1, 'services': ['ec2']}, **settings)
+    assert 'shards.py args --services ec2' in shard
+    assert '--output-filename AcmeCorp-1721159874-shard1' in shard
+    assert 'aws s3 cp /opt/AcmeCorp-1721159874-shard1.csv s3://results-bucket/AcmeCorp-1721159874/shards/1.csv' in shard
+    assert 'npm' not in shard and 'trends.py' not in shard
+    assert shard.rstrip().endswith('bash /opt/shutdown.sh')
+
+def test_broker_shares_one_session_with_every_prowler_run():
+    script = render_user_data(
+        aws_region='us-west-2', bucket_name='results-bucket', object_key='AcmeCorp-1721159874', scan_name='AcmeCorp',
+        role_arn='arn:aws:iam::111111111111:role/CrossAccountRole', external_id='abc12345', team_name='Mission',
+        prowler_version='4.2.4', region_parallelism=4, previous_key='AcmeCorp-1720000000.csv', broker=True
+    )
+    serve = script.index('credential_broker.py serve --role-arn arn:aws:iam::111111111111:role/CrossAccountRole')
+    assert serve < script.index('credential_broker.py process --wait 120') < script.index('delta.py plan')
+    assert 'credential_process = python3 /opt/tooling/credential_broker.py process' in script
+    assert ('AWS_CONTAINER_CREDENTIALS_FULL_URI=http://127.0.0.1:8297/credentials '
+            'AWS_CONTAINER_AUTHORIZATION_TOKEN=$(cat /opt/broker.token) xargs -P 4') in script
+    assert '--role ' not in script and '--session-duration' not in script
+
+def test_scans_are_cataloged_before_done():
+    script = render(baked=True)
+    add = script.index('catalog.py add --bucket results-bucket --object-key AcmeCorp-1721159874 --scan-name "AcmeCorp"')
+    assert script.index('columnar.py convert') < add < script.index('phase done')
+    assert '--object output=AcmeCorp-1721159874.zip --object csv=AcmeCorp-1721159874.csv' in script
+    assert '--object reports=' not in script
+    assert '--started "$(head -n 1 /opt/phases.log | cut -d \' \' -f 1)"' in script
@@ -0,0 +1,250 @@
+import json
+import threading
+import time
+from functools import partial
+
+import pytest
+
+pytest.importorskip('boto3')
+
+import worker  # noqa: E402
+
+
+@pytest.fixture
+def created(monkeypatch):
+    calls = []
+
+    def create_client(service):
+        time.sleep(0.01)
+        calls.append(service)
+        return object()
+    monkeypatch.setattr(worker, 'create_client', create_client)
+    monkeypatch.setattr(worker, 'clients', {})
+    return calls
+
+
+def test_import_builds_no_clients():
+    assert not hasattr(worker, 'ec2_client')
+    assert not hasattr(worker, 'job_store')
+
+
+def test_clients_are_created_once_and_reused(created):
+    s3 = worker.get_client('s3')
+
+    assert worker.get_client('s3') is s3
+    assert created == ['s3']
+
+
+def test_concurrent_first_use_builds_one_client(created):
+    threads = [threading.Thread(target=worker.get_client, args=('ec2',)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert created == ['ec2']
+
+
+def test_status_only_needs_s3(created):
+    worker.get_status({'queryStringParameters': {'job': 'AcmeCorp-1721159874'}}, None)
+
+    assert created == ['s3']
+
+
+def test_queued_launch_records_the_job_and_builds_no_ec2_client(created, monkeypatch):
+    from dispatcher import MemoryQueue
+    from jobs import MemoryJobStore
+    store, queue = MemoryJobStore(), MemoryQueue()
+    monkeypatch.setattr(worker, 'launch_queue_url', 'https://sqs/launch')
+    monkeypatch.setattr(worker, 'get_job_store', lambda: store)
+    monkeypatch.setattr(worker, 'get_launch_queue', lambda: queue)
+
+    response = worker.run_scan({'queryStringParameters': {
+        'role_arn': 'arn:aws:iam::111111111111:role/CrossAccountRole',
+        'external_id': 'abc123',
+        'scan_name': 'AcmeCorp'
+    }}, None)
+
+    assert response['statusCode'] == 202
+    job_id = json.loads(response['body'])['job_id']
+    assert store.get(job_id)['phase'] == 'queued'
+    message = json.loads(queue.receive()[0]['body'])
+    assert message['job_id'] == job_id and message['options']['severities']
+    assert created == []
+
+def test_sharded_launch_starts_one_instance_per_shard(monkeypatch):
+    from jobs import MemoryJobStore
+    store, launched = MemoryJobStore(), []
+
+    def run_scanner_instance(image_id, instance_types, user_data, name, ts):
+        launched.append((name, user_data))
+        instance = {'InstanceId': f'i-{len(launched)}', 'InstanceType': 't3.medium', 'SubnetId': 'subnet-1',
+                    'VpcId': 'vpc-1', 'PrivateIpAddress': '10.0.0.1'}
+        return instance, 'on-demand', []
+    monkeypatch.setattr(worker, 'get_job_store', lambda: store)
+    monkeypatch.setattr(worker, 'get_client', lambda service: None)
+    monkeypatch.setattr(worker, 'get_scanner_image', lambda: ('ami-1', True))
+    monkeypatch.setattr(worker, 'latest_service_runtimes', lambda s3, bucket, scan_name: {})
+    monkeypatch.setattr(worker, 'load_size_hint', lambda s3, bucket, scan_name: None)
+    monkeypatch.setattr(worker, 'run_scanner_instance', run_scanner_instance)
+
+    options = worker.target_options({'shards': '3', 'delta': 'true'})
+    response = worker.launch_scan('arn:aws:iam::111111111111:role/CrossAccountRole', 'abc123', 'Acme', '100',
+                                  options)
+
+    assert sorted(name for name, _ in launched) == ['Acme', 'Acme-shard1', 'Acme-shard2']
+    assert launched[-1][0] == 'Acme' and '--shards 3' in launched[-1][1]
+    assert [s['job_id'] for s in response['shards']] == ['Acme-100-shard1', 'Acme-100-shard2']
+    assert response['delta_from'] is None
+    assert store.get('Acme-100-shard1')['shard_of'] == 'Acme-100'
+    assert 'scan_name' not in store.get('Acme-100-shard1')
+    assert len(store.get('Acme-100')['shards']) == 2
+
+def test_failed_shard_launch_fails_every_record(monkeypatch):
+    from jobs import MemoryJobStore
+    store, terminated = MemoryJobStore(), []
+
+    class Ec2:
+        def terminate_instances(self, InstanceIds):
+            terminated.extend(InstanceIds)
+
+    def run_scanner_instance(image_id, instance_types, user_data, name, ts):
+        if name == 'Acme-shard2':
+            raise RuntimeError('No capacity')
+        instance = {'InstanceId': f'i-{name}', 'InstanceType': 't3.medium', 'SubnetId': 'subnet-1',
+                    'VpcId': 'vpc-1', 'PrivateIpAddress': '10.0.0.1'}
+        return instance, 'on-demand', []
+    monkeypatch.setattr(worker, 'get_job_store', lambda: store)
+    monkeypatch.setattr(worker, 'get_client', lambda service: Ec2())
+    monkeypatch.setattr(worker, 'get_scanner_image', lambda: ('ami-1', True))
+    monkeypatch.setattr(worker, 'latest_service_runtimes', lambda s3, bucket, scan_name: {})
+    monkeypatch.setattr(worker, 'load_size_hint', lambda s3, bucket, scan_name: None)
+    monkeypatch.setattr(worker, 'run_scanner_instance', run_scanner_instance)
+
+    with pytest.raises(RuntimeError):
+        worker.launch_scan('arn:aws:iam::111111111111:role/CrossAccountRole', 'abc123', 'Acme', '100',
+                           worker.target_options({'shards': '3'}))
+    assert terminated == ['i-Acme-shard1']
+    assert {job_id: r['phase'] for job_id, r in store.records.items()} == {
+        'Acme-100': 'failed', 'Acme-100-shard1': 'failed', 'Acme-100-shard2': 'failed'
+    }
+
+@pytest.mark.parametrize('queued, phase', [(False, 'failed'), (True, 'queued')])
+def test_job_is_recorded_before_the_launch(monkeypatch, queued, phase):
+    from jobs import MemoryJobStore, create_job
+    store, seen = MemoryJobStore(), []
+
+    def run_scanner_instance(image_id, instance_types, user_data, name, ts):
+        seen.append(store.get('Acme-100')['phase'])
+        if len(seen) > 1:
+            raise RuntimeError('No capacity')
+        instance = {'InstanceId': 'i-1', 'InstanceType': 't3.medium', 'SubnetId': 'subnet-1', 'VpcId': 'vpc-1',
+                    'PrivateIpAddress': '10.0.0.1'}
+        return instance, 'on-demand', []
+    monkeypatch.setattr(worker, 'get_job_store', lambda: store)
+    monkeypatch.setattr(worker, 'get_client', lambda service: None)
+    monkeypatch.setattr(worker, 'get_scanner_image', lambda: ('ami-1', True))
+    monkeypatch.setattr(worker, 'load_size_hint', lambda s3, bucket, scan_name: None)
+    monkeypatch.setattr(worker, 'run_scanner_instance', run_scanner_instance)
+    launch = partial(worker.launch_scan, 'arn:aws:iam::111111111111:role/CrossAccountRole', 'abc123', 'Acme', '100',
+                     worker.target_options({}), queued=queued)
+
+    if queued:
+        create_job(store, 'Acme-100', phase='queued', scan_name='Acme')
+    launch()
+    record = store.get('Acme-100')
+    assert seen == ['bootstrap']
+    assert (record['phase'], record['instance_id'], record['scan_name']) == ('bootstrap', 'i-1', 'Acme')
+    assert 'run_instances' in record['timings']
+
+    store.records.clear()
+    if queued:
+        create_job(store, 'Acme-100', phase='queued', scan_name='Acme')
+    with pytest.raises(RuntimeError):
+        launch()
+    record = store.get('Acme-100')
+    assert (record['phase'], record['detail']) == (phase, 'Launch failed: No capacity')
+
+@pytest.mark.parametrize('delta_scans, previous', [(6, 'Acme-90.csv'), (7, None)])
+def test_full_scan_after_a_run_of_delta_scans(monkeypatch, delta_scans, previous):
+    from jobs import MemoryJobStore
+    rendered = {}
+
+    def render_user_data(**kwargs):
+        rendered.update(kwargs)
+        return ''
+    instance = {'InstanceId': 'i-1', 'InstanceType': 't3.medium', 'SubnetId': 'subnet-1', 'VpcId': 'vpc-1',
+                'PrivateIpAddress': '10.0.0.1'}
+    monkeypatch.setattr(worker, 'get_job_store', MemoryJobStore)
+    monkeypatch.setattr(worker, 'get_client', lambda service: None)
+    monkeypatch.setattr(worker, 'get_scanner_image', lambda: ('ami-1', True))
+    monkeypatch.setattr(worker, 'find_previous_results', lambda scan_name: 'Acme-90.csv')
+    monkeypatch.setattr(worker, 'delta_scans_before', lambda s3, bucket, key: delta_scans)
+    monkeypatch.setattr(worker, 'delta_full_scan_every', 7)
+    monkeypatch.setattr(worker, 'render_user_data', render_user_data)
+    monkeypatch.setattr(worker, 'load_size_hint', lambda s3, bucket, scan_name: None)
+    monkeypatch.setattr(worker, 'run_scanner_instance', lambda *args: (instance, 'on-demand', []))
+
+    response = worker.launch_scan('arn:aws:iam::111111111111:role/CrossAccountRole', 'abc123', 'Acme', '100',
+                                  worker.target_options({'delta': 'true'}))
+    assert rendered['previous_key'] == response['delta_from'] == previous
+
+def test_catalog_query_rejects_bad_dates(created):
+    response = worker.query_scans({'queryStringParameters': {'since': 'last week'}}, None)
+    assert response['statusCode'] == 400
+    assert created == []
+
+def packed_event(*names):
+    return {'body': json.dumps({'mode': 'packed', 'targets': [{
+        'role_arn': 'arn:aws:iam::111111111111:role/CrossAccountRole',
+        'external_id': 'abc123',
+        'scan_name': name
+    } for name in names]})}
+
+def test_packed_batch_is_queued_as_one_launch(monkeypatch):
+    from dispatcher import MemoryQueue, instances_needed
+    from jobs import MemoryJobStore
+    store, queue, seen = MemoryJobStore(), MemoryQueue(), []
+
+    def run_scanner_instance(image_id, instance_types, user_data, name, ts):
+        seen.append({job_id: r['phase'] for job_id, r in store.records.items()})
+        instance = {'InstanceId': 'i-1', 'InstanceType': 'm5.xlarge'}
+        return instance, 'on-demand', []
+    monkeypatch.setattr(worker, 'launch_queue_url', 'https://sqs/launch')
+    monkeypatch.setattr(worker, 'get_job_store', lambda: store)
+    monkeypatch.setattr(worker, 'get_launch_queue', lambda: queue)
+    monkeypatch.setattr(worker, 'get_scanner_image', lambda: ('ami-1', True))
+    monkeypatch.setattr(worker, 'run_scanner_instance', run_scanner_instance)
+
+    response = json.loads(worker.run_batch(packed_event('Acme', 'Globex'), None)['body'])
+
+    assert response['message'] == 'Queued 2 of 2 Prowler scans'
+    assert sorted(store.records) == sorted(r['result']['job_id'] for r in response['results'])
+    assert {r['phase'] for r in store.records.values()} == {'queued'}
+    message = json.loads(queue.receive()[0]['body'])
+    assert message['mode'] == 'packed' and instances_needed(message, 20) == 1
+
+    worker.launch_queued_scan(message)
+    assert seen == [{job_id: 'bootstrap' for job_id in store.records}]
+    assert {(r['phase'], r['instance_id'], r['batch']) for r in store.records.values()} == {
+        ('bootstrap', 'i-1', message['job_id'])
+    }
+
+    worker.fail_queued_scan(message, RuntimeError('No capacity'))
+    assert {r['phase'] for r in store.records.values()} == {'failed'}
+
+def test_failed_packed_launch_fails_every_record(monkeypatch):
+    from jobs import MemoryJobStore
+    store = MemoryJobStore()
+
+    def run_scanner_instance(image_id, instance_types, user_data, name, ts):
+        raise RuntimeError('No capacity')
+    monkeypatch.setattr(worker, 'get_job_store', lambda: store)
+    monkeypatch.setattr(worker, 'get_scanner_image', lambda: ('ami-1', True))
+    monkeypatch.setattr(worker, 'run_scanner_instance', run_scanner_instance)
+
+    response = worker.run_batch(packed_event('Acme', 'Globex'), None)
+
+    assert response['statusCode'] == 500
+    assert {(r['phase'], r['detail']) for r in store.records.values()} == {('failed', 'Launch failed: No capacity')}
+    assert len(store.records) == 2